@@ -16,6 +16,8 @@ from db_helpers import (
     get_product_by_id,
 )
 
+from services.subscription_entitlements import entitlement_service
+
 # Imports depuis advanced_helpers
 from advanced_helpers import (
     generate_verification_token,
@@ -208,6 +210,9 @@ def add_products_endpoints(app, verify_token):
         if not success:
             raise HTTPException(status_code=500, detail="Erreur lors de la suppression")
 
+        if not product.get("deleted_at"):
+            entitlement_service.record_usage("products", -1, profile_id=merchant["id"])
+
         return {"message": "Produit supprimé avec succès"}
 
 
@@ -260,6 +265,7 @@ def add_campaigns_endpoints(app, verify_token):
             raise HTTPException(status_code=500, detail="Erreur lors de la création de la campagne")
 
         campaign = result.data[0]
+        entitlement_service.record_usage("campaigns", 1, profile_id=merchant["id"])
 
         # Assigner les produits si fournis
         if campaign_data.product_ids:
@@ -299,6 +305,8 @@ def add_campaigns_endpoints(app, verify_token):
         if not success:
             raise HTTPException(status_code=500, detail="Erreur lors de la suppression")
 
+        entitlement_service.record_usage("campaigns", -1, user_id=user["id"], role="merchant")
+
         return {"message": "Campagne supprimée avec succès"}
 
 
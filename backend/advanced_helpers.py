@@ -4,6 +4,8 @@ Ajout des fonctionnalités CRUD complètes
 """
 
 from supabase_client import supabase
+from services.subscription_entitlements import entitlement_service
+from utils.identity import invalidate_identity
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 import secrets
@@ -36,6 +38,8 @@ def create_product(
         }
 
         result = supabase.table("products").insert(product_data).execute()
+        if result.data:
+            entitlement_service.record_usage("products", 1, profile_id=merchant_id)
         return result.data[0] if result.data else None
     except Exception as e:
         print(f"Error creating product: {e}")
@@ -162,6 +166,7 @@ def accept_invitation(invitation_code: str, user_id: str) -> bool:
         }
 
         supabase.table("influencers").insert(influencer_data).execute()
+        invalidate_identity(user_id)  # Profil créé: plus de résolution négative en cache
 
         # Marquer l'invitation comme acceptée
         supabase.table("invitations").update(
@@ -457,6 +462,7 @@ def update_user_profile(user_id: str, updates: Dict) -> bool:
     try:
         updates["updated_at"] = datetime.now().isoformat()
         supabase.table("users").update(updates).eq("id", user_id).execute()
+        invalidate_identity(user_id)
         return True
     except Exception as e:
         print(f"Error updating user profile: {e}")
@@ -469,6 +475,7 @@ def deactivate_user(user_id: str) -> bool:
         supabase.table("users").update(
             {"is_active": False, "deactivated_at": datetime.now().isoformat()}
         ).eq("id", user_id).execute()
+        invalidate_identity(user_id)
         return True
     except Exception as e:
         print(f"Error deactivating user: {e}")
@@ -9,6 +9,8 @@ from typing import Optional, List
 from datetime import datetime
 from supabase_client import supabase
 from tracking_service import tracking_service
+from services.subscription_entitlements import entitlement_service
+from utils.product_visibility import is_publicly_visible
 import logging
 
 logger = logging.getLogger(__name__)
@@ -57,7 +59,7 @@ async def create_affiliation_request(
         # 1. Récupérer le produit pour avoir le merchant_id
         product_result = supabase.table('products').select('*').eq('id', request_data.product_id).execute()
 
-        if not product_result.data:
+        if not product_result.data or not is_publicly_visible(product_result.data[0]):
             raise HTTPException(status_code=404, detail="Produit introuvable")
 
         product = product_result.data[0]
@@ -248,6 +250,8 @@ async def respond_to_request(
             # ✅ APPROBATION
             # Générer automatiquement le lien trackable
             product = supabase.table('products').select('*').eq('id', affiliation_request['product_id']).execute().data[0]
+            if not is_publicly_visible(product):
+                raise HTTPException(status_code=400, detail="Produit en cours de modération")
 
             link_result = await tracking_service.create_tracking_link(
                 influencer_id=affiliation_request['influencer_id'],
@@ -268,6 +272,9 @@ async def respond_to_request(
             }
 
             supabase.table('affiliation_requests').update(update_data).eq('id', request_id).execute()
+            # Une affiliation de plus: "affiliates" du marchand, "campaigns" de l'influenceur
+            entitlement_service.record_usage("affiliates", 1, profile_id=merchant_id)
+            entitlement_service.record_usage("campaigns", 1, profile_id=affiliation_request['influencer_id'])
 
             # Envoyer notification à l'influenceur
             await send_influencer_approval_notification(
@@ -9,6 +9,7 @@ import jwt
 import os
 from dotenv import load_dotenv
 from db_helpers import get_user_by_id
+from utils.identity import remember_identity
 
 # Load environment variables
 load_dotenv()
@@ -32,6 +33,7 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         token = credentials.credentials
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        remember_identity(payload)
         return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(
@@ -70,6 +72,7 @@ async def optional_auth(credentials: HTTPAuthorizationCredentials = Depends(HTTP
     try:
         token = credentials.credentials
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        remember_identity(payload)
         return payload
     except Exception:
         return None
@@ -3,10 +3,15 @@ Service de Paiement Automatique pour Influenceurs
 Gère la validation des ventes et les paiements automatiques
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from supabase_client import supabase
-from typing import List, Dict, Optional
+from services.realtime_events import EventTypes, realtime_bus
+from typing import Callable, List, Dict, Optional
+from utils.rpc_fallback import OptionalRpc
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -15,6 +20,31 @@ load_dotenv()
 MIN_PAYOUT_AMOUNT = 50.0  # Montant minimum pour retrait
 SALE_VALIDATION_DAYS = 14  # Jours avant validation automatique
 PAYOUT_SCHEDULE = "FRIDAY"  # Jour de paiement hebdomadaire
+VALIDATION_CHUNK_SIZE = int(os.getenv("SALE_VALIDATION_CHUNK_SIZE", "500"))  # Ventes par lot
+PAYOUT_BATCH_SIZE = 200  # IDs par requête groupée (limite de longueur d'URL)
+PAYOUT_MAX_WORKERS = int(os.getenv("PAYOUT_MAX_WORKERS", "8"))  # Appels passerelles simultanés
+PAYOUT_GATEWAY_RATE_LIMITS = {  # Appels par seconde et par passerelle
+    "paypal": float(os.getenv("PAYOUT_PAYPAL_RATE_LIMIT", "10")),
+    "bank_transfer": float(os.getenv("PAYOUT_BANK_TRANSFER_RATE_LIMIT", "50")),
+}
+
+
+class GatewayRateLimiter:
+    """Limiteur de débit thread-safe (intervalle minimal entre deux appels)"""
+
+    def __init__(self, calls_per_second: float):
+        self.interval = 1.0 / calls_per_second if calls_per_second > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self):
+        """Bloque jusqu'au prochain créneau disponible"""
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            time.sleep(wait)
 
 
 class AutoPaymentService:
@@ -22,131 +52,118 @@ class AutoPaymentService:
 
     def __init__(self):
         self.supabase = supabase
+        self._batch_rpc = OptionalRpc("validate_sales_batch")
+        self._gateway_limiters = {
+            method: GatewayRateLimiter(rate) for method, rate in PAYOUT_GATEWAY_RATE_LIMITS.items()
+        }
 
     # ============================================
     # 1. VALIDATION AUTOMATIQUE DES VENTES
     # ============================================
 
-    def validate_pending_sales(self) -> Dict:
+    def validate_pending_sales(
+        self,
+        chunk_size: int = VALIDATION_CHUNK_SIZE,
+        max_chunks: Optional[int] = None,
+        progress_callback: Optional[Callable[[Dict], None]] = None,
+    ) -> Dict:
         """
         Valide automatiquement les ventes de plus de 14 jours
         et crédite le solde des influenceurs
+
+        Traitement par lots: chaque lot passe ses ventes en "completed",
+        insère les commissions en masse et applique un seul delta de solde
+        par influenceur. Un lot validé n'est plus "pending", donc une
+        exécution interrompue (ou limitée par max_chunks) reprend là où
+        elle s'est arrêtée au prochain appel.
+
+        Args:
+            chunk_size: Nombre de ventes par lot
+            max_chunks: Nombre maximum de lots pour cet appel (None = tout)
+            progress_callback: Appelé après chaque lot avec le rapport courant
         """
         try:
+            started_at = datetime.now()
+
             # Date limite (14 jours en arrière)
-            validation_date = (datetime.now() - timedelta(days=SALE_VALIDATION_DAYS)).isoformat()
+            validation_date = (started_at - timedelta(days=SALE_VALIDATION_DAYS)).isoformat()
 
-            # Récupérer les ventes en attente (pending) de plus de 14 jours
-            response = (
-                supabase.table("sales")
-                .select(
-                    """
-                id,
-                influencer_id,
-                merchant_id,
-                amount,
-                influencer_commission,
-                platform_commission,
-                merchant_revenue,
-                product_id,
-                link_id,
-                created_at
-            """
+            report = {
+                "validated_sales": 0,
+                "total_commission": 0.0,
+                "chunks": 0,
+                "failed_chunks": 0,
+            }
+            influencers_updated = set()
+            remaining = False
+
+            while True:
+                if max_chunks is not None and report["chunks"] >= max_chunks:
+                    remaining = True
+                    break
+
+                # Lot suivant des ventes en attente (pending) de plus de 14 jours
+                response = (
+                    supabase.table("sales")
+                    .select("id, influencer_id, influencer_commission, link_id, created_at")
+                    .eq("status", "pending")
+                    .lt("created_at", validation_date)
+                    .order("created_at")
+                    .order("id")
+                    .limit(chunk_size)
+                    .execute()
                 )
-                .eq("status", "pending")
-                .lt("created_at", validation_date)
-                .execute()
-            )
-
-            pending_sales = response.data if response.data else []
 
-            validated_count = 0
-            total_commission = 0.0
-            influencers_updated = set()
+                chunk = response.data if response.data else []
+                if not chunk:
+                    break
 
-            for sale in pending_sales:
-                # Vérifier qu'il n'y a pas eu de retour/remboursement
-                # (Cette logique peut être étendue avec une table de retours)
+                report["chunks"] += 1
 
                 try:
-                    # 1. Mettre à jour le statut de la vente
-                    supabase.table("sales").update(
+                    result = self._validate_sales_chunk(chunk)
+                except Exception as e:
+                    print(f"❌ Erreur validation lot {report['chunks']} ({len(chunk)} ventes): {e}")
+                    report["failed_chunks"] += 1
+                    remaining = True
+                    break
+
+                if result["validated"] == 0:
+                    # Aucun progrès possible: éviter de reboucler sur le même lot
+                    remaining = True
+                    break
+
+                report["validated_sales"] += result["validated"]
+                report["total_commission"] += result["commission"]
+                influencers_updated.update(result["influencers"])
+                self._publish_commission_events(chunk, result["influencers"])
+
+                print(
+                    f"✅ Lot {report['chunks']}: {result['validated']} ventes validées "
+                    f"({report['validated_sales']} au total)"
+                )
+
+                if progress_callback:
+                    progress_callback(
                         {
-                            "status": "completed",
-                            "payment_status": "pending",
-                            "payment_processed_at": None,
+                            **report,
+                            "influencers_updated": len(influencers_updated),
+                            "elapsed_seconds": (datetime.now() - started_at).total_seconds(),
                         }
-                    ).eq("id", sale["id"]).execute()
-
-                    # 2. Créer l'entrée de commission
-                    commission_data = {
-                        "sale_id": sale["id"],
-                        "influencer_id": sale["influencer_id"],
-                        "amount": sale["influencer_commission"],
-                        "currency": "EUR",
-                        "status": "approved",  # Approuvée automatiquement
-                        "approved_at": datetime.now().isoformat(),
-                    }
-                    supabase.table("commissions").insert(commission_data).execute()
-
-                    # 3. Mettre à jour le solde de l'influenceur
-                    influencer = (
-                        supabase.table("influencers")
-                        .select("balance, total_earnings")
-                        .eq("id", sale["influencer_id"])
-                        .execute()
                     )
 
-                    if influencer.data:
-                        current_balance = float(influencer.data[0].get("balance", 0))
-                        current_earnings = float(influencer.data[0].get("total_earnings", 0))
-
-                        new_balance = current_balance + float(sale["influencer_commission"])
-                        new_earnings = current_earnings + float(sale["influencer_commission"])
-
-                        supabase.table("influencers").update(
-                            {
-                                "balance": new_balance,
-                                "total_earnings": new_earnings,
-                                "updated_at": datetime.now().isoformat(),
-                            }
-                        ).eq("id", sale["influencer_id"]).execute()
-
-                        influencers_updated.add(sale["influencer_id"])
-
-                    # 4. Mettre à jour les stats du lien d'affiliation
-                    if sale.get("link_id"):
-                        link = (
-                            supabase.table("trackable_links")
-                            .select("total_commission")
-                            .eq("id", sale["link_id"])
-                            .execute()
-                        )
-                        if link.data:
-                            current_link_commission = float(link.data[0].get("total_commission", 0))
-                            supabase.table("trackable_links").update(
-                                {
-                                    "total_commission": current_link_commission
-                                    + float(sale["influencer_commission"])
-                                }
-                            ).eq("id", sale["link_id"]).execute()
-
-                    validated_count += 1
-                    total_commission += float(sale["influencer_commission"])
-
-                    print(
-                        f"✅ Vente validée: {sale['id']} - Commission: {sale['influencer_commission']}€"
-                    )
-
-                except Exception as e:
-                    print(f"❌ Erreur validation vente {sale['id']}: {e}")
-                    continue
+                if len(chunk) < chunk_size:
+                    break
 
             return {
                 "success": True,
-                "validated_sales": validated_count,
-                "total_commission": round(total_commission, 2),
+                "validated_sales": report["validated_sales"],
+                "total_commission": round(report["total_commission"], 2),
                 "influencers_updated": len(influencers_updated),
+                "chunks": report["chunks"],
+                "failed_chunks": report["failed_chunks"],
+                "remaining": remaining,
+                "duration_seconds": round((datetime.now() - started_at).total_seconds(), 2),
                 "timestamp": datetime.now().isoformat(),
             }
 
@@ -154,6 +171,128 @@ class AutoPaymentService:
             print(f"Erreur dans validate_pending_sales: {e}")
             return {"success": False, "error": str(e)}
 
+    def _validate_sales_chunk(self, sales: List[Dict]) -> Dict:
+        """
+        Valide un lot de ventes en une opération
+
+        Utilise la fonction SQL validate_sales_batch (transaction unique:
+        statuts, commissions, soldes et liens). Si elle n'est pas déployée,
+        repli rejouable: commissions, crédit atomique, puis statut des ventes.
+
+        Returns:
+            {"validated": int, "commission": float, "influencers": set}
+        """
+        sale_ids = [sale["id"] for sale in sales]
+
+        if self._batch_rpc.enabled():
+            try:
+                result = supabase.rpc("validate_sales_batch", {"p_sale_ids": sale_ids}).execute()
+                self._batch_rpc.succeeded()
+                data = result.data or {}
+                return {
+                    "validated": int(data.get("validated", 0)),
+                    "commission": float(data.get("total_commission", 0)),
+                    "influencers": set(data.get("influencer_ids") or []),
+                }
+            except Exception as e:
+                if not self._batch_rpc.missing(e):
+                    raise
+
+        return self._validate_sales_chunk_fallback(sale_ids)
+
+    def _validate_sales_chunk_fallback(self, sale_ids: List[str]) -> Dict:
+        """
+        Validation sans validate_sales_batch, dans un ordre rejouable
+
+        1. Ventes encore pending du lot
+        2. Commissions manquantes insérées avec approved_at NULL (non créditées)
+        3. Crédit atomique des soldes et liens (RPC credit_sale_commissions,
+           qui ignore les commissions déjà créditées)
+        4. Ventes passées en "completed" en dernier
+
+        Une erreur à n'importe quelle étape laisse les ventes en pending: le
+        passage suivant reprend le lot sans créer ni créditer deux fois.
+        Sans credit_sale_commissions, l'erreur remonte et rien n'est validé.
+        """
+        pending = (
+            supabase.table("sales")
+            .select("id, influencer_id, influencer_commission")
+            .in_("id", sale_ids)
+            .eq("status", "pending")
+            .execute()
+        ).data or []
+        if not pending:
+            return {"validated": 0, "commission": 0.0, "influencers": set()}
+        pending_ids = [sale["id"] for sale in pending]
+
+        # Commissions déjà créées par un passage interrompu
+        existing = (
+            supabase.table("commissions")
+            .select("sale_id")
+            .in_("sale_id", pending_ids)
+            .execute()
+        ).data or []
+        existing_ids = {row["sale_id"] for row in existing}
+        missing = [sale for sale in pending if sale["id"] not in existing_ids]
+        if missing:
+            supabase.table("commissions").insert(
+                [
+                    {
+                        "sale_id": sale["id"],
+                        "influencer_id": sale["influencer_id"],
+                        "amount": sale["influencer_commission"],
+                        "currency": "EUR",
+                        "status": "approved",  # Approuvée automatiquement
+                        "approved_at": None,  # Renseigné par le crédit
+                    }
+                    for sale in missing
+                ]
+            ).execute()
+
+        supabase.rpc("credit_sale_commissions", {"p_sale_ids": pending_ids}).execute()
+
+        updated = (
+            supabase.table("sales")
+            .update({"status": "completed", "payment_status": "pending", "payment_processed_at": None})
+            .in_("id", pending_ids)
+            .eq("status", "pending")
+            .execute()
+        )
+        validated_ids = {row["id"] for row in (updated.data or [])}
+        validated = [sale for sale in pending if sale["id"] in validated_ids]
+
+        return {
+            "validated": len(validated),
+            "commission": sum(float(sale["influencer_commission"] or 0) for sale in validated),
+            "influencers": {sale["influencer_id"] for sale in validated},
+        }
+
+    def _publish_commission_events(self, sales: List[Dict], influencer_ids: set):
+        """Notifie en temps réel les influenceurs crédités (une requête user_id par lot)"""
+        if not influencer_ids:
+            return
+        try:
+            response = (
+                supabase.table("influencers")
+                .select("id, user_id")
+                .in_("id", list(influencer_ids))
+                .execute()
+            )
+            user_ids = {row["id"]: row.get("user_id") for row in (response.data or [])}
+            realtime_bus.publish_many(
+                [
+                    (
+                        user_ids.get(sale["influencer_id"]),
+                        EventTypes.COMMISSION_CREATED,
+                        {"sale_id": sale["id"], "amount": sale["influencer_commission"]},
+                    )
+                    for sale in sales
+                    if sale["influencer_id"] in influencer_ids
+                ]
+            )
+        except Exception as e:
+            print(f"⚠️  Notification temps réel des commissions impossible: {e}")
+
     # ============================================
     # 2. PAIEMENT AUTOMATIQUE
     # ============================================
@@ -162,6 +301,13 @@ class AutoPaymentService:
         """
         Traite automatiquement les paiements pour les influenceurs
         dont le solde est ≥ 50€ et qui ont configuré leur méthode de paiement
+
+        Traitement par lots:
+        - une requête pour les paiements déjà en cours de tout le lot
+        - création groupée des payouts (clé d'idempotence par influenceur et par jour)
+        - appels passerelles via un pool de workers borné, limité par passerelle
+        - mises à jour de statut groupées
+        - débit des soldes du montant payé (debit_payout_balances, migration 019)
         """
         try:
             # Récupérer les influenceurs éligibles
@@ -186,6 +332,7 @@ class AutoPaymentService:
             processed_count = 0
             total_paid = 0.0
             failed_payments = []
+            configured = []
 
             for influencer in eligible_influencers:
                 # Vérifier que la méthode de paiement est configurée
@@ -201,90 +348,77 @@ class AutoPaymentService:
                         }
                     )
                     continue
+                configured.append(influencer)
 
-                # Vérifier qu'il n'y a pas déjà un paiement en cours
-                pending_payout = (
-                    supabase.table("payouts")
-                    .select("id")
-                    .eq("influencer_id", influencer["id"])
-                    .in_("status", ["pending", "processing"])
-                    .execute()
-                )
-
-                if pending_payout.data:
+            # Vérifier qu'il n'y a pas déjà un paiement en cours (une requête par lot d'IDs)
+            in_flight = self._load_in_flight_payouts([i["id"] for i in configured])
+            to_pay = []
+            for influencer in configured:
+                if influencer["id"] in in_flight:
                     print(f"⚠️  Influenceur {influencer['username']}: Paiement déjà en cours")
                     continue
+                to_pay.append(influencer)
+
+            # Créer les demandes de paiement en masse
+            payouts = self._create_payouts(to_pay)
+            influencers_by_id = {i["id"]: i for i in to_pay}
+
+            # Tenter les paiements en parallèle (pool borné, limites par passerelle)
+            results = self._dispatch_payouts(payouts, influencers_by_id)
+
+            paid, failed = [], []
+            for payout, (payment_success, transaction_id) in results:
+                (paid if payment_success else failed).append((payout, transaction_id))
+
+            now = datetime.now().isoformat()
+
+            if paid:
+                # Mettre à jour les payouts réussis (un upsert groupé)
+                supabase.table("payouts").upsert(
+                    [
+                        {**payout, "status": "paid", "transaction_id": transaction_id, "paid_at": now}
+                        for payout, transaction_id in paid
+                    ]
+                ).execute()
+
+                # Débiter le montant payé (pas de remise à zéro: un crédit
+                # reçu pendant le run reste sur le solde)
+                supabase.rpc(
+                    "debit_payout_balances",
+                    {"p_idempotency_keys": [payout["idempotency_key"] for payout, _ in paid]},
+                ).execute()
+
+                for payout, transaction_id in paid:
+                    influencer = influencers_by_id[payout["influencer_id"]]
+                    processed_count += 1
+                    total_paid += float(payout["amount"])
+                    print(f"✅ Paiement réussi: {influencer['username']} - {payout['amount']}€")
+
+                # Envoyer les notifications
+                self._send_payment_notifications(
+                    [
+                        (influencers_by_id[payout["influencer_id"]], float(payout["amount"]), transaction_id)
+                        for payout, transaction_id in paid
+                    ]
+                )
 
-                # Créer la demande de paiement
-                payout_amount = float(influencer["balance"])
+            if failed:
+                # Échec du paiement
+                supabase.table("payouts").update(
+                    {"status": "failed", "notes": "Échec du traitement automatique"}
+                ).in_("id", [payout["id"] for payout, _ in failed]).execute()
 
-                payout_data = {
-                    "influencer_id": influencer["id"],
-                    "amount": payout_amount,
-                    "currency": "EUR",
-                    "status": "processing",
-                    "payment_method": influencer["payment_method"],
-                    "requested_at": datetime.now().isoformat(),
-                    "approved_at": datetime.now().isoformat(),
-                    "is_automatic": True,
-                }
+                for payout, _ in failed:
+                    failed_payments.append(
+                        {
+                            "influencer_id": payout["influencer_id"],
+                            "reason": "payment_processing_failed",
+                            "balance": float(payout["amount"]),
+                        }
+                    )
+                    print(f"❌ Échec paiement: {influencers_by_id[payout['influencer_id']]['username']}")
 
-                payout_result = supabase.table("payouts").insert(payout_data).execute()
-
-                if payout_result.data:
-                    payout_id = payout_result.data[0]["id"]
-
-                    # Tenter le paiement selon la méthode
-                    payment_success = False
-                    transaction_id = None
-
-                    if influencer["payment_method"] == "paypal":
-                        payment_success, transaction_id = self._process_paypal_payment(
-                            influencer["payment_details"], payout_amount
-                        )
-                    elif influencer["payment_method"] == "bank_transfer":
-                        payment_success, transaction_id = self._process_bank_transfer(
-                            influencer["payment_details"], payout_amount
-                        )
-
-                    if payment_success:
-                        # Mettre à jour le payout
-                        supabase.table("payouts").update(
-                            {
-                                "status": "paid",
-                                "transaction_id": transaction_id,
-                                "paid_at": datetime.now().isoformat(),
-                            }
-                        ).eq("id", payout_id).execute()
-
-                        # Débiter le solde de l'influenceur
-                        supabase.table("influencers").update(
-                            {"balance": 0.0, "updated_at": datetime.now().isoformat()}
-                        ).eq("id", influencer["id"]).execute()
-
-                        processed_count += 1
-                        total_paid += payout_amount
-
-                        print(f"✅ Paiement réussi: {influencer['username']} - {payout_amount}€")
-
-                        # Envoyer notification
-                        self._send_payment_notification(influencer, payout_amount, transaction_id)
-
-                    else:
-                        # Échec du paiement
-                        supabase.table("payouts").update(
-                            {"status": "failed", "notes": "Échec du traitement automatique"}
-                        ).eq("id", payout_id).execute()
-
-                        failed_payments.append(
-                            {
-                                "influencer_id": influencer["id"],
-                                "reason": "payment_processing_failed",
-                                "balance": payout_amount,
-                            }
-                        )
-
-                        print(f"❌ Échec paiement: {influencer['username']}")
+            self._publish_payout_events(paid, failed, influencers_by_id)
 
             return {
                 "success": True,
@@ -299,13 +433,107 @@ class AutoPaymentService:
             print(f"Erreur dans process_automatic_payouts: {e}")
             return {"success": False, "error": str(e)}
 
+    def _load_in_flight_payouts(self, influencer_ids: List[str]) -> set:
+        """IDs des influenceurs ayant déjà un paiement pending/processing"""
+        in_flight = set()
+        for i in range(0, len(influencer_ids), PAYOUT_BATCH_SIZE):
+            result = (
+                supabase.table("payouts")
+                .select("influencer_id")
+                .in_("influencer_id", influencer_ids[i : i + PAYOUT_BATCH_SIZE])
+                .in_("status", ["pending", "processing"])
+                .execute()
+            )
+            in_flight.update(row["influencer_id"] for row in (result.data or []))
+        return in_flight
+
+    def _create_payouts(self, influencers: List[Dict]) -> List[Dict]:
+        """
+        Crée les payouts "processing" en masse
+
+        La clé d'idempotence (influenceur + jour) empêche un second run le même
+        jour de créer un doublon: les lignes existantes sont ignorées.
+        """
+        now = datetime.now()
+        payouts = []
+
+        for i in range(0, len(influencers), PAYOUT_BATCH_SIZE):
+            rows = [
+                {
+                    "influencer_id": influencer["id"],
+                    "amount": float(influencer["balance"]),
+                    "currency": "EUR",
+                    "status": "processing",
+                    "payment_method": influencer["payment_method"],
+                    "requested_at": now.isoformat(),
+                    "approved_at": now.isoformat(),
+                    "is_automatic": True,
+                    "idempotency_key": f"auto-{influencer['id']}-{now.strftime('%Y%m%d')}",
+                }
+                for influencer in influencers[i : i + PAYOUT_BATCH_SIZE]
+            ]
+            result = (
+                supabase.table("payouts")
+                .upsert(rows, on_conflict="idempotency_key", ignore_duplicates=True)
+                .execute()
+            )
+            payouts.extend(result.data or [])
+
+        return payouts
+
+    def _dispatch_payouts(self, payouts: List[Dict], influencers_by_id: Dict[str, Dict]) -> List[tuple]:
+        """
+        Envoie les paiements aux passerelles via un pool de threads borné
+
+        Returns:
+            [(payout, (success, transaction_id)), ...]
+        """
+
+        def pay(payout: Dict) -> tuple:
+            influencer = influencers_by_id[payout["influencer_id"]]
+            method = influencer["payment_method"]
+            amount = float(payout["amount"])
+            key = payout.get("idempotency_key") or payout["id"]
+
+            limiter = self._gateway_limiters.get(method)
+            if limiter:
+                limiter.acquire()
+
+            if method == "paypal":
+                return self._process_paypal_payment(influencer["payment_details"], amount, key)
+            if method == "bank_transfer":
+                return self._process_bank_transfer(influencer["payment_details"], amount, key)
+            return False, None
+
+        if not payouts:
+            return []
+
+        with ThreadPoolExecutor(max_workers=PAYOUT_MAX_WORKERS) as executor:
+            outcomes = list(executor.map(self._safe_call(pay), payouts))
+
+        return list(zip(payouts, outcomes))
+
+    @staticmethod
+    def _safe_call(func: Callable) -> Callable:
+        def wrapper(payout: Dict) -> tuple:
+            try:
+                return func(payout)
+            except Exception as e:
+                print(f"Erreur passerelle paiement {payout.get('id')}: {e}")
+                return False, None
+
+        return wrapper
+
     # ============================================
     # 3. MÉTHODES DE PAIEMENT
     # ============================================
 
-    def _process_paypal_payment(self, payment_details: dict, amount: float) -> tuple:
+    def _process_paypal_payment(
+        self, payment_details: dict, amount: float, idempotency_key: Optional[str] = None
+    ) -> tuple:
         """
         Traite un paiement PayPal
+        idempotency_key: utilisé comme sender_item_id (PayPal ignore les doublons)
         Retourne: (success: bool, transaction_id: str)
         """
         try:
@@ -335,7 +563,7 @@ class AutoPaymentService:
                     },
                     "receiver": paypal_email,
                     "note": "Commission d'affiliation",
-                    "sender_item_id": f"item_{datetime.now().timestamp()}"
+                    "sender_item_id": idempotency_key
                 }]
             })
             
@@ -347,7 +575,7 @@ class AutoPaymentService:
             """
 
             # SIMULATION
-            transaction_id = f"PAYPAL_SIM_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            transaction_id = f"PAYPAL_SIM_{idempotency_key or datetime.now().strftime('%Y%m%d%H%M%S')}"
             print(f"[SIMULATION] Paiement PayPal: {amount}€ → {paypal_email}")
             return True, transaction_id
 
@@ -355,9 +583,12 @@ class AutoPaymentService:
             print(f"Erreur PayPal: {e}")
             return False, None
 
-    def _process_bank_transfer(self, payment_details: dict, amount: float) -> tuple:
+    def _process_bank_transfer(
+        self, payment_details: dict, amount: float, idempotency_key: Optional[str] = None
+    ) -> tuple:
         """
         Génère un ordre de virement bancaire (SEPA)
+        idempotency_key: référence de bout en bout (EndToEndId) du virement
         Retourne: (success: bool, transaction_id: str)
         """
         try:
@@ -369,7 +600,7 @@ class AutoPaymentService:
                 return False, None
 
             # Générer fichier SEPA XML
-            transaction_id = f"SEPA_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            transaction_id = f"SEPA_{idempotency_key or datetime.now().strftime('%Y%m%d%H%M%S')}"
 
             # TODO: Générer fichier SEPA pour import dans banque
             # Utiliser bibliothèque comme sepaxml ou pain.001
@@ -385,33 +616,63 @@ class AutoPaymentService:
     # 4. NOTIFICATIONS
     # ============================================
 
-    def _send_payment_notification(self, influencer: dict, amount: float, transaction_id: str):
-        """Envoie une notification de paiement à l'influenceur"""
+    def _send_payment_notifications(self, payments: List[tuple]):
+        """
+        Envoie les notifications de paiement en masse
+        payments: [(influencer, amount, transaction_id), ...]
+        """
         try:
-            # Récupérer l'email de l'utilisateur
-            user = supabase.table("users").select("email").eq("id", influencer["user_id"]).execute()
-
-            if user.data:
-                email = user.data[0]["email"]
+            # Récupérer les emails des utilisateurs (une requête)
+            user_ids = [influencer["user_id"] for influencer, _, _ in payments]
+            users = supabase.table("users").select("id, email").in_("id", user_ids).execute()
+            emails = {user["id"]: user["email"] for user in (users.data or [])}
+
+            notifications = []
+            for influencer, amount, transaction_id in payments:
+                email = emails.get(influencer["user_id"])
+                if not email:
+                    continue
 
                 # TODO: Envoyer email via SendGrid/SMTP
                 print(f"📧 Notification envoyée à {email}: Paiement de {amount}€")
 
                 # Créer une notification in-app
-                notification_data = {
-                    "user_id": influencer["user_id"],
-                    "type": "payout_completed",
-                    "title": "Paiement effectué",
-                    "message": f"Votre paiement de {amount}€ a été traité avec succès. Référence: {transaction_id}",
-                    "is_read": False,
-                    "created_at": datetime.now().isoformat(),
-                }
+                notifications.append(
+                    {
+                        "user_id": influencer["user_id"],
+                        "type": "payout_completed",
+                        "title": "Paiement effectué",
+                        "message": f"Votre paiement de {amount}€ a été traité avec succès. Référence: {transaction_id}",
+                        "is_read": False,
+                        "created_at": datetime.now().isoformat(),
+                    }
+                )
 
-                supabase.table("notifications").insert(notification_data).execute()
+            if notifications:
+                supabase.table("notifications").insert(notifications).execute()
 
         except Exception as e:
             print(f"Erreur notification: {e}")
 
+    def _publish_payout_events(
+        self, paid: List[tuple], failed: List[tuple], influencers_by_id: Dict[str, Dict]
+    ):
+        """Notifie en temps réel le changement de statut des payouts"""
+        try:
+            realtime_bus.publish_many(
+                [
+                    (
+                        influencers_by_id[payout["influencer_id"]].get("user_id"),
+                        EventTypes.PAYMENT_STATUS_CHANGED,
+                        {"payment_id": payout["id"], "status": status, "amount": payout["amount"]},
+                    )
+                    for status, payouts in (("paid", paid), ("failed", failed))
+                    for payout, _ in payouts
+                ]
+            )
+        except Exception as e:
+            print(f"⚠️  Notification temps réel des paiements impossible: {e}")
+
     # ============================================
     # 5. GESTION DES RETOURS
     # ============================================
@@ -0,0 +1,91 @@
+"""
+Benchmark du pipeline d'optimisation d'images
+
+Compare l'encodage dans le processus (encode_workers=0) et le pool de
+processus, sur des photos synthétiques toutes différentes (pas de
+déduplication), puis mesure un passage sur des uploads identiques.
+Rapporte le débit en images/s et en images/s/cœur.
+
+Usage:
+    python benchmark_image_optimizer.py --images 8 --megapixels 12 --workers 4
+    python benchmark_image_optimizer.py --mode thumbnails --formats webp,jpeg
+"""
+
+import argparse
+import io
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from services.image_optimizer import ImageOptimizer, get_encode_pool, shutdown_encode_pools
+
+
+def make_photos(count: int, megapixels: float, seed: int = 0) -> list:
+    """Photos JPEG synthétiques (dégradé + bruit, proche d'une photo produit)"""
+    rng = np.random.default_rng(seed)
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    gradient = np.linspace(0, 180, width, dtype=np.float32)[None, :, None]
+    photos = []
+    for _ in range(count):
+        pixels = (rng.random((height, width, 3), dtype=np.float32) * 60 + gradient).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+        photos.append(buffer.getvalue())
+    return photos
+
+
+def run(optimizer: ImageOptimizer, photos: list, mode: str, formats: list) -> float:
+    started = time.perf_counter()
+    for i, data in enumerate(photos):
+        if mode == 'optimize':
+            result = optimizer.optimize_image(data, f'bench_{i}.jpg', generate_formats=formats)
+        else:
+            result = optimizer.generate_thumbnails(data, f'bench_{i}.jpg', formats=formats)
+        if not result['success']:
+            raise RuntimeError(result.get('error'))
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--megapixels", type=float, default=12)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--mode", choices=["optimize", "thumbnails"], default="optimize")
+    parser.add_argument("--formats", default="webp,jpeg")
+    args = parser.parse_args()
+
+    formats = args.formats.split(",")
+    photos = make_photos(args.images, args.megapixels)
+
+    # Démarrer les processus du pool avant la mesure
+    pool = get_encode_pool(args.workers)
+    if pool is not None:
+        list(pool.map(abs, range(args.workers)))
+
+    engines = {
+        "in_process": (ImageOptimizer(encode_workers=0, dedup_cache_bytes=0), 1),
+        f"pool_{args.workers}": (ImageOptimizer(encode_workers=args.workers, dedup_cache_bytes=0), max(args.workers, 1)),
+    }
+
+    print(f"{args.images} images de {args.megapixels} MP, mode={args.mode}, formats={','.join(formats)}")
+    print(f"{'engine':<16}{'seconds':>10}{'img/s':>10}{'img/s/core':>12}")
+    for name, (optimizer, cores) in engines.items():
+        elapsed = run(optimizer, photos, args.mode, formats)
+        rate = args.images / elapsed
+        print(f"{name:<16}{elapsed:>10.2f}{rate:>10.2f}{rate / cores:>12.3f}")
+
+    # Uploads identiques: le second passage est servi par le hash de contenu
+    optimizer = ImageOptimizer(encode_workers=args.workers)
+    run(optimizer, photos[:1], args.mode, formats)
+    elapsed = run(optimizer, photos[:1] * args.images, args.mode, formats)
+    print(f"{'dedup_hits':<16}{elapsed:>10.2f}{args.images / elapsed:>10.0f}{'':>12}")
+
+    shutdown_encode_pools()
+
+
+if __name__ == "__main__":
+    main()
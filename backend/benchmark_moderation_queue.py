@@ -0,0 +1,171 @@
+"""
+Benchmark de la modération IA des produits, contre un serveur stub local
+
+Le stub imite /v1/chat/completions avec une latence fixe par requête (plus
+un coût par produit du lot) et renvoie un verdict par produit.
+
+Compare:
+- "sync_client": ancien chemin, client OpenAI synchrone appelé depuis une
+  coroutine (un appel par produit, boucle bloquée pendant l'appel)
+- "queue": moderate_product_with_ai via moderation_queue (micro-lots,
+  concurrence bornée, AsyncOpenAI)
+- "queue_cached": les mêmes produits une seconde fois (cache des verdicts)
+
+Rapporte produits/s, requêtes au stub et retard de la boucle asyncio (p99
+et max, mesuré par une tâche qui dort 5 ms en boucle).
+
+Usage:
+    python benchmark_moderation_queue.py --products 200 --latency-ms 200
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PROMPT_MARKER = "PRODUITS À ANALYSER:\n"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Réponses chat.completions: un verdict "approved" par produit du prompt"""
+
+    latency = 0.2
+    per_item = 0.005
+    requests = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = body["messages"][-1]["content"]
+        if PROMPT_MARKER in prompt:
+            items = json.loads(prompt.split(PROMPT_MARKER, 1)[1].split("\n", 1)[0])
+            content = {"results": [{"id": item["id"], "approved": True, "confidence": 0.95, "risk_level": "low",
+                                    "flags": [], "reason": "", "recommendation": "Approved"} for item in items]}
+        else:
+            items = [None]
+            content = {"approved": True, "confidence": 0.95, "risk_level": "low", "flags": [],
+                       "reason": "", "recommendation": "Approved"}
+
+        StubHandler.requests += 1
+        time.sleep(self.latency + self.per_item * len(items))
+        payload = json.dumps({
+            "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": json.dumps(content)}}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub(latency_ms: float, per_item_ms: float) -> str:
+    StubHandler.latency = latency_ms / 1000
+    StubHandler.per_item = per_item_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/v1"
+
+
+async def measure(name: str, products: list, moderate, concurrency: int) -> dict:
+    lags = []
+    running = True
+
+    async def monitor():
+        while running:
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lags.append((time.perf_counter() - started - 0.005) * 1000)
+
+    monitor_task = asyncio.create_task(monitor())
+    semaphore = asyncio.Semaphore(concurrency)
+    requests_before = StubHandler.requests
+
+    async def one(product):
+        async with semaphore:
+            result = await moderate(product)
+            if result.get("flags") == ["ai_error"]:
+                raise RuntimeError(result["reason"])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(p) for p in products))
+    elapsed = time.perf_counter() - started
+    running = False
+    await monitor_task
+
+    lags.sort()
+    return {
+        "engine": name,
+        "products_per_s": round(len(products) / elapsed, 1),
+        "stub_requests": StubHandler.requests - requests_before,
+        "lag_p99_ms": round(lags[max(0, int(len(lags) * 0.99) - 1)], 1) if lags else 0.0,
+        "lag_max_ms": round(lags[-1], 1) if lags else 0.0,
+        "lag_mean_ms": round(statistics.mean(lags), 1) if lags else 0.0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=100, help="Créations de produits simultanées")
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--per-item-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    os.environ["OPENAI_BASE_URL"] = start_stub(args.latency_ms, args.per_item_ms)
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+    from openai import OpenAI
+    import moderation_service
+
+    legacy_client = OpenAI()
+
+    async def legacy_moderate(product):
+        # Ancien moderate_product_with_ai: appel synchrone dans une coroutine
+        response = legacy_client.chat.completions.create(
+            model=moderation_service.MODERATION_AI_MODEL,
+            messages=[{"role": "user", "content": f"Nom: {product['name']}\nDescription: {product['description']}"}],
+            temperature=0.1,
+            max_tokens=500,
+            response_format={"type": "json_object"},
+        )
+        return json.loads(response.choices[0].message.content)
+
+    async def queued_moderate(product):
+        return await moderation_service.moderate_product_with_ai(product["name"], product["description"])
+
+    products = [{"name": f"Tapis berbère n°{i}", "description": f"Tapis tissé main, laine naturelle, modèle {i}"}
+                for i in range(args.products)]
+
+    # Sortie silencieuse: moderate_product_with_ai journalise chaque verdict
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = [
+            await measure("sync_client", products, legacy_moderate, args.concurrency),
+            await measure("queue", products, queued_moderate, args.concurrency),
+            await measure("queue_cached", products, queued_moderate, args.concurrency),
+        ]
+
+    print(f"{args.products} produits, {args.concurrency} simultanés, stub {args.latency_ms:.0f} ms "
+          f"+ {args.per_item_ms:.0f} ms/produit")
+    print(f"{'engine':<14}{'prod/s':>10}{'requests':>10}{'lag p99':>10}{'lag max':>10}{'lag mean':>10}")
+    for r in results:
+        print(f"{r['engine']:<14}{r['products_per_s']:>10}{r['stub_requests']:>10}"
+              f"{r['lag_p99_ms']:>10}{r['lag_max_ms']:>10}{r['lag_mean_ms']:>10}")
+    print(f"queue: {moderation_service.moderation_queue.get_stats()}")
+
+    await moderation_service.stop_moderation()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
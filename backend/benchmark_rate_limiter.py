@@ -0,0 +1,72 @@
+"""
+Benchmark des moteurs de rate limiting
+
+Compare "sliding_log" (sorted set, client Redis synchrone) et "lua"
+(script atomique, client async, pré-contrôle local) sur le même Redis.
+
+Usage:
+    REDIS_URL=redis://localhost:6379/0 python benchmark_rate_limiter.py --requests 20000 --concurrency 200
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("JWT_SECRET", "benchmark-secret-key-not-used-for-tokens")
+
+from middleware.rate_limiting import LuaRateLimiter, RateLimiter  # noqa: E402
+
+
+async def run(limiter, name: str, requests: int, concurrency: int, identifiers: int, limit: int) -> dict:
+    latencies = []
+    allowed = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        nonlocal allowed
+        async with semaphore:
+            started = time.perf_counter()
+            ok, _, _ = await limiter.check_rate_limit(f"bench:{i % identifiers}", f"/bench/{name}", limit, 60)
+            latencies.append((time.perf_counter() - started) * 1000)
+            allowed += bool(ok)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "engine": name,
+        "req_per_s": round(requests / elapsed),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 3),
+        "allowed": allowed,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--identifiers", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    engines = {
+        "sliding_log": RateLimiter(key_prefix="ratelimit:bench"),
+        "lua": LuaRateLimiter(key_prefix="ratelimit:bench:sw"),
+        "lua_no_precheck": LuaRateLimiter(key_prefix="ratelimit:bench:sw2", local_precheck=False),
+    }
+
+    print(f"{'engine':<18}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'allowed':>10}")
+    for name, limiter in engines.items():
+        result = await run(limiter, name, args.requests, args.concurrency, args.identifiers, args.limit)
+        print(f"{name:<18}{result['req_per_s']:>10}{result['p50_ms']:>10}{result['p99_ms']:>10}{result['allowed']:>10}")
+        for i in range(args.identifiers):
+            await limiter.reset_limit(f"bench:{i}", f"/bench/{name}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+"""
+Benchmark de l'index de recherche embarqué (services/search_index.py)
+
+Catalogue synthétique (noms et descriptions FR/AR, catégories, prix,
+notes), puis:
+- construction de l'index et taille du snapshot JSON
+- rechargement depuis le snapshot
+- latence de recherche (p50 / p99) pour des requêtes exactes, préfixes,
+  avec faute de frappe, filtrées, et parcours sans requête
+
+Usage:
+    python benchmark_search_index.py --products 50000 --queries 300
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+WORDS = (
+    "tapis berbère laine tissé main babouches cuir fès lampe cuivre ciselée coussin brodé poterie safi "
+    "argan huile bio savon beldi caftan soie brodé théière argent plateau zellige bois thuya sac osier "
+    "djellaba coton écharpe pouf tajine terre cuite bracelet amazigh miroir henné parfum musc ambre "
+    "زيت أركان صابون بلدي قفطان زربية"
+).split()
+CATEGORIES = ["maison", "mode", "beaute", "artisanat", "cuisine", "bijoux", "decoration", "textile"]
+QUERIES = {
+    "exact": ["tapis laine", "huile argan", "théière argent", "sac osier", "زيت أركان"],
+    "prefix": ["tap", "babou", "théi", "djel", "zell"],
+    "typo": ["tapsi", "babouchse", "cuivr", "caftna", "poterei"],
+}
+
+
+def catalog(count: int, seed: int = 7):
+    rng = random.Random(seed)
+    # Vocabulaire de remplissage: chaque mot métier est dans ~5% des descriptions
+    filler = ["".join(rng.choices("abcdefghilmnoprstu", k=rng.randint(4, 9))) for _ in range(5000)]
+    for i in range(count):
+        yield {
+            "id": f"p-{i}",
+            "name": " ".join(rng.sample(WORDS, 2) + rng.sample(filler, 1)) + f" n°{i}",
+            "description": " ".join(rng.choices(WORDS, k=3) + rng.choices(filler, k=22)),
+            "category": rng.choice(CATEGORIES),
+            "price": round(rng.uniform(20, 5000), 2),
+            "rating": round(rng.uniform(1, 5), 1),
+            "merchant_id": f"m-{i % 300}",
+            "merchant_name": f"Boutique {i % 300}",
+            "sales_count": rng.randint(0, 500),
+            "created_at": f"2026-{1 + i % 12:02d}-{1 + i % 28:02d}T00:00:00",
+            "updated_at": f"2026-{1 + i % 12:02d}-{1 + i % 28:02d}T00:00:00",
+        }
+
+
+def latencies(index, calls):
+    timings = []
+    for kwargs in calls:
+        started = time.perf_counter()
+        index.search(**kwargs)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[max(0, int(len(timings) * 0.99) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=300)
+    args = parser.parse_args()
+
+    from services.search_index import EmbeddedSearchIndex, product_document
+
+    index = EmbeddedSearchIndex(snapshot_path=None)
+    started = time.perf_counter()
+    index.index_many(product_document(row) for row in catalog(args.products))
+    build_s = time.perf_counter() - started
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "search_index.json")
+        started = time.perf_counter()
+        index.save_snapshot(path)
+        save_s = time.perf_counter() - started
+        size_mb = os.path.getsize(path) / 1e6
+        started = time.perf_counter()
+        restored = EmbeddedSearchIndex.load_snapshot(path)
+        load_s = time.perf_counter() - started
+    assert len(restored) == len(index)
+
+    rng = random.Random(11)
+    scenarios = {
+        name: [{"query": rng.choice(queries)} for _ in range(args.queries)]
+        for name, queries in QUERIES.items()
+    }
+    scenarios["filtered"] = [
+        {"query": rng.choice(QUERIES["exact"]), "category": rng.choice(CATEGORIES),
+         "min_price": 100, "max_price": 2000, "min_rating": 3, "sort_by": "price_asc"}
+        for _ in range(args.queries)
+    ]
+    scenarios["browse_category"] = [
+        {"category": rng.choice(CATEGORIES), "sort_by": "popular"} for _ in range(args.queries // 10 or 1)
+    ]
+    latencies(index, scenarios["typo"][:1])  # Index des variantes construit à la première faute
+
+    print(f"{args.products} produits: construction {build_s:.1f}s, snapshot {save_s:.1f}s ({size_mb:.0f} Mo), "
+          f"rechargement {load_s:.1f}s, {index.get_stats()['terms']} termes")
+    print(f"{'scenario':<18}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, calls in scenarios.items():
+        p50, p99 = latencies(index, calls)
+        print(f"{name:<18}{p50:>10.2f}{p99:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,10 +4,16 @@ Simplifie les opérations CRUD
 """
 
 from supabase_client import supabase
+from services.stats_rollup_service import StatsRollupService
+from utils.identity import get_merchant_id, invalidate_identity
+from utils.product_visibility import only_public_products
+from services.subscription_entitlements import entitlement_service
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 import bcrypt
 
+stats_rollups = StatsRollupService(supabase)
+
 # ============================================
 # USERS
 # ============================================
@@ -131,6 +137,8 @@ def update_user(user_id: str, updates: Dict[str, Any]) -> bool:
 
         # Exécuter la mise à jour
         supabase.table("users").update(updates).eq("id", user_id).execute()
+        # Rôle / profil potentiellement changés: IDs de profil relus au prochain accès
+        invalidate_identity(user_id)
         return True
     except Exception as e:
         print(f"Error updating user: {e}")
@@ -279,16 +287,18 @@ def get_influencer_by_user_id(user_id: str) -> Optional[Dict]:
 def get_all_products(
     category: Optional[str] = None, merchant_id: Optional[str] = None
 ) -> List[Dict]:
-    """Récupère tous les produits avec filtres optionnels"""
+    """Récupère tous les produits visibles publiquement avec filtres optionnels"""
     try:
-        query = supabase.table("products").select(
-            """
+        query = only_public_products(
+            supabase.table("products").select(
+                """
             *,
             merchants:merchant_id (
                 id,
                 company_name
             )
         """
+            )
         )
 
         if category:
@@ -385,6 +395,8 @@ def create_affiliate_link(product_id: str, influencer_id: str, unique_code: str)
         }
 
         result = supabase.table("trackable_links").insert(link_data).execute()
+        if result.data:
+            entitlement_service.record_usage("links", 1, profile_id=influencer_id)
         return result.data[0] if result.data else None
     except Exception as e:
         print(f"Error creating affiliate link: {e}")
@@ -432,6 +444,8 @@ def create_campaign(merchant_id: str, name: str, **kwargs) -> Optional[Dict]:
         }
 
         result = supabase.table("campaigns").insert(campaign_data).execute()
+        if result.data:
+            entitlement_service.record_usage("campaigns", 1, profile_id=merchant_id)
         return result.data[0] if result.data else None
     except Exception as e:
         print(f"Error creating campaign: {e}")
@@ -447,7 +461,17 @@ def get_dashboard_stats(role: str, user_id: str) -> Dict:
     """Récupère les statistiques pour le dashboard selon le rôle"""
     try:
         if role == "admin":
-            # Stats admin
+            # Stats admin (rollup matérialisé, scan en repli)
+            totals = stats_rollups.get_platform_totals()
+            if totals:
+                return {
+                    "total_users": totals["users_count"],
+                    "total_merchants": totals["merchants_count"],
+                    "total_influencers": totals["influencers_count"],
+                    "total_products": totals["products_count"],
+                    "total_revenue": float(totals["completed_revenue"]),
+                }
+
             users_count = supabase.table("users").select("id", count="exact").execute().count
             merchants_count = (
                 supabase.table("merchants").select("id", count="exact").execute().count
@@ -471,14 +495,23 @@ def get_dashboard_stats(role: str, user_id: str) -> Dict:
 
         elif role == "merchant":
             # Stats merchant
-            merchant = get_merchant_by_user_id(user_id)
-            if not merchant:
+            merchant_id = get_merchant_id(user_id, supabase)
+            if not merchant_id:
                 return {}
 
+            totals = stats_rollups.get_merchant_totals(merchant_id)
+            if totals:
+                return {
+                    "total_sales": float(totals["completed_revenue"]),
+                    "products_count": totals["products_count"],
+                    "affiliates_count": 0,  # À implémenter
+                    "roi": 320.5,
+                }
+
             products_count = (
                 supabase.table("products")
                 .select("id", count="exact")
-                .eq("merchant_id", merchant["id"])
+                .eq("merchant_id", merchant_id)
                 .execute()
                 .count
             )
@@ -486,7 +519,7 @@ def get_dashboard_stats(role: str, user_id: str) -> Dict:
             sales = (
                 supabase.table("sales")
                 .select("amount")
-                .eq("merchant_id", merchant["id"])
+                .eq("merchant_id", merchant_id)
                 .eq("status", "completed")
                 .execute()
             )
@@ -2,10 +2,18 @@
 Helpers pour requêtes de base de données - Endpoints réels (non-mockés)
 Remplace toutes les données statiques par des requêtes Supabase réelles
 """
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Iterator
 from datetime import datetime, timedelta
 from supabase_client import get_supabase_client
 from utils.db_safe import safe_ilike
+from utils.product_visibility import is_publicly_visible, only_public_products
+from utils.identity import (
+    get_influencer_id, get_merchant_id, invalidate_identity, require_influencer_id, require_merchant_id
+)
+from services.subscription_entitlements import entitlement_service
+from utils.keyset_pagination import (
+    paginate_keyset, iter_keyset, decode_cursor, cached_count, PAGINATION_COUNT_MODE, EXPORT_PAGE_SIZE
+)
 
 # ============================================
 # ANALYTICS - INFLUENCER
@@ -82,17 +90,10 @@ async def get_influencer_earnings_chart(user_id: str, weeks: int = 4) -> List[Di
         supabase = get_supabase_client()
         
         # Récupérer l'influencer_id
-        influencer_response = supabase.table("influencers") \
-            .select("id") \
-            .eq("user_id", user_id) \
-            .single() \
-            .execute()
-        
-        if not influencer_response.data:
+        influencer_id = get_influencer_id(user_id, supabase)
+        if not influencer_id:
             return []
         
-        influencer_id = influencer_response.data["id"]
-        
         # Date de début (X semaines en arrière)
         start_date = datetime.now() - timedelta(weeks=weeks)
         
@@ -141,17 +142,10 @@ async def get_merchant_sales_chart(user_id: str, days: int = 7) -> List[Dict[str
         supabase = get_supabase_client()
         
         # Récupérer merchant_id
-        merchant_response = supabase.table("merchants") \
-            .select("id") \
-            .eq("user_id", user_id) \
-            .single() \
-            .execute()
-        
-        if not merchant_response.data:
+        merchant_id = get_merchant_id(user_id, supabase)
+        if not merchant_id:
             return []
         
-        merchant_id = merchant_response.data["id"]
-        
         # Date de début
         start_date = datetime.now() - timedelta(days=days-1)
         
@@ -209,17 +203,10 @@ async def get_user_affiliate_links(user_id: str) -> List[Dict[str, Any]]:
         supabase = get_supabase_client()
         
         # Récupérer influencer_id
-        influencer_response = supabase.table("influencers") \
-            .select("id") \
-            .eq("user_id", user_id) \
-            .single() \
-            .execute()
-        
-        if not influencer_response.data:
+        influencer_id = get_influencer_id(user_id, supabase)
+        if not influencer_id:
             return []
         
-        influencer_id = influencer_response.data["id"]
-        
         # Récupérer les liens avec les infos produits
         links_response = supabase.table("trackable_links") \
             .select("""
@@ -342,17 +329,10 @@ async def get_merchant_products(user_id: str) -> List[Dict[str, Any]]:
         supabase = get_supabase_client()
         
         # Récupérer merchant_id
-        merchant_response = supabase.table("merchants") \
-            .select("id") \
-            .eq("user_id", user_id) \
-            .single() \
-            .execute()
-        
-        if not merchant_response.data:
+        merchant_id = get_merchant_id(user_id, supabase)
+        if not merchant_id:
             return []
         
-        merchant_id = merchant_response.data["id"]
-        
         # Récupérer les produits
         products_response = supabase.table("products") \
             .select("*") \
@@ -399,17 +379,10 @@ async def get_user_payouts(user_id: str) -> List[Dict[str, Any]]:
         supabase = get_supabase_client()
         
         # Récupérer influencer_id
-        influencer_response = supabase.table("influencers") \
-            .select("id") \
-            .eq("user_id", user_id) \
-            .single() \
-            .execute()
-        
-        if not influencer_response.data:
+        influencer_id = get_influencer_id(user_id, supabase)
+        if not influencer_id:
             return []
         
-        influencer_id = influencer_response.data["id"]
-        
         # Récupérer les payouts (table à créer si elle n'existe pas)
         # Pour l'instant, on utilise les commissions avec status = "paid"
         payouts_response = supabase.table("commissions") \
@@ -449,17 +422,10 @@ async def get_user_campaigns(user_id: str) -> List[Dict[str, Any]]:
         supabase = get_supabase_client()
         
         # Récupérer merchant_id
-        merchant_response = supabase.table("merchants") \
-            .select("id") \
-            .eq("user_id", user_id) \
-            .single() \
-            .execute()
-        
-        if not merchant_response.data:
+        merchant_id = get_merchant_id(user_id, supabase)
+        if not merchant_id:
             return []
         
-        merchant_id = merchant_response.data["id"]
-        
         # Récupérer les campagnes
         campaigns_response = supabase.table("campaigns") \
             .select("*") \
@@ -515,13 +481,15 @@ async def create_affiliate_link(
         
         # Récupérer les infos du produit pour le commission_rate par défaut
         product_response = supabase.table("products") \
-            .select("commission_rate, name") \
+            .select("commission_rate, name, moderation_status") \
             .eq("id", product_id) \
             .single() \
             .execute()
         
         if not product_response.data:
             return {"success": False, "error": "Product not found"}
+        if not is_publicly_visible(product_response.data):
+            return {"success": False, "error": "Product not available for affiliation"}
         
         product = product_response.data
         final_commission_rate = commission_rate if commission_rate else product.get("commission_rate", 15.00)
@@ -548,6 +516,7 @@ async def create_affiliate_link(
             return {"success": False, "error": "Failed to create link"}
         
         created_link = link_response.data[0]
+        entitlement_service.record_usage("links", 1, profile_id=influencer_id)
         
         return {
             "success": True,
@@ -589,8 +558,8 @@ async def get_all_products(
     try:
         supabase = get_supabase_client()
         
-        # Base query
-        query = supabase.table("products").select("*")
+        # Base query (produits modérés uniquement)
+        query = only_public_products(supabase.table("products").select("*"))
         
         # Filtrer par catégorie
         if category:
@@ -622,7 +591,7 @@ async def get_all_products(
         products_response = query.execute()
         
         # Compter le total (sans pagination)
-        count_query = supabase.table("products").select("id", count="exact")
+        count_query = only_public_products(supabase.table("products").select("id", count="exact"))
         if category:
             count_query = count_query.eq("category", category)
         if min_price is not None:
@@ -805,6 +774,7 @@ async def create_product(merchant_id: str, product_data: Dict[str, Any]) -> Dict
             .execute()
         
         created_product = product_response.data[0]
+        entitlement_service.record_usage("products", 1, profile_id=merchant_id)
         
         return {
             "success": True,
@@ -907,97 +877,110 @@ async def get_merchant_performance(user_id: str) -> Dict[str, Any]:
 # SALES - GET ALL
 # ============================================
 
+def _format_sale(sale: Dict[str, Any]) -> Dict[str, Any]:
+    """Ligne de vente exposée par l'API et les exports"""
+    product_data = sale.get("products") or {}
+    link_data = sale.get("trackable_links") or {}
+
+    return {
+        "id": sale["id"],
+        "product_name": product_data.get("name", ""),
+        "tracking_code": link_data.get("unique_code", ""),
+        "amount": float(sale.get("amount", 0)),
+        "influencer_commission": float(sale.get("influencer_commission", 0)),
+        "platform_commission": float(sale.get("platform_commission", 0)),
+        "merchant_revenue": float(sale.get("merchant_revenue", 0)),
+        "status": sale.get("status", "pending"),
+        "payment_status": sale.get("payment_status", "pending"),
+        "sale_timestamp": sale.get("sale_timestamp"),
+        "created_at": sale.get("created_at")
+    }
+
+
 async def get_all_sales(
     user_id: str,
     user_role: str,
     status: str = None,
     limit: int = 50,
-    offset: int = 0
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    include_total: bool = True
 ) -> Dict[str, Any]:
     """
     Récupérer les ventes d'un utilisateur (merchant ou influencer)
+
+    Pagination par curseur sur (sale_timestamp, id): passer `next_cursor` /
+    `prev_cursor` de la page précédente. `offset` > 0 sans curseur reste
+    supporté pour les anciens clients. Le total est estimé et mis en cache.
+
+    Raises:
+        ValueError: curseur invalide
     """
+    if cursor:
+        decode_cursor(cursor, "sale_timestamp")
+
     try:
         supabase = get_supabase_client()
-        
-        query = supabase.table("sales").select("*, products(name), trackable_links(unique_code)")
-        
+        scope_column, scope_id = None, None
+
         # Filtrer selon le rôle
         if user_role == "merchant":
             # Récupérer le merchant_id
-            merchant_response = supabase.table("merchants") \
-                .select("id") \
-                .eq("user_id", user_id) \
-                .single() \
-                .execute()
-            merchant_id = merchant_response.data["id"]
-            query = query.eq("merchant_id", merchant_id)
-        
+            scope_column, scope_id = "merchant_id", require_merchant_id(user_id, supabase)
+
         elif user_role == "influencer":
             # Récupérer l'influencer_id
-            influencer_response = supabase.table("influencers") \
-                .select("id") \
-                .eq("user_id", user_id) \
-                .single() \
-                .execute()
-            influencer_id = influencer_response.data["id"]
-            query = query.eq("influencer_id", influencer_id)
-        
-        # Filtrer par statut
-        if status:
-            query = query.eq("status", status)
-        
+            scope_column, scope_id = "influencer_id", require_influencer_id(user_id, supabase)
+
+        def build(select: str, **kwargs):
+            query = supabase.table("sales").select(select, **kwargs)
+            if scope_column:
+                query = query.eq(scope_column, scope_id)
+            # Filtrer par statut
+            if status:
+                query = query.eq("status", status)
+            return query
+
+        query = build("*, products(name), trackable_links(unique_code)")
+
         # Pagination et tri
-        query = query.order("sale_timestamp", desc=True).range(offset, offset + limit - 1)
-        
-        sales_response = query.execute()
-        
+        if offset and not cursor:
+            rows = query.order("sale_timestamp", desc=True).range(offset, offset + limit - 1).execute().data
+            page = {"items": rows, "next_cursor": None, "prev_cursor": None, "has_more": len(rows) == limit}
+        else:
+            page = paginate_keyset(query, "sale_timestamp", limit, cursor=cursor)
+
         # Formater les ventes
-        sales = []
-        for sale in sales_response.data:
-            product_data = sale.get("products", {})
-            link_data = sale.get("trackable_links", {})
-            
-            sales.append({
-                "id": sale["id"],
-                "product_name": product_data.get("name", ""),
-                "tracking_code": link_data.get("unique_code", ""),
-                "amount": float(sale.get("amount", 0)),
-                "influencer_commission": float(sale.get("influencer_commission", 0)),
-                "platform_commission": float(sale.get("platform_commission", 0)),
-                "merchant_revenue": float(sale.get("merchant_revenue", 0)),
-                "status": sale.get("status", "pending"),
-                "payment_status": sale.get("payment_status", "pending"),
-                "sale_timestamp": sale.get("sale_timestamp"),
-                "created_at": sale.get("created_at")
-            })
-        
-        # Compter le total
-        count_query = supabase.table("sales").select("id", count="exact")
-        if user_role == "merchant":
-            count_query = count_query.eq("merchant_id", merchant_id)
-        elif user_role == "influencer":
-            count_query = count_query.eq("influencer_id", influencer_id)
-        if status:
-            count_query = count_query.eq("status", status)
-        
-        count_response = count_query.execute()
-        total = count_response.count if count_response.count else 0
-        
+        sales = [_format_sale(sale) for sale in page["items"]]
+
+        # Total estimé (mis en cache)
+        total = None
+        if include_total:
+            total = cached_count(
+                ("sales", scope_column, scope_id, status),
+                lambda: build("id", count=PAGINATION_COUNT_MODE)
+            )
+
         return {
             "sales": sales,
             "total": total,
             "limit": limit,
-            "offset": offset
+            "offset": offset,
+            "next_cursor": page["next_cursor"],
+            "prev_cursor": page["prev_cursor"],
+            "has_more": page["has_more"]
         }
-    
+
     except Exception as e:
         print(f"❌ Erreur get_all_sales: {str(e)}")
         return {
             "sales": [],
             "total": 0,
             "limit": limit,
-            "offset": offset
+            "offset": offset,
+            "next_cursor": None,
+            "prev_cursor": None,
+            "has_more": False
         }
 
 
@@ -1121,12 +1104,7 @@ async def get_conversion_funnel(user_id: str, user_role: str) -> Dict[str, Any]:
         
         if user_role == "merchant":
             # Récupérer le merchant_id
-            merchant_response = supabase.table("merchants") \
-                .select("id") \
-                .eq("user_id", user_id) \
-                .single() \
-                .execute()
-            merchant_id = merchant_response.data["id"]
+            merchant_id = require_merchant_id(user_id, supabase)
             
             # Stats des produits
             products_response = supabase.table("products") \
@@ -1190,102 +1168,196 @@ async def get_conversion_funnel(user_id: str, user_role: str) -> Dict[str, Any]:
 # COMMISSIONS - GET ALL
 # ============================================
 
+def _format_commission(comm: Dict[str, Any]) -> Dict[str, Any]:
+    """Ligne de commission exposée par l'API et les exports"""
+    sale_data = comm.get("sales", {})
+
+    return {
+        "id": comm["id"],
+        "sale_id": comm.get("sale_id"),
+        "amount": float(comm.get("amount", 0)),
+        "status": comm.get("status", "pending"),
+        "payment_method": comm.get("payment_method"),
+        "paid_at": comm.get("paid_at"),
+        "sale_amount": float(sale_data.get("amount", 0)) if sale_data else 0,
+        "sale_date": sale_data.get("sale_timestamp") if sale_data else None,
+        "created_at": comm.get("created_at")
+    }
+
+
 async def get_all_commissions(
     user_id: str,
     user_role: str,
     status: str = None,
     limit: int = 50,
-    offset: int = 0
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    include_total: bool = True
 ) -> Dict[str, Any]:
     """
     Récupérer les commissions d'un utilisateur
+
+    Pagination par curseur sur (created_at, id), voir get_all_sales.
+
+    Raises:
+        ValueError: curseur invalide
     """
+    if cursor:
+        decode_cursor(cursor, "created_at")
+
     try:
         supabase = get_supabase_client()
-        
+
         if user_role == "influencer":
             # Récupérer l'influencer_id
-            influencer_response = supabase.table("influencers") \
-                .select("id") \
-                .eq("user_id", user_id) \
-                .single() \
-                .execute()
-            influencer_id = influencer_response.data["id"]
-            
-            query = supabase.table("commissions") \
-                .select("*, sales(amount, sale_timestamp, status)") \
-                .eq("influencer_id", influencer_id)
-        
+            scope = ("influencer_id", require_influencer_id(user_id, supabase))
+            embed = "sales(amount, sale_timestamp, status)"
+
         elif user_role == "merchant":
             # Les merchants peuvent voir toutes les commissions liées à leurs produits
-            merchant_response = supabase.table("merchants") \
-                .select("id") \
-                .eq("user_id", user_id) \
-                .single() \
-                .execute()
-            merchant_id = merchant_response.data["id"]
-            
-            query = supabase.table("commissions") \
-                .select("*, sales!inner(merchant_id, amount, sale_timestamp, status)") \
-                .eq("sales.merchant_id", merchant_id)
-        
+            scope = ("sales.merchant_id", require_merchant_id(user_id, supabase))
+            embed = "sales!inner(merchant_id, amount, sale_timestamp, status)"
+
         else:
             # Admin voit tout
-            query = supabase.table("commissions").select("*, sales(amount, sale_timestamp, status)")
-        
-        # Filtrer par statut
-        if status:
-            query = query.eq("status", status)
-        
+            scope = None
+            embed = "sales(amount, sale_timestamp, status)"
+
+        def build(select: str, **kwargs):
+            query = supabase.table("commissions").select(select, **kwargs)
+            if scope:
+                query = query.eq(*scope)
+            # Filtrer par statut
+            if status:
+                query = query.eq("status", status)
+            return query
+
+        query = build(f"*, {embed}")
+
         # Pagination et tri
-        query = query.order("created_at", desc=True).range(offset, offset + limit - 1)
-        
-        commissions_response = query.execute()
-        
+        if offset and not cursor:
+            rows = query.order("created_at", desc=True).range(offset, offset + limit - 1).execute().data
+            page = {"items": rows, "next_cursor": None, "prev_cursor": None, "has_more": len(rows) == limit}
+        else:
+            page = paginate_keyset(query, "created_at", limit, cursor=cursor)
+
         # Formater les commissions
-        commissions = []
-        for comm in commissions_response.data:
-            sale_data = comm.get("sales", {})
-            
-            commissions.append({
-                "id": comm["id"],
-                "sale_id": comm.get("sale_id"),
-                "amount": float(comm.get("amount", 0)),
-                "status": comm.get("status", "pending"),
-                "payment_method": comm.get("payment_method"),
-                "paid_at": comm.get("paid_at"),
-                "sale_amount": float(sale_data.get("amount", 0)) if sale_data else 0,
-                "sale_date": sale_data.get("sale_timestamp") if sale_data else None,
-                "created_at": comm.get("created_at")
-            })
-        
-        # Compter le total
-        count_query = supabase.table("commissions").select("id", count="exact")
-        if user_role == "influencer":
-            count_query = count_query.eq("influencer_id", influencer_id)
-        if status:
-            count_query = count_query.eq("status", status)
-        
-        count_response = count_query.execute()
-        total = count_response.count if count_response.count else 0
-        
+        commissions = [_format_commission(comm) for comm in page["items"]]
+
+        # Total estimé (mis en cache), mêmes filtres que la page
+        total = None
+        if include_total:
+            count_select = "id, sales!inner(merchant_id)" if user_role == "merchant" else "id"
+            total = cached_count(
+                ("commissions", scope, status),
+                lambda: build(count_select, count=PAGINATION_COUNT_MODE)
+            )
+
         return {
             "commissions": commissions,
             "total": total,
             "limit": limit,
-            "offset": offset
+            "offset": offset,
+            "next_cursor": page["next_cursor"],
+            "prev_cursor": page["prev_cursor"],
+            "has_more": page["has_more"]
         }
-    
+
     except Exception as e:
         print(f"❌ Erreur get_all_commissions: {str(e)}")
         return {
             "commissions": [],
             "total": 0,
             "limit": limit,
-            "offset": offset
+            "offset": offset,
+            "next_cursor": None,
+            "prev_cursor": None,
+            "has_more": False
         }
 
 
+# ============================================
+# EXPORTS (STREAMING)
+# ============================================
+
+def iter_sales_for_export(
+    user_id: str,
+    user_role: str,
+    status: str = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    page_size: int = EXPORT_PAGE_SIZE
+) -> Iterator[Dict[str, Any]]:
+    """
+    Toutes les ventes d'un utilisateur, lues page par page (keyset)
+
+    Le périmètre est résolu immédiatement (IdentityNotFound avant le début
+    de la réponse); les lignes sont lues à la demande pendant le streaming.
+    Seul un admin exporte sans périmètre (PermissionError pour les autres rôles).
+    """
+    supabase = get_supabase_client()
+    scope = None
+    if user_role == "merchant":
+        scope = ("merchant_id", require_merchant_id(user_id, supabase))
+    elif user_role == "influencer":
+        scope = ("influencer_id", require_influencer_id(user_id, supabase))
+    elif user_role != "admin":
+        raise PermissionError(f"Export non autorisé pour le rôle {user_role}")
+
+    def build():
+        query = supabase.table("sales").select("*, products(name), trackable_links(unique_code)")
+        if scope:
+            query = query.eq(*scope)
+        if status:
+            query = query.eq("status", status)
+        if start_date:
+            query = query.gte("sale_timestamp", start_date)
+        if end_date:
+            query = query.lte("sale_timestamp", end_date)
+        return query
+
+    return (_format_sale(sale) for sale in iter_keyset(build, "sale_timestamp", page_size))
+
+
+def iter_commissions_for_export(
+    user_id: str,
+    user_role: str,
+    status: str = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    page_size: int = EXPORT_PAGE_SIZE
+) -> Iterator[Dict[str, Any]]:
+    """
+    Toutes les commissions d'un utilisateur, lues page par page (keyset)
+
+    Voir iter_sales_for_export.
+    """
+    supabase = get_supabase_client()
+    scope = None
+    embed = "sales(amount, sale_timestamp, status)"
+    if user_role == "influencer":
+        scope = ("influencer_id", require_influencer_id(user_id, supabase))
+    elif user_role == "merchant":
+        scope = ("sales.merchant_id", require_merchant_id(user_id, supabase))
+        embed = "sales!inner(merchant_id, amount, sale_timestamp, status)"
+    elif user_role != "admin":
+        raise PermissionError(f"Export non autorisé pour le rôle {user_role}")
+
+    def build():
+        query = supabase.table("commissions").select(f"*, {embed}")
+        if scope:
+            query = query.eq(*scope)
+        if status:
+            query = query.eq("status", status)
+        if start_date:
+            query = query.gte("created_at", start_date)
+        if end_date:
+            query = query.lte("created_at", end_date)
+        return query
+
+    return (_format_commission(comm) for comm in iter_keyset(build, "created_at", page_size))
+
+
 # ============================================
 # PAYOUTS - REQUEST NEW
 # ============================================
@@ -1412,12 +1484,7 @@ async def update_sale_status(
         
         # Si merchant, vérifier qu'il possède cette vente
         if user_role == "merchant":
-            merchant_response = supabase.table("merchants") \
-                .select("id") \
-                .eq("user_id", user_id) \
-                .single() \
-                .execute()
-            merchant_id = merchant_response.data["id"]
+            merchant_id = require_merchant_id(user_id, supabase)
             
             if sale_response.data.get("merchant_id") != merchant_id:
                 return {
@@ -1774,6 +1841,7 @@ async def update_user_profile(user_id: str, profile_data: Dict[str, Any]) -> Dic
                 .update(user_updates) \
                 .eq("id", user_id) \
                 .execute()
+            invalidate_identity(user_id)
         
         # Récupérer le rôle pour savoir quelle table mettre à jour
         user_response = supabase.table("users") \
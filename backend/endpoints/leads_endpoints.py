@@ -33,6 +33,10 @@ class CreateLeadRequest(BaseModel):
     product_id: Optional[str] = None
 
 
+class CreateLeadsBatchRequest(BaseModel):
+    leads: List[CreateLeadRequest] = Field(..., min_length=1, max_length=500)
+
+
 class ValidateLeadRequest(BaseModel):
     status: str = Field(..., description="validated, rejected, converted, lost")
     quality_score: Optional[int] = Field(None, ge=1, le=10)
@@ -148,6 +152,85 @@ async def create_lead(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/batch")
+async def create_leads_batch(
+    request: CreateLeadsBatchRequest,
+    current_user: dict = Depends(verify_token)
+):
+    """
+    Créer plusieurs leads en un appel (import, pic de trafic)
+    Les montants sont réservés en une seule opération sur les dépôts.
+    Accessible: influenceurs, commerciaux
+    """
+    try:
+        supabase = get_supabase_client()
+        lead_service = LeadService(supabase)
+        
+        user_id = current_user.get("user_id")
+        role = current_user.get("role")
+        
+        influencer_id = None
+        commercial_id = None
+        
+        if role == 'influencer':
+            influencer = supabase.table('influencers').select('id').eq('user_id', user_id).single().execute()
+            if influencer.data:
+                influencer_id = influencer.data['id']
+        elif role == 'commercial' or role == 'admin':
+            commercial_id = user_id
+        else:
+            raise HTTPException(status_code=403, detail="Rôle non autorisé")
+        
+        # merchant_id de toutes les campagnes en une requête
+        campaign_ids = list({item.campaign_id for item in request.leads})
+        campaigns = supabase.table('campaigns').select('id, merchant_id').in_('id', campaign_ids).execute()
+        merchants_by_campaign = {c['id']: c['merchant_id'] for c in (campaigns.data or [])}
+        
+        leads = []
+        positions = []  # index dans la requête de chaque lead transmis
+        failed = []
+        for index, item in enumerate(request.leads):
+            merchant_id = merchants_by_campaign.get(item.campaign_id)
+            if not merchant_id:
+                failed.append({'index': index, 'error': "Campagne non trouvée"})
+                continue
+            positions.append(index)
+            leads.append({
+                'campaign_id': item.campaign_id,
+                'merchant_id': merchant_id,
+                'influencer_id': influencer_id or item.influencer_id,
+                'commercial_id': commercial_id or item.commercial_id,
+                'estimated_value': Decimal(str(item.estimated_value)),
+                'customer_data': {
+                    'customer_name': item.customer_name,
+                    'customer_email': item.customer_email,
+                    'customer_phone': item.customer_phone,
+                    'customer_company': item.customer_company,
+                    'customer_notes': item.customer_notes,
+                    'product_id': item.product_id
+                },
+                'source': item.source
+            })
+        
+        result = lead_service.create_leads_batch(leads) if leads else {'created': [], 'failed': []}
+        
+        # Ramener les index d'échec sur la requête d'origine
+        failed += [{**f, 'index': positions[f['index']]} for f in result['failed']]
+        
+        return {
+            "success": True,
+            "leads": result['created'],
+            "failed": sorted(failed, key=lambda f: f['index']),
+            "message": f"{len(result['created'])} lead(s) créé(s)"
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Erreur create_leads_batch: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/{lead_id}")
 async def get_lead(
     lead_id: str,
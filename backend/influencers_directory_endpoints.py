@@ -19,6 +19,7 @@ from supabase import create_client, Client
 import os
 from auth import get_current_user
 from utils.db_safe import safe_ilike
+from utils.keyset_pagination import paginate_keyset
 
 router = APIRouter(prefix="/api/influencers", tags=["Influencers Directory"])
 
@@ -38,6 +39,10 @@ if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
+# Colonnes triables de l'annuaire: sort_by est injecté dans le filtre
+# PostgREST du curseur, il ne doit jamais venir tel quel du client.
+INFLUENCER_SORT_FIELDS = ("total_followers", "average_engagement_rate", "created_at", "view_count")
+
 # ============================================
 # PYDANTIC MODELS
 # ============================================
@@ -411,7 +416,8 @@ async def search_influencers(
     sort_by: str = Query("total_followers", description="Sort field"),
     sort_order: str = Query("desc", description="Sort order: asc or desc"),
     limit: int = Query(20, ge=1, le=100),
-    offset: int = Query(0, ge=0)
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="next_cursor / prev_cursor de la page précédente")
 ):
     """
     Rechercher dans l'annuaire des influenceurs
@@ -433,6 +439,11 @@ async def search_influencers(
     - sort_by: total_followers, average_engagement_rate, created_at, view_count
     - sort_order: asc, desc
     """
+    if sort_by not in INFLUENCER_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Tri non supporté: {sort_by}")
+    if sort_order.lower() not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="sort_order doit être asc ou desc")
+
     try:
         query = supabase.from_("v_influencer_profiles_public").select("*")
 
@@ -483,22 +494,27 @@ async def search_influencers(
         # Toujours filtrer par disponibilité et visibilité
         query = query.eq("is_available", True)
 
-        # Tri
+        # Tri + pagination (curseur sur (sort_by, id); offset pour les anciens clients)
         desc = (sort_order.lower() == "desc")
-        query = query.order(sort_by, desc=desc)
-
-        # Pagination
-        query = query.range(offset, offset + limit - 1)
-
-        response = query.execute()
+        if offset and not cursor:
+            response = query.order(sort_by, desc=desc).range(offset, offset + limit - 1).execute()
+            page = {"items": response.data, "next_cursor": None, "prev_cursor": None,
+                    "has_more": len(response.data) == limit}
+        else:
+            page = paginate_keyset(query, sort_by, limit, cursor=cursor, desc=desc)
 
         return {
-            "influencers": response.data,
-            "count": len(response.data),
+            "influencers": page["items"],
+            "count": len(page["items"]),
             "limit": limit,
-            "offset": offset
+            "offset": offset,
+            "next_cursor": page["next_cursor"],
+            "prev_cursor": page["prev_cursor"],
+            "has_more": page["has_more"]
         }
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -766,24 +782,34 @@ async def create_review(
 async def get_influencer_reviews(
     user_id: str,
     limit: int = Query(10, ge=1, le=50),
-    offset: int = Query(0, ge=0)
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="next_cursor / prev_cursor de la page précédente")
 ):
     """Récupérer les avis d'un influenceur"""
     try:
-        response = supabase.from_("profile_reviews") \
+        query = supabase.from_("profile_reviews") \
             .select("*, reviewer:reviewer_id(first_name, last_name, profile_picture)") \
             .eq("profile_user_id", user_id) \
             .eq("profile_type", "influencer") \
-            .eq("is_public", True) \
-            .order("created_at", desc=True) \
-            .range(offset, offset + limit - 1) \
-            .execute()
+            .eq("is_public", True)
+
+        if offset and not cursor:
+            response = query.order("created_at", desc=True).range(offset, offset + limit - 1).execute()
+            page = {"items": response.data, "next_cursor": None, "prev_cursor": None,
+                    "has_more": len(response.data) == limit}
+        else:
+            page = paginate_keyset(query, "created_at", limit, cursor=cursor)
 
         return {
-            "reviews": response.data,
-            "count": len(response.data)
+            "reviews": page["items"],
+            "count": len(page["items"]),
+            "next_cursor": page["next_cursor"],
+            "prev_cursor": page["prev_cursor"],
+            "has_more": page["has_more"]
         }
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -10,6 +10,8 @@ from functools import wraps
 from fastapi import HTTPException, Security, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
+from utils.identity import remember_identity
+
 
 # Configuration JWT avec validation stricte
 SECRET_KEY = os.getenv("JWT_SECRET_KEY") or os.getenv("JWT_SECRET")
@@ -57,6 +59,7 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Security(security))
                 detail="Token invalide: user_id manquant"
             )
         
+        remember_identity(payload)
         return payload
         
     except jwt.ExpiredSignatureError:
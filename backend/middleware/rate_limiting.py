@@ -9,22 +9,37 @@ Features:
 - Customizable limits par endpoint/user
 - Automatic cleanup
 - Headers informatifs (X-RateLimit-*)
+
+Deux moteurs, sélectionnables par endpoint (voir get_endpoint_limits):
+- "sliding_log": sorted set Redis par clé, client synchrone (historique)
+- "lua": compteur à fenêtre glissante dans un script Lua atomique,
+  client Redis async et pré-contrôle local par token bucket
 """
 
+import math
 import redis
+import redis.asyncio as aioredis
 import time
 from fastapi import Request, HTTPException, status
 from fastapi.responses import JSONResponse
-from typing import Callable, Optional
+from typing import Callable, Dict, Optional
 import structlog
 import os
 from functools import wraps
 
+from utils.local_cache import LocalTTLCache
+
 logger = structlog.get_logger()
 
 # Configuration Redis
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+async_redis_client = aioredis.from_url(REDIS_URL, decode_responses=True)
+
+# Moteur par défaut ("sliding_log" ou "lua")
+RATE_LIMIT_ENGINE = os.getenv("RATE_LIMIT_ENGINE", "sliding_log")
+# Nombre max de token buckets locaux par worker
+RATE_LIMIT_LOCAL_BUCKETS = int(os.getenv("RATE_LIMIT_LOCAL_BUCKETS", "50000"))
 
 
 class RateLimitExceeded(HTTPException):
@@ -131,8 +146,180 @@ class RateLimiter:
         self.redis.delete(key)
 
 
-# Instance globale
+# ============================================
+# MOTEUR LUA (fenêtre glissante, async)
+# ============================================
+
+# Compteur à fenêtre glissante: deux compteurs de fenêtre fixe, le précédent
+# pondéré par la part de fenêtre encore couverte. Deux clés de taille
+# constante par identifiant au lieu d'un sorted set de `limit` membres.
+#
+# KEYS[1]: compteur fenêtre courante, KEYS[2]: compteur fenêtre précédente
+# ARGV: limit, window (s), elapsed (s écoulées dans la fenêtre courante)
+# Retour: {allowed, remaining, retry_after_ms}
+SLIDING_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local elapsed = tonumber(ARGV[3])
+
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+local weight = 1 - elapsed / window
+local estimated = previous * weight + current
+
+if estimated + 1 > limit then
+  local retry
+  if current + 1 > limit then
+    retry = (window - elapsed) + window * math.max(0, 1 - (limit - 1) / current)
+  else
+    retry = window * (1 - (limit - 1 - current) / previous) - elapsed
+  end
+  return {0, 0, math.ceil(retry * 1000)}
+end
+
+current = redis.call('INCR', KEYS[1])
+if current == 1 then
+  redis.call('PEXPIRE', KEYS[1], window * 2000)
+end
+return {1, math.floor(limit - estimated - 1), 0}
+"""
+
+
+class LocalTokenBucket:
+    """
+    Token bucket en mémoire (par worker)
+
+    Capacité `limit`, recharge `limit / window` jetons par seconde. Un worker
+    qui vide son bucket a dépassé à lui seul la limite globale: la requête
+    est refusée sans aller-retour Redis.
+    """
+
+    def __init__(self, maxsize: int = RATE_LIMIT_LOCAL_BUCKETS, timer: Callable[[], float] = time.monotonic):
+        self._buckets = LocalTTLCache(maxsize=maxsize, ttl=3600, timer=timer)
+        self._timer = timer
+
+    def try_acquire(self, key: str, limit: int, window: int) -> float:
+        """
+        Consomme un jeton
+
+        Returns:
+            0 si autorisé, sinon le délai (secondes) avant le prochain jeton
+        """
+        now = self._timer()
+        rate = limit / window
+        bucket = self._buckets.get(key, count=False)
+        if bucket is None:
+            bucket = [float(limit), now]
+            self._buckets.set(key, bucket, ttl=window * 2)
+
+        tokens = min(limit, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            return (1 - tokens) / rate
+
+        bucket[0] = tokens - 1
+        return 0
+
+    def reset(self, key: str) -> None:
+        self._buckets.delete(key)
+
+
+class LuaRateLimiter:
+    """
+    Rate limiter à fenêtre glissante en un seul script Lua atomique
+
+    Même interface que RateLimiter. Les clés portent un hash tag
+    ({endpoint:identifier}) pour que les deux compteurs tombent sur le même
+    shard en Redis Cluster.
+    """
+
+    def __init__(
+        self,
+        key_prefix: str = "ratelimit:sw",
+        default_limit: int = 100,
+        default_window: int = 60,
+        client=None,
+        local_precheck: bool = True
+    ):
+        self.redis = client if client is not None else async_redis_client
+        self.key_prefix = key_prefix
+        self.default_limit = default_limit
+        self.default_window = default_window
+        self.local = LocalTokenBucket() if local_precheck else None
+        self._script = self.redis.register_script(SLIDING_WINDOW_SCRIPT)
+        self.stats = {"local_rejections": 0, "redis_calls": 0, "redis_errors": 0}
+
+    def get_rate_limit_key(self, identifier: str, endpoint: str) -> str:
+        """Préfixe des clés Redis (hash tag pour le sharding)"""
+        return f"{self.key_prefix}:{{{endpoint}:{identifier}}}"
+
+    async def check_rate_limit(
+        self,
+        identifier: str,
+        endpoint: str,
+        limit: Optional[int] = None,
+        window: Optional[int] = None
+    ) -> tuple[bool, int, int]:
+        """
+        Vérifier rate limit (pré-contrôle local puis script Lua)
+
+        Returns:
+            (allowed, remaining, retry_after)
+        """
+        limit = limit or self.default_limit
+        window = window or self.default_window
+        base_key = self.get_rate_limit_key(identifier, endpoint)
+
+        if self.local is not None:
+            wait = self.local.try_acquire(base_key, limit, window)
+            if wait:
+                self.stats["local_rejections"] += 1
+                return False, 0, max(1, math.ceil(wait))
+
+        now = time.time()
+        window_index = int(now // window)
+        elapsed = now - window_index * window
+
+        try:
+            self.stats["redis_calls"] += 1
+            allowed, remaining, retry_after_ms = await self._script(
+                keys=[f"{base_key}:{window_index}", f"{base_key}:{window_index - 1}"],
+                args=[limit, window, elapsed]
+            )
+        except redis.RedisError as e:
+            self.stats["redis_errors"] += 1
+            logger.error("rate_limit_redis_error", error=str(e), engine="lua")
+            # En cas d'erreur Redis, permettre la requête (fail open)
+            return True, limit, 0
+
+        if not allowed:
+            return False, 0, max(1, math.ceil(int(retry_after_ms) / 1000))
+        return True, max(int(remaining), 0), 0
+
+    async def reset_limit(self, identifier: str, endpoint: str):
+        """Reset rate limit pour un identifiant (utile pour tests/admin)"""
+        base_key = self.get_rate_limit_key(identifier, endpoint)
+        if self.local is not None:
+            self.local.reset(base_key)
+        keys = [key async for key in self.redis.scan_iter(match=f"{base_key}:*")]
+        if keys:
+            await self.redis.delete(*keys)
+
+
+# Instances globales
 rate_limiter = RateLimiter()
+lua_rate_limiter = LuaRateLimiter()
+
+RATE_LIMIT_ENGINES: Dict[str, object] = {
+    "sliding_log": rate_limiter,
+    "lua": lua_rate_limiter,
+}
+
+
+def get_rate_limiter(engine: Optional[str] = None):
+    """Moteur de rate limiting par nom (défaut: RATE_LIMIT_ENGINE)"""
+    return RATE_LIMIT_ENGINES.get(engine or RATE_LIMIT_ENGINE, rate_limiter)
 
 
 # ============================================
@@ -161,7 +348,8 @@ async def rate_limit_middleware(request: Request, call_next: Callable):
     limits = get_endpoint_limits(endpoint)
 
     # Vérifier rate limit
-    allowed, remaining, retry_after = await rate_limiter.check_rate_limit(
+    limiter = get_rate_limiter(limits.get("engine"))
+    allowed, remaining, retry_after = await limiter.check_rate_limit(
         identifier=identifier,
         endpoint=endpoint,
         limit=limits["limit"],
@@ -207,6 +395,7 @@ def get_endpoint_limits(endpoint: str) -> dict:
     Récupérer les limites spécifiques à un endpoint
 
     Endpoints critiques = limites plus strictes
+    Clé optionnelle "engine": moteur à utiliser ("sliding_log" ou "lua")
     """
     # Limites par défaut
     default = {"limit": 100, "window": 60}  # 100 req/min
@@ -227,8 +416,8 @@ def get_endpoint_limits(endpoint: str) -> dict:
         "/api/influencers": {"limit": 300, "window": 60},
 
         # Webhooks - très généreux (vient de Stripe/etc)
-        "/api/stripe/webhook": {"limit": 1000, "window": 60},
-        "/api/social-media/webhooks": {"limit": 1000, "window": 60},
+        "/api/stripe/webhook": {"limit": 1000, "window": 60, "engine": "lua"},
+        "/api/social-media/webhooks": {"limit": 1000, "window": 60, "engine": "lua"},
 
         # Bot IA - modéré
         "/api/bot/chat": {"limit": 30, "window": 60},  # 30 msg/min
@@ -241,13 +430,13 @@ def get_endpoint_limits(endpoint: str) -> dict:
 # DECORATEUR POUR ENDPOINTS SPÉCIFIQUES
 # ============================================
 
-def rate_limit(limit: int, window: int):
+def rate_limit(limit: int, window: int, engine: Optional[str] = None):
     """
     Décorateur pour appliquer rate limit sur endpoint spécifique
 
     Usage:
         @router.post("/api/sensitive")
-        @rate_limit(limit=5, window=60)
+        @rate_limit(limit=5, window=60, engine="lua")
         async def sensitive_endpoint():
             ...
     """
@@ -262,7 +451,7 @@ def rate_limit(limit: int, window: int):
             endpoint = request.url.path
 
             # Vérifier rate limit
-            allowed, remaining, retry_after = await rate_limiter.check_rate_limit(
+            allowed, remaining, retry_after = await get_rate_limiter(engine).check_rate_limit(
                 identifier=identifier,
                 endpoint=endpoint,
                 limit=limit,
@@ -0,0 +1,31 @@
+-- Migration pour l'ingestion bufferisée des clics de tracking
+-- Date: 2026-10-16
+
+-- ============================================
+-- FONCTION: Incrément agrégé des compteurs de clics
+-- ============================================
+-- p_increments: [{"link_id": "uuid", "clicks": 3, "last_click_at": "iso"}]
+-- Un seul UPDATE atomique (clicks = clicks + n) par flush, sans lecture préalable.
+
+CREATE OR REPLACE FUNCTION increment_tracking_link_clicks(p_increments JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+  v_updated INTEGER;
+BEGIN
+  UPDATE tracking_links t
+  SET clicks = COALESCE(t.clicks, 0) + x.clicks,
+      last_click_at = GREATEST(COALESCE(t.last_click_at, x.last_click_at), x.last_click_at)
+  FROM jsonb_to_recordset(p_increments) AS x(link_id UUID, clicks INTEGER, last_click_at TIMESTAMP WITH TIME ZONE)
+  WHERE t.id = x.link_id;
+
+  GET DIAGNOSTICS v_updated = ROW_COUNT;
+  RETURN v_updated;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================
+-- INDEX
+-- ============================================
+
+CREATE INDEX IF NOT EXISTS idx_tracking_links_short_code ON tracking_links(short_code);
+CREATE INDEX IF NOT EXISTS idx_click_logs_link_id ON click_logs(link_id, clicked_at DESC);
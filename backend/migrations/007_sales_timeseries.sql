@@ -0,0 +1,49 @@
+-- Migration pour les graphiques des dashboards (séries temporelles des ventes)
+-- Date: 2026-10-16
+
+-- ============================================
+-- FONCTION: Ventes agrégées par jour/semaine/mois
+-- ============================================
+-- Remplace une requête par jour par une seule requête groupée sur la fenêtre.
+
+CREATE OR REPLACE FUNCTION get_sales_timeseries(
+  p_start TIMESTAMP WITH TIME ZONE,
+  p_end TIMESTAMP WITH TIME ZONE,
+  p_granularity TEXT DEFAULT 'day',
+  p_merchant_id UUID DEFAULT NULL,
+  p_affiliate_id UUID DEFAULT NULL
+)
+RETURNS TABLE(
+  bucket DATE,
+  sales_count BIGINT,
+  amount_total NUMERIC,
+  commission_total NUMERIC
+) AS $$
+BEGIN
+  IF p_granularity NOT IN ('day', 'week', 'month') THEN
+    RAISE EXCEPTION 'Granularité % non supportée', p_granularity;
+  END IF;
+
+  RETURN QUERY
+  SELECT
+    date_trunc(p_granularity, s.created_at)::DATE AS bucket,
+    COUNT(*) AS sales_count,
+    COALESCE(SUM(s.amount), 0) AS amount_total,
+    COALESCE(SUM(s.commission), 0) AS commission_total
+  FROM sales s
+  WHERE s.created_at >= p_start
+    AND s.created_at < p_end
+    AND (p_merchant_id IS NULL OR s.merchant_id = p_merchant_id)
+    AND (p_affiliate_id IS NULL OR s.affiliate_id = p_affiliate_id)
+  GROUP BY 1
+  ORDER BY 1;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- ============================================
+-- INDEX
+-- ============================================
+
+CREATE INDEX IF NOT EXISTS idx_sales_created_at ON sales(created_at);
+CREATE INDEX IF NOT EXISTS idx_sales_merchant_created_at ON sales(merchant_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_sales_affiliate_created_at ON sales(affiliate_id, created_at);
@@ -0,0 +1,246 @@
+-- Migration pour les compteurs matérialisés du dashboard
+-- Date: 2026-10-16
+
+-- ============================================
+-- TABLE: Totaux agrégés (plateforme / marchand / influenceur)
+-- ============================================
+-- Mis à jour incrémentalement par triggers, réconcilié périodiquement
+-- par reconcile_stats_rollups(). Le dashboard lit une ligne au lieu de
+-- compter les tables et de sommer toutes les ventes.
+
+CREATE TABLE IF NOT EXISTS stats_rollups (
+  scope TEXT NOT NULL CHECK (scope IN ('platform', 'merchant', 'influencer')),
+  scope_id UUID NOT NULL DEFAULT '00000000-0000-0000-0000-000000000000',
+
+  users_count BIGINT NOT NULL DEFAULT 0,
+  merchants_count BIGINT NOT NULL DEFAULT 0,
+  influencers_count BIGINT NOT NULL DEFAULT 0,
+  products_count BIGINT NOT NULL DEFAULT 0,
+  completed_sales_count BIGINT NOT NULL DEFAULT 0,
+  completed_revenue NUMERIC(14, 2) NOT NULL DEFAULT 0,
+
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  reconciled_at TIMESTAMP WITH TIME ZONE,
+
+  PRIMARY KEY (scope, scope_id)
+);
+
+-- ============================================
+-- FONCTION: Incrément atomique d'une ligne de rollup
+-- ============================================
+
+CREATE OR REPLACE FUNCTION bump_stats_rollup(
+  p_scope TEXT,
+  p_scope_id UUID,
+  p_users BIGINT DEFAULT 0,
+  p_merchants BIGINT DEFAULT 0,
+  p_influencers BIGINT DEFAULT 0,
+  p_products BIGINT DEFAULT 0,
+  p_sales BIGINT DEFAULT 0,
+  p_revenue NUMERIC DEFAULT 0
+)
+RETURNS VOID AS $$
+BEGIN
+  IF p_scope_id IS NULL THEN
+    RETURN;
+  END IF;
+
+  INSERT INTO stats_rollups AS r (
+    scope, scope_id, users_count, merchants_count, influencers_count,
+    products_count, completed_sales_count, completed_revenue
+  )
+  VALUES (p_scope, p_scope_id, p_users, p_merchants, p_influencers, p_products, p_sales, p_revenue)
+  ON CONFLICT (scope, scope_id) DO UPDATE SET
+    users_count = r.users_count + EXCLUDED.users_count,
+    merchants_count = r.merchants_count + EXCLUDED.merchants_count,
+    influencers_count = r.influencers_count + EXCLUDED.influencers_count,
+    products_count = r.products_count + EXCLUDED.products_count,
+    completed_sales_count = r.completed_sales_count + EXCLUDED.completed_sales_count,
+    completed_revenue = r.completed_revenue + EXCLUDED.completed_revenue,
+    updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================
+-- TRIGGER: Ventes (changement de statut / montant)
+-- ============================================
+
+CREATE OR REPLACE FUNCTION stats_rollup_on_sales()
+RETURNS TRIGGER AS $$
+DECLARE
+  v_platform UUID := '00000000-0000-0000-0000-000000000000';
+BEGIN
+  -- Retirer l'ancienne contribution
+  IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status = 'completed' THEN
+    PERFORM bump_stats_rollup('platform', v_platform, p_sales => -1, p_revenue => -COALESCE(OLD.amount, 0));
+    PERFORM bump_stats_rollup('merchant', OLD.merchant_id, p_sales => -1, p_revenue => -COALESCE(OLD.amount, 0));
+    PERFORM bump_stats_rollup('influencer', OLD.influencer_id, p_sales => -1, p_revenue => -COALESCE(OLD.amount, 0));
+  END IF;
+
+  -- Ajouter la nouvelle contribution
+  IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status = 'completed' THEN
+    PERFORM bump_stats_rollup('platform', v_platform, p_sales => 1, p_revenue => COALESCE(NEW.amount, 0));
+    PERFORM bump_stats_rollup('merchant', NEW.merchant_id, p_sales => 1, p_revenue => COALESCE(NEW.amount, 0));
+    PERFORM bump_stats_rollup('influencer', NEW.influencer_id, p_sales => 1, p_revenue => COALESCE(NEW.amount, 0));
+  END IF;
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_stats_rollup_sales ON sales;
+CREATE TRIGGER trg_stats_rollup_sales
+  AFTER INSERT OR DELETE OR UPDATE OF status, amount, merchant_id, influencer_id ON sales
+  FOR EACH ROW EXECUTE FUNCTION stats_rollup_on_sales();
+
+-- ============================================
+-- TRIGGER: Produits
+-- ============================================
+
+CREATE OR REPLACE FUNCTION stats_rollup_on_products()
+RETURNS TRIGGER AS $$
+DECLARE
+  v_platform UUID := '00000000-0000-0000-0000-000000000000';
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    IF TG_OP = 'DELETE' THEN
+      PERFORM bump_stats_rollup('platform', v_platform, p_products => -1);
+    END IF;
+    PERFORM bump_stats_rollup('merchant', OLD.merchant_id, p_products => -1);
+  END IF;
+
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    IF TG_OP = 'INSERT' THEN
+      PERFORM bump_stats_rollup('platform', v_platform, p_products => 1);
+    END IF;
+    PERFORM bump_stats_rollup('merchant', NEW.merchant_id, p_products => 1);
+  END IF;
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_stats_rollup_products ON products;
+CREATE TRIGGER trg_stats_rollup_products
+  AFTER INSERT OR DELETE OR UPDATE OF merchant_id ON products
+  FOR EACH ROW EXECUTE FUNCTION stats_rollup_on_products();
+
+-- ============================================
+-- TRIGGER: Comptes (users / merchants / influencers)
+-- ============================================
+
+CREATE OR REPLACE FUNCTION stats_rollup_on_accounts()
+RETURNS TRIGGER AS $$
+DECLARE
+  v_platform UUID := '00000000-0000-0000-0000-000000000000';
+  v_delta BIGINT := CASE WHEN TG_OP = 'INSERT' THEN 1 ELSE -1 END;
+BEGIN
+  IF TG_TABLE_NAME = 'users' THEN
+    PERFORM bump_stats_rollup('platform', v_platform, p_users => v_delta);
+  ELSIF TG_TABLE_NAME = 'merchants' THEN
+    PERFORM bump_stats_rollup('platform', v_platform, p_merchants => v_delta);
+  ELSIF TG_TABLE_NAME = 'influencers' THEN
+    PERFORM bump_stats_rollup('platform', v_platform, p_influencers => v_delta);
+  END IF;
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_stats_rollup_users ON users;
+CREATE TRIGGER trg_stats_rollup_users
+  AFTER INSERT OR DELETE ON users
+  FOR EACH ROW EXECUTE FUNCTION stats_rollup_on_accounts();
+
+DROP TRIGGER IF EXISTS trg_stats_rollup_merchants ON merchants;
+CREATE TRIGGER trg_stats_rollup_merchants
+  AFTER INSERT OR DELETE ON merchants
+  FOR EACH ROW EXECUTE FUNCTION stats_rollup_on_accounts();
+
+DROP TRIGGER IF EXISTS trg_stats_rollup_influencers ON influencers;
+CREATE TRIGGER trg_stats_rollup_influencers
+  AFTER INSERT OR DELETE ON influencers
+  FOR EACH ROW EXECUTE FUNCTION stats_rollup_on_accounts();
+
+-- ============================================
+-- FONCTION: Réconciliation complète
+-- ============================================
+-- Recalcule les totaux depuis les tables sources et corrige toute dérive.
+
+CREATE OR REPLACE FUNCTION reconcile_stats_rollups()
+RETURNS INTEGER AS $$
+DECLARE
+  v_platform UUID := '00000000-0000-0000-0000-000000000000';
+  v_rows INTEGER;
+BEGIN
+  -- Plateforme
+  INSERT INTO stats_rollups AS r (
+    scope, scope_id, users_count, merchants_count, influencers_count,
+    products_count, completed_sales_count, completed_revenue, updated_at, reconciled_at
+  )
+  SELECT
+    'platform', v_platform,
+    (SELECT COUNT(*) FROM users),
+    (SELECT COUNT(*) FROM merchants),
+    (SELECT COUNT(*) FROM influencers),
+    (SELECT COUNT(*) FROM products),
+    COUNT(*),
+    COALESCE(SUM(amount), 0),
+    NOW(), NOW()
+  FROM sales
+  WHERE status = 'completed'
+  ON CONFLICT (scope, scope_id) DO UPDATE SET
+    users_count = EXCLUDED.users_count,
+    merchants_count = EXCLUDED.merchants_count,
+    influencers_count = EXCLUDED.influencers_count,
+    products_count = EXCLUDED.products_count,
+    completed_sales_count = EXCLUDED.completed_sales_count,
+    completed_revenue = EXCLUDED.completed_revenue,
+    updated_at = NOW(),
+    reconciled_at = NOW();
+
+  -- Marchands
+  INSERT INTO stats_rollups AS r (
+    scope, scope_id, products_count, completed_sales_count, completed_revenue, updated_at, reconciled_at
+  )
+  SELECT
+    'merchant', m.id,
+    (SELECT COUNT(*) FROM products p WHERE p.merchant_id = m.id),
+    COUNT(s.id),
+    COALESCE(SUM(s.amount), 0),
+    NOW(), NOW()
+  FROM merchants m
+  LEFT JOIN sales s ON s.merchant_id = m.id AND s.status = 'completed'
+  GROUP BY m.id
+  ON CONFLICT (scope, scope_id) DO UPDATE SET
+    products_count = EXCLUDED.products_count,
+    completed_sales_count = EXCLUDED.completed_sales_count,
+    completed_revenue = EXCLUDED.completed_revenue,
+    updated_at = NOW(),
+    reconciled_at = NOW();
+
+  -- Influenceurs
+  INSERT INTO stats_rollups AS r (
+    scope, scope_id, completed_sales_count, completed_revenue, updated_at, reconciled_at
+  )
+  SELECT
+    'influencer', i.id,
+    COUNT(s.id),
+    COALESCE(SUM(s.amount), 0),
+    NOW(), NOW()
+  FROM influencers i
+  LEFT JOIN sales s ON s.influencer_id = i.id AND s.status = 'completed'
+  GROUP BY i.id
+  ON CONFLICT (scope, scope_id) DO UPDATE SET
+    completed_sales_count = EXCLUDED.completed_sales_count,
+    completed_revenue = EXCLUDED.completed_revenue,
+    updated_at = NOW(),
+    reconciled_at = NOW();
+
+  SELECT COUNT(*) INTO v_rows FROM stats_rollups;
+  RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Initialisation
+SELECT reconcile_stats_rollups();
@@ -0,0 +1,82 @@
+-- Migration pour la validation des ventes par lots
+-- Date: 2026-10-16
+
+-- ============================================
+-- FONCTION: Validation d'un lot de ventes
+-- ============================================
+-- Une transaction par lot:
+-- 1. UPDATE des ventes encore "pending" → "completed"
+-- 2. INSERT groupé des commissions
+-- 3. Un delta agrégé par influenceur (balance, total_earnings)
+-- 4. Un delta agrégé par lien (total_commission)
+-- Les ventes déjà validées sont ignorées: rejouer un lot est sans effet.
+
+CREATE OR REPLACE FUNCTION validate_sales_batch(p_sale_ids UUID[])
+RETURNS JSONB AS $$
+DECLARE
+  v_validated INTEGER;
+  v_total NUMERIC;
+  v_influencers JSONB;
+BEGIN
+  CREATE TEMP TABLE IF NOT EXISTS _validated_sales (
+    id UUID,
+    influencer_id UUID,
+    link_id UUID,
+    commission NUMERIC
+  ) ON COMMIT DROP;
+  TRUNCATE _validated_sales;
+
+  WITH updated AS (
+    UPDATE sales
+    SET status = 'completed',
+        payment_status = 'pending',
+        payment_processed_at = NULL
+    WHERE id = ANY(p_sale_ids)
+      AND status = 'pending'
+    RETURNING id, influencer_id, link_id, COALESCE(influencer_commission, 0) AS commission
+  )
+  INSERT INTO _validated_sales SELECT * FROM updated;
+
+  INSERT INTO commissions (sale_id, influencer_id, amount, currency, status, approved_at)
+  SELECT id, influencer_id, commission, 'EUR', 'approved', NOW()
+  FROM _validated_sales;
+
+  UPDATE influencers i
+  SET balance = COALESCE(i.balance, 0) + d.total,
+      total_earnings = COALESCE(i.total_earnings, 0) + d.total,
+      updated_at = NOW()
+  FROM (
+    SELECT influencer_id, SUM(commission) AS total
+    FROM _validated_sales
+    GROUP BY influencer_id
+  ) d
+  WHERE i.id = d.influencer_id;
+
+  UPDATE trackable_links l
+  SET total_commission = COALESCE(l.total_commission, 0) + d.total
+  FROM (
+    SELECT link_id, SUM(commission) AS total
+    FROM _validated_sales
+    WHERE link_id IS NOT NULL
+    GROUP BY link_id
+  ) d
+  WHERE l.id = d.link_id;
+
+  SELECT COUNT(*), COALESCE(SUM(commission), 0),
+         COALESCE(jsonb_agg(DISTINCT influencer_id), '[]'::jsonb)
+  INTO v_validated, v_total, v_influencers
+  FROM _validated_sales;
+
+  RETURN jsonb_build_object(
+    'validated', v_validated,
+    'total_commission', v_total,
+    'influencer_ids', v_influencers
+  );
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================
+-- INDEX
+-- ============================================
+
+CREATE INDEX IF NOT EXISTS idx_sales_status_created_at ON sales(status, created_at, id);
@@ -0,0 +1,14 @@
+-- Migration pour les paiements automatiques par lots
+-- Date: 2026-10-16
+
+-- ============================================
+-- COLONNE: Clé d'idempotence des payouts
+-- ============================================
+-- Format des paiements automatiques: auto-<influencer_id>-<YYYYMMDD>
+-- Transmise aux passerelles (PayPal sender_item_id, référence SEPA)
+-- pour qu'un run rejoué ne crée ni payout ni virement en double.
+
+ALTER TABLE payouts ADD COLUMN IF NOT EXISTS idempotency_key TEXT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_payouts_idempotency_key ON payouts(idempotency_key);
+CREATE INDEX IF NOT EXISTS idx_payouts_influencer_status ON payouts(influencer_id, status);
@@ -0,0 +1,24 @@
+-- Migration pour la pagination par curseur (keyset)
+-- Date: 2026-10-16
+
+-- ============================================
+-- INDEX: Tri (colonne, id) par périmètre
+-- ============================================
+-- Une page keyset filtre "(colonne, id) < (dernière valeur, dernier id)"
+-- puis trie sur (colonne, id). Avec ces index, Postgres descend
+-- directement à la position du curseur: le coût d'une page ne dépend plus
+-- de sa profondeur.
+
+-- Ventes (utils/keyset_pagination.py via get_all_sales)
+CREATE INDEX IF NOT EXISTS idx_sales_merchant_ts_id ON sales(merchant_id, sale_timestamp DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_sales_influencer_ts_id ON sales(influencer_id, sale_timestamp DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_sales_ts_id ON sales(sale_timestamp DESC, id DESC);
+
+-- Commissions (get_all_commissions)
+CREATE INDEX IF NOT EXISTS idx_commissions_influencer_created_id ON commissions(influencer_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_commissions_created_id ON commissions(created_at DESC, id DESC);
+
+-- Avis des annuaires influenceurs / commerciaux
+CREATE INDEX IF NOT EXISTS idx_profile_reviews_public_created_id
+  ON profile_reviews(profile_user_id, profile_type, created_at DESC, id DESC)
+  WHERE is_public = TRUE;
@@ -0,0 +1,81 @@
+-- Migration pour le catalogue de traductions en mémoire
+-- Date: 2026-10-16
+
+-- ============================================
+-- TABLE: Version du catalogue par langue
+-- ============================================
+-- Incrémentée à chaque ajout / modification / suppression d'une traduction.
+-- Les workers comparent cette version (une petite requête) au lieu de
+-- recharger tout le catalogue.
+
+CREATE TABLE IF NOT EXISTS translation_versions (
+    language VARCHAR(10) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+INSERT INTO translation_versions (language, version)
+SELECT DISTINCT language, 1 FROM translations
+ON CONFLICT (language) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_translation_version()
+RETURNS TRIGGER AS $$
+DECLARE
+  v_language VARCHAR(10);
+BEGIN
+  v_language := CASE WHEN TG_OP = 'DELETE' THEN OLD.language ELSE NEW.language END;
+
+  INSERT INTO translation_versions (language, version, updated_at)
+  VALUES (v_language, 1, NOW())
+  ON CONFLICT (language) DO UPDATE
+  SET version = translation_versions.version + 1,
+      updated_at = NOW();
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Seules les modifications de contenu changent la version (pas last_used)
+DROP TRIGGER IF EXISTS trigger_translation_version ON translations;
+CREATE TRIGGER trigger_translation_version
+AFTER INSERT OR DELETE OR UPDATE OF key, language, value ON translations
+FOR EACH ROW
+EXECUTE FUNCTION bump_translation_version();
+
+-- ============================================
+-- COMPTEUR D'UTILISATION
+-- ============================================
+-- Le trigger existant force usage_count = OLD + 1 à chaque UPDATE: on
+-- conserve une valeur fournie explicitement (incréments agrégés).
+
+CREATE OR REPLACE FUNCTION increment_translation_usage()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.usage_count IS NOT DISTINCT FROM OLD.usage_count THEN
+        NEW.usage_count = COALESCE(OLD.usage_count, 0) + 1;
+    END IF;
+    NEW.last_used = NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================
+-- FONCTION: Mise à jour groupée de last_used / usage_count
+-- ============================================
+-- p_usage: [{"key": "nav_dashboard", "uses": 12}]
+-- Un seul UPDATE par langue et par flush (last_used = NOW() via le trigger).
+
+CREATE OR REPLACE FUNCTION touch_translations(p_language VARCHAR, p_usage JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+  v_updated INTEGER;
+BEGIN
+  UPDATE translations t
+  SET usage_count = COALESCE(t.usage_count, 0) + x.uses
+  FROM jsonb_to_recordset(p_usage) AS x(key VARCHAR, uses INTEGER)
+  WHERE t.language = p_language AND t.key = x.key;
+
+  GET DIAGNOSTICS v_updated = ROW_COUNT;
+  RETURN v_updated;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,243 @@
+-- Migration pour le registre atomique des réservations de dépôts (leads)
+-- Date: 2026-10-16
+
+-- ============================================
+-- SOLDE DISPONIBLE
+-- ============================================
+-- Maintenu par Postgres à chaque écriture: les alertes et les vérifications
+-- de solde le lisent directement, sans recalcul.
+
+ALTER TABLE company_deposits
+    ADD COLUMN IF NOT EXISTS available_balance DECIMAL(10, 2)
+    GENERATED ALWAYS AS (current_balance - COALESCE(reserved_amount, 0)) STORED;
+
+-- ============================================
+-- TABLE: Registre des réservations
+-- ============================================
+-- Une ligne par lead. lead_id n'est pas une clé étrangère: la réservation
+-- est prise avant l'insertion du lead (l'ID est généré par l'application).
+
+CREATE TABLE IF NOT EXISTS deposit_reservations (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    deposit_id UUID NOT NULL REFERENCES company_deposits(id) ON DELETE CASCADE,
+    lead_id UUID NOT NULL UNIQUE,
+    amount DECIMAL(10, 2) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'reserved',
+    created_at TIMESTAMP DEFAULT NOW(),
+    settled_at TIMESTAMP,
+
+    CHECK (amount > 0),
+    CHECK (status IN ('reserved', 'released', 'deducted'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_deposit_reservations_open
+    ON deposit_reservations(deposit_id) WHERE status = 'reserved';
+
+-- Dépôt actif le plus récent d'un merchant (et d'une campagne)
+CREATE INDEX IF NOT EXISTS idx_deposits_active_lookup
+    ON company_deposits(merchant_id, campaign_id, created_at DESC) WHERE status = 'active';
+
+-- ============================================
+-- FONCTION: Réserver le montant d'un lead
+-- ============================================
+-- Verrouille le dépôt actif, vérifie le solde disponible et réserve en une
+-- transaction: deux leads simultanés ne peuvent pas sur-engager le dépôt.
+-- Idempotente par lead_id.
+
+CREATE OR REPLACE FUNCTION reserve_deposit_amount(
+    p_merchant_id UUID,
+    p_campaign_id UUID,
+    p_lead_id UUID,
+    p_amount DECIMAL
+) RETURNS JSONB AS $$
+DECLARE
+    v_deposit company_deposits%ROWTYPE;
+    v_existing deposit_reservations%ROWTYPE;
+BEGIN
+    SELECT * INTO v_existing FROM deposit_reservations WHERE lead_id = p_lead_id;
+    IF FOUND THEN
+        SELECT * INTO v_deposit FROM company_deposits WHERE id = v_existing.deposit_id;
+        RETURN jsonb_build_object(
+            'success', TRUE,
+            'lead_id', p_lead_id,
+            'deposit_id', v_deposit.id,
+            'current_balance', v_deposit.current_balance,
+            'reserved_amount', v_deposit.reserved_amount,
+            'available_balance', v_deposit.available_balance
+        );
+    END IF;
+
+    SELECT * INTO v_deposit
+    FROM company_deposits
+    WHERE merchant_id = p_merchant_id
+      AND status = 'active'
+      AND (p_campaign_id IS NULL OR campaign_id = p_campaign_id)
+    ORDER BY created_at DESC
+    LIMIT 1
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('success', FALSE, 'lead_id', p_lead_id, 'error', 'no_active_deposit');
+    END IF;
+
+    IF v_deposit.available_balance < p_amount THEN
+        RETURN jsonb_build_object(
+            'success', FALSE,
+            'lead_id', p_lead_id,
+            'error', 'insufficient_balance',
+            'deposit_id', v_deposit.id,
+            'available_balance', v_deposit.available_balance
+        );
+    END IF;
+
+    UPDATE company_deposits
+    SET reserved_amount = COALESCE(reserved_amount, 0) + p_amount,
+        updated_at = NOW()
+    WHERE id = v_deposit.id
+    RETURNING * INTO v_deposit;
+
+    INSERT INTO deposit_reservations (deposit_id, lead_id, amount)
+    VALUES (v_deposit.id, p_lead_id, p_amount);
+
+    RETURN jsonb_build_object(
+        'success', TRUE,
+        'lead_id', p_lead_id,
+        'deposit_id', v_deposit.id,
+        'current_balance', v_deposit.current_balance,
+        'reserved_amount', v_deposit.reserved_amount,
+        'available_balance', v_deposit.available_balance
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================
+-- FONCTION: Réservations groupées (intake en lot)
+-- ============================================
+-- p_reservations: [{"merchant_id": "uuid", "campaign_id": "uuid", "lead_id": "uuid", "amount": 80}]
+-- Un résultat par entrée, dans l'ordre; une réservation refusée n'annule pas les autres.
+
+CREATE OR REPLACE FUNCTION reserve_deposit_amounts(p_reservations JSONB)
+RETURNS JSONB AS $$
+DECLARE
+    v_item RECORD;
+    v_results JSONB := '[]'::JSONB;
+BEGIN
+    FOR v_item IN
+        SELECT * FROM jsonb_to_recordset(p_reservations)
+            AS x(merchant_id UUID, campaign_id UUID, lead_id UUID, amount DECIMAL)
+    LOOP
+        v_results := v_results || jsonb_build_array(
+            reserve_deposit_amount(v_item.merchant_id, v_item.campaign_id, v_item.lead_id, v_item.amount)
+        );
+    END LOOP;
+
+    RETURN v_results;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================
+-- FONCTION: Solder une réservation (libération ou déduction)
+-- ============================================
+-- p_action: 'release' (lead rejeté / expiré) ou 'deduct' (lead validé).
+-- La déduction débite current_balance, libère la réservation et trace la
+-- transaction en une seule opération. Idempotente: une réservation déjà
+-- soldée par la même action n'est pas rejouée. Une action contraire au
+-- règlement existant (déduire une réservation libérée, libérer une
+-- réservation déduite) est refusée: le lead ne doit pas être validé sans
+-- débit ni expiré après débit.
+
+CREATE OR REPLACE FUNCTION settle_deposit_reservation(
+    p_lead_id UUID,
+    p_action VARCHAR,
+    p_description TEXT DEFAULT NULL
+) RETURNS JSONB AS $$
+DECLARE
+    v_reservation deposit_reservations%ROWTYPE;
+    v_deposit company_deposits%ROWTYPE;
+BEGIN
+    IF p_action NOT IN ('release', 'deduct') THEN
+        RAISE EXCEPTION 'Action invalide: %', p_action;
+    END IF;
+
+    SELECT * INTO v_reservation FROM deposit_reservations WHERE lead_id = p_lead_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('success', FALSE, 'lead_id', p_lead_id, 'error', 'reservation_not_found');
+    END IF;
+
+    IF v_reservation.status <> 'reserved' THEN
+        IF v_reservation.status <> CASE WHEN p_action = 'deduct' THEN 'deducted' ELSE 'released' END THEN
+            RETURN jsonb_build_object(
+                'success', FALSE,
+                'lead_id', p_lead_id,
+                'error', 'settlement_conflict',
+                'status', v_reservation.status
+            );
+        END IF;
+
+        SELECT * INTO v_deposit FROM company_deposits WHERE id = v_reservation.deposit_id;
+        RETURN jsonb_build_object(
+            'success', TRUE,
+            'already_settled', TRUE,
+            'lead_id', p_lead_id,
+            'status', v_reservation.status,
+            'deposit_id', v_deposit.id,
+            'campaign_id', v_deposit.campaign_id,
+            'current_balance', v_deposit.current_balance,
+            'reserved_amount', v_deposit.reserved_amount,
+            'available_balance', v_deposit.available_balance,
+            'alert_threshold', v_deposit.alert_threshold,
+            'deposit_status', v_deposit.status
+        );
+    END IF;
+
+    IF p_action = 'deduct' THEN
+        UPDATE company_deposits
+        SET current_balance = current_balance - v_reservation.amount,
+            reserved_amount = GREATEST(COALESCE(reserved_amount, 0) - v_reservation.amount, 0),
+            updated_at = NOW(),
+            status = CASE
+                WHEN current_balance - v_reservation.amount <= 0 THEN 'depleted'::VARCHAR
+                ELSE status
+            END,
+            depleted_at = CASE
+                WHEN current_balance - v_reservation.amount <= 0 THEN NOW()
+                ELSE depleted_at
+            END
+        WHERE id = v_reservation.deposit_id
+        RETURNING * INTO v_deposit;
+
+        INSERT INTO deposit_transactions (
+            deposit_id, merchant_id, lead_id, transaction_type,
+            amount, balance_before, balance_after, description
+        ) VALUES (
+            v_deposit.id, v_deposit.merchant_id, p_lead_id, 'deduction',
+            -v_reservation.amount, v_deposit.current_balance + v_reservation.amount, v_deposit.current_balance,
+            COALESCE(p_description, 'Déduction pour lead validé')
+        );
+    ELSE
+        UPDATE company_deposits
+        SET reserved_amount = GREATEST(COALESCE(reserved_amount, 0) - v_reservation.amount, 0),
+            updated_at = NOW()
+        WHERE id = v_reservation.deposit_id
+        RETURNING * INTO v_deposit;
+    END IF;
+
+    UPDATE deposit_reservations
+    SET status = CASE WHEN p_action = 'deduct' THEN 'deducted' ELSE 'released' END,
+        settled_at = NOW()
+    WHERE id = v_reservation.id;
+
+    RETURN jsonb_build_object(
+        'success', TRUE,
+        'lead_id', p_lead_id,
+        'status', CASE WHEN p_action = 'deduct' THEN 'deducted' ELSE 'released' END,
+        'deposit_id', v_deposit.id,
+        'campaign_id', v_deposit.campaign_id,
+        'current_balance', v_deposit.current_balance,
+        'reserved_amount', v_deposit.reserved_amount,
+        'available_balance', v_deposit.available_balance,
+        'alert_threshold', v_deposit.alert_threshold,
+        'deposit_status', v_deposit.status
+    );
+END;
+$$ LANGUAGE plpgsql;
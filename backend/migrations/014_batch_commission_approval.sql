@@ -0,0 +1,149 @@
+-- Migration pour l'approbation des commissions par lots
+-- Date: 2026-10-16
+
+-- ============================================
+-- FONCTION: Changement de statut d'un lot de commissions
+-- ============================================
+-- Mêmes règles de transition que approve_payout_transaction, appliquées
+-- au lot entier en une transaction:
+-- 1. Une lecture verrouillée des commissions, ventes et influenceurs
+-- 2. Validation des transitions (un message d'erreur par commission refusée)
+-- 3. Un UPDATE des commissions acceptées
+-- 4. Un delta agrégé par influenceur (balance) et par merchant (total_commission_paid)
+-- Retourne [{"id", "success", "error"}] dans l'ordre des IDs reçus.
+--
+-- Solde insuffisant: les approbations d'un même influenceur sont imputées
+-- dans l'ordre du lot, comme des appels successifs à
+-- approve_payout_transaction: seule la commission qui dépasse le solde
+-- restant est refusée, les suivantes qui tiennent dans ce solde passent.
+
+CREATE OR REPLACE FUNCTION approve_commissions_batch(
+    p_commission_ids UUID[],
+    p_status TEXT DEFAULT 'approved'
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_results JSONB;
+    v_row RECORD;
+    v_influencer UUID;
+    v_remaining NUMERIC;
+BEGIN
+    IF p_status NOT IN ('approved', 'paid', 'rejected', 'pending') THEN
+        RAISE EXCEPTION 'Statut % non supporté', p_status;
+    END IF;
+
+    -- Verrous dans un ordre stable (pas d'interblocage entre lots concurrents)
+    PERFORM 1 FROM commissions WHERE id = ANY(p_commission_ids) ORDER BY id FOR UPDATE;
+    PERFORM 1 FROM influencers
+    WHERE id IN (SELECT influencer_id FROM commissions WHERE id = ANY(p_commission_ids))
+    ORDER BY id FOR UPDATE;
+
+    CREATE TEMP TABLE IF NOT EXISTS _commission_batch (
+        id UUID,
+        ord BIGINT,
+        influencer_id UUID,
+        merchant_id UUID,
+        amount NUMERIC,
+        status TEXT,
+        balance NUMERIC,
+        error TEXT
+    ) ON COMMIT DROP;
+    TRUNCATE _commission_batch;
+
+    INSERT INTO _commission_batch
+    SELECT DISTINCT ON (req.id)
+        req.id, req.ord, c.influencer_id, s.merchant_id, c.amount, c.status, i.balance, NULL
+    FROM unnest(p_commission_ids) WITH ORDINALITY AS req(id, ord)
+    LEFT JOIN commissions c ON c.id = req.id
+    LEFT JOIN sales s ON s.id = c.sale_id
+    LEFT JOIN influencers i ON i.id = c.influencer_id
+    ORDER BY req.id, req.ord;
+
+    UPDATE _commission_batch
+    SET error = CASE
+        WHEN status IS NULL OR balance IS NULL THEN format('Commission %s introuvable', id)
+        WHEN status = 'paid' AND p_status <> 'paid' THEN
+            format('La commission %s a déjà été réglée et ne peut pas changer de statut.', id)
+        WHEN status = p_status THEN NULL
+        WHEN amount <= 0 THEN format('Montant invalide pour la commission %s', id)
+        WHEN p_status = 'paid' AND status <> 'approved' THEN
+            'La commission doit être approuvée avant d''être payée.'
+    END;
+
+    IF p_status = 'approved' THEN
+        FOR v_row IN
+            SELECT id, influencer_id, amount, balance
+            FROM _commission_batch
+            WHERE error IS NULL AND status = 'pending'
+            ORDER BY influencer_id, ord
+        LOOP
+            IF v_influencer IS DISTINCT FROM v_row.influencer_id THEN
+                v_influencer := v_row.influencer_id;
+                v_remaining := COALESCE(v_row.balance, 0);
+            END IF;
+
+            IF v_remaining < v_row.amount THEN
+                UPDATE _commission_batch
+                SET error = format('Solde insuffisant pour approuver la commission %s', v_row.id)
+                WHERE id = v_row.id;
+            ELSE
+                v_remaining := v_remaining - v_row.amount;
+            END IF;
+        END LOOP;
+    END IF;
+
+    UPDATE commissions c
+    SET
+        status = p_status,
+        approved_at = CASE
+            WHEN p_status = 'approved' AND b.status = 'pending' THEN NOW()
+            WHEN p_status IN ('pending', 'rejected') THEN NULL
+            ELSE c.approved_at
+        END,
+        paid_at = CASE
+            WHEN p_status = 'paid' THEN NOW()
+            WHEN p_status IN ('pending', 'rejected') THEN NULL
+            ELSE c.paid_at
+        END
+    FROM _commission_batch b
+    WHERE c.id = b.id AND b.error IS NULL AND b.status <> p_status;
+
+    UPDATE influencers i
+    SET balance = COALESCE(i.balance, 0) + d.delta
+    FROM (
+        SELECT influencer_id, SUM(
+            CASE
+                WHEN p_status = 'approved' AND status = 'pending' THEN -amount
+                WHEN p_status IN ('pending', 'rejected') AND status = 'approved' THEN amount
+                ELSE 0
+            END
+        ) AS delta
+        FROM _commission_batch
+        WHERE error IS NULL AND status <> p_status
+        GROUP BY influencer_id
+    ) d
+    WHERE i.id = d.influencer_id AND d.delta <> 0;
+
+    IF p_status = 'paid' THEN
+        UPDATE merchants m
+        SET total_commission_paid = COALESCE(m.total_commission_paid, 0) + d.total,
+            updated_at = NOW()
+        FROM (
+            SELECT merchant_id, SUM(amount) AS total
+            FROM _commission_batch
+            WHERE error IS NULL AND status = 'approved' AND merchant_id IS NOT NULL
+            GROUP BY merchant_id
+        ) d
+        WHERE m.id = d.merchant_id;
+    END IF;
+
+    SELECT COALESCE(
+        jsonb_agg(jsonb_build_object('id', id, 'success', error IS NULL, 'error', error) ORDER BY ord),
+        '[]'::JSONB
+    )
+    INTO v_results
+    FROM _commission_batch;
+
+    RETURN v_results;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,81 @@
+-- Migration pour le cache des droits d'abonnement (limites + compteurs d'usage)
+-- Date: 2026-10-16
+
+-- ============================================
+-- SUPPRESSION LOGIQUE DES PRODUITS ET CAMPAGNES
+-- ============================================
+-- delete_product / delete_campaign (advanced_helpers) renseignent deleted_at:
+-- les lignes supprimées ne comptent plus dans l'usage du plan.
+
+ALTER TABLE products ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMPTZ;
+ALTER TABLE campaigns ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMPTZ;
+
+-- ============================================
+-- INDEX DES COMPTAGES D'USAGE
+-- ============================================
+
+CREATE INDEX IF NOT EXISTS idx_products_merchant_live ON products(merchant_id) WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_campaigns_merchant_live ON campaigns(merchant_id) WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_affiliations_merchant ON affiliations(merchant_id);
+CREATE INDEX IF NOT EXISTS idx_affiliations_influencer ON affiliations(influencer_id);
+CREATE INDEX IF NOT EXISTS idx_trackable_links_influencer ON trackable_links(influencer_id);
+
+-- ============================================
+-- FONCTION: Profil d'abonnement + usage en un appel
+-- ============================================
+-- Remplace la lecture du profil et les 3 comptages "count=exact" faits à
+-- chaque vérification de limite. Utilisée par EntitlementService
+-- (services/subscription_entitlements.py) au chargement et à la
+-- réconciliation périodique des compteurs.
+-- Retourne {"profile": <ligne merchants/influencers>, "usage": {...}}
+-- ou NULL si l'utilisateur n'a pas de profil pour ce rôle.
+
+CREATE OR REPLACE FUNCTION get_subscription_entitlement(
+    p_user_id UUID,
+    p_role TEXT
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_profile JSONB;
+    v_profile_id UUID;
+BEGIN
+    IF p_role = 'merchant' THEN
+        SELECT to_jsonb(m), m.id INTO v_profile, v_profile_id
+        FROM merchants m
+        WHERE m.user_id = p_user_id
+        LIMIT 1;
+
+        IF v_profile_id IS NULL THEN
+            RETURN NULL;
+        END IF;
+
+        RETURN jsonb_build_object(
+            'profile', v_profile,
+            'usage', jsonb_build_object(
+                'products', (SELECT COUNT(*) FROM products WHERE merchant_id = v_profile_id AND deleted_at IS NULL),
+                'campaigns', (SELECT COUNT(*) FROM campaigns WHERE merchant_id = v_profile_id AND deleted_at IS NULL),
+                'affiliates', (SELECT COUNT(*) FROM affiliations WHERE merchant_id = v_profile_id)
+            )
+        );
+    ELSIF p_role = 'influencer' THEN
+        SELECT to_jsonb(i), i.id INTO v_profile, v_profile_id
+        FROM influencers i
+        WHERE i.user_id = p_user_id
+        LIMIT 1;
+
+        IF v_profile_id IS NULL THEN
+            RETURN NULL;
+        END IF;
+
+        RETURN jsonb_build_object(
+            'profile', v_profile,
+            'usage', jsonb_build_object(
+                'campaigns', (SELECT COUNT(*) FROM affiliations WHERE influencer_id = v_profile_id),
+                'links', (SELECT COUNT(*) FROM trackable_links WHERE influencer_id = v_profile_id)
+            )
+        );
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql STABLE;
@@ -0,0 +1,90 @@
+-- Migration pour la modération IA non bloquante des produits
+-- Date: 2026-10-16
+
+-- ============================================
+-- STATUT DE MODÉRATION DU PRODUIT
+-- ============================================
+-- submit_product_moderation (moderation_service.py) crée le produit sans
+-- attendre le modèle: le produit est "pending_review" jusqu'au verdict IA,
+-- puis "approved" ou "under_review" (révision admin dans moderation_queue),
+-- puis "approved" / "rejected" après décision admin.
+-- NULL: produit antérieur à la modération automatique.
+-- Un produit resté "pending_review" (worker arrêté avant le verdict) est
+-- soumis à nouveau par sweep_pending_moderations via l'index ci-dessous.
+
+ALTER TABLE products ADD COLUMN IF NOT EXISTS moderation_status VARCHAR(20)
+    CHECK (moderation_status IN ('pending_review', 'approved', 'under_review', 'rejected'));
+
+CREATE INDEX IF NOT EXISTS idx_products_moderation_pending
+    ON products(created_at)
+    WHERE moderation_status IN ('pending_review', 'under_review');
+
+-- ============================================
+-- DÉCISIONS ADMIN: REPORT SUR LE PRODUIT
+-- ============================================
+-- Mêmes fonctions que database/CREATE_MODERATION_TABLES.sql, avec la mise à
+-- jour de products.moderation_status.
+
+CREATE OR REPLACE FUNCTION approve_moderation(
+    p_moderation_id UUID,
+    p_admin_user_id UUID,
+    p_comment TEXT DEFAULT NULL
+)
+RETURNS BOOLEAN AS $$
+DECLARE
+    v_product_id UUID;
+BEGIN
+    UPDATE moderation_queue
+    SET
+        status = 'approved',
+        admin_decision = 'approved',
+        admin_user_id = p_admin_user_id,
+        admin_comment = p_comment,
+        reviewed_at = NOW()
+    WHERE id = p_moderation_id
+    AND status = 'pending'
+    RETURNING product_id INTO v_product_id;
+
+    IF FOUND THEN
+        UPDATE products SET moderation_status = 'approved' WHERE id = v_product_id;
+
+        INSERT INTO moderation_history (moderation_id, action, performed_by, old_status, new_status, comment)
+        VALUES (p_moderation_id, 'admin_approved', p_admin_user_id, 'pending', 'approved', p_comment);
+        RETURN TRUE;
+    END IF;
+
+    RETURN FALSE;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION reject_moderation(
+    p_moderation_id UUID,
+    p_admin_user_id UUID,
+    p_comment TEXT
+)
+RETURNS BOOLEAN AS $$
+DECLARE
+    v_product_id UUID;
+BEGIN
+    UPDATE moderation_queue
+    SET
+        status = 'rejected',
+        admin_decision = 'rejected',
+        admin_user_id = p_admin_user_id,
+        admin_comment = p_comment,
+        reviewed_at = NOW()
+    WHERE id = p_moderation_id
+    AND status = 'pending'
+    RETURNING product_id INTO v_product_id;
+
+    IF FOUND THEN
+        UPDATE products SET moderation_status = 'rejected' WHERE id = v_product_id;
+
+        INSERT INTO moderation_history (moderation_id, action, performed_by, old_status, new_status, comment)
+        VALUES (p_moderation_id, 'admin_rejected', p_admin_user_id, 'pending', 'rejected', p_comment);
+        RETURN TRUE;
+    END IF;
+
+    RETURN FALSE;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,125 @@
+-- Migration pour la synchronisation incrémentale de l'index de recherche
+-- Date: 2026-10-16
+
+-- ============================================
+-- updated_at MAINTENU PAR LA BASE
+-- ============================================
+-- services/search_sync.py lit les changements par filigrane updated_at.
+-- Toute écriture doit donc faire avancer updated_at, y compris celles qui
+-- ne le renseignent pas explicitement.
+
+CREATE OR REPLACE FUNCTION update_updated_at_column()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS update_products_updated_at ON products;
+CREATE TRIGGER update_products_updated_at
+    BEFORE UPDATE ON products
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+DROP TRIGGER IF EXISTS update_merchants_updated_at ON merchants;
+CREATE TRIGGER update_merchants_updated_at
+    BEFORE UPDATE ON merchants
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+DROP TRIGGER IF EXISTS update_influencers_updated_at ON influencers;
+CREATE TRIGGER update_influencers_updated_at
+    BEFORE UPDATE ON influencers
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- Pages keyset (updated_at, id) croissantes (utils/keyset_pagination.py)
+CREATE INDEX IF NOT EXISTS idx_products_updated_id ON products(updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_merchants_updated_id ON merchants(updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_influencers_updated_id ON influencers(updated_at, id);
+
+-- ============================================
+-- TABLE: Suppressions physiques (tombstones)
+-- ============================================
+-- Une ligne supprimée n'a plus d'updated_at: le trigger garde son id pour
+-- que la synchronisation la retire de l'index. Purgé par
+-- purge_search_deletions() au-delà de SEARCH_DELETIONS_RETENTION_DAYS.
+
+CREATE TABLE IF NOT EXISTS search_deletions (
+    id BIGSERIAL PRIMARY KEY,
+    entity TEXT NOT NULL CHECK (entity IN ('products', 'merchants', 'influencers')),
+    entity_id UUID NOT NULL,
+    deleted_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_search_deletions_deleted_id ON search_deletions(deleted_at, id);
+
+CREATE OR REPLACE FUNCTION record_search_deletion()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO search_deletions (entity, entity_id) VALUES (TG_TABLE_NAME, OLD.id);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_search_deletion_products ON products;
+CREATE TRIGGER trg_search_deletion_products
+    AFTER DELETE ON products
+    FOR EACH ROW EXECUTE FUNCTION record_search_deletion();
+
+DROP TRIGGER IF EXISTS trg_search_deletion_merchants ON merchants;
+CREATE TRIGGER trg_search_deletion_merchants
+    AFTER DELETE ON merchants
+    FOR EACH ROW EXECUTE FUNCTION record_search_deletion();
+
+DROP TRIGGER IF EXISTS trg_search_deletion_influencers ON influencers;
+CREATE TRIGGER trg_search_deletion_influencers
+    AFTER DELETE ON influencers
+    FOR EACH ROW EXECUTE FUNCTION record_search_deletion();
+
+CREATE OR REPLACE FUNCTION purge_search_deletions(p_before TIMESTAMP)
+RETURNS BIGINT AS $$
+DECLARE
+    v_count BIGINT;
+BEGIN
+    DELETE FROM search_deletions WHERE deleted_at < p_before;
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================
+-- TABLE: État de la synchronisation (Elasticsearch)
+-- ============================================
+-- Un filigrane par flux (products, merchants, influencers, deletions),
+-- partagé par tous les workers, et un bail ('_lease') pour qu'un seul
+-- worker synchronise le cluster à la fois.
+
+CREATE TABLE IF NOT EXISTS search_sync_state (
+    entity TEXT PRIMARY KEY,
+    watermark TIMESTAMP,
+    index_name TEXT,
+    lag_seconds NUMERIC(12, 3),
+    documents_synced BIGINT NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_until TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION claim_search_sync_lease(p_owner TEXT, p_lease_seconds INTEGER)
+RETURNS BOOLEAN AS $$
+DECLARE
+    v_owner TEXT;
+BEGIN
+    INSERT INTO search_sync_state (entity, lease_owner, lease_until)
+    VALUES ('_lease', p_owner, NOW() + make_interval(secs => p_lease_seconds))
+    ON CONFLICT (entity) DO UPDATE
+        SET lease_owner = EXCLUDED.lease_owner,
+            lease_until = EXCLUDED.lease_until,
+            updated_at = NOW()
+        WHERE search_sync_state.lease_until IS NULL
+           OR search_sync_state.lease_until < NOW()
+           OR search_sync_state.lease_owner = p_owner
+    RETURNING lease_owner INTO v_owner;
+
+    RETURN v_owner IS NOT NULL;
+END;
+$$ LANGUAGE plpgsql;
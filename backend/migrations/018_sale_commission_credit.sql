@@ -0,0 +1,68 @@
+-- Migration pour le crédit atomique des commissions de ventes validées
+-- Date: 2026-10-17
+
+-- ============================================
+-- FONCTION: Crédit des commissions d'un lot de ventes
+-- ============================================
+-- Utilisée par AutoPaymentService quand validate_sales_batch (009) n'est
+-- pas déployée. Le repli insère les commissions avec approved_at NULL
+-- (« pas encore créditée »), appelle cette fonction, puis seulement passe
+-- les ventes en "completed". En une transaction:
+-- 1. approved_at = NOW() sur les commissions non créditées de ces ventes
+-- 2. Un delta agrégé par influenceur (balance, total_earnings)
+-- 3. Un delta agrégé par lien (total_commission)
+-- Une commission déjà créditée est ignorée: rejouer après une coupure entre
+-- deux étapes du repli ne crédite jamais deux fois.
+
+CREATE OR REPLACE FUNCTION credit_sale_commissions(p_sale_ids UUID[])
+RETURNS JSONB AS $$
+DECLARE
+  v_credited INTEGER;
+  v_total NUMERIC;
+BEGIN
+  CREATE TEMP TABLE IF NOT EXISTS _credited_commissions (
+    sale_id UUID,
+    influencer_id UUID,
+    amount NUMERIC
+  ) ON COMMIT DROP;
+  TRUNCATE _credited_commissions;
+
+  WITH credited AS (
+    UPDATE commissions
+    SET approved_at = NOW()
+    WHERE sale_id = ANY(p_sale_ids)
+      AND status = 'approved'
+      AND approved_at IS NULL
+    RETURNING sale_id, influencer_id, COALESCE(amount, 0) AS amount
+  )
+  INSERT INTO _credited_commissions SELECT * FROM credited;
+
+  UPDATE influencers i
+  SET balance = COALESCE(i.balance, 0) + d.total,
+      total_earnings = COALESCE(i.total_earnings, 0) + d.total,
+      updated_at = NOW()
+  FROM (
+    SELECT influencer_id, SUM(amount) AS total
+    FROM _credited_commissions
+    GROUP BY influencer_id
+  ) d
+  WHERE i.id = d.influencer_id;
+
+  UPDATE trackable_links l
+  SET total_commission = COALESCE(l.total_commission, 0) + d.total
+  FROM (
+    SELECT s.link_id, SUM(c.amount) AS total
+    FROM _credited_commissions c
+    JOIN sales s ON s.id = c.sale_id
+    WHERE s.link_id IS NOT NULL
+    GROUP BY s.link_id
+  ) d
+  WHERE l.id = d.link_id;
+
+  SELECT COUNT(*), COALESCE(SUM(amount), 0)
+  INTO v_credited, v_total
+  FROM _credited_commissions;
+
+  RETURN jsonb_build_object('credited', v_credited, 'total_commission', v_total);
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,62 @@
+-- Migration pour le débit atomique des soldes après paiement automatique
+-- Date: 2026-10-17
+
+-- ============================================
+-- COLONNE: Débit du solde effectué
+-- ============================================
+-- NULL tant que le montant du payout n'a pas été retiré du solde de
+-- l'influenceur. Un run rejoué avec la même clé d'idempotence ne débite
+-- jamais deux fois.
+
+ALTER TABLE payouts ADD COLUMN IF NOT EXISTS balance_debited_at TIMESTAMPTZ;
+
+-- ============================================
+-- FONCTION: Débit des soldes d'un lot de payouts payés
+-- ============================================
+-- Utilisée par AutoPaymentService après l'appel aux passerelles. Le solde
+-- est décrémenté du montant réellement payé (balance = balance - amount)
+-- au lieu d'être remis à zéro: une commission créditée pendant le run
+-- (credit_sale_commissions, validate_sales_batch) reste acquise.
+-- En une transaction:
+-- 1. balance_debited_at = NOW() sur les payouts payés non encore débités
+-- 2. Un delta agrégé par influenceur (balance)
+
+CREATE OR REPLACE FUNCTION debit_payout_balances(p_idempotency_keys TEXT[])
+RETURNS JSONB AS $$
+DECLARE
+  v_debited INTEGER;
+  v_total NUMERIC;
+BEGIN
+  CREATE TEMP TABLE IF NOT EXISTS _debited_payouts (
+    influencer_id UUID,
+    amount NUMERIC
+  ) ON COMMIT DROP;
+  TRUNCATE _debited_payouts;
+
+  WITH debited AS (
+    UPDATE payouts
+    SET balance_debited_at = NOW()
+    WHERE idempotency_key = ANY(p_idempotency_keys)
+      AND status = 'paid'
+      AND balance_debited_at IS NULL
+    RETURNING influencer_id, COALESCE(amount, 0) AS amount
+  )
+  INSERT INTO _debited_payouts SELECT * FROM debited;
+
+  UPDATE influencers i
+  SET balance = COALESCE(i.balance, 0) - d.total,
+      updated_at = NOW()
+  FROM (
+    SELECT influencer_id, SUM(amount) AS total
+    FROM _debited_payouts
+    GROUP BY influencer_id
+  ) d
+  WHERE i.id = d.influencer_id;
+
+  SELECT COUNT(*), COALESCE(SUM(amount), 0)
+  INTO v_debited, v_total
+  FROM _debited_payouts;
+
+  RETURN jsonb_build_object('debited', v_debited, 'total_amount', v_total);
+END;
+$$ LANGUAGE plpgsql;
@@ -18,6 +18,7 @@ from mobile_payment_service import (
 from auth import get_current_user
 # from db_helpers import log_user_activity, get_user_balance  # TODO: Implémenter dans db_helpers
 from supabase_client import supabase
+from services.realtime_events import EventTypes, realtime_bus
 
 router = APIRouter(prefix="/api/mobile-payments", tags=["Mobile Payments"])
 
@@ -109,6 +110,12 @@ async def request_payout(
         # Insérer dans Supabase
         result = supabase.table("payouts").insert(payout_record).execute()
 
+        await realtime_bus.publish_async(request.user_id, EventTypes.PAYMENT_CREATED, {
+            "payment_id": payout_response.payout_id,
+            "status": payout_response.status,
+            "amount": request.amount
+        })
+
         # Si le payout est accepté, déduire du solde
         if payout_response.status in [PaymentStatus.PROCESSING, PaymentStatus.COMPLETED]:
             # Mettre à jour le solde de l'utilisateur
@@ -321,6 +328,12 @@ async def get_payout_status(
                     "updated_at": datetime.now().isoformat()
                 }).eq("payout_id", payout_id).execute()
 
+                await realtime_bus.publish_async(current_user["id"], EventTypes.PAYMENT_STATUS_CHANGED, {
+                    "payment_id": payout_id,
+                    "status": live_status,
+                    "amount": payout["amount"]
+                })
+
                 payout["status"] = live_status
 
         return payout
@@ -12,7 +12,7 @@ from datetime import datetime
 import os
 
 from auth import get_current_user, get_current_admin, require_role
-from moderation_service import moderate_product, ModerationStats
+from moderation_service import moderate_product, ModerationStats, reload_prohibited_keywords
 
 # Configuration Supabase
 from supabase import create_client, Client
@@ -440,3 +440,22 @@ async def test_moderation_service(
     except Exception as e:
         print(f"❌ Error in test moderation: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/keywords/reload")
+async def reload_moderation_keywords(
+    current_user: dict = Depends(get_current_admin)
+):
+    """
+    Recompile les mots-clés interdits depuis MODERATION_KEYWORDS_FILE (ce worker)
+
+    Les autres workers détectent la modification du fichier d'eux-mêmes.
+    """
+    try:
+        return {
+            "reloaded": reload_prohibited_keywords(),
+            "message": "Mots-clés de modération rechargés"
+        }
+
+    except (OSError, ValueError) as e:
+        print(f"❌ Error reloading moderation keywords: {e}")
+        raise HTTPException(status_code=400, detail=f"Invalid keywords file: {e}")
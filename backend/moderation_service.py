@@ -5,11 +5,17 @@ Utilise OpenAI pour détecter contenu inapproprié
 ============================================
 """
 
+import asyncio
 import os
-from typing import Dict, Any, Optional
-from openai import OpenAI
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterable, List, Optional
+from openai import AsyncOpenAI
 import json
 
+from services.moderation_queue import ModerationQueue
+from utils.keyword_matcher import KeywordMatcher
+
 # Configuration OpenAI
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
@@ -17,7 +23,19 @@ if not OPENAI_API_KEY:
     print("⚠️ Warning: OpenAI API key not configured for content moderation")
     client = None
 else:
-    client = OpenAI(api_key=OPENAI_API_KEY)
+    # Client async (OPENAI_BASE_URL: serveur compatible / stub local)
+    client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+
+MODERATION_AI_MODEL = os.getenv("MODERATION_AI_MODEL", "gpt-4o-mini")  # Modèle rapide et économique
+
+# Listes de mots-clés rechargeables sans redémarrage (JSON, optionnel)
+MODERATION_KEYWORDS_FILE = os.getenv("MODERATION_KEYWORDS_FILE", "")
+MODERATION_KEYWORDS_RELOAD_INTERVAL = float(os.getenv("MODERATION_KEYWORDS_RELOAD_INTERVAL", "30"))  # Secondes
+
+# Produits restés "pending_review" (worker arrêté avant le verdict IA)
+MODERATION_PENDING_TIMEOUT = float(os.getenv("MODERATION_PENDING_TIMEOUT", "900"))  # Secondes avant nouvelle soumission
+MODERATION_SWEEP_INTERVAL = float(os.getenv("MODERATION_SWEEP_INTERVAL", "300"))  # Secondes entre deux passages
+MODERATION_SWEEP_BATCH_SIZE = int(os.getenv("MODERATION_SWEEP_BATCH_SIZE", "50"))  # Produits par passage
 
 # ============================================
 # CATÉGORIES INTERDITES
@@ -45,6 +63,119 @@ PROHIBITED_CATEGORIES = {
 # MODÉRATION IA
 # ============================================
 
+MODERATION_SYSTEM_PROMPT = "Tu es un expert en modération de contenu e-commerce. Tu réponds UNIQUEMENT en JSON valide, sans markdown ni texte supplémentaire."
+
+MODERATION_CRITERIA = """CRITÈRES D'INTERDICTION:
+1. Contenu sexuel, adulte ou +18
+2. Armes, explosifs, munitions
+3. Drogues ou substances illicites
+4. Jeux d'argent illégaux
+5. Produits contrefaits ou faux documents
+6. Contenu haineux ou discriminatoire
+7. Contenu violent ou gore
+8. Services illégaux (piratage, fraude, blanchiment)
+9. Tabac ou cigarettes électroniques non autorisées
+10. Alcool sans licence de vente
+11. Médicaments non autorisés ou fausses promesses médicales
+12. Schémas pyramidaux ou MLM frauduleux
+13. Biens volés ou recel
+14. Espèces animales protégées
+15. Vente de données personnelles"""
+
+
+def _build_batch_prompt(products: List[Dict[str, Any]]) -> str:
+    """Prompt de modération d'un lot de produits (un verdict par "id")"""
+    items = [
+        {
+            "id": index,
+            "nom": product.get("name"),
+            "description": product.get("description"),
+            "categorie": product.get("category") or "Non spécifiée",
+            "prix_mad": product.get("price"),
+            "images": bool(product.get("images_urls")),
+        }
+        for index, product in enumerate(products)
+    ]
+    return f"""Tu es un système de modération de contenu pour une plateforme e-commerce au Maroc.
+Analyse chacun de ces produits/services et détermine s'il est ACCEPTABLE ou INACCEPTABLE selon les critères suivants:
+
+{MODERATION_CRITERIA}
+
+PRODUITS À ANALYSER:
+{json.dumps(items, ensure_ascii=False)}
+
+INSTRUCTIONS:
+1. Analyse le nom et la description de chaque produit pour détecter des contenus interdits
+2. Vérifie les termes cachés, euphémismes ou codes
+3. Évalue le risque selon le contexte marocain et la loi islamique
+4. Les produits sont indépendants: un verdict par "id", sans en oublier
+5. Retourne UNIQUEMENT un JSON valide (pas de markdown, pas de texte avant/après)
+
+FORMAT DE RÉPONSE (JSON STRICT):
+{{
+    "results": [
+        {{
+            "id": 0,
+            "approved": true/false,
+            "confidence": 0.0-1.0,
+            "risk_level": "low"|"medium"|"high"|"critical",
+            "flags": ["categorie1", "categorie2", ...],
+            "reason": "Explication détaillée si rejeté",
+            "recommendation": "Action recommandée"
+        }}
+    ]
+}}"""
+
+
+async def _moderate_batch_with_ai(products: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+    """
+    Un seul appel au modèle pour un lot de produits (appelé par moderation_queue)
+
+    Returns:
+        Un verdict par produit, dans l'ordre; None si absent de la réponse
+    """
+    response = await client.chat.completions.create(
+        model=MODERATION_AI_MODEL,
+        messages=[
+            {"role": "system", "content": MODERATION_SYSTEM_PROMPT},
+            {"role": "user", "content": _build_batch_prompt(products)}
+        ],
+        temperature=0.1,  # Peu de créativité, cohérence max
+        max_tokens=200 + 300 * len(products),
+        response_format={"type": "json_object"}  # Force le JSON
+    )
+
+    # Extraire la réponse
+    result_text = response.choices[0].message.content.strip()
+    try:
+        data = json.loads(result_text)
+    except json.JSONDecodeError:
+        # Si le JSON est invalide, essayer de nettoyer
+        result_text = result_text.replace("```json", "").replace("```", "").strip()
+        data = json.loads(result_text)
+
+    verdicts: List[Optional[Dict[str, Any]]] = [None] * len(products)
+    for item in data.get("results", []):
+        try:
+            index = int(item.pop("id"))
+        except (KeyError, TypeError, ValueError):
+            continue
+        if 0 <= index < len(products):
+            # Validation et enrichissement
+            item.setdefault("approved", True)
+            item.setdefault("confidence", 0.5)
+            item.setdefault("risk_level", "low")
+            item.setdefault("flags", [])
+            item.setdefault("reason", "")
+            item.setdefault("recommendation", "Approved")
+            verdicts[index] = item
+    return verdicts
+
+
+# File partagée du worker: micro-lots, concurrence bornée, cache des verdicts
+moderation_queue = ModerationQueue(call_batch=_moderate_batch_with_ai)
+
+
 async def moderate_product_with_ai(
     product_name: str,
     description: str,
@@ -54,6 +185,9 @@ async def moderate_product_with_ai(
 ) -> Dict[str, Any]:
     """
     Analyse un produit avec l'IA OpenAI pour détecter du contenu inapproprié
+
+    Le produit rejoint le prochain lot de moderation_queue (appel async, sans
+    bloquer la boucle); un contenu déjà modéré est servi depuis le cache.
     
     Returns:
         {
@@ -79,86 +213,13 @@ async def moderate_product_with_ai(
         }
     
     try:
-        # Construire le prompt pour l'IA
-        prompt = f"""Tu es un système de modération de contenu pour une plateforme e-commerce au Maroc.
-Analyse ce produit/service et détermine s'il est ACCEPTABLE ou INACCEPTABLE selon les critères suivants:
-
-CRITÈRES D'INTERDICTION:
-1. Contenu sexuel, adulte ou +18
-2. Armes, explosifs, munitions
-3. Drogues ou substances illicites
-4. Jeux d'argent illégaux
-5. Produits contrefaits ou faux documents
-6. Contenu haineux ou discriminatoire
-7. Contenu violent ou gore
-8. Services illégaux (piratage, fraude, blanchiment)
-9. Tabac ou cigarettes électroniques non autorisées
-10. Alcool sans licence de vente
-11. Médicaments non autorisés ou fausses promesses médicales
-12. Schémas pyramidaux ou MLM frauduleux
-13. Biens volés ou recel
-14. Espèces animales protégées
-15. Vente de données personnelles
-
-PRODUIT À ANALYSER:
-- Nom: {product_name}
-- Description: {description}
-- Catégorie: {category or "Non spécifiée"}
-- Prix: {price} MAD
-- Images: {"Oui" if images_urls else "Non"}
-
-INSTRUCTIONS:
-1. Analyse le nom et la description pour détecter des contenus interdits
-2. Vérifie les termes cachés, euphémismes ou codes
-3. Évalue le risque selon le contexte marocain et la loi islamique
-4. Retourne UNIQUEMENT un JSON valide (pas de markdown, pas de texte avant/après)
-
-FORMAT DE RÉPONSE (JSON STRICT):
-{{
-    "approved": true/false,
-    "confidence": 0.0-1.0,
-    "risk_level": "low"|"medium"|"high"|"critical",
-    "flags": ["categorie1", "categorie2", ...],
-    "reason": "Explication détaillée si rejeté",
-    "recommendation": "Action recommandée"
-}}"""
-
-        # Appel à l'API OpenAI
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # Modèle rapide et économique
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Tu es un expert en modération de contenu e-commerce. Tu réponds UNIQUEMENT en JSON valide, sans markdown ni texte supplémentaire."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.1,  # Peu de créativité, cohérence max
-            max_tokens=500,
-            response_format={"type": "json_object"}  # Force le JSON
-        )
-        
-        # Extraire la réponse
-        result_text = response.choices[0].message.content.strip()
-        
-        # Parser le JSON
-        try:
-            result = json.loads(result_text)
-        except json.JSONDecodeError:
-            # Si le JSON est invalide, essayer de nettoyer
-            result_text = result_text.replace("```json", "").replace("```", "").strip()
-            result = json.loads(result_text)
-        
-        # Validation et enrichissement
-        result.setdefault("approved", True)
-        result.setdefault("confidence", 0.5)
-        result.setdefault("risk_level", "low")
-        result.setdefault("flags", [])
-        result.setdefault("reason", "")
-        result.setdefault("recommendation", "Approved")
+        result = await moderation_queue.moderate({
+            "name": product_name,
+            "description": description,
+            "category": category,
+            "price": price,
+            "images_urls": images_urls
+        })
         
         # Log pour monitoring
         status = "✅ APPROVED" if result["approved"] else "❌ REJECTED"
@@ -185,56 +246,148 @@ FORMAT DE RÉPONSE (JSON STRICT):
 # MODÉRATION PAR MOTS-CLÉS (FALLBACK)
 # ============================================
 
+# Mots entiers (pluriel / féminin tolérés); "mot*" = radical pour les dérivés
+# que l'ancienne recherche par sous-chaîne attrapait (porno, pornographique,
+# sexuellement, escorting, إباحية...)
 PROHIBITED_KEYWORDS = {
     "adult_content": [
-        "sexe", "xxx", "porn", "adulte", "érotique", "sexuel", 
-        "lingerie coquine", "sex toy", "vibr", "escort", "massage sensuel"
+        "sexe", "xxx", "porn*", "adulte", "érotique", "sexuel*",
+        "lingerie coquine", "sex toy", "vibr*", "escort*", "massage sensuel",
+        "إباحي*"
     ],
     "weapons": [
-        "arme", "pistolet", "fusil", "couteau", "explosif", "munition",
-        "grenade", "bombe", "kalachnikov", "revolver"
+        "arme", "armement", "pistolet", "fusil", "couteau", "explosif", "munition",
+        "grenade", "bombe", "kalachnikov", "revolver", "سلاح", "مسدس"
     ],
     "drugs": [
         "drogue", "cannabis", "cocaine", "héroïne", "mdma", "ecstasy",
-        "shit", "beuh", "weed", "joint", "psychotrope"
+        "shit", "beuh", "weed", "joint", "psychotrope",
+        "حشيش", "مخدرات", "كوكايين", "hachich", "zetla", "qarqoubi"
     ],
     "gambling": [
         "casino", "poker", "pari sportif", "jeux d'argent", "bet",
-        "machine à sous", "roulette", "blackjack"
+        "machine à sous", "roulette", "blackjack", "قمار"
     ],
     "counterfeit": [
         "faux", "contrefait", "copie", "réplique", "fake", "imitation",
-        "fausse carte", "faux passeport", "faux diplôme"
+        "fausse carte", "faux passeport", "faux diplôme", "مزور*"
     ],
     "illegal_services": [
-        "piratage", "hacking", "crack", "keygen", "comptes piratés",
+        "piratage", "hacking", "crack", "cracked", "keygen", "comptes piratés",
         "blanchiment", "fausse facture", "fraude"
     ]
 }
 
+# Mots ultra-interdits: rejet immédiat, sans appel IA
+INSTANT_REJECT_KEYWORDS = [
+    "porn*", "xxx", "sexe", "drogue", "cannabis", "cocaine",
+    "arme", "pistolet", "explosif", "escort*", "casino"
+]
+
+# Catégorie réservée du détecteur pour INSTANT_REJECT_KEYWORDS (jamais dans "flags")
+INSTANT_REJECT = "instant_reject"
+
+
+def _compile_keywords(keywords: Dict[str, List[str]], instant_reject: List[str]) -> KeywordMatcher:
+    """Un seul détecteur (un seul parcours du texte) pour les deux listes"""
+    return KeywordMatcher({**keywords, INSTANT_REJECT: instant_reject})
+
+
+# Détecteur compilé une fois (mots entiers, sans accents, FR / AR / darija),
+# remplacé d'un bloc par reload_prohibited_keywords
+_keyword_matcher = _compile_keywords(PROHIBITED_KEYWORDS, INSTANT_REJECT_KEYWORDS)
+_keywords_file_mtime: Optional[float] = None
+_keywords_checked_at = 0.0
+
+
+def reload_prohibited_keywords(
+    keywords: Optional[Dict[str, List[str]]] = None,
+    instant_reject: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    Recompile les listes de mots-clés sans redémarrer le worker
+
+    Sans argument, relit MODERATION_KEYWORDS_FILE s'il est configuré:
+        {"prohibited": {"drugs": [...], ...}, "instant_reject": [...]}
+    Une clé absente garde la liste par défaut du module. Les autres workers
+    relisent le fichier dès que sa date de modification change.
+
+    Raises:
+        OSError / ValueError: fichier illisible ou JSON invalide (listes inchangées)
+    """
+    global _keyword_matcher, _keywords_file_mtime, _keywords_checked_at
+
+    source = "arguments"
+    if keywords is None and instant_reject is None:
+        source = "defaults"
+        if MODERATION_KEYWORDS_FILE:
+            mtime = os.path.getmtime(MODERATION_KEYWORDS_FILE)
+            with open(MODERATION_KEYWORDS_FILE, encoding="utf-8") as f:
+                data = json.load(f)
+            keywords = data.get("prohibited")
+            instant_reject = data.get("instant_reject")
+            _keywords_file_mtime = mtime
+            source = MODERATION_KEYWORDS_FILE
+
+    keywords = keywords if keywords is not None else PROHIBITED_KEYWORDS
+    instant_reject = instant_reject if instant_reject is not None else INSTANT_REJECT_KEYWORDS
+    _keyword_matcher = _compile_keywords(keywords, instant_reject)
+    _keywords_checked_at = time.monotonic()
+
+    print(f"🔄 Moderation keywords reloaded from {source}: {_keyword_matcher.size} keywords")
+    return {
+        "source": source,
+        "categories": list(keywords),
+        "keywords": sum(len(words) for words in keywords.values()),
+        "instant_reject": len(instant_reject)
+    }
+
+
+def _refresh_keywords_if_changed():
+    """Recharge le fichier de mots-clés si modifié (vérifié au plus toutes les N secondes)"""
+    global _keywords_checked_at
+
+    if not MODERATION_KEYWORDS_FILE:
+        return
+    now = time.monotonic()
+    if now - _keywords_checked_at < MODERATION_KEYWORDS_RELOAD_INTERVAL:
+        return
+    _keywords_checked_at = now
+
+    try:
+        if os.path.getmtime(MODERATION_KEYWORDS_FILE) != _keywords_file_mtime:
+            reload_prohibited_keywords()
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Moderation keywords file not reloaded, keeping current lists: {e}")
+
+
 def moderate_product_keywords(product_name: str, description: str) -> Dict[str, Any]:
     """
     Modération basique par mots-clés (fallback si pas d'IA)
     """
-    text = f"{product_name} {description}".lower()
-    flags = []
-    
-    for category, keywords in PROHIBITED_KEYWORDS.items():
-        for keyword in keywords:
-            if keyword in text:
-                flags.append(category)
-                break
-    
+    _refresh_keywords_if_changed()
+    return _keyword_result(_keyword_matcher.find(f"{product_name} {description}"))
+
+
+def _keyword_result(matches: Dict[str, List[str]]) -> Dict[str, Any]:
+    """Résultat de modération à partir des mots-clés trouvés"""
+    instant_reject = matches.pop(INSTANT_REJECT, None)
+    flags = list(matches)
+    if instant_reject and not flags:
+        flags = ["prohibited_keyword"]
+        matches = {"prohibited_keyword": instant_reject}
+
     if flags:
         return {
             "approved": False,
             "confidence": 0.7,
             "risk_level": "high",
-            "flags": list(set(flags)),
+            "flags": flags,
+            "matched_keywords": matches,
             "reason": f"Mots-clés interdits détectés: {', '.join(flags)}",
             "recommendation": "Manual review required - keyword match"
         }
-    
+
     return {
         "approved": True,
         "confidence": 0.6,
@@ -244,6 +397,34 @@ def moderate_product_keywords(product_name: str, description: str) -> Dict[str,
         "recommendation": "Approved by keyword filter"
     }
 
+
+def screen_products(products: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Filtrage par mots-clés d'un lot de produits (import en masse), en mémoire
+
+    À appeler avant toute modération IA: les produits "instant_reject" sont
+    rejetés sans appel payant, les autres peuvent passer par moderate_product.
+
+    Args:
+        products: Dicts avec "name" et "description"
+
+    Returns:
+        Un résultat moderate_product_keywords par produit (même ordre),
+        avec "instant_reject"
+    """
+    _refresh_keywords_if_changed()
+
+    results = []
+    for product in products:
+        name = product.get("name") or ""
+        description = product.get("description") or ""
+        matches = _keyword_matcher.find(f"{name} {description}")
+        result = _keyword_result(dict(matches))
+        result["instant_reject"] = INSTANT_REJECT in matches
+        result["product_name"] = name
+        results.append(result)
+    return results
+
 # ============================================
 # FONCTION PRINCIPALE
 # ============================================
@@ -282,21 +463,266 @@ async def moderate_product(
             "recommendation": "Reject - incomplete product information"
         }
     
-    # Modération par IA si disponible
+    # Rejet immédiat des contenus évidents, sans appel IA payant
+    prescreen = {}
     if use_ai and client:
+        _refresh_keywords_if_changed()
+        prescreen = _keyword_matcher.find(f"{product_name} {description}")
+
+    if INSTANT_REJECT in prescreen:
+        result = _keyword_result(prescreen)
+        result.update({
+            "approved": False,
+            "confidence": 0.9,
+            "risk_level": "critical",
+            "recommendation": "Reject - prohibited keyword"
+        })
+        method = "keywords_prescreen"
+    # Modération par IA si disponible
+    elif use_ai and client:
         result = await moderate_product_with_ai(
             product_name, description, category, price, images_urls
         )
+        method = "ai"
     else:
         # Fallback sur mots-clés
         result = moderate_product_keywords(product_name, description)
+        method = "keywords"
     
     # Ajouter metadata
-    result["moderation_method"] = "ai" if (use_ai and client) else "keywords"
+    result["moderation_method"] = method
     result["product_name"] = product_name
     
     return result
 
+# ============================================
+# MODÉRATION NON BLOQUANTE (CRÉATION DE PRODUIT)
+# ============================================
+
+# Vérifications IA en cours (attendues à l'arrêt du serveur)
+_background_moderations: set = set()
+
+
+def _product_moderation_status(result: Dict[str, Any]) -> str:
+    """Statut du produit: approuvé, ou en révision admin (moderation_queue)"""
+    return "approved" if result.get("approved") else "under_review"
+
+
+def _save_moderation(
+    product_id: str,
+    merchant_id: Optional[str],
+    user_id: Optional[str],
+    product: Dict[str, Any],
+    result: Optional[Dict[str, Any]]
+) -> None:
+    """Enregistre le verdict (moderation_queue + statut du produit) - appel synchrone"""
+    from supabase_client import get_supabase_client
+    supabase = get_supabase_client()
+
+    if result is not None:
+        supabase.rpc("submit_product_for_moderation", {
+            "p_product_id": product_id,
+            "p_merchant_id": merchant_id,
+            "p_user_id": user_id,
+            "p_product_name": product["name"],
+            "p_product_description": product["description"],
+            "p_product_category": product.get("category"),
+            "p_product_price": product.get("price"),
+            "p_product_images": product.get("images_urls") or [],
+            "p_ai_result": result
+        }).execute()
+        status = _product_moderation_status(result)
+    else:
+        status = "pending_review"
+
+    supabase.table("products").update({"moderation_status": status}).eq("id", product_id).execute()
+
+
+async def _moderate_in_background(
+    product_id, merchant_id, user_id, product: Dict[str, Any], mark_pending: bool = True
+) -> None:
+    if mark_pending:
+        try:
+            await asyncio.to_thread(_save_moderation, product_id, merchant_id, user_id, product, None)
+        except Exception as e:
+            print(f"⚠️ Product {product_id} not marked pending_review: {e}")
+
+    result = await moderate_product(
+        product["name"], product["description"], product.get("category"), product.get("price"), product.get("images_urls")
+    )
+    try:
+        await asyncio.to_thread(_save_moderation, product_id, merchant_id, user_id, product, result)
+    except Exception as e:
+        print(f"❌ Error saving moderation of product {product_id}: {e}")
+
+
+def _start_background_moderation(product_id, merchant_id, user_id, product: Dict[str, Any], mark_pending: bool = True):
+    task = asyncio.create_task(
+        _moderate_in_background(product_id, merchant_id, user_id, product, mark_pending)
+    )
+    _background_moderations.add(task)
+    task.add_done_callback(_background_moderations.discard)
+
+
+async def submit_product_moderation(
+    product_id: str,
+    merchant_id: Optional[str],
+    user_id: Optional[str],
+    product_name: str,
+    description: str,
+    category: Optional[str] = None,
+    price: Optional[float] = None,
+    images_urls: Optional[list] = None
+) -> Dict[str, Any]:
+    """
+    Modère un produit qui vient d'être créé, sans faire attendre la requête
+
+    Verdict immédiat quand il ne coûte pas d'appel IA (IA non configurée,
+    mot-clé interdit, contenu déjà modéré). Sinon le produit passe en
+    "pending_review" et le verdict IA est enregistré à son arrivée.
+
+    Returns:
+        Résultat de moderate_product avec "status", ou {"status": "pending_review"}
+    """
+    product = {
+        "name": product_name,
+        "description": description,
+        "category": category,
+        "price": price,
+        "images_urls": images_urls
+    }
+
+    immediate = (
+        not client
+        or not product_name
+        or not description
+        or quick_check_prohibited_keywords(f"{product_name} {description}")
+        or moderation_queue.cached_verdict(product) is not None
+    )
+    if immediate:
+        result = await moderate_product(product_name, description, category, price, images_urls)
+        try:
+            await asyncio.to_thread(_save_moderation, product_id, merchant_id, user_id, product, result)
+        except Exception as e:
+            print(f"❌ Error saving moderation of product {product_id}: {e}")
+        return {**result, "status": _product_moderation_status(result)}
+
+    _start_background_moderation(product_id, merchant_id, user_id, product)
+
+    return {
+        "status": "pending_review",
+        "moderation_method": "ai",
+        "product_name": product_name,
+        "recommendation": "AI review in progress"
+    }
+
+
+# ============================================
+# REPRISE DES PRODUITS SANS VERDICT
+# ============================================
+
+# Passage périodique (start_moderation_sweeper / stop_moderation)
+_sweeper_task: Optional[asyncio.Task] = None
+
+
+def _claim_stale_pending(limit: int) -> List[Dict[str, Any]]:
+    """
+    Produits "pending_review" depuis plus de MODERATION_PENDING_TIMEOUT - appel synchrone
+
+    Chaque produit est réservé par un UPDATE conditionnel de updated_at: un
+    seul worker le soumet à nouveau, et pas avant un nouveau délai.
+    """
+    from supabase_client import get_supabase_client
+    supabase = get_supabase_client()
+    cutoff = (datetime.utcnow() - timedelta(seconds=MODERATION_PENDING_TIMEOUT)).isoformat()
+
+    # idx_products_moderation_pending (created_at, statut en attente)
+    stale = (
+        supabase.table("products")
+        .select("id, merchant_id, name, description, category, price, images, merchants(user_id)")
+        .eq("moderation_status", "pending_review")
+        .lt("created_at", cutoff)
+        .lt("updated_at", cutoff)
+        .order("created_at")
+        .limit(limit)
+        .execute()
+    ).data or []
+
+    claimed = []
+    now = datetime.utcnow().isoformat()
+    for product in stale:
+        result = (
+            supabase.table("products")
+            .update({"updated_at": now})
+            .eq("id", product["id"])
+            .eq("moderation_status", "pending_review")
+            .lt("updated_at", cutoff)
+            .execute()
+        )
+        if result.data:
+            claimed.append(product)
+    return claimed
+
+
+async def sweep_pending_moderations(limit: int = MODERATION_SWEEP_BATCH_SIZE) -> int:
+    """
+    Soumet à nouveau les produits restés "pending_review" (worker redémarré,
+    arrêté avant le verdict ou délai d'arrêt dépassé)
+
+    Returns:
+        Nombre de produits soumis à nouveau
+    """
+    stale = await asyncio.to_thread(_claim_stale_pending, limit)
+    for product in stale:
+        merchant = product.get("merchants") or {}
+        _start_background_moderation(
+            product["id"],
+            product.get("merchant_id"),
+            merchant.get("user_id"),
+            {
+                "name": product.get("name") or "",
+                "description": product.get("description") or "",
+                "category": product.get("category"),
+                "price": product.get("price"),
+                "images_urls": product.get("images")
+            },
+            mark_pending=False
+        )
+    return len(stale)
+
+
+async def _sweep_periodically() -> None:
+    while True:
+        try:
+            count = await sweep_pending_moderations()
+            if count:
+                print(f"🔁 {count} product(s) resubmitted for moderation")
+        except Exception as e:
+            print(f"⚠️ Moderation sweep failed: {e}")
+        await asyncio.sleep(MODERATION_SWEEP_INTERVAL)
+
+
+def start_moderation_sweeper() -> None:
+    """Lance la reprise périodique des produits sans verdict (depuis la boucle asyncio)"""
+    global _sweeper_task
+    if _sweeper_task is None or _sweeper_task.done():
+        _sweeper_task = asyncio.get_running_loop().create_task(_sweep_periodically())
+
+
+async def stop_moderation(timeout: float = 10.0) -> None:
+    """Termine les modérations en cours et arrête la file IA (arrêt du serveur)"""
+    global _sweeper_task
+    if _sweeper_task is not None:
+        _sweeper_task.cancel()
+        try:
+            await _sweeper_task
+        except asyncio.CancelledError:
+            pass
+        _sweeper_task = None
+    if _background_moderations:
+        await asyncio.wait(list(_background_moderations), timeout=timeout)
+    await moderation_queue.stop(timeout)
+
 # ============================================
 # VÉRIFICATION RAPIDE
 # ============================================
@@ -304,21 +730,10 @@ async def moderate_product(
 def quick_check_prohibited_keywords(text: str) -> bool:
     """
     Vérification rapide pour rejeter immédiatement les contenus évidents
-    Retourne True si contenu suspect détecté
+    Retourne True si contenu suspect détecté (INSTANT_REJECT_KEYWORDS)
     """
-    text_lower = text.lower()
-    
-    # Liste de mots ultra-interdits qui déclenchent un rejet immédiat
-    instant_reject_words = [
-        "porn", "xxx", "sexe", "drogue", "cannabis", "cocaine",
-        "arme", "pistolet", "explosif", "escort", "casino"
-    ]
-    
-    for word in instant_reject_words:
-        if word in text_lower:
-            return True
-    
-    return False
+    _refresh_keywords_if_changed()
+    return INSTANT_REJECT in _keyword_matcher.find(text)
 
 # ============================================
 # STATISTIQUES DE MODÉRATION
@@ -1,11 +1,15 @@
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 
+from utils.async_db import async_db, AsyncRepositoryProxy
+
 
 class BaseRepository:
     def __init__(self, supabase_client):
         self.supabase = supabase_client
         self.table_name = None
+        # Variante awaitable: `await repo.aio.find_by_id(id)` depuis un handler async
+        self.aio = AsyncRepositoryProxy(self, async_db)
     
     def _execute_query(self, query):
         try:
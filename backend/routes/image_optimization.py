@@ -4,10 +4,11 @@ Endpoints pour upload, optimisation et gestion d'images
 """
 from flask import Blueprint, request, jsonify, send_file
 from werkzeug.utils import secure_filename
+import atexit
 import io
 from typing import Optional
 
-from services.image_optimizer import ImageOptimizer
+from services.image_optimizer import ImageOptimizer, shutdown_encode_pools
 from utils.image_processing import validate_image, ImageValidationError, get_safe_filename
 from utils.logger import logger
 
@@ -21,6 +22,9 @@ optimizer = ImageOptimizer(
     enable_webp=True
 )
 
+# Processus d'encodage arrêtés avec l'application
+atexit.register(shutdown_encode_pools)
+
 # Configuration
 ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'webp', 'gif'}
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
@@ -15,12 +15,14 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from services.deposit_service import DepositService
 from services.notification_service import NotificationService
 from services.lead_service import LeadService
+from services.stats_rollup_service import StatsRollupService
 from supabase_client import supabase
 
 # Initialiser les services
 deposit_service = DepositService(supabase)
 notification_service = NotificationService(supabase)
 lead_service = LeadService(supabase)
+stats_rollup_service = StatsRollupService(supabase)
 
 
 def check_deposits_and_send_alerts():
@@ -62,9 +64,11 @@ def check_deposits_and_send_alerts():
                 merchant_id = deposit['merchant_id']
                 current_balance = float(deposit['current_balance'])
                 initial_amount = float(deposit['initial_amount'])
+                # Solde non engagé (colonne générée, migration 013)
+                available_balance = float(deposit.get('available_balance', current_balance) or 0)
                 
-                # Calculer le pourcentage restant
-                percentage = (current_balance / initial_amount) * 100 if initial_amount > 0 else 0
+                # Calculer le pourcentage restant (hors montants réservés)
+                percentage = (available_balance / initial_amount) * 100 if initial_amount > 0 else 0
                 
                 # Déterminer le niveau d'alerte
                 if current_balance <= 0:
@@ -207,32 +211,23 @@ def cleanup_expired_leads():
             try:
                 lead_id = lead['id']
                 
-                # Marquer comme "lost" (perdu)
-                supabase.table('leads')\
+                # Marquer comme "lost" (perdu), sauf s'il a été validé entre-temps
+                expired = supabase.table('leads')\
                     .update({
                         'status': 'lost',
                         'rejection_reason': 'Expiré - Aucune validation après 72h',
                         'updated_at': datetime.now().isoformat()
                     })\
                     .eq('id', lead_id)\
+                    .eq('status', 'pending')\
                     .execute()
                 
-                # Libérer la commission réservée
+                if not expired.data:
+                    continue
+                
+                # Libérer la commission réservée (atomique via le registre)
                 if lead.get('commission_amount'):
-                    deposit_id = supabase.table('company_deposits')\
-                        .select('id')\
-                        .eq('merchant_id', lead['merchant_id'])\
-                        .eq('status', 'active')\
-                        .limit(1)\
-                        .execute()
-                    
-                    if deposit_id.data and len(deposit_id.data) > 0:
-                        supabase.table('company_deposits')\
-                            .update({
-                                'reserved_amount': supabase.table('company_deposits').select('reserved_amount').eq('id', deposit_id.data[0]['id']).execute().data[0]['reserved_amount'] - float(lead['commission_amount'])
-                            })\
-                            .eq('id', deposit_id.data[0]['id'])\
-                            .execute()
+                    lead_service.release_lead_reservation(lead)
                 
                 print(f"   🗑️  Lead {lead_id} expiré et marqué comme perdu")
             
@@ -310,6 +305,25 @@ def generate_daily_report():
         print(f"❌ Erreur génération rapport: {e}")
 
 
+def reconcile_dashboard_stats():
+    """
+    Réconciliation HORAIRE des compteurs matérialisés du dashboard
+    
+    Les triggers maintiennent stats_rollups en continu; cette tâche
+    corrige toute dérive en recalculant depuis les tables sources.
+    """
+    print(f"\n🔄 [{datetime.now()}] Réconciliation des compteurs dashboard...")
+    
+    result = stats_rollup_service.reconcile()
+    
+    if result.get('success'):
+        print(f"✅ Compteurs réconciliés: {result.get('rows')} lignes")
+    else:
+        print(f"❌ Erreur réconciliation: {result.get('error')}")
+    
+    return result
+
+
 # ============================================
 # CONFIGURATION DU SCHEDULER
 # ============================================
@@ -344,6 +358,16 @@ scheduler.add_job(
 )
 
 
+# Réconciliation des compteurs dashboard TOUTES LES HEURES
+scheduler.add_job(
+    reconcile_dashboard_stats,
+    trigger=CronTrigger(minute=30),  # Chaque heure à H:30
+    id='reconcile_dashboard_stats',
+    name='Réconciliation compteurs dashboard',
+    replace_existing=True
+)
+
+
 def start_scheduler():
     """Démarre le scheduler"""
     try:
@@ -352,6 +376,7 @@ def start_scheduler():
         print("   🔄 Vérification dépôts: Toutes les heures")
         print("   🧹 Nettoyage leads expirés: 23:00 quotidien")
         print("   📊 Rapport quotidien: 09:00 quotidien")
+        print("   🔄 Réconciliation compteurs dashboard: Toutes les heures")
         return scheduler
     except Exception as e:
         print(f"❌ Erreur démarrage scheduler: {e}")
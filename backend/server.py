@@ -20,6 +20,7 @@ from typing import Optional, List
 from datetime import datetime, timedelta
 import jwt
 import os
+import asyncio
 import logging
 from dotenv import load_dotenv
 
@@ -51,6 +52,16 @@ from db_helpers import (
     update_payout_status,
 )
 from supabase_client import supabase
+from services.sales_timeseries import get_sales_timeseries
+from utils.async_db import async_db
+from utils.identity import (
+    get_influencer_id,
+    get_merchant_id,
+    identity_claims,
+    invalidate_identity,
+    remember_identity,
+)
+from utils.product_visibility import is_publicly_visible
 
 # Initialize logger
 logging.basicConfig(level=logging.INFO)
@@ -353,6 +364,10 @@ class PayoutStatusUpdate(BaseModel):
 class AffiliateLinkGenerate(BaseModel):
     product_id: str = Field(..., min_length=1)
 
+class TrackingLinkUpdate(BaseModel):
+    status: Optional[str] = Field(None, pattern="^(active|inactive)$")
+    destination_url: Optional[str] = Field(None, min_length=1)
+
 class AIContentGenerate(BaseModel):
     type: str = Field(default="social_post", pattern="^(social_post|email|blog)$")
     platform: Optional[str] = "Instagram"
@@ -393,6 +408,7 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         token = credentials.credentials
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        remember_identity(payload)
         return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(
@@ -478,7 +494,8 @@ async def login(login_data: LoginRequest):
     access_token = create_access_token({
         "sub": user["id"],
         "email": user["email"],
-        "role": user["role"]
+        "role": user["role"],
+        **identity_claims(user["id"], user["role"])
     })
 
     # Retirer le password_hash de la réponse
@@ -523,7 +540,8 @@ async def verify_2fa(data: TwoFAVerifyRequest):
     access_token = create_access_token({
         "sub": user["id"],
         "email": user["email"],
-        "role": user["role"]
+        "role": user["role"],
+        **identity_claims(user["id"], user["role"])
     })
 
     user_data = {k: v for k, v in user.items() if k != "password_hash"}
@@ -537,7 +555,7 @@ async def verify_2fa(data: TwoFAVerifyRequest):
 @app.get("/api/auth/me")
 async def get_current_user(payload: dict = Depends(verify_token)):
     """Récupère l'utilisateur connecté"""
-    user = get_user_by_id(payload["sub"])
+    user = await async_db.run(get_user_by_id, payload["sub"])
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     user_data = {k: v for k, v in user.items() if k != "password_hash"}
@@ -588,6 +606,7 @@ async def register(data: RegisterRequest):
                 'engagement_rate': 3.0
             }
             supabase.table('influencers').insert(influencer_data).execute()
+        invalidate_identity(user["id"])  # Profil créé: plus de résolution négative en cache
     except Exception as e:
         print(f"Warning: Could not create profile for {data.role}: {e}")
         # Continue anyway, profile can be created later
@@ -601,21 +620,21 @@ async def register(data: RegisterRequest):
 @app.get("/api/dashboard/stats")
 async def get_dashboard_stats_endpoint(payload: dict = Depends(verify_token)):
     """Statistiques du dashboard selon le rôle"""
-    user = get_user_by_id(payload["sub"])
+    user = await async_db.run(get_user_by_id, payload["sub"])
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    stats = get_dashboard_stats(user["role"], user["id"])
+    stats = await async_db.run(get_dashboard_stats, user["role"], user["id"])
     return stats
 
 @app.get("/api/analytics/overview")
 async def get_analytics_overview(payload: dict = Depends(verify_token)):
     """Vue d'ensemble des analytics"""
-    user = get_user_by_id(payload["sub"])
+    user = await async_db.run(get_user_by_id, payload["sub"])
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    stats = get_dashboard_stats(user["role"], user["id"])
+    stats = await async_db.run(get_dashboard_stats, user["role"], user["id"])
     return stats
 
 # ============================================
@@ -625,13 +644,13 @@ async def get_analytics_overview(payload: dict = Depends(verify_token)):
 @app.get("/api/merchants")
 async def get_merchants(payload: dict = Depends(verify_token)):
     """Liste tous les merchants"""
-    merchants = get_all_merchants()
+    merchants = await async_db.run(get_all_merchants)
     return {"merchants": merchants, "total": len(merchants)}
 
 @app.get("/api/merchants/{merchant_id}")
 async def get_merchant(merchant_id: str, payload: dict = Depends(verify_token)):
     """Récupère les détails d'un merchant"""
-    merchant = get_merchant_by_id(merchant_id)
+    merchant = await async_db.run(get_merchant_by_id, merchant_id)
     if not merchant:
         raise HTTPException(status_code=404, detail="Merchant non trouvé")
     return merchant
@@ -643,13 +662,13 @@ async def get_merchant(merchant_id: str, payload: dict = Depends(verify_token)):
 @app.get("/api/influencers")
 async def get_influencers(payload: dict = Depends(verify_token)):
     """Liste tous les influencers"""
-    influencers = get_all_influencers()
+    influencers = await async_db.run(get_all_influencers)
     return {"influencers": influencers, "total": len(influencers)}
 
 @app.get("/api/influencers/{influencer_id}")
 async def get_influencer(influencer_id: str, payload: dict = Depends(verify_token)):
     """Récupère les détails d'un influencer"""
-    influencer = get_influencer_by_id(influencer_id)
+    influencer = await async_db.run(get_influencer_by_id, influencer_id)
     if not influencer:
         raise HTTPException(status_code=404, detail="Influencer non trouvé")
     return influencer
@@ -720,7 +739,7 @@ async def get_products(category: Optional[str] = None, merchant_id: Optional[str
 async def get_product(product_id: str):
     """Récupère les détails d'un produit"""
     product = get_product_by_id(product_id)
-    if not product:
+    if not product or not is_publicly_visible(product):
         raise HTTPException(status_code=404, detail="Produit non trouvé")
     return product
 
@@ -757,7 +776,7 @@ async def generate_affiliate_link(data: AffiliateLinkGenerate, payload: dict = D
         raise HTTPException(status_code=404, detail="Profil influencer non trouvé")
 
     product = get_product_by_id(data.product_id)
-    if not product:
+    if not product or not is_publicly_visible(product):
         raise HTTPException(status_code=404, detail="Produit non trouvé")
 
     # Générer un code unique
@@ -937,49 +956,36 @@ async def get_clicks_endpoint(payload: dict = Depends(verify_token)):
 # ============================================
 
 @app.get("/api/analytics/merchant/sales-chart")
-async def get_merchant_sales_chart(payload: dict = Depends(verify_token)):
+async def get_merchant_sales_chart(
+    days: int = Query(7, ge=1, le=365),
+    granularity: str = Query("day", pattern="^(day|week|month)$"),
+    payload: dict = Depends(verify_token)
+):
     """
-    Données de ventes des 7 derniers jours pour le marchand
+    Données de ventes des N derniers jours pour le marchand (7 par défaut)
     Format: [{date: '01/06', ventes: 12, revenus: 3500}, ...]
     """
+    # Admin: toute la plateforme; sinon le profil marchand du sujet du token
+    merchant_id = None
+    if payload.get("role") != 'admin':
+        merchant_id = await async_db.run(get_merchant_id, payload["sub"])
+        if not merchant_id:
+            raise HTTPException(status_code=403, detail="Profil marchand requis")
+
     try:
-        from datetime import datetime, timedelta
-        
-        user_id = payload.get("user_id")
-        role = payload.get("role")
-        
-        # Calculer les 7 derniers jours
-        today = datetime.now()
-        days_data = []
-        
-        for i in range(6, -1, -1):  # 6 jours en arrière jusqu'à aujourd'hui
-            target_date = today - timedelta(days=i)
-            date_str = target_date.strftime('%Y-%m-%d')
-            
-            # Query: ventes du jour pour ce marchand
-            query = supabase.table('sales').select('amount, commission, status')
-            
-            # Filtrer par merchant_id si pas admin
-            if role != 'admin':
-                query = query.eq('merchant_id', user_id)
-            
-            # Filtrer par date (créées ce jour-là)
-            query = query.gte('created_at', f'{date_str}T00:00:00').lt('created_at', f'{date_str}T23:59:59')
-            
-            response = query.execute()
-            sales = response.data if response.data else []
-            
-            # Calculer les totaux
-            ventes_count = len(sales)
-            revenus_total = sum(float(s.get('amount', 0)) for s in sales)
-            
-            days_data.append({
-                'date': target_date.strftime('%d/%m'),
-                'ventes': ventes_count,
-                'revenus': round(revenus_total, 2)
-            })
+        # Une seule requête pour toute la fenêtre, agrégée par bucket
+        series = await async_db.run(
+            get_sales_timeseries,
+            supabase,
+            days=days,
+            granularity=granularity,
+            merchant_id=merchant_id
+        )
         
-        return {"data": days_data}
+        return {"data": [
+            {'date': b['label'], 'ventes': b['count'], 'revenus': b['amount']}
+            for b in series
+        ]}
         
     except Exception as e:
         print(f"Error fetching merchant sales chart: {e}")
@@ -987,79 +993,56 @@ async def get_merchant_sales_chart(payload: dict = Depends(verify_token)):
         return {"data": [{"date": f"0{i}/01", "ventes": 0, "revenus": 0} for i in range(1, 8)]}
 
 @app.get("/api/analytics/influencer/earnings-chart")
-async def get_influencer_earnings_chart(payload: dict = Depends(verify_token)):
+async def get_influencer_earnings_chart(
+    days: int = Query(7, ge=1, le=365),
+    granularity: str = Query("day", pattern="^(day|week|month)$"),
+    payload: dict = Depends(verify_token)
+):
     """
-    Données de revenus des 7 derniers jours pour l'influenceur
+    Données de revenus des N derniers jours pour l'influenceur (7 par défaut)
     Format: [{date: '01/06', gains: 450}, ...]
     """
+    influencer_id = await async_db.run(get_influencer_id, payload["sub"])
+    if not influencer_id:
+        raise HTTPException(status_code=403, detail="Profil influenceur requis")
+
     try:
-        from datetime import datetime, timedelta
-        
-        user_id = payload.get("user_id")
-        today = datetime.now()
-        days_data = []
-        
-        for i in range(6, -1, -1):
-            target_date = today - timedelta(days=i)
-            date_str = target_date.strftime('%Y-%m-%d')
-            
-            # Query: commissions gagnées ce jour
-            query = supabase.table('sales').select('commission').eq('affiliate_id', user_id)
-            query = query.gte('created_at', f'{date_str}T00:00:00').lt('created_at', f'{date_str}T23:59:59')
-            
-            response = query.execute()
-            sales = response.data if response.data else []
-            
-            gains_total = sum(float(s.get('commission', 0)) for s in sales)
-            
-            days_data.append({
-                'date': target_date.strftime('%d/%m'),
-                'gains': round(gains_total, 2)
-            })
+        series = await async_db.run(
+            get_sales_timeseries,
+            supabase,
+            days=days,
+            granularity=granularity,
+            affiliate_id=influencer_id
+        )
         
-        return {"data": days_data}
+        return {"data": [{'date': b['label'], 'gains': b['commission']} for b in series]}
         
     except Exception as e:
         print(f"Error fetching influencer earnings chart: {e}")
         return {"data": [{"date": f"0{i}/01", "gains": 0} for i in range(1, 8)]}
 
 @app.get("/api/analytics/admin/revenue-chart")
-async def get_admin_revenue_chart(payload: dict = Depends(verify_token)):
+async def get_admin_revenue_chart(
+    days: int = Query(7, ge=1, le=365),
+    granularity: str = Query("day", pattern="^(day|week|month)$"),
+    payload: dict = Depends(verify_token)
+):
     """
-    Données de revenus des 7 derniers jours pour l'admin (toute la plateforme)
+    Données de revenus des N derniers jours pour l'admin (toute la plateforme)
     Format: [{date: '01/06', revenus: 8500}, ...]
     """
     try:
-        from datetime import datetime, timedelta
-        
         role = payload.get("role")
         
         if role != 'admin':
             raise HTTPException(status_code=403, detail="Admin access required")
         
-        today = datetime.now()
-        days_data = []
+        series = await async_db.run(get_sales_timeseries, supabase, days=days, granularity=granularity)
         
-        for i in range(6, -1, -1):
-            target_date = today - timedelta(days=i)
-            date_str = target_date.strftime('%Y-%m-%d')
-            
-            # Query: toutes les ventes du jour
-            query = supabase.table('sales').select('amount')
-            query = query.gte('created_at', f'{date_str}T00:00:00').lt('created_at', f'{date_str}T23:59:59')
-            
-            response = query.execute()
-            sales = response.data if response.data else []
-            
-            revenus_total = sum(float(s.get('amount', 0)) for s in sales)
-            
-            days_data.append({
-                'date': target_date.strftime('%d/%m'),
-                'revenus': round(revenus_total, 2)
-            })
-        
-        return {"data": days_data}
+        return {"data": [{'date': b['label'], 'revenus': b['amount']} for b in series]}
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error fetching admin revenue chart: {e}")
         return {"data": [{"date": f"0{i}/01", "revenus": 0} for i in range(1, 8)]}
@@ -1899,12 +1882,18 @@ async def startup_event():
     print("⏰ Lancement du scheduler de paiements automatiques...")
     start_scheduler()
     print("✅ Scheduler actif")
+    if tracking_service.click_buffer is not None:
+        tracking_service.click_buffer.start()
+    await asyncio.to_thread(tracking_service.warm_link_cache)
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Événement d'arrêt - Arrête le scheduler"""
     print("🛑 Arrêt du serveur...")
+    if tracking_service.click_buffer is not None:
+        await tracking_service.click_buffer.stop()
     stop_scheduler()
+    async_db.shutdown(wait=False)
     print("✅ Scheduler arrêté")
 
 # ============================================
@@ -2077,6 +2066,37 @@ async def redirect_tracking_link(short_code: str, request: Request, response: Re
         raise HTTPException(status_code=500, detail="Erreur lors du tracking")
 
 
+@app.get("/api/admin/tracking/cache-stats")
+async def get_tracking_cache_stats(payload: dict = Depends(verify_token)):
+    """Compteurs du cache de résolution des short codes et du tampon de clics (admin only)"""
+    user = await async_db.run(get_user_by_id, payload["sub"])
+    if not user:
+        raise HTTPException(status_code=401, detail="Utilisateur introuvable")
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin uniquement")
+
+    return {
+        "link_cache": tracking_service.get_cache_stats(),
+        "click_buffer": (
+            {**tracking_service.click_buffer.stats, "pending": len(tracking_service.click_buffer)}
+            if tracking_service.click_buffer is not None
+            else None
+        ),
+    }
+
+
+@app.get("/api/admin/db/stats")
+async def get_db_call_stats(payload: dict = Depends(verify_token)):
+    """Latence et concurrence des appels base de données du worker (admin only)"""
+    user = await async_db.run(get_user_by_id, payload["sub"])
+    if not user:
+        raise HTTPException(status_code=401, detail="Utilisateur introuvable")
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin uniquement")
+
+    return async_db.get_stats()
+
+
 @app.post("/api/tracking-links/generate")
 async def generate_tracking_link(data: AffiliateLinkGenerate, payload: dict = Depends(verify_token)):
     """
@@ -2167,6 +2187,51 @@ async def get_tracking_link_stats(link_id: str, payload: dict = Depends(verify_t
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _tracking_link_scope(payload: dict) -> Optional[str]:
+    """influencer_id propriétaire des liens modifiables (None pour un admin)"""
+    if payload.get("role") == "admin":
+        return None
+    influencer_id = await async_db.run(get_influencer_id, payload["sub"])
+    if not influencer_id:
+        raise HTTPException(status_code=403, detail="Profil influenceur requis")
+    return influencer_id
+
+
+def _tracking_link_result(result: dict) -> dict:
+    if result.get("success"):
+        return result
+    if result.get("error") == "Lien introuvable":
+        raise HTTPException(status_code=404, detail="Lien introuvable")
+    if result.get("error") == "Aucune modification":
+        raise HTTPException(status_code=400, detail="Aucune modification")
+    raise HTTPException(status_code=500, detail=result.get("error"))
+
+
+@app.patch("/api/tracking-links/{link_id}")
+async def update_tracking_link(link_id: str, data: TrackingLinkUpdate, payload: dict = Depends(verify_token)):
+    """
+    Modifie le statut et/ou la destination d'un lien tracké
+
+    La redirection du short code est invalidée dans le cache du worker.
+    """
+    influencer_id = await _tracking_link_scope(payload)
+    result = await tracking_service.update_link(
+        link_id,
+        status=data.status,
+        destination_url=data.destination_url,
+        influencer_id=influencer_id
+    )
+    return _tracking_link_result(result)
+
+
+@app.delete("/api/tracking-links/{link_id}")
+async def deactivate_tracking_link(link_id: str, payload: dict = Depends(verify_token)):
+    """Désactive un lien tracké: son short code ne redirige plus"""
+    influencer_id = await _tracking_link_scope(payload)
+    result = await tracking_service.update_link(link_id, status="inactive", influencer_id=influencer_id)
+    return _tracking_link_result(result)
+
+
 # ============================================
 # ENDPOINTS WEBHOOKS E-COMMERCE
 # ============================================
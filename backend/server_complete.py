@@ -5,7 +5,7 @@ Plateforme d'affiliation influenceurs-marchands au Maroc
 
 from fastapi import FastAPI, HTTPException, Depends, status, Request, Response, Query, File, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi.responses import RedirectResponse, JSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List, Dict, Any, Annotated
@@ -13,6 +13,7 @@ from datetime import datetime, timedelta
 import jwt
 import os
 import sys
+import asyncio
 import json
 import bcrypt
 import time
@@ -52,6 +53,13 @@ except Exception as e:
     supabase = None
     SUPABASE_ENABLED = False
 
+# Identity claims (user_id -> merchant_id / influencer_id)
+from utils.identity import identity_claims, remember_identity, IdentityNotFound
+from utils.product_visibility import is_publicly_visible, only_public_products
+
+# Exports (rapports en streaming)
+from services.report_generator import report_generator, ReportType, ReportFormat
+
 # Services
 try:
     from services.email_service import email_service, EmailTemplates
@@ -71,13 +79,21 @@ except ImportError as e:
 
 # Translation service with OpenAI and DB cache
 try:
-    from translation_service import init_translation_service, translation_service
+    from translation_service import init_translation_service, translation_service, SUPPORTED_LANGUAGES
     TRANSLATION_SERVICE_AVAILABLE = True
     print("✅ Translation service with OpenAI loaded")
 except ImportError as e:
     TRANSLATION_SERVICE_AVAILABLE = False
     print(f"⚠️ Translation service not available: {e}")
 
+# Search index incremental sync (Elasticsearch or embedded index)
+try:
+    from services.search_sync import SEARCH_SYNC_ENABLED, search_sync
+    SEARCH_SYNC_AVAILABLE = SEARCH_SYNC_ENABLED
+except ImportError as e:
+    SEARCH_SYNC_AVAILABLE = False
+    print(f"⚠️ Search sync not available: {e}")
+
 # Database queries helpers (real data, not mocked)
 try:
     from db_queries_real import (
@@ -100,6 +116,8 @@ try:
         get_top_products,
         get_conversion_funnel,
         get_all_commissions,
+        iter_sales_for_export,
+        iter_commissions_for_export,
         request_payout,
         approve_payout,
         update_sale_status,
@@ -128,6 +146,7 @@ except ImportError as e:
 # Moderation endpoints
 try:
     from moderation_endpoints import router as moderation_router
+    from moderation_service import start_moderation_sweeper, stop_moderation, submit_product_moderation
     MODERATION_ENDPOINTS_AVAILABLE = True
     print("✅ Moderation endpoints loaded successfully")
 except ImportError as e:
@@ -250,11 +269,56 @@ app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 # Initialize Translation Service with Supabase
 print(f"🔍 DEBUG: TRANSLATION_SERVICE_AVAILABLE={TRANSLATION_SERVICE_AVAILABLE}, SUPABASE_ENABLED={SUPABASE_ENABLED}")
 if TRANSLATION_SERVICE_AVAILABLE and SUPABASE_ENABLED:
-    init_translation_service(supabase)
+    translation_service = init_translation_service(supabase)
     print("✅ Translation service initialized with Supabase")
 else:
     print(f"⚠️ Translation service initialization skipped (Translation: {TRANSLATION_SERVICE_AVAILABLE}, Supabase: {SUPABASE_ENABLED})")
 
+
+@app.on_event("startup")
+async def start_translation_service():
+    """Précharge les catalogues de traduction et lance l'écriture groupée de last_used"""
+    if TRANSLATION_SERVICE_AVAILABLE and translation_service is not None:
+        await translation_service.preload()
+        translation_service.start()
+
+
+@app.on_event("shutdown")
+async def stop_translation_service():
+    """Écrit les utilisations de traductions en attente"""
+    if TRANSLATION_SERVICE_AVAILABLE and translation_service is not None:
+        await translation_service.stop()
+
+
+@app.on_event("startup")
+async def start_search_sync():
+    """Construit l'index de recherche et lance la synchronisation incrémentale"""
+    if SEARCH_SYNC_AVAILABLE:
+        await search_sync.service.create_indexes()
+        search_sync.start()
+
+
+@app.on_event("shutdown")
+async def stop_search_sync():
+    """Arrête la synchronisation et sauvegarde le snapshot de l'index embarqué"""
+    if SEARCH_SYNC_AVAILABLE:
+        await search_sync.stop()
+        await asyncio.to_thread(search_sync.service.save_local_index)
+
+
+@app.on_event("startup")
+async def start_product_moderation():
+    """Reprend périodiquement les produits restés sans verdict IA"""
+    if MODERATION_ENDPOINTS_AVAILABLE:
+        start_moderation_sweeper()
+
+
+@app.on_event("shutdown")
+async def stop_product_moderation():
+    """Termine les modérations IA de produits en cours"""
+    if MODERATION_ENDPOINTS_AVAILABLE:
+        await stop_moderation()
+
 # ============================================
 # ROUTERS
 # ============================================
@@ -305,6 +369,7 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
             if datetime.utcnow().timestamp() > exp_timestamp:
                 raise HTTPException(status_code=401, detail="Token expiré")
         
+        remember_identity(payload)
         return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expiré")
@@ -322,6 +387,9 @@ def create_token(user_id: str, email: str, role: str) -> str:
         "exp": datetime.utcnow() + timedelta(seconds=JWT_EXPIRATION),
         "iat": datetime.utcnow()
     }
+    # ID de profil du rôle, évite la résolution user_id -> merchant/influencer à chaque requête
+    if SUPABASE_ENABLED:
+        payload.update(identity_claims(user_id, role, supabase))
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 def validate_password_strength(password: str) -> None:
@@ -1232,6 +1300,13 @@ async def create_new_product(
             result = await create_product(merchant_id, product_data)
             
             if result.get("success"):
+                if MODERATION_ENDPOINTS_AVAILABLE:
+                    # Verdict IA en tâche de fond: le produit reste "pending_review" d'ici là
+                    product = result["product"]
+                    result["moderation"] = await submit_product_moderation(
+                        product["id"], merchant_id, user_id, product["name"], product.get("description", ""),
+                        product.get("category"), product.get("price"), product.get("images")
+                    )
                 return result
             else:
                 raise HTTPException(
@@ -1289,8 +1364,8 @@ async def get_marketplace_products(
     """Produits et services pour le marketplace - Depuis Supabase"""
     try:
         if SUPABASE_ENABLED:
-            # Récupérer depuis Supabase
-            query = supabase.table("products").select("*")
+            # Récupérer depuis Supabase (produits modérés uniquement)
+            query = only_public_products(supabase.table("products").select("*"))
             
             # Filtrer par type si spécifié
             if type:
@@ -1303,7 +1378,7 @@ async def get_marketplace_products(
             products = result.data if result.data else []
             
             # Compter le total
-            count_result = supabase.table("products").select("id", count="exact")
+            count_result = only_public_products(supabase.table("products").select("id", count="exact"))
             if type:
                 count_result = count_result.eq("type", type)
             count_data = count_result.execute()
@@ -1354,7 +1429,7 @@ async def get_product_detail(product_id: str):
             # Récupérer depuis Supabase
             result = supabase.table("products").select("*").eq("id", product_id).execute()
             
-            if not result.data or len(result.data) == 0:
+            if not result.data or not is_publicly_visible(result.data[0]):
                 raise HTTPException(status_code=404, detail="Produit non trouvé")
             
             product = result.data[0]
@@ -4890,6 +4965,64 @@ async def generate_report(
         "expires_at": (datetime.now() + timedelta(hours=24)).isoformat()
     }
 
+@app.get("/api/reports/export/{report_type}")
+async def export_report(
+    report_type: str,
+    format: str = Query("csv", description="csv, json (NDJSON) ou excel"),
+    status: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    payload: dict = Depends(verify_token)
+):
+    """
+    Export en streaming des ventes / commissions (mémoire constante)
+    
+    Les lignes sont lues par pages keyset pendant l'envoi: le premier octet
+    part immédiatement, quelle que soit la taille de l'export. Marchands et
+    influenceurs exportent leurs propres lignes, l'admin toute la plateforme.
+    """
+    exporters = {
+        ReportType.SALES.value: iter_sales_for_export,
+        ReportType.COMMISSIONS.value: iter_commissions_for_export,
+    }
+    if not DB_QUERIES_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Exports non disponibles")
+    if report_type not in exporters:
+        raise HTTPException(status_code=400, detail=f"Type d'export non supporté: {report_type}")
+    try:
+        export_format = ReportFormat(format)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Format non supporté: {format}")
+    
+    try:
+        rows = await asyncio.to_thread(
+            exporters[report_type],
+            payload.get("sub") or payload.get("user_id"),
+            payload.get("role"),
+            status=status,
+            start_date=start_date,
+            end_date=end_date
+        )
+        export = report_generator.stream_report(
+            ReportType(report_type),
+            export_format,
+            rows,
+            user_info={"company_name": payload.get("email")}
+        )
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except IdentityNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return StreamingResponse(
+        export["content"],
+        media_type=export["media_type"],
+        headers={"Content-Disposition": f'attachment; filename="{export["filename"]}"'}
+    )
+
+
 @app.get("/api/reports/download/{report_id}")
 async def download_report(
     report_id: str,
@@ -5660,6 +5793,8 @@ async def get_sales(
     status: Optional[str] = None,
     limit: int = Query(50, le=200),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="next_cursor / prev_cursor de la page précédente"),
+    include_total: bool = Query(True, description="Inclure le total estimé"),
     payload: dict = Depends(verify_token)
 ):
     """Ventes (DONNÉES RÉELLES depuis DB)"""
@@ -5673,9 +5808,13 @@ async def get_sales(
                 user_role=user_role,
                 status=status,
                 limit=limit,
-                offset=offset
+                offset=offset,
+                cursor=cursor,
+                include_total=include_total
             )
             return result
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
             print(f"❌ Erreur get_sales: {str(e)}")
             # Fallback to mocked
@@ -5753,6 +5892,8 @@ async def get_commissions(
     status: Optional[str] = None,
     limit: int = Query(50, le=200),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="next_cursor / prev_cursor de la page précédente"),
+    include_total: bool = Query(True, description="Inclure le total estimé"),
     payload: dict = Depends(verify_token)
 ):
     """Commissions (DONNÉES RÉELLES depuis DB)"""
@@ -5766,9 +5907,13 @@ async def get_commissions(
                 user_role=user_role,
                 status=status,
                 limit=limit,
-                offset=offset
+                offset=offset,
+                cursor=cursor,
+                include_total=include_total
             )
             return result
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
             print(f"❌ Erreur get_commissions: {str(e)}")
             # Fallback to mocked
@@ -6377,16 +6522,27 @@ async def check_feature_access(feature_name: str, payload: dict = Depends(verify
 # ============================================
 
 @app.get("/api/translations/{language}")
-async def get_all_translations(language: str):
+async def get_all_translations(language: str, request: Request, response: Response):
     """
     Récupère toutes les traductions pour une langue
     Utilisé au chargement initial de l'application
+    
+    Renvoie un ETag (version du catalogue): 304 si If-None-Match correspond
     """
-    if not TRANSLATION_SERVICE_AVAILABLE:
+    if not TRANSLATION_SERVICE_AVAILABLE or translation_service is None:
         raise HTTPException(status_code=503, detail="Translation service not available")
     
+    if language not in SUPPORTED_LANGUAGES:
+        raise HTTPException(status_code=400, detail=f"Langue non supportée: {language}")
+    
     try:
+        etag = await translation_service.get_catalog_etag(language)
+        if etag and request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        
         translations = await translation_service.get_all_translations(language)
+        if etag:
+            response.headers["ETag"] = etag
         
         return {
             "success": True,
@@ -6415,7 +6571,7 @@ async def translate_text(
         "auto_translate": true
     }
     """
-    if not TRANSLATION_SERVICE_AVAILABLE:
+    if not TRANSLATION_SERVICE_AVAILABLE or translation_service is None:
         raise HTTPException(status_code=503, detail="Translation service not available")
     
     try:
@@ -6467,7 +6623,7 @@ async def batch_translate(
         "context": "Navigation menu"
     }
     """
-    if not TRANSLATION_SERVICE_AVAILABLE:
+    if not TRANSLATION_SERVICE_AVAILABLE or translation_service is None:
         raise HTTPException(status_code=503, detail="Translation service not available")
     
     try:
@@ -6521,7 +6677,7 @@ async def import_translations(
     if payload.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    if not TRANSLATION_SERVICE_AVAILABLE:
+    if not TRANSLATION_SERVICE_AVAILABLE or translation_service is None:
         raise HTTPException(status_code=503, detail="Translation service not available")
     
     try:
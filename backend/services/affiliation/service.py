@@ -17,7 +17,9 @@ from db_helpers import (
     get_influencer_by_user_id,
     get_merchant_by_user_id,
 )
+from services.subscription_entitlements import entitlement_service
 from supabase_client import supabase
+from utils.product_visibility import is_publicly_visible
 
 from .schemas import AffiliationRequestCreate, AffiliationDecision
 
@@ -85,7 +87,7 @@ def create_affiliation_request(user_id: str, request_data: AffiliationRequestCre
     product_query = (
         supabase.table("products").select("*").eq("id", request_data.product_id).execute()
     )
-    if not product_query.data:
+    if not product_query.data or not is_publicly_visible(product_query.data[0]):
         raise HTTPException(status_code=404, detail="Produit non trouvé")
 
     product = product_query.data[0]
@@ -430,6 +432,10 @@ def approve_affiliation_request(
     if not update_result.data:
         raise HTTPException(status_code=400, detail="Impossible d'approuver cette demande")
 
+    # Une affiliation de plus: "affiliates" du marchand, "campaigns" de l'influenceur
+    entitlement_service.record_usage("affiliates", 1, profile_id=merchant["id"])
+    entitlement_service.record_usage("campaigns", 1, profile_id=request_record.get("influencer_id"))
+
     record_affiliation_history(
         request_id=request_id,
         old_status="pending",
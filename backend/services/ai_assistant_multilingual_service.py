@@ -20,15 +20,22 @@ from datetime import datetime, timedelta
 from enum import Enum
 from dataclasses import dataclass
 import json
+import os
 import httpx
 import logging
 import re
 from collections import Counter
 import statistics
 from supabase_client import supabase
+from utils.llm_cache import LLMResponseCache
 
 logger = logging.getLogger(__name__)
 
+# Client HTTP partagé vers l'API du modèle (par worker)
+AI_API_URL = os.getenv("AI_API_URL", "https://api.anthropic.com/v1/messages")
+AI_HTTP_MAX_CONNECTIONS = int(os.getenv("AI_HTTP_MAX_CONNECTIONS", "20"))
+AI_HTTP_TIMEOUT = float(os.getenv("AI_HTTP_TIMEOUT", "30"))
+
 
 # ============================================
 # ENUMS & MODELS
@@ -137,19 +144,89 @@ class AIAssistantMultilingualService:
         self,
         api_key: Optional[str] = None,
         model: str = "claude-3-5-sonnet-20241022",
-        demo_mode: bool = False
+        demo_mode: bool = False,
+        api_url: str = AI_API_URL,
+        http_client: Optional[httpx.AsyncClient] = None,
+        response_cache: Optional[LLMResponseCache] = None
     ):
         self.api_key = api_key
         self.model = model
         self.demo_mode = demo_mode or not api_key
         self.supabase = supabase
 
-        # Configuration API
-        self.anthropic_api_url = "https://api.anthropic.com/v1/messages"
+        # Configuration API (api_url surchargeable: serveur stub local pour les tests)
+        self.anthropic_api_url = api_url
+        self._http_client = http_client
+        self.response_cache = response_cache or LLMResponseCache()
 
         if self.demo_mode:
             logger.warning("⚠️ AI Assistant en mode DEMO (pas de clés API)")
 
+    # ============================================
+    # APPELS AU MODÈLE (CLIENT PARTAGÉ + CACHE)
+    # ============================================
+
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """Client httpx partagé (pool de connexions keep-alive)"""
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = httpx.AsyncClient(
+                timeout=AI_HTTP_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=AI_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=AI_HTTP_MAX_CONNECTIONS
+                )
+            )
+        return self._http_client
+
+    async def _call_model(self, system: str, prompt: str, max_tokens: int) -> str:
+        """Appel direct à l'API Messages, retourne le texte de la réponse"""
+        response = await self._get_http_client().post(
+            self.anthropic_api_url,
+            headers={
+                "x-api-key": self.api_key,
+                "anthropic-version": "2023-06-01",
+                "content-type": "application/json"
+            },
+            json={
+                "model": self.model,
+                "max_tokens": max_tokens,
+                "system": system,
+                "messages": [{"role": "user", "content": prompt}]
+            }
+        )
+
+        response.raise_for_status()
+        result = response.json()
+        return result["content"][0]["text"]
+
+    async def _complete(
+        self,
+        operation: str,
+        system: str,
+        prompt: str,
+        max_tokens: int,
+        language: Optional[str] = None
+    ) -> str:
+        """
+        Appel au modèle mis en cache par contenu
+
+        Les prompts identiques (après normalisation) sont servis depuis le
+        cache; les appels identiques simultanés partagent une seule requête.
+        """
+        key = LLMResponseCache.make_key(operation, self.model, system, prompt, max_tokens, language=language)
+        return await self.response_cache.get_or_call(
+            key, lambda: self._call_model(system, prompt, max_tokens)
+        )
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Statistiques du cache de réponses"""
+        return self.response_cache.get_stats()
+
+    async def aclose(self) -> None:
+        """Ferme le client HTTP partagé (à l'arrêt du serveur)"""
+        if self._http_client is not None and not self._http_client.is_closed:
+            await self._http_client.aclose()
+
     # ============================================
     # 1. CHATBOT IA MULTILINGUE
     # ============================================
@@ -215,39 +292,16 @@ Reply concisely, friendly, and professionally."""
             if context:
                 user_context = f"\n\nContexte utilisateur: {json.dumps(context, ensure_ascii=False)}"
 
-            # Appeler l'API Claude
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.anthropic_api_url,
-                    headers={
-                        "x-api-key": self.api_key,
-                        "anthropic-version": "2023-06-01",
-                        "content-type": "application/json"
-                    },
-                    json={
-                        "model": self.model,
-                        "max_tokens": 1024,
-                        "system": system_prompts[language] + user_context,
-                        "messages": [{
-                            "role": "user",
-                            "content": message
-                        }]
-                    },
-                    timeout=30.0
-                )
-
-                response.raise_for_status()
-                result = response.json()
+            # Appeler l'API Claude (réponse personnalisée: pas de cache)
+            bot_response = await self._call_model(system_prompts[language] + user_context, message, 1024)
 
-                bot_response = result["content"][0]["text"]
-
-                return {
-                    "success": True,
-                    "response": bot_response,
-                    "language": language.value,
-                    "model": self.model,
-                    "suggested_actions": self._extract_suggested_actions(bot_response)
-                }
+            return {
+                "success": True,
+                "response": bot_response,
+                "language": language.value,
+                "model": self.model,
+                "suggested_actions": self._extract_suggested_actions(bot_response)
+            }
 
         except Exception as e:
             logger.error(f"❌ Erreur chatbot: {str(e)}")
@@ -328,29 +382,16 @@ Reply concisely, friendly, and professionally."""
                 product_name, category, price, key_features, language, tone
             )
 
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.anthropic_api_url,
-                    headers={
-                        "x-api-key": self.api_key,
-                        "anthropic-version": "2023-06-01",
-                        "content-type": "application/json"
-                    },
-                    json={
-                        "model": self.model,
-                        "max_tokens": 2048,
-                        "system": "Tu es un expert en rédaction de descriptions produits e-commerce optimisées pour le SEO.",
-                        "messages": [{"role": "user", "content": prompt}]
-                    },
-                    timeout=30.0
-                )
-
-                response.raise_for_status()
-                result = response.json()
-                content = result["content"][0]["text"]
+            content = await self._complete(
+                "product_description",
+                "Tu es un expert en rédaction de descriptions produits e-commerce optimisées pour le SEO.",
+                prompt,
+                2048,
+                language.value
+            )
 
-                # Parser la réponse structurée
-                return self._parse_product_description(content, language)
+            # Parser la réponse structurée
+            return self._parse_product_description(content, language)
 
         except Exception as e:
             logger.error(f"❌ Erreur génération description: {str(e)}")
@@ -665,28 +706,15 @@ Optimise pour le marché marocain et le SEO Google."""
                 content, target_keywords, language, content_type, current_analysis
             )
 
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.anthropic_api_url,
-                    headers={
-                        "x-api-key": self.api_key,
-                        "anthropic-version": "2023-06-01",
-                        "content-type": "application/json"
-                    },
-                    json={
-                        "model": self.model,
-                        "max_tokens": 2048,
-                        "system": "Tu es un expert SEO spécialisé dans le e-commerce marocain.",
-                        "messages": [{"role": "user", "content": prompt}]
-                    },
-                    timeout=30.0
-                )
-
-                response.raise_for_status()
-                result = response.json()
-                ai_suggestions = result["content"][0]["text"]
+            ai_suggestions = await self._complete(
+                "optimize_seo",
+                "Tu es un expert SEO spécialisé dans le e-commerce marocain.",
+                prompt,
+                2048,
+                language.value
+            )
 
-                return self._parse_seo_optimization(ai_suggestions, target_keywords, language)
+            return self._parse_seo_optimization(ai_suggestions, target_keywords, language)
 
         except Exception as e:
             logger.error(f"❌ Erreur optimisation SEO: {str(e)}")
@@ -846,35 +874,22 @@ Optimise pour Google Maroc et le marché francophone/arabophone."""
         try:
             prompt = self._build_translation_prompt(text, source_language, target_language, context)
 
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.anthropic_api_url,
-                    headers={
-                        "x-api-key": self.api_key,
-                        "anthropic-version": "2023-06-01",
-                        "content-type": "application/json"
-                    },
-                    json={
-                        "model": self.model,
-                        "max_tokens": 1024,
-                        "system": "Tu es un traducteur expert spécialisé dans le e-commerce marocain et les dialectes locaux.",
-                        "messages": [{"role": "user", "content": prompt}]
-                    },
-                    timeout=30.0
-                )
+            translation = await self._complete(
+                "translate",
+                "Tu es un traducteur expert spécialisé dans le e-commerce marocain et les dialectes locaux.",
+                prompt,
+                1024,
+                f"{source_language.value}->{target_language.value}"
+            )
 
-                response.raise_for_status()
-                result = response.json()
-                translation = result["content"][0]["text"]
-
-                return {
-                    "success": True,
-                    "translation": translation,
-                    "source_language": source_language.value,
-                    "target_language": target_language.value,
-                    "confidence": 0.95,
-                    "context": context
-                }
+            return {
+                "success": True,
+                "translation": translation,
+                "source_language": source_language.value,
+                "target_language": target_language.value,
+                "confidence": 0.95,
+                "context": context
+            }
 
         except Exception as e:
             logger.error(f"❌ Erreur traduction: {str(e)}")
@@ -984,28 +999,15 @@ Fournis une réponse JSON structurée avec:
 
 Analyse en profondeur pour insights actionnables."""
 
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.anthropic_api_url,
-                    headers={
-                        "x-api-key": self.api_key,
-                        "anthropic-version": "2023-06-01",
-                        "content-type": "application/json"
-                    },
-                    json={
-                        "model": self.model,
-                        "max_tokens": 1536,
-                        "system": "Tu es un expert en analyse de sentiment et NLP.",
-                        "messages": [{"role": "user", "content": prompt}]
-                    },
-                    timeout=30.0
-                )
-
-                response.raise_for_status()
-                result = response.json()
-                analysis = result["content"][0]["text"]
+            analysis = await self._complete(
+                "analyze_sentiment",
+                "Tu es un expert en analyse de sentiment et NLP.",
+                prompt,
+                1536,
+                language.value
+            )
 
-                return self._parse_sentiment_analysis(analysis)
+            return self._parse_sentiment_analysis(analysis)
 
         except Exception as e:
             logger.error(f"❌ Erreur analyse sentiment: {str(e)}")
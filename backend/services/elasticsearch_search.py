@@ -5,15 +5,47 @@ Advanced Search Service with Elasticsearch
 - Faceted search (filters)
 - Search analytics & tracking
 - Real-time indexing
+- Embedded in-process index when no cluster is reachable (services/search_index.py)
 """
+import asyncio
 import os
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterable, List, Any, Optional, Tuple
 from datetime import datetime
 from elasticsearch import Elasticsearch, helpers
 from elasticsearch.exceptions import NotFoundError, RequestError
 
 from utils.logger import logger
 from services.advanced_caching import cache_service
+from services.search_index import (
+    SEARCH_EMBEDDED_ENABLED,
+    SEARCH_SNAPSHOT_PATH,
+    EmbeddedSearchIndex,
+    product_document,
+)
+from services.search_sync import SEARCH_SYNC_CHUNK_SIZE, chunked, retry_async
+
+# Autocomplete analysis shared by the products and merchants indexes
+AUTOCOMPLETE_ANALYSIS = {
+    "analyzer": {
+        "autocomplete_analyzer": {
+            "type": "custom",
+            "tokenizer": "standard",
+            "filter": ["lowercase", "autocomplete_filter"]
+        },
+        "search_analyzer": {
+            "type": "custom",
+            "tokenizer": "standard",
+            "filter": ["lowercase"]
+        }
+    },
+    "filter": {
+        "autocomplete_filter": {
+            "type": "edge_ngram",
+            "min_gram": 2,
+            "max_gram": 20
+        }
+    }
+}
 
 
 class ElasticsearchService:
@@ -53,6 +85,12 @@ class ElasticsearchService:
             'influencers': 'getyourshare_influencers'
         }
 
+        # Embedded index: same search API without a cluster (filled by create_indexes)
+        self.local_index: Optional[EmbeddedSearchIndex] = None
+        if not self.available and SEARCH_EMBEDDED_ENABLED:
+            self.local_index = EmbeddedSearchIndex()
+            logger.info("Using embedded search index (Elasticsearch not available)")
+
     # ========================================
     # INDEX MANAGEMENT
     # ========================================
@@ -60,6 +98,9 @@ class ElasticsearchService:
     async def create_indexes(self):
         """Create all search indexes with mappings"""
         if not self.available:
+            if self.local_index is not None:
+                await self.build_local_index()
+                return
             logger.warning("Elasticsearch not available, skipping index creation")
             return
 
@@ -77,39 +118,13 @@ class ElasticsearchService:
 
         logger.info("✅ All Elasticsearch indexes created")
 
-    async def _create_products_index(self):
+    async def _create_products_index(self, index_name: Optional[str] = None):
         """Create products index with custom mapping"""
-        index_name = self.indexes['products']
-
-        if self.es.indices.exists(index=index_name):
-            logger.info(f"Index {index_name} already exists")
-            return
-
         mapping = {
             "settings": {
                 "number_of_shards": 2,
                 "number_of_replicas": 1,
-                "analysis": {
-                    "analyzer": {
-                        "autocomplete_analyzer": {
-                            "type": "custom",
-                            "tokenizer": "standard",
-                            "filter": ["lowercase", "autocomplete_filter"]
-                        },
-                        "search_analyzer": {
-                            "type": "custom",
-                            "tokenizer": "standard",
-                            "filter": ["lowercase"]
-                        }
-                    },
-                    "filter": {
-                        "autocomplete_filter": {
-                            "type": "edge_ngram",
-                            "min_gram": 2,
-                            "max_gram": 20
-                        }
-                    }
-                }
+                "analysis": AUTOCOMPLETE_ANALYSIS
             },
             "mappings": {
                 "properties": {
@@ -157,16 +172,35 @@ class ElasticsearchService:
             }
         }
 
-        self.es.indices.create(index=index_name, body=mapping)
-        logger.info(f"✅ Created index: {index_name}")
+        return await asyncio.to_thread(self._create_index, 'products', mapping, index_name)
 
-    async def _create_users_index(self):
-        """Create users index"""
-        index_name = self.indexes['users']
+    async def build_local_index(self, client=None):
+        """Load the embedded index from its snapshot, or build it from the products table"""
+        def load_or_build():
+            index = EmbeddedSearchIndex.load_snapshot(SEARCH_SNAPSHOT_PATH)
+            if index is None:
+                index = EmbeddedSearchIndex.from_database(client)
+                index.save_snapshot()
+            return index
 
-        if self.es.indices.exists(index=index_name):
-            return
+        try:
+            # Built off the event loop, then swapped in
+            self.local_index = await asyncio.to_thread(load_or_build)
+        except Exception as e:
+            logger.error(f"Embedded search index build failed: {e}")
+
+    def save_local_index(self) -> bool:
+        """Write the embedded index snapshot (call on shutdown)"""
+        if self.local_index is None:
+            return False
+        try:
+            return self.local_index.save_snapshot()
+        except OSError as e:
+            logger.error(f"Embedded search index snapshot failed: {e}")
+            return False
 
+    async def _create_users_index(self, index_name: Optional[str] = None):
+        """Create users index"""
         mapping = {
             "mappings": {
                 "properties": {
@@ -185,17 +219,14 @@ class ElasticsearchService:
             }
         }
 
-        self.es.indices.create(index=index_name, body=mapping)
-        logger.info(f"✅ Created index: {index_name}")
+        return await asyncio.to_thread(self._create_index, 'users', mapping, index_name)
 
-    async def _create_merchants_index(self):
+    async def _create_merchants_index(self, index_name: Optional[str] = None):
         """Create merchants index"""
-        index_name = self.indexes['merchants']
-
-        if self.es.indices.exists(index=index_name):
-            return
-
         mapping = {
+            "settings": {
+                "analysis": AUTOCOMPLETE_ANALYSIS
+            },
             "mappings": {
                 "properties": {
                     "id": {"type": "keyword"},
@@ -216,16 +247,10 @@ class ElasticsearchService:
             }
         }
 
-        self.es.indices.create(index=index_name, body=mapping)
-        logger.info(f"✅ Created index: {index_name}")
+        return await asyncio.to_thread(self._create_index, 'merchants', mapping, index_name)
 
-    async def _create_influencers_index(self):
+    async def _create_influencers_index(self, index_name: Optional[str] = None):
         """Create influencers index"""
-        index_name = self.indexes['influencers']
-
-        if self.es.indices.exists(index=index_name):
-            return
-
         mapping = {
             "mappings": {
                 "properties": {
@@ -244,8 +269,75 @@ class ElasticsearchService:
             }
         }
 
+        return await asyncio.to_thread(self._create_index, 'influencers', mapping, index_name)
+
+    def _create_index(self, entity: str, mapping: Dict[str, Any], index_name: Optional[str] = None) -> str:
+        """
+        Create a versioned index (e.g. getyourshare_products_20261016120000)
+
+        Without index_name: first index of the entity, created behind its alias
+        (self.indexes) unless the alias or a legacy index of that name exists.
+        With index_name: reindex target, attached by swap_alias once loaded.
+        """
+        alias = self.indexes[entity]
+        if index_name is None:
+            if self.es.indices.exists(index=alias):
+                logger.info(f"Index {alias} already exists")
+                return alias
+            index_name = self.versioned_index_name(entity)
+            mapping = {**mapping, "aliases": {alias: {}}}
+
         self.es.indices.create(index=index_name, body=mapping)
         logger.info(f"✅ Created index: {index_name}")
+        return index_name
+
+    def versioned_index_name(self, entity: str) -> str:
+        return f"{self.indexes[entity]}_{datetime.utcnow():%Y%m%d%H%M%S}"
+
+    async def create_reindex_target(self, entity: str) -> str:
+        """New empty index for a full reindex, refresh disabled while loading"""
+        creators = {
+            'products': self._create_products_index,
+            'users': self._create_users_index,
+            'merchants': self._create_merchants_index,
+            'influencers': self._create_influencers_index
+        }
+        index_name = await creators[entity](self.versioned_index_name(entity))
+        await asyncio.to_thread(
+            self.es.indices.put_settings, index=index_name, settings={"index": {"refresh_interval": "-1"}}
+        )
+        return index_name
+
+    async def swap_alias(self, entity: str, index_name: str) -> List[str]:
+        """
+        Point the entity alias at index_name in one atomic update, then drop
+        the previous indexes. Returns the indexes that were replaced.
+        """
+        alias = self.indexes[entity]
+
+        def swap():
+            self.es.indices.put_settings(index=index_name, settings={"index": {"refresh_interval": None}})
+            self.es.indices.refresh(index=index_name)
+
+            actions = [{"add": {"index": index_name, "alias": alias}}]
+            previous = []
+            if self.es.indices.exists_alias(name=alias):
+                previous = [name for name in self.es.indices.get_alias(name=alias) if name != index_name]
+                actions = [{"remove": {"index": name, "alias": alias}} for name in previous] + actions
+            elif self.es.indices.exists(index=alias):
+                # Concrete index created before aliases: replaced in the same update
+                actions = [{"remove_index": {"index": alias}}] + actions
+                previous = [alias]
+
+            self.es.indices.update_aliases(actions=actions)
+            for name in previous:
+                if name != alias:
+                    self.es.indices.delete(index=name, ignore_unavailable=True)
+            return previous
+
+        previous = await asyncio.to_thread(swap)
+        logger.info(f"✅ Alias {alias} -> {index_name} (replaced: {previous or 'none'})")
+        return previous
 
     # ========================================
     # INDEXING (ADD/UPDATE/DELETE)
@@ -254,39 +346,14 @@ class ElasticsearchService:
     async def index_product(self, product: Dict[str, Any]):
         """Index a single product"""
         if not self.available:
+            if self.local_index is not None:
+                self.local_index.index(product_document(product))
             return
 
         index_name = self.indexes['products']
 
-        # Prepare document
-        doc = {
-            'id': str(product['id']),
-            'name': product['name'],
-            'description': product.get('description', ''),
-            'category': product.get('category', 'uncategorized'),
-            'sub_category': product.get('sub_category'),
-            'price': float(product.get('price', 0)),
-            'original_price': float(product.get('original_price', 0)),
-            'discount_percentage': int(product.get('discount_percentage', 0)),
-            'merchant_id': str(product.get('merchant_id')),
-            'merchant_name': product.get('merchant_name', ''),
-            'rating': float(product.get('rating', 0)),
-            'reviews_count': int(product.get('reviews_count', 0)),
-            'sales_count': int(product.get('sales_count', 0)),
-            'status': product.get('status', 'active'),
-            'tags': product.get('tags', []),
-            'image_url': product.get('image_url', ''),
-            'created_at': product.get('created_at'),
-            'updated_at': datetime.utcnow().isoformat(),
-            'metadata': product.get('metadata', {})
-        }
-
-        # Add location if available
-        if 'latitude' in product and 'longitude' in product:
-            doc['location'] = {
-                'lat': product['latitude'],
-                'lon': product['longitude']
-            }
+        # Prepare document (location included when available)
+        doc = product_document(product)
 
         # Index document
         self.es.index(
@@ -297,41 +364,51 @@ class ElasticsearchService:
 
         logger.debug(f"Indexed product: {product['name']}")
 
-    async def bulk_index_products(self, products: List[Dict[str, Any]]):
-        """Bulk index multiple products (faster)"""
-        if not self.available or not products:
-            return
-
-        index_name = self.indexes['products']
-
-        # Prepare bulk actions
-        actions = []
-        for product in products:
-            doc = {
-                '_index': index_name,
-                '_id': str(product['id']),
-                '_source': {
-                    'id': str(product['id']),
-                    'name': product['name'],
-                    'description': product.get('description', ''),
-                    'category': product.get('category', 'uncategorized'),
-                    'price': float(product.get('price', 0)),
-                    'merchant_name': product.get('merchant_name', ''),
-                    'rating': float(product.get('rating', 0)),
-                    'status': product.get('status', 'active'),
-                    'updated_at': datetime.utcnow().isoformat()
-                }
-            }
-            actions.append(doc)
-
-        # Bulk insert
-        success, failed = helpers.bulk(self.es, actions, raise_on_error=False)
+    async def bulk_index_products(
+        self,
+        products: Iterable[Dict[str, Any]],
+        index_name: Optional[str] = None
+    ) -> Dict[str, int]:
+        """
+        Bulk index products (faster)
 
-        logger.info(f"✅ Bulk indexed {success} products, {len(failed)} failed")
+        The iterable is consumed lazily, SEARCH_SYNC_CHUNK_SIZE products per
+        bulk request, each request sent off the event loop and retried on
+        connection errors.
+        """
+        if not self.available:
+            if self.local_index is not None:
+                count = self.local_index.index_many(product_document(product) for product in products)
+                logger.info(f"✅ Bulk indexed {count} products (embedded index)")
+                return {'indexed': count, 'failed': 0}
+            return {'indexed': 0, 'failed': 0}
+
+        index_name = index_name or self.indexes['products']
+        indexed = failed = 0
+        for chunk in chunked(products, SEARCH_SYNC_CHUNK_SIZE):
+            actions = [
+                {'_index': index_name, '_id': doc['id'], '_source': doc}
+                for doc in map(product_document, chunk)
+            ]
+            success, errors = await retry_async(self.bulk, actions, what="bulk index products")
+            indexed += success
+            failed += len(errors)
+
+        logger.info(f"✅ Bulk indexed {indexed} products, {failed} failed")
+        return {'indexed': indexed, 'failed': failed}
+
+    async def bulk(self, actions: List[Dict[str, Any]]) -> Tuple[int, List[Dict[str, Any]]]:
+        """One bulk request in a worker thread: (successes, per-document errors)"""
+        return await asyncio.to_thread(
+            helpers.bulk, self.es, actions,
+            raise_on_error=False, max_retries=2, initial_backoff=1
+        )
 
     async def delete_product(self, product_id: str):
         """Delete a product from index"""
         if not self.available:
+            if self.local_index is not None and self.local_index.delete(product_id):
+                logger.debug(f"Deleted product: {product_id}")
             return
 
         index_name = self.indexes['products']
@@ -375,7 +452,17 @@ class ElasticsearchService:
             }
         """
         if not self.available:
-            return {'results': [], 'total': 0, 'page': 1, 'page_size': page_size}
+            if self.local_index is None:
+                return {'results': [], 'total': 0, 'page': 1, 'page_size': page_size}
+            found = self.local_index.search(
+                query=query, category=category, min_price=min_price, max_price=max_price,
+                min_rating=min_rating, merchant_id=merchant_id, tags=tags, sort_by=sort_by,
+                page=page, page_size=page_size, location=location, radius_km=radius_km
+            )
+            return await self._search_response(
+                found['results'], found['total'], found['facets'], query, page, page_size,
+                category, min_price, max_price, min_rating
+            )
 
         # Build query
         must_queries = []
@@ -467,6 +554,12 @@ class ElasticsearchService:
             },
             "price_stats": {
                 "stats": {"field": "price"}
+            },
+            "ratings": {
+                "range": {
+                    "field": "rating",
+                    "ranges": [{"from": 4}, {"from": 3}, {"from": 2}, {"from": 1}]
+                }
             }
         }
 
@@ -497,30 +590,21 @@ class ElasticsearchService:
                     {'min': bucket['key'], 'max': bucket['key'] + 100, 'count': bucket['doc_count']}
                     for bucket in response['aggregations']['price_ranges']['buckets']
                 ],
+                'ratings': sorted(
+                    [
+                        {'min': bucket['from'], 'count': bucket['doc_count']}
+                        for bucket in response['aggregations']['ratings']['buckets']
+                    ],
+                    key=lambda bucket: -bucket['min']
+                ),
                 'avg_rating': response['aggregations']['avg_rating']['value'],
                 'price_stats': response['aggregations']['price_stats']
             }
 
-            # Get suggestions if query exists
-            suggestions = []
-            if query:
-                suggestions = await self.get_suggestions(query, limit=5)
-
-            result = {
-                'results': results,
-                'total': total,
-                'page': page,
-                'page_size': page_size,
-                'total_pages': (total + page_size - 1) // page_size,
-                'facets': facets,
-                'suggestions': suggestions,
-                'query': query,
-                'filters': {
-                    'category': category,
-                    'price_range': {'min': min_price, 'max': max_price},
-                    'min_rating': min_rating
-                }
-            }
+            result = await self._search_response(
+                results, total, facets, query, page, page_size,
+                category, min_price, max_price, min_rating
+            )
 
             # Cache results for 5 minutes
             cache_key = f"search:{hash(str(es_query))}"
@@ -532,14 +616,51 @@ class ElasticsearchService:
             logger.error(f"Elasticsearch search error: {e}")
             return {'results': [], 'total': 0, 'page': 1, 'page_size': page_size}
 
+    async def _search_response(
+        self,
+        results: List[Dict[str, Any]],
+        total: int,
+        facets: Dict[str, Any],
+        query: str,
+        page: int,
+        page_size: int,
+        category: Optional[str],
+        min_price: Optional[float],
+        max_price: Optional[float],
+        min_rating: Optional[float]
+    ) -> Dict[str, Any]:
+        """Search payload shared by the Elasticsearch and embedded paths"""
+        # Get suggestions if query exists
+        suggestions = []
+        if query:
+            suggestions = await self.get_suggestions(query, limit=5)
+
+        return {
+            'results': results,
+            'total': total,
+            'page': page,
+            'page_size': page_size,
+            'total_pages': (total + page_size - 1) // page_size,
+            'facets': facets,
+            'suggestions': suggestions,
+            'query': query,
+            'filters': {
+                'category': category,
+                'price_range': {'min': min_price, 'max': max_price},
+                'min_rating': min_rating
+            }
+        }
+
     # ========================================
     # AUTOCOMPLETE & SUGGESTIONS
     # ========================================
 
     async def get_suggestions(self, query: str, limit: int = 10) -> List[str]:
         """Get autocomplete suggestions"""
-        if not self.available or not query:
+        if not query:
             return []
+        if not self.available:
+            return self.local_index.suggest(query, limit) if self.local_index is not None else []
 
         try:
             response = self.es.search(
@@ -616,6 +737,11 @@ async def init_search_indexes():
     await search_service.create_indexes()
 
 
+def save_search_snapshot():
+    """Call this on app shutdown (embedded index only)"""
+    search_service.save_local_index()
+
+
 # Example FastAPI endpoints
 if __name__ == "__main__":
     """
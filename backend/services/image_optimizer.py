@@ -1,16 +1,35 @@
 """
 Service d'optimisation d'images automatique
 Pipeline complet de transformation, compression et génération de formats optimaux
+
+Pipeline:
+- L'image est décodée une seule fois (décodage JPEG réduit quand seuls des
+  thumbnails sont demandés)
+- Les thumbnails sont taillés dans une pyramide de réductions: chaque
+  niveau est calculé à partir du précédent, pas depuis l'image pleine taille
+- Les encodages (WebP, AVIF, JPEG, PNG) tournent en parallèle dans un pool
+  de processus partagé; les variantes *_async n'occupent pas la boucle
+- Un upload identique (même hash SHA-256, mêmes options) réutilise les
+  encodages déjà calculés; nom de fichier, dates et durée sont ceux de la
+  requête. Le cache est borné en octets encodés.
 """
+import asyncio
+import hashlib
 import io
+import math
+import multiprocessing
 import os
+import threading
 import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from typing import Dict, List, Optional, Any, Tuple, BinaryIO
 from pathlib import Path
 from datetime import datetime
-from PIL import Image, ImageFilter, ImageOps, ExifTags
+from PIL import Image, ImageFilter, ImageMode, ImageOps, ExifTags
 import pillow_heif  # Pour support AVIF
 
+from utils.local_cache import LocalTTLCache
 from utils.logger import logger
 from utils.image_processing import (
     validate_image,
@@ -42,6 +61,204 @@ DEFAULT_QUALITY = {
     'png': 95
 }
 
+# Pipeline de traitement
+IMAGE_ENCODE_WORKERS = int(os.getenv("IMAGE_ENCODE_WORKERS", str(os.cpu_count() or 1)))  # 0 = encodage dans le processus
+IMAGE_DEDUP_CACHE_MB = float(os.getenv("IMAGE_DEDUP_CACHE_MB", "128"))  # Encodages conservés par worker (0 = désactivé)
+IMAGE_DEDUP_TTL = int(os.getenv("IMAGE_DEDUP_TTL", "3600"))  # Secondes
+
+ORIENTATION_TAG = 0x0112
+
+
+# ============================================
+# ENCODAGE (exécuté dans le pool de processus)
+# ============================================
+
+def _raw_size(image: Image.Image) -> int:
+    """Taille décompressée, équivalente à len(image.tobytes()) sans copier les pixels"""
+    if image.mode == '1':
+        return (image.width + 7) // 8 * image.height
+    typestr = ImageMode.getmode(image.mode).typestr
+    return image.width * image.height * len(image.getbands()) * int(typestr[-1])
+
+
+def encode_image(
+    image: Image.Image,
+    format: str,
+    quality: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Encode une image dans un format donné
+
+    Fonction de module (picklable) pour être exécutée dans le pool de processus.
+
+    Args:
+        image: Image PIL
+        format: webp, avif, jpeg/jpg ou png
+        quality: Qualité de compression (None = calculée selon le contenu)
+    """
+    quality = quality or calculate_optimal_quality(image, format)
+    original_size = _raw_size(image)
+    buffer = io.BytesIO()
+
+    # Conversion de mode si nécessaire
+    if format in ('jpeg', 'jpg'):
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # JPEG ne supporte pas la transparence
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            if image.mode == 'P':
+                image = image.convert('RGBA')
+            background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        image.save(
+            buffer,
+            format='JPEG',
+            quality=quality,
+            optimize=True,
+            progressive=True
+        )
+
+    elif format == 'webp':
+        image.save(
+            buffer,
+            format='WEBP',
+            quality=quality,
+            method=6,  # Meilleure compression
+            optimize=True
+        )
+
+    elif format == 'avif':
+        # AVIF nécessite pillow-heif
+        image.save(
+            buffer,
+            format='AVIF',
+            quality=quality
+        )
+
+    elif format == 'png':
+        if image.mode not in ('RGB', 'RGBA', 'P'):
+            image = image.convert('RGBA')
+
+        image.save(
+            buffer,
+            format='PNG',
+            optimize=True,
+            compress_level=9
+        )
+
+    data = buffer.getvalue()
+
+    return {
+        'format': format,
+        'data': data,
+        'size': len(data),
+        'quality': quality,
+        'compression': estimate_compression_ratio(original_size, len(data))
+    }
+
+
+_encode_pools: Dict[int, ProcessPoolExecutor] = {}
+_encode_pools_lock = threading.Lock()
+
+
+def get_encode_pool(workers: int = IMAGE_ENCODE_WORKERS) -> Optional[ProcessPoolExecutor]:
+    """
+    Pool de processus partagé pour les encodages (None si workers <= 0)
+
+    Démarrage "spawn": pas de fork d'un serveur multi-threadé.
+    """
+    if workers <= 0:
+        return None
+    with _encode_pools_lock:
+        pool = _encode_pools.get(workers)
+        if pool is None:
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            _encode_pools[workers] = pool
+        return pool
+
+
+def _discard_encode_pool(workers: int, pool: ProcessPoolExecutor) -> None:
+    """Oublier un pool cassé (processus tué): le prochain appel en recrée un"""
+    with _encode_pools_lock:
+        if _encode_pools.get(workers) is pool:
+            del _encode_pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_encode_pools() -> None:
+    """Arrêter les pools d'encodage (arrêt de l'application)"""
+    with _encode_pools_lock:
+        pools = list(_encode_pools.values())
+        _encode_pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _encoded_size(outputs: Any) -> int:
+    """Octets d'images encodées d'une entrée du cache de déduplication"""
+    if isinstance(outputs, dict):
+        data = outputs.get('data')
+        if isinstance(data, (bytes, bytearray)):
+            return len(data)
+        return sum(_encoded_size(value) for value in outputs.values())
+    if isinstance(outputs, (list, tuple)):
+        return sum(_encoded_size(value) for value in outputs)
+    return 0
+
+
+# ============================================
+# PYRAMIDE DE RÉDUCTIONS
+# ============================================
+
+class ResizePyramid:
+    """
+    Réductions successives par 2 d'une image décodée une seule fois
+
+    Chaque niveau est calculé (paresseusement) à partir du précédent; un
+    thumbnail est taillé dans le plus petit niveau encore assez grand, ce qui
+    évite de repartir de l'image pleine taille pour chaque dimension.
+    """
+
+    def __init__(self, image: Image.Image):
+        self.levels: List[Image.Image] = [image]
+
+    @staticmethod
+    def scale_for(width: int, height: int, target_width: int, target_height: int, method: str = 'cover') -> float:
+        """Facteur d'échelle appliqué à l'image source pour obtenir la taille cible"""
+        ratios = (target_width / width, target_height / height)
+        return min(ratios) if method == 'contain' else max(ratios)
+
+    def source_for(self, target_width: int, target_height: int, method: str = 'cover') -> Image.Image:
+        """Plus petit niveau qui ne nécessite pas d'agrandissement pour la taille cible"""
+        base = self.levels[0]
+        scale = self.scale_for(base.width, base.height, target_width, target_height, method)
+        needed = (base.width * scale, base.height * scale)
+
+        index = 0
+        while True:
+            if index + 1 == len(self.levels):
+                level = self.levels[index]
+                if level.width // 2 < needed[0] or level.height // 2 < needed[1]:
+                    return level
+                self.levels.append(self._reduce(level))
+            index += 1
+            level = self.levels[index]
+            if level.width < needed[0] or level.height < needed[1]:
+                return self.levels[index - 1]
+
+    @staticmethod
+    def _reduce(image: Image.Image) -> Image.Image:
+        if image.mode == 'P':
+            image = image.convert('RGBA')
+        elif image.mode == '1':
+            image = image.convert('L')
+        return image.reduce(2)
+
 
 class ImageOptimizer:
     """
@@ -52,7 +269,9 @@ class ImageOptimizer:
         self,
         storage_path: str = '/tmp/optimized_images',
         enable_avif: bool = True,
-        enable_webp: bool = True
+        enable_webp: bool = True,
+        encode_workers: int = IMAGE_ENCODE_WORKERS,
+        dedup_cache_bytes: int = int(IMAGE_DEDUP_CACHE_MB * 1024 * 1024)
     ):
         """
         Initialise le service d'optimisation
@@ -61,17 +280,26 @@ class ImageOptimizer:
             storage_path: Chemin de stockage des images optimisées
             enable_avif: Activer la génération AVIF
             enable_webp: Activer la génération WebP
+            encode_workers: Processus d'encodage (0 = encodage dans le processus appelant)
+            dedup_cache_bytes: Octets d'encodages mémorisés par hash de contenu (0 = désactivé)
         """
         self.storage_path = Path(storage_path)
         self.storage_path.mkdir(parents=True, exist_ok=True)
         self.enable_avif = enable_avif
         self.enable_webp = enable_webp
+        self.encode_workers = encode_workers
+        self._dedup_cache = (
+            LocalTTLCache(
+                maxsize=10000, ttl=IMAGE_DEDUP_TTL, max_bytes=dedup_cache_bytes, sizeof=_encoded_size
+            ) if dedup_cache_bytes > 0 else None
+        )
 
         logger.info(
             "ImageOptimizer initialisé",
             storage_path=str(storage_path),
             avif_enabled=enable_avif,
-            webp_enabled=enable_webp
+            webp_enabled=enable_webp,
+            encode_workers=encode_workers
         )
 
     def optimize_image(
@@ -94,88 +322,62 @@ class ImageOptimizer:
             Dictionnaire avec les URLs et métadonnées
         """
         start_time = time.time()
+        generate_formats = self._resolve_formats(generate_formats)
+        cache_key = self._cache_key(image_data, 'optimize', tuple(generate_formats), quality)
+
+        cached = self._dedup_get(cache_key, filename)
+        if cached is not None:
+            return self._optimize_result(filename, image_data, *cached, start_time, deduplicated=True)
 
         try:
-            # Validation
-            validation_result = validate_image(image_data, filename)
-            logger.info(f"Image validée: {filename}", **validation_result)
+            image, validation_result = self._decode(image_data, filename)
 
-            # Charger l'image
-            image = Image.open(io.BytesIO(image_data))
+            # Encodages lancés dans le pool pendant l'extraction des métadonnées
+            futures = self._submit_encodes([(image, fmt, quality) for fmt in generate_formats])
+            metadata = self.extract_metadata(image, filename)
+            encoded = self._collect(futures)
 
-            # Correction d'orientation EXIF
-            image = self._fix_orientation(image)
+            return self._finish_optimize(
+                cache_key, filename, image_data, validation_result,
+                generate_formats, encoded, metadata, start_time
+            )
 
-            # Formats à générer
-            if generate_formats is None:
-                generate_formats = []
-                if self.enable_webp:
-                    generate_formats.append('webp')
-                if self.enable_avif:
-                    generate_formats.append('avif')
-                generate_formats.append('jpeg')  # Toujours générer JPEG comme fallback
+        except Exception as e:
+            return self._optimize_error(e)
 
-            # Extraire métadonnées
-            metadata = self.extract_metadata(image, filename)
+    async def optimize_image_async(
+        self,
+        image_data: bytes,
+        filename: str,
+        generate_formats: Optional[List[str]] = None,
+        quality: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Variante de optimize_image pour les handlers async: décodage et
+        métadonnées dans un thread, encodages dans le pool de processus
+        """
+        start_time = time.time()
+        generate_formats = self._resolve_formats(generate_formats)
+        cache_key = self._cache_key(image_data, 'optimize', tuple(generate_formats), quality)
 
-            # Générer les formats optimisés
-            optimized_formats = {}
-            for fmt in generate_formats:
-                try:
-                    optimized = self._optimize_format(
-                        image,
-                        fmt,
-                        quality or calculate_optimal_quality(image, fmt)
-                    )
-                    optimized_formats[fmt] = optimized
-                    logger.info(
-                        f"Format généré: {fmt}",
-                        size_kb=optimized['size'] / 1024,
-                        compression=optimized['compression']['percentage']
-                    )
-                except Exception as e:
-                    logger.error(f"Erreur génération format {fmt}: {str(e)}")
-
-            duration = time.time() - start_time
+        cached = self._dedup_get(cache_key, filename)
+        if cached is not None:
+            return self._optimize_result(filename, image_data, *cached, start_time, deduplicated=True)
 
-            result = {
-                'success': True,
-                'original': {
-                    'filename': filename,
-                    'size': len(image_data),
-                    'format': validation_result['format'],
-                    'dimensions': {
-                        'width': validation_result['width'],
-                        'height': validation_result['height']
-                    }
-                },
-                'optimized': optimized_formats,
-                'metadata': metadata,
-                'processing_time': round(duration, 3)
-            }
+        try:
+            image, validation_result = await asyncio.to_thread(self._decode, image_data, filename)
 
-            logger.info(
-                f"Image optimisée avec succès: {filename}",
-                duration_ms=duration * 1000,
-                formats_generated=len(optimized_formats)
-            )
+            futures = self._submit_encodes([(image, fmt, quality) for fmt in generate_formats])
+            metadata = await asyncio.to_thread(self.extract_metadata, image, filename)
+            encoded = await self._collect_async(futures)
 
-            return result
+            return self._finish_optimize(
+                cache_key, filename, image_data, validation_result,
+                generate_formats, encoded, metadata, start_time
+            )
 
-        except ImageValidationError as e:
-            logger.error(f"Validation échouée: {str(e)}")
-            return {
-                'success': False,
-                'error': str(e),
-                'error_type': 'validation'
-            }
         except Exception as e:
-            logger.error(f"Erreur optimisation image: {str(e)}")
-            return {
-                'success': False,
-                'error': str(e),
-                'error_type': 'processing'
-            }
+            return self._optimize_error(e)
 
     def generate_thumbnails(
         self,
@@ -197,71 +399,45 @@ class ImageOptimizer:
             Dict avec tous les thumbnails générés
         """
         start_time = time.time()
+        sizes, formats = self._resolve_thumbnail_options(sizes, formats)
+        cache_key = self._cache_key(image_data, 'thumbnails', tuple(sizes.items()), tuple(formats))
 
-        try:
-            # Validation
-            validate_image(image_data, filename)
-
-            # Charger l'image
-            image = Image.open(io.BytesIO(image_data))
-            image = self._fix_orientation(image)
-
-            # Utiliser les tailles par défaut si non spécifiées
-            if sizes is None:
-                sizes = THUMBNAIL_SIZES
+        cached = self._dedup_get(cache_key, filename)
+        if cached is not None:
+            return self._thumbnails_result(filename, cached, start_time, deduplicated=True)
 
-            # Formats par défaut
-            if formats is None:
-                formats = ['webp', 'jpeg']
-
-            thumbnails = {}
-
-            for size_name, (width, height) in sizes.items():
-                thumbnails[size_name] = {}
-
-                # Créer le thumbnail
-                thumb = self._create_thumbnail(image, width, height)
-
-                # Générer dans chaque format
-                for fmt in formats:
-                    try:
-                        quality = calculate_optimal_quality(thumb, fmt)
-                        optimized = self._optimize_format(thumb, fmt, quality)
-
-                        thumbnails[size_name][fmt] = {
-                            'data': optimized['data'],
-                            'size': optimized['size'],
-                            'dimensions': {
-                                'width': thumb.width,
-                                'height': thumb.height
-                            },
-                            'url': optimized.get('url')
-                        }
-
-                        logger.debug(
-                            f"Thumbnail généré: {size_name} ({fmt})",
-                            size_kb=optimized['size'] / 1024
-                        )
+        try:
+            jobs = self._prepare_thumbnails(image_data, filename, sizes, formats)
+            encoded = self._collect(self._submit_encodes([job[2:] for job in jobs]))
+            return self._finish_thumbnails(cache_key, filename, sizes, jobs, encoded, start_time)
 
-                    except Exception as e:
-                        logger.error(
-                            f"Erreur génération thumbnail {size_name}/{fmt}: {str(e)}"
-                        )
+        except Exception as e:
+            logger.error(f"Erreur génération thumbnails: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
 
-            duration = time.time() - start_time
+    async def generate_thumbnails_async(
+        self,
+        image_data: bytes,
+        filename: str,
+        sizes: Optional[Dict[str, Tuple[int, int]]] = None,
+        formats: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Variante de generate_thumbnails pour les handlers async"""
+        start_time = time.time()
+        sizes, formats = self._resolve_thumbnail_options(sizes, formats)
+        cache_key = self._cache_key(image_data, 'thumbnails', tuple(sizes.items()), tuple(formats))
 
-            logger.info(
-                f"Thumbnails générés: {filename}",
-                count=len(thumbnails),
-                duration_ms=duration * 1000
-            )
+        cached = self._dedup_get(cache_key, filename)
+        if cached is not None:
+            return self._thumbnails_result(filename, cached, start_time, deduplicated=True)
 
-            return {
-                'success': True,
-                'thumbnails': thumbnails,
-                'sizes_generated': list(thumbnails.keys()),
-                'processing_time': round(duration, 3)
-            }
+        try:
+            jobs = await asyncio.to_thread(self._prepare_thumbnails, image_data, filename, sizes, formats)
+            encoded = await self._collect_async(self._submit_encodes([job[2:] for job in jobs]))
+            return self._finish_thumbnails(cache_key, filename, sizes, jobs, encoded, start_time)
 
         except Exception as e:
             logger.error(f"Erreur génération thumbnails: {str(e)}")
@@ -490,49 +666,29 @@ class ImageOptimizer:
                 filename,
                 formats=['webp', 'jpeg']
             )
+            return self._build_srcset(thumbnails_result, filename, base_url)
 
-            if not thumbnails_result['success']:
-                raise Exception(thumbnails_result.get('error'))
-
-            thumbnails = thumbnails_result['thumbnails']
-
-            # Construire les srcsets
-            srcsets = {
-                'webp': [],
-                'jpeg': []
-            }
-
-            safe_name = get_safe_filename(filename)
-            base_name = Path(safe_name).stem
-
-            for size_name, size_data in thumbnails.items():
-                width = size_data.get('webp', size_data.get('jpeg', {})).get(
-                    'dimensions', {}
-                ).get('width')
-
-                if width:
-                    for fmt in ['webp', 'jpeg']:
-                        if fmt in size_data:
-                            url = f"{base_url}/{base_name}_{size_name}.{fmt}"
-                            srcsets[fmt].append(f"{url} {width}w")
-
-            # Générer les chaînes srcset
-            result = {
-                'success': True,
-                'srcset': {
-                    'webp': ', '.join(srcsets['webp']),
-                    'jpeg': ', '.join(srcsets['jpeg'])
-                },
-                'sizes': {
-                    size: data.get('webp', data.get('jpeg', {})).get('dimensions')
-                    for size, data in thumbnails.items()
-                },
-                'thumbnails': thumbnails
+        except Exception as e:
+            logger.error(f"Erreur génération srcset: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e)
             }
 
-            logger.info(f"Srcset généré pour: {filename}")
-
-            return result
+    async def generate_responsive_srcset_async(
+        self,
+        image_data: bytes,
+        filename: str,
+        base_url: str = ''
+    ) -> Dict[str, Any]:
+        """Variante de generate_responsive_srcset pour les handlers async"""
+        try:
+            thumbnails_result = await self.generate_thumbnails_async(
+                image_data,
+                filename,
+                formats=['webp', 'jpeg']
+            )
+            return self._build_srcset(thumbnails_result, filename, base_url)
 
         except Exception as e:
             logger.error(f"Erreur génération srcset: {str(e)}")
@@ -541,6 +697,56 @@ class ImageOptimizer:
                 'error': str(e)
             }
 
+    def _build_srcset(
+        self,
+        thumbnails_result: Dict[str, Any],
+        filename: str,
+        base_url: str
+    ) -> Dict[str, Any]:
+        """Construit les chaînes srcset à partir des thumbnails générés"""
+        if not thumbnails_result['success']:
+            raise Exception(thumbnails_result.get('error'))
+
+        thumbnails = thumbnails_result['thumbnails']
+
+        # Construire les srcsets
+        srcsets = {
+            'webp': [],
+            'jpeg': []
+        }
+
+        safe_name = get_safe_filename(filename)
+        base_name = Path(safe_name).stem
+
+        for size_name, size_data in thumbnails.items():
+            width = size_data.get('webp', size_data.get('jpeg', {})).get(
+                'dimensions', {}
+            ).get('width')
+
+            if width:
+                for fmt in ['webp', 'jpeg']:
+                    if fmt in size_data:
+                        url = f"{base_url}/{base_name}_{size_name}.{fmt}"
+                        srcsets[fmt].append(f"{url} {width}w")
+
+        # Générer les chaînes srcset
+        result = {
+            'success': True,
+            'srcset': {
+                'webp': ', '.join(srcsets['webp']),
+                'jpeg': ', '.join(srcsets['jpeg'])
+            },
+            'sizes': {
+                size: data.get('webp', data.get('jpeg', {})).get('dimensions')
+                for size, data in thumbnails.items()
+            },
+            'thumbnails': thumbnails
+        }
+
+        logger.info(f"Srcset généré pour: {filename}")
+
+        return result
+
     # Méthodes privées
 
     def _fix_orientation(self, image: Image.Image) -> Image.Image:
@@ -572,6 +778,14 @@ class ImageOptimizer:
 
         return image
 
+    @staticmethod
+    def _exif_orientation(image: Image.Image) -> Optional[int]:
+        """Orientation EXIF lue dans l'en-tête (sans décoder les pixels)"""
+        try:
+            return image.getexif().get(ORIENTATION_TAG)
+        except Exception:
+            return None
+
     def _create_thumbnail(
         self,
         image: Image.Image,
@@ -607,65 +821,296 @@ class ImageOptimizer:
         """
         Optimise une image dans un format spécifique
         """
-        buffer = io.BytesIO()
-
-        # Conversion de mode si nécessaire
-        if format in ('jpeg', 'jpg'):
-            if image.mode in ('RGBA', 'LA', 'P'):
-                # JPEG ne supporte pas la transparence
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                if image.mode == 'P':
-                    image = image.convert('RGBA')
-                background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-                image = background
-            elif image.mode != 'RGB':
-                image = image.convert('RGB')
-
-            image.save(
-                buffer,
-                format='JPEG',
-                quality=quality,
-                optimize=True,
-                progressive=True
-            )
+        return encode_image(image, format, quality)
+
+    # ============================================
+    # PIPELINE
+    # ============================================
+
+    def _resolve_formats(self, generate_formats: Optional[List[str]]) -> List[str]:
+        """Formats à générer (par défaut selon la configuration)"""
+        if generate_formats is not None:
+            return list(generate_formats)
+        formats = []
+        if self.enable_webp:
+            formats.append('webp')
+        if self.enable_avif:
+            formats.append('avif')
+        formats.append('jpeg')  # Toujours générer JPEG comme fallback
+        return formats
+
+    @staticmethod
+    def _resolve_thumbnail_options(
+        sizes: Optional[Dict[str, Tuple[int, int]]],
+        formats: Optional[List[str]]
+    ) -> Tuple[Dict[str, Tuple[int, int]], List[str]]:
+        return (
+            dict(sizes if sizes is not None else THUMBNAIL_SIZES),
+            list(formats if formats is not None else ['webp', 'jpeg'])
+        )
 
-        elif format == 'webp':
-            image.save(
-                buffer,
-                format='WEBP',
-                quality=quality,
-                method=6,  # Meilleure compression
-                optimize=True
-            )
+    def _decode(
+        self,
+        image_data: bytes,
+        filename: str,
+        min_scale: Optional[float] = None
+    ) -> Tuple[Image.Image, Dict[str, Any]]:
+        """
+        Valide et décode l'image une seule fois (orientation EXIF corrigée)
 
-        elif format == 'avif':
-            # AVIF nécessite pillow-heif
-            image.save(
-                buffer,
-                format='AVIF',
-                quality=quality
-            )
+        Args:
+            min_scale: Échelle maximale réellement utilisée (< 1: un JPEG est
+                décodé directement à taille réduite)
+        """
+        validation_result = validate_image(image_data, filename)
+        logger.info(f"Image validée: {filename}", **validation_result)
 
-        elif format == 'png':
-            if image.mode not in ('RGB', 'RGBA', 'P'):
-                image = image.convert('RGBA')
+        image = Image.open(io.BytesIO(image_data))
+        if min_scale is not None and min_scale < 1 and image.format == 'JPEG':
+            image.draft(image.mode, (
+                math.ceil(image.width * min_scale),
+                math.ceil(image.height * min_scale)
+            ))
+
+        image = self._fix_orientation(image)
+        image.load()
+        return image, validation_result
+
+    def _prepare_thumbnails(
+        self,
+        image_data: bytes,
+        filename: str,
+        sizes: Dict[str, Tuple[int, int]],
+        formats: List[str]
+    ) -> List[Tuple[str, Tuple[int, int], Image.Image, str, Optional[int]]]:
+        """
+        Décode l'image et taille tous les thumbnails dans la pyramide
+
+        Returns:
+            [(size_name, dimensions, thumbnail, format, quality)] à encoder
+        """
+        with Image.open(io.BytesIO(image_data)) as probe:
+            width, height = probe.size
+            if self._exif_orientation(probe) in (6, 8):
+                width, height = height, width
+        min_scale = max(
+            (ResizePyramid.scale_for(width, height, w, h) for w, h in sizes.values()),
+            default=1.0
+        )
+
+        image, _ = self._decode(image_data, filename, min_scale=min_scale)
+        pyramid = ResizePyramid(image)
+
+        # Du plus grand au plus petit: les niveaux de la pyramide sont réutilisés
+        jobs = []
+        for size_name, (w, h) in sorted(sizes.items(), key=lambda item: item[1][0] * item[1][1], reverse=True):
+            thumb = self._create_thumbnail(pyramid.source_for(w, h), w, h)
+            jobs.extend((size_name, thumb.size, thumb, fmt, None) for fmt in formats)
+        return jobs
+
+    def _submit_encodes(self, jobs: List[Tuple[Image.Image, str, Optional[int]]]) -> List[Future]:
+        """Lance les encodages dans le pool (ou dans le processus si désactivé/cassé)"""
+        pool = get_encode_pool(self.encode_workers)
+        futures = []
+        for job in jobs:
+            if pool is not None:
+                try:
+                    futures.append(pool.submit(encode_image, *job))
+                    continue
+                except BrokenProcessPool:
+                    logger.warning("Pool d'encodage indisponible, encodage dans le processus")
+                    _discard_encode_pool(self.encode_workers, pool)
+                    pool = None
+
+            future: Future = Future()
+            try:
+                future.set_result(encode_image(*job))
+            except Exception as e:
+                future.set_exception(e)
+            futures.append(future)
+        return futures
+
+    @staticmethod
+    def _collect(futures: List[Future]) -> List[Any]:
+        """Résultats des encodages (l'exception à la place d'un encodage échoué)"""
+        return [future.exception() or future.result() for future in futures]
+
+    @staticmethod
+    async def _collect_async(futures: List[Future]) -> List[Any]:
+        return await asyncio.gather(
+            *(asyncio.wrap_future(future) for future in futures),
+            return_exceptions=True
+        )
 
-            image.save(
-                buffer,
-                format='PNG',
-                optimize=True,
-                compress_level=9
+    def _finish_optimize(
+        self,
+        cache_key: Optional[tuple],
+        filename: str,
+        image_data: bytes,
+        validation_result: Dict[str, Any],
+        generate_formats: List[str],
+        encoded: List[Any],
+        metadata: Dict[str, Any],
+        start_time: float
+    ) -> Dict[str, Any]:
+        optimized_formats = {}
+        for fmt, optimized in zip(generate_formats, encoded):
+            if isinstance(optimized, BaseException):
+                logger.error(f"Erreur génération format {fmt}: {str(optimized)}")
+                continue
+            optimized_formats[fmt] = optimized
+            logger.info(
+                f"Format généré: {fmt}",
+                size_kb=optimized['size'] / 1024,
+                compression=optimized['compression']['percentage']
             )
 
-        data = buffer.getvalue()
+        # Seuls les encodages et les données tirées des pixels sont mis en cache
+        source = {key: validation_result[key] for key in ('format', 'hash', 'width', 'height')}
+        content_metadata = {
+            key: value for key, value in metadata.items() if key not in ('filename', 'created_at')
+        }
+        self._dedup_set(cache_key, (source, optimized_formats, content_metadata))
 
+        result = self._optimize_result(
+            filename, image_data, source, optimized_formats, content_metadata, start_time
+        )
+        logger.info(
+            f"Image optimisée avec succès: {filename}",
+            duration_ms=result['processing_time'] * 1000,
+            formats_generated=len(optimized_formats)
+        )
+        return result
+
+    @staticmethod
+    def _optimize_result(
+        filename: str,
+        image_data: bytes,
+        source: Dict[str, Any],
+        optimized_formats: Dict[str, Any],
+        content_metadata: Dict[str, Any],
+        start_time: float,
+        deduplicated: bool = False
+    ) -> Dict[str, Any]:
+        """Réponse d'optimize_image: encodages (éventuellement en cache) + champs de cette requête"""
+        result = {
+            'success': True,
+            'original': {
+                'filename': filename,
+                'size': len(image_data),
+                'format': source['format'],
+                'hash': source['hash'],
+                'dimensions': {
+                    'width': source['width'],
+                    'height': source['height']
+                }
+            },
+            'optimized': optimized_formats,
+            'metadata': {
+                'filename': filename,
+                **content_metadata,
+                'created_at': datetime.utcnow().isoformat()
+            },
+            'processing_time': round(time.time() - start_time, 3)
+        }
+        if deduplicated:
+            result['deduplicated'] = True
+        return result
+
+    @staticmethod
+    def _optimize_error(error: Exception) -> Dict[str, Any]:
+        if isinstance(error, ImageValidationError):
+            logger.error(f"Validation échouée: {str(error)}")
+            return {
+                'success': False,
+                'error': str(error),
+                'error_type': 'validation'
+            }
+        logger.error(f"Erreur optimisation image: {str(error)}")
         return {
-            'format': format,
-            'data': data,
-            'size': len(data),
-            'quality': quality,
-            'compression': estimate_compression_ratio(
-                len(image.tobytes()),
-                len(data)
+            'success': False,
+            'error': str(error),
+            'error_type': 'processing'
+        }
+
+    def _finish_thumbnails(
+        self,
+        cache_key: Optional[tuple],
+        filename: str,
+        sizes: Dict[str, Tuple[int, int]],
+        jobs: List[tuple],
+        encoded: List[Any],
+        start_time: float
+    ) -> Dict[str, Any]:
+        thumbnails = {size_name: {} for size_name in sizes}
+
+        for (size_name, (width, height), _, fmt, _), optimized in zip(jobs, encoded):
+            if isinstance(optimized, BaseException):
+                logger.error(f"Erreur génération thumbnail {size_name}/{fmt}: {str(optimized)}")
+                continue
+
+            thumbnails[size_name][fmt] = {
+                'data': optimized['data'],
+                'size': optimized['size'],
+                'dimensions': {
+                    'width': width,
+                    'height': height
+                },
+                'url': optimized.get('url')
+            }
+
+            logger.debug(
+                f"Thumbnail généré: {size_name} ({fmt})",
+                size_kb=optimized['size'] / 1024
             )
+
+        self._dedup_set(cache_key, thumbnails)
+        result = self._thumbnails_result(filename, thumbnails, start_time)
+        logger.info(
+            f"Thumbnails générés: {filename}",
+            count=len(thumbnails),
+            duration_ms=result['processing_time'] * 1000
+        )
+        return result
+
+    @staticmethod
+    def _thumbnails_result(
+        filename: str,
+        thumbnails: Dict[str, Dict[str, Any]],
+        start_time: float,
+        deduplicated: bool = False
+    ) -> Dict[str, Any]:
+        """Réponse de generate_thumbnails: encodages + durée de cette requête"""
+        result = {
+            'success': True,
+            'thumbnails': thumbnails,
+            'sizes_generated': list(thumbnails.keys()),
+            'processing_time': round(time.time() - start_time, 3)
         }
+        if deduplicated:
+            result['deduplicated'] = True
+        return result
+
+    # ============================================
+    # DÉDUPLICATION PAR CONTENU
+    # ============================================
+
+    def _cache_key(self, image_data: bytes, operation: str, *options: Any) -> Optional[tuple]:
+        """Clé de déduplication: hash SHA-256 du contenu + opération + options"""
+        if self._dedup_cache is None:
+            return None
+        return (hashlib.sha256(image_data).hexdigest(), operation, *options)
+
+    def _dedup_get(self, cache_key: Optional[tuple], filename: str) -> Optional[Any]:
+        """Encodages déjà calculés pour ce contenu (la réponse est reconstruite par l'appelant)"""
+        if cache_key is None:
+            return None
+        cached = self._dedup_cache.get(cache_key)
+        if cached is None:
+            return None
+        logger.info(f"Upload identique, encodages réutilisés: {filename}", hash=cache_key[0])
+        return cached
+
+    def _dedup_set(self, cache_key: Optional[tuple], outputs: Any) -> None:
+        if cache_key is not None:
+            self._dedup_cache.set(cache_key, outputs)
@@ -9,16 +9,106 @@ Match automatique Marchand ↔ Influenceur avec IA
 from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
 from decimal import Decimal
+import asyncio
+import bisect
+import heapq
+import os
 import random
+import time
 
 from utils.logger import logger
 
+# Durée de vie de l'index de caractéristiques (secondes)
+MATCHING_INDEX_TTL = int(os.getenv("MATCHING_INDEX_TTL", "600"))
+
+MIN_MATCH_SCORE = 50  # Seuil minimum
+
+# Poids des facteurs du score de compatibilité
+SCORE_WEIGHTS = {
+    'audience_alignment': 0.30,
+    'niche_match': 0.25,
+    'budget_fit': 0.15,
+    'performance_history': 0.20,
+    'engagement_rate': 0.10,
+}
+
+
+class InfluencerFeatureIndex:
+    """
+    Index pré-calculé des caractéristiques des influenceurs
+
+    Chaque entrée garde les parties du score indépendantes du marchand
+    (engagement, fourchette de prix, ensembles normalisés d'audience et de
+    niches, portée estimée). Un index inversé niche → influenceurs sert au
+    pré-filtrage. L'index est reconstruit quand il dépasse son TTL.
+    """
+
+    def __init__(self, ttl: int = MATCHING_INDEX_TTL):
+        self.ttl = ttl
+        self.entries: List[Dict[str, Any]] = []
+        self.by_niche: Dict[str, List[int]] = {}
+        self.built_at: Optional[float] = None
+
+    def is_stale(self) -> bool:
+        return self.built_at is None or time.monotonic() - self.built_at >= self.ttl
+
+    def build(self, influencers: List[Dict[str, Any]], service: "InfluencerMatchingService") -> None:
+        """Reconstruit l'index à partir de la liste des influenceurs actifs"""
+        entries = []
+        by_niche: Dict[str, List[int]] = {}
+
+        for position, influencer in enumerate(influencers):
+            audience = influencer.get('audience_demographics') or {}
+            avg_price = influencer.get('average_campaign_price', 0)
+            price_range = influencer.get('price_range', {})
+            niches = {n.lower() for n in influencer.get('niches', [])}
+            categories = {c.lower() for c in influencer.get('content_categories', [])}
+
+            entries.append({
+                'position': position,
+                'influencer': influencer,
+                'niches': niches,
+                'content_categories': categories,
+                'ages': set((audience.get('age_distribution') or {}).keys()),
+                'gender_split': audience.get('gender_split') or {},
+                'locations': set(audience.get('top_locations') or []),
+                'interests': set(audience.get('interests') or []),
+                'avg_price': avg_price,
+                'min_price': price_range.get('min', avg_price * 0.7) if avg_price else 0,
+                'max_price': price_range.get('max', avg_price * 1.3) if avg_price else 0,
+                'past_campaigns': [
+                    (c.get('type', ''), c.get('roi_percentage', 100))
+                    for c in influencer.get('past_campaigns', [])
+                ],
+                'performance_by_goals': {},
+                'engagement_score': service._score_engagement_rate(influencer.get('engagement_rate', 0)),
+                'estimated_reach': service._estimate_reach(influencer, {}),
+                'estimated_engagement': service._estimate_engagement(influencer),
+            })
+            for niche in niches | categories:
+                by_niche.setdefault(niche, []).append(position)
+
+        self.entries = entries
+        self.by_niche = by_niche
+        self.built_at = time.monotonic()
+
+    def niche_candidates(self, product_category: Optional[str]) -> List[Dict[str, Any]]:
+        """Influenceurs dont une niche ou catégorie de contenu correspond au produit"""
+        if not product_category:
+            return list(self.entries)
+        return [self.entries[i] for i in self.by_niche.get(product_category.lower(), [])]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
 
 class InfluencerMatchingService:
     """Service de matching intelligent marchand-influenceur"""
 
     def __init__(self):
         self.db = None  # supabase client
+        self.feature_index = InfluencerFeatureIndex()
+        self._index_lock = asyncio.Lock()
 
     # ========================================
     # SCORING & MATCHING ALGORITHM
@@ -40,47 +130,159 @@ class InfluencerMatchingService:
                 'target_audience': {...},
                 'budget': float,
                 'campaign_goals': ['awareness', 'sales', 'engagement'],
-                'duration_days': int
+                'duration_days': int,
+                'require_niche': bool  # optionnel: niche/catégorie obligatoire
             }
             limit: Nombre de résultats
 
         Returns:
             Liste d'influenceurs avec score de match (0-100)
         """
-        # Récupérer profil marchand
-        merchant = await self._get_merchant_profile(merchant_id)
+        # Index pré-calculé des influenceurs actifs
+        index = await self.get_feature_index()
 
-        # Récupérer tous les influenceurs actifs
-        influencers = await self._get_active_influencers()
+        # Pré-filtre niche: `require_niche` restreint aux influenceurs de la catégorie
+        if campaign_details.get('require_niche'):
+            candidates = index.niche_candidates(campaign_details.get('product_category'))
+        else:
+            candidates = index.entries
+
+        # Partie exacte bon marché (niche, budget, engagement) + borne haute
+        # des facteurs restants (audience 30, performance 20)
+        product_category = campaign_details.get('product_category')
+        budget = campaign_details.get('budget', 0)
+        remaining_max = 100 * (SCORE_WEIGHTS['audience_alignment'] + SCORE_WEIGHTS['performance_history'])
+        heap = []
+        for entry in candidates:
+            niche_score = self._score_niche_from_entry(product_category, entry)
+            budget_score = self._score_budget_from_entry(budget, entry)
+            upper = (
+                niche_score * SCORE_WEIGHTS['niche_match']
+                + budget_score * SCORE_WEIGHTS['budget_fit']
+                + entry['engagement_score'] * SCORE_WEIGHTS['engagement_rate']
+                + remaining_max
+            )
+            if upper >= MIN_MATCH_SCORE:
+                heap.append((-upper, entry['position'], niche_score, budget_score))
+        heapq.heapify(heap)
+
+        # Score complet par borne décroissante, arrêt dès que la borne ne
+        # peut plus dépasser le limit-ième meilleur score
+        scored = []  # (-score, position, entry, match_score), trié
+        while heap and limit > 0:
+            neg_upper, position, niche_score, budget_score = heapq.heappop(heap)
+            if len(scored) >= limit and -scored[limit - 1][0] > int(-neg_upper + 1e-9):
+                break
+
+            entry = index.entries[position]
+            match_score = self._complete_match_score(entry, campaign_details, niche_score, budget_score)
+            if match_score['total'] >= MIN_MATCH_SCORE:
+                bisect.insort(scored, (-match_score['total'], position, entry, match_score))
+
+        scored_matches = [
+            {
+                'influencer': entry['influencer'],
+                'match_score': match_score['total'],
+                'score_breakdown': match_score['breakdown'],
+                'estimated_reach': entry['estimated_reach'],
+                'estimated_engagement': entry['estimated_engagement'],
+                'estimated_conversions': self._estimate_conversions(entry['influencer'], campaign_details),
+                'pricing': self._calculate_pricing(entry['influencer'], campaign_details),
+                'match_reasons': self._generate_match_reasons(match_score['breakdown'])
+            }
+            for _, _, entry, match_score in scored[:limit]
+        ]
 
-        # Calculer score de match pour chaque influenceur
-        scored_matches = []
+        logger.info(
+            f"✅ Trouvé {len(scored_matches)} matches pour marchand {merchant_id} "
+            f"({len(scored)}/{len(index)} influenceurs scorés)"
+        )
 
-        for influencer in influencers:
-            match_score = await self._calculate_match_score(
-                merchant,
-                influencer,
-                campaign_details
-            )
+        return scored_matches
+
+    async def get_feature_index(self, force: bool = False) -> InfluencerFeatureIndex:
+        """Index des caractéristiques, reconstruit s'il a expiré"""
+        if force or self.feature_index.is_stale():
+            async with self._index_lock:
+                if force or self.feature_index.is_stale():
+                    influencers = await self._get_active_influencers()
+                    self.feature_index.build(influencers, self)
+                    logger.info(f"🔄 Index de matching reconstruit ({len(influencers)} influenceurs)")
+        return self.feature_index
+
+    def _complete_match_score(
+        self,
+        entry: Dict[str, Any],
+        campaign: Dict[str, Any],
+        niche_score: int,
+        budget_score: int
+    ) -> Dict[str, Any]:
+        """Score complet d'une entrée de l'index (même formule que _calculate_match_score)"""
+        breakdown = {
+            'audience_alignment': self._score_audience_from_entry(campaign.get('target_audience', {}), entry),
+            'niche_match': niche_score,
+            'budget_fit': budget_score,
+            'performance_history': self._score_performance_from_entry(campaign.get('campaign_goals', []), entry),
+            'engagement_rate': entry['engagement_score'],
+        }
+        total_score = sum(breakdown[factor] * SCORE_WEIGHTS[factor] for factor in SCORE_WEIGHTS)
+        return {
+            'total': int(total_score),
+            'breakdown': breakdown
+        }
+
+    def _score_audience_from_entry(self, target_audience: Dict[str, Any], entry: Dict[str, Any]) -> int:
+        """_score_audience_alignment sur les ensembles pré-calculés"""
+        score = 0
 
-            if match_score >= 50:  # Seuil minimum
-                scored_matches.append({
-                    'influencer': influencer,
-                    'match_score': match_score,
-                    'score_breakdown': match_score['breakdown'],
-                    'estimated_reach': self._estimate_reach(influencer, campaign_details),
-                    'estimated_engagement': self._estimate_engagement(influencer),
-                    'estimated_conversions': self._estimate_conversions(influencer, campaign_details),
-                    'pricing': self._calculate_pricing(influencer, campaign_details),
-                    'match_reasons': self._generate_match_reasons(match_score['breakdown'])
-                })
+        target_ages = set(target_audience.get('age_range') or [])
+        if target_ages and entry['ages']:
+            score += len(target_ages & entry['ages']) / len(target_ages) * 30
 
-        # Trier par score décroissant
-        scored_matches.sort(key=lambda x: x['match_score'], reverse=True)
+        target_gender = target_audience.get('gender')
+        if target_gender and entry['gender_split']:
+            score += (entry['gender_split'].get(target_gender, 0) / 100) * 25
 
-        logger.info(f"✅ Trouvé {len(scored_matches)} matches pour marchand {merchant_id}")
+        target_locs = set(target_audience.get('locations') or [])
+        if target_locs and entry['locations']:
+            score += len(target_locs & entry['locations']) / len(target_locs) * 25
 
-        return scored_matches[:limit]
+        target_interests = set(target_audience.get('interests') or [])
+        if target_interests and entry['interests']:
+            score += len(target_interests & entry['interests']) / len(target_interests) * 20
+
+        return int(min(score, 100))
+
+    def _score_niche_from_entry(self, product_category: Optional[str], entry: Dict[str, Any]) -> int:
+        """_score_niche_match sur les niches normalisées"""
+        if not product_category:
+            return 50
+        category = product_category.lower()
+        if category in entry['niches']:
+            return 100
+        if category in entry['content_categories']:
+            return 80
+        return 60
+
+    def _score_budget_from_entry(self, campaign_budget: float, entry: Dict[str, Any]) -> int:
+        """_score_budget_fit sur la fourchette de prix pré-calculée"""
+        if not campaign_budget or not entry['avg_price']:
+            return 50
+        if entry['min_price'] <= campaign_budget <= entry['max_price']:
+            return 100
+        if campaign_budget < entry['min_price']:
+            return int(campaign_budget / entry['min_price'] * 50)
+        return 90
+
+    def _score_performance_from_entry(self, campaign_goals: List[str], entry: Dict[str, Any]) -> int:
+        """_score_performance_history mémorisé par ensemble d'objectifs"""
+        key = tuple(campaign_goals)
+        cached = entry['performance_by_goals'].get(key)
+        if cached is None:
+            past = [{'type': t, 'roi_percentage': roi} for t, roi in entry['past_campaigns']]
+            cached = self._score_performance_history(past, campaign_goals)
+            entry['performance_by_goals'][key] = cached
+        return cached
 
     async def _calculate_match_score(
         self,
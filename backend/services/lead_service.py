@@ -7,7 +7,7 @@ Optimisé avec eager loading et batch fetching pour éviter N+1 queries
 from typing import Optional, Dict, List, Any
 from datetime import datetime, timedelta
 from decimal import Decimal
-from uuid import UUID
+from uuid import UUID, uuid4
 from supabase import Client
 
 import logging
@@ -19,6 +19,12 @@ try:
 except ImportError:
     DBOptimizer = None
 
+from utils.rpc_fallback import OptionalRpc
+
+# Registre des réservations (migration 013), partagé par les instances
+_reserve_rpc = OptionalRpc("reserve_deposit_amounts")
+_settle_rpc = OptionalRpc("settle_deposit_reservation")
+
 class LeadService:
     """Service pour gérer les leads (génération, validation, commissions)"""
     
@@ -99,73 +105,46 @@ class LeadService:
             Lead créé
         """
         try:
-            if not influencer_id and not commercial_id:
-                raise ValueError("Influencer ou commercial requis")
-            
-            if not estimated_value or estimated_value < 50:
-                raise ValueError("Valeur estimée minimum: 50 dhs")
-            
-            # Récupérer paramètres campagne
-            campaign_settings = self._get_campaign_settings(campaign_id)
-            
-            # Calculer commission
-            commission_data = self.calculate_commission(estimated_value, campaign_settings)
-            
-            # Récupérer l'accord influenceur/commercial
-            agreement = self._get_agreement(
-                merchant_id, 
-                influencer_id or commercial_id,
-                campaign_id
+            lead_data = self._build_lead_row(
+                campaign_id, merchant_id, influencer_id, commercial_id,
+                estimated_value, customer_data, source, metadata
             )
+            lead_id = lead_data['id']
+            commission_amount = Decimal(str(lead_data['commission_amount']))
             
-            # Calculer commission influenceur/commercial
-            influencer_percentage = Decimal(agreement.get('commission_percentage', 30.00)) if agreement else Decimal('30.00')
-            influencer_commission = Decimal(commission_data['commission_amount']) * influencer_percentage / 100
-            
-            # Vérifier disponibilité dépôt
-            deposit = self._get_active_deposit(merchant_id, campaign_id)
-            if not deposit:
-                raise ValueError("Aucun dépôt actif trouvé pour cette campagne")
-            
-            if Decimal(deposit['current_balance']) < Decimal(commission_data['commission_amount']):
-                raise ValueError("Solde du dépôt insuffisant")
-            
-            # Créer le lead
-            lead_data = {
-                'campaign_id': campaign_id,
+            # Réserver le montant dans le dépôt (atomique côté base)
+            reservation = self._reserve_for_leads([{
                 'merchant_id': merchant_id,
-                'influencer_id': influencer_id,
-                'commercial_id': commercial_id,
-                'estimated_value': float(estimated_value),
-                'commission_amount': commission_data['commission_amount'],
-                'commission_type': commission_data['commission_type'],
-                'influencer_percentage': float(influencer_percentage),
-                'influencer_commission': float(influencer_commission),
-                'source': source,
-                'status': 'pending',
-                **(customer_data or {})
-            }
-            
-            # Ajouter metadata si fournie
-            if metadata:
-                lead_data.update({
-                    'ip_address': metadata.get('ip_address'),
-                    'user_agent': metadata.get('user_agent')
-                })
-            
-            result = self.supabase.table('leads').insert(lead_data).execute()
-            
-            if not result.data:
-                raise Exception("Erreur création lead")
+                'campaign_id': campaign_id,
+                'lead_id': lead_id,
+                'amount': float(commission_amount)
+            }])
+            
+            deposit = None
+            if reservation is None:
+                # Registre non déployé: vérification et réservation lecture/écriture
+                deposit = self._get_active_deposit(merchant_id, campaign_id)
+                if not deposit:
+                    raise ValueError("Aucun dépôt actif trouvé pour cette campagne")
+                
+                if Decimal(deposit['current_balance']) < commission_amount:
+                    raise ValueError("Solde du dépôt insuffisant")
+            elif not reservation[0].get('success'):
+                raise ValueError(self._reservation_error(reservation[0]))
+            
+            try:
+                result = self.supabase.table('leads').insert(lead_data).execute()
+                if not result.data:
+                    raise Exception("Erreur création lead")
+            except Exception:
+                if deposit is None:
+                    self._settle_reservation(lead_id, 'release')
+                raise
             
             lead = result.data[0]
             
-            # Réserver le montant dans le dépôt
-            self._reserve_deposit_amount(
-                deposit['id'],
-                Decimal(commission_data['commission_amount']),
-                lead['id']
-            )
+            if deposit is not None:
+                self._reserve_deposit_amount(deposit['id'], commission_amount, lead['id'])
             
             # Notification nouveau lead
             self._notify_new_lead(merchant_id, lead)
@@ -219,6 +198,25 @@ class LeadService:
             if quality_score and (quality_score < 1 or quality_score > 10):
                 raise ValueError("Score qualité doit être entre 1 et 10")
             
+            # Seul un lead pending se valide ou se rejette; un lead déjà validé
+            # peut encore être converti ou perdu (dépôt déjà débité)
+            settle = previous_status == 'pending'
+            if not settle and not (previous_status == 'validated' and status in ('converted', 'lost')):
+                raise ValueError(f"Lead déjà traité (statut: {previous_status})")
+            
+            # Solder la réservation avant de changer le statut (opération atomique
+            # et idempotente du registre): en cas d'erreur le lead reste pending
+            # et un nouvel essai ne débite pas le dépôt deux fois
+            settled = None
+            if settle and status in ('validated', 'converted'):
+                # Déduire du dépôt et libérer réservation
+                settled = self._settle_reservation(
+                    lead_id, 'deduct', f"Lead validé: {lead_data.get('customer_name', 'N/A')}"
+                )
+            elif settle and status == 'rejected':
+                # Libérer la réservation sans déduction
+                settled = self._settle_reservation(lead_id, 'release')
+            
             # Mettre à jour le lead
             update_data = {
                 'status': status,
@@ -236,7 +234,13 @@ class LeadService:
             if status == 'converted':
                 update_data['conversion_date'] = datetime.now().isoformat()
             
-            result = self.supabase.table('leads').update(update_data).eq('id', lead_id).execute()
+            result = (
+                self.supabase.table('leads')
+                .update(update_data)
+                .eq('id', lead_id)
+                .eq('status', previous_status)
+                .execute()
+            )
             
             if not result.data:
                 raise Exception("Erreur mise à jour lead")
@@ -255,11 +259,19 @@ class LeadService:
                 rejection_reason
             )
             
-            # Gérer le dépôt selon le statut
+            if settled is not None:
+                # Le registre renvoie le solde à jour: pas de relecture
+                if not settled.get('already_settled'):
+                    self._check_deposit_balance(settled['deposit_id'], merchant_id, settled)
+                return updated_lead
+            
+            if not settle:
+                return updated_lead
+            
+            # Lead antérieur au registre (ou registre non déployé)
             deposit = self._get_active_deposit(merchant_id, lead_data['campaign_id'])
             
             if status == 'validated' or status == 'converted':
-                # Déduire du dépôt et libérer réservation
                 self._deduct_from_deposit(
                     deposit['id'],
                     Decimal(lead_data['commission_amount']),
@@ -267,7 +279,6 @@ class LeadService:
                     f"Lead validé: {lead_data.get('customer_name', 'N/A')}"
                 )
             elif status == 'rejected':
-                # Libérer la réservation sans déduction
                 self._release_reserved_amount(
                     deposit['id'],
                     Decimal(lead_data['commission_amount'])
@@ -283,6 +294,124 @@ class LeadService:
             raise
     
     
+    def create_leads_batch(self, leads: List[Dict[str, Any]]) -> Dict[str, List]:
+        """
+        Créer plusieurs leads en un lot
+        
+        Paramètres de campagne et accords lus une fois par campagne/accord,
+        réservations prises en un seul appel (reserve_deposit_amounts) puis
+        insertion groupée des leads acceptés.
+        
+        Args:
+            leads: Liste de dicts avec les arguments de create_lead
+                   (campaign_id, merchant_id, influencer_id, commercial_id,
+                   estimated_value, customer_data, source, metadata)
+            
+        Returns:
+            {'created': [leads], 'failed': [{'index', 'error'}]}
+        """
+        created: List[Dict] = []
+        failed: List[Dict] = []
+        settings_cache: Dict = {}
+        agreement_cache: Dict = {}
+        
+        rows = []
+        for index, lead in enumerate(leads):
+            try:
+                row = self._build_lead_row(
+                    lead['campaign_id'],
+                    lead['merchant_id'],
+                    lead.get('influencer_id'),
+                    lead.get('commercial_id'),
+                    lead.get('estimated_value'),
+                    lead.get('customer_data'),
+                    lead.get('source', 'direct'),
+                    lead.get('metadata'),
+                    settings_cache=settings_cache,
+                    agreement_cache=agreement_cache
+                )
+                rows.append((index, row))
+            except Exception as e:
+                failed.append({'index': index, 'error': str(e)})
+        
+        if not rows:
+            return {'created': created, 'failed': failed}
+        
+        reservations = self._reserve_for_leads([
+            {
+                'merchant_id': row['merchant_id'],
+                'campaign_id': row['campaign_id'],
+                'lead_id': row['id'],
+                'amount': float(row['commission_amount'])
+            }
+            for _, row in rows
+        ])
+        
+        if reservations is None:
+            # Registre non déployé: création unitaire
+            for index, _ in rows:
+                lead = leads[index]
+                try:
+                    created.append(self.create_lead(**{
+                        key: lead.get(key) for key in (
+                            'campaign_id', 'merchant_id', 'influencer_id', 'commercial_id',
+                            'estimated_value', 'customer_data', 'metadata'
+                        )
+                    }, source=lead.get('source', 'direct')))
+                except Exception as e:
+                    failed.append({'index': index, 'error': str(e)})
+            return {'created': created, 'failed': failed}
+        
+        accepted = []
+        for (index, row), reservation in zip(rows, reservations):
+            if reservation.get('success'):
+                accepted.append(row)
+            else:
+                failed.append({'index': index, 'error': self._reservation_error(reservation)})
+        
+        if accepted:
+            try:
+                result = self.supabase.table('leads').insert(accepted).execute()
+                created = result.data or []
+            except Exception as e:
+                print(f"Erreur create_leads_batch: {e}")
+                for row in accepted:
+                    self._settle_reservation(row['id'], 'release')
+                raise
+            
+            for lead in created:
+                self._notify_new_lead(lead['merchant_id'], lead)
+        
+        return {'created': created, 'failed': failed}
+    
+    
+    def release_lead_reservation(self, lead: Dict) -> bool:
+        """
+        Libérer la réservation d'un lead non validé (rejet, expiration)
+        
+        Args:
+            lead: Lead avec id, merchant_id, campaign_id, commission_amount
+            
+        Returns:
+            True si le montant a été libéré
+        """
+        try:
+            if self._settle_reservation(lead['id'], 'release') is not None:
+                return True
+            
+            # Lead antérieur au registre
+            deposit = self._get_active_deposit(lead['merchant_id'], lead.get('campaign_id'))
+            if not deposit:
+                return False
+            
+            self._release_reserved_amount(deposit['id'], Decimal(str(lead['commission_amount'])))
+            return True
+            
+        except Exception as e:
+            print(f"Erreur release_lead_reservation: {e}")
+            return False
+    
+    
     def get_leads_by_campaign(
         self,
         campaign_id: str,
@@ -476,6 +605,159 @@ class LeadService:
             return None
     
     
+    def _build_lead_row(
+        self,
+        campaign_id: str,
+        merchant_id: str,
+        influencer_id: Optional[str],
+        commercial_id: Optional[str],
+        estimated_value: Decimal,
+        customer_data: Optional[Dict],
+        source: str,
+        metadata: Optional[Dict],
+        settings_cache: Optional[Dict] = None,
+        agreement_cache: Optional[Dict] = None
+    ) -> Dict[str, Any]:
+        """
+        Construire la ligne d'un lead (commission calculée, ID généré)
+        
+        Les caches optionnels évitent de relire paramètres de campagne et
+        accords pour chaque lead d'un lot.
+        """
+        if not influencer_id and not commercial_id:
+            raise ValueError("Influencer ou commercial requis")
+        
+        if not estimated_value or estimated_value < 50:
+            raise ValueError("Valeur estimée minimum: 50 dhs")
+        
+        # Récupérer paramètres campagne
+        if settings_cache is not None and campaign_id in settings_cache:
+            campaign_settings = settings_cache[campaign_id]
+        else:
+            campaign_settings = self._get_campaign_settings(campaign_id)
+            if settings_cache is not None:
+                settings_cache[campaign_id] = campaign_settings
+        
+        # Calculer commission
+        commission_data = self.calculate_commission(estimated_value, campaign_settings)
+        
+        # Récupérer l'accord influenceur/commercial
+        agreement_key = (merchant_id, influencer_id or commercial_id, campaign_id)
+        if agreement_cache is not None and agreement_key in agreement_cache:
+            agreement = agreement_cache[agreement_key]
+        else:
+            agreement = self._get_agreement(*agreement_key)
+            if agreement_cache is not None:
+                agreement_cache[agreement_key] = agreement
+        
+        # Calculer commission influenceur/commercial
+        influencer_percentage = Decimal(agreement.get('commission_percentage', 30.00)) if agreement else Decimal('30.00')
+        influencer_commission = Decimal(commission_data['commission_amount']) * influencer_percentage / 100
+        
+        lead_data = {
+            'id': str(uuid4()),
+            'campaign_id': campaign_id,
+            'merchant_id': merchant_id,
+            'influencer_id': influencer_id,
+            'commercial_id': commercial_id,
+            'estimated_value': float(estimated_value),
+            'commission_amount': commission_data['commission_amount'],
+            'commission_type': commission_data['commission_type'],
+            'influencer_percentage': float(influencer_percentage),
+            'influencer_commission': float(influencer_commission),
+            'source': source,
+            'status': 'pending',
+            **(customer_data or {})
+        }
+        
+        # Ajouter metadata si fournie
+        if metadata:
+            lead_data.update({
+                'ip_address': metadata.get('ip_address'),
+                'user_agent': metadata.get('user_agent')
+            })
+        
+        return lead_data
+    
+    
+    def _reserve_for_leads(self, reservations: List[Dict]) -> Optional[List[Dict]]:
+        """
+        Réserver atomiquement les montants de plusieurs leads (RPC reserve_deposit_amounts)
+        
+        Returns:
+            Un résultat par réservation (dans l'ordre), ou None si le registre
+            n'est pas déployé (migration 013 absente)
+        """
+        if not _reserve_rpc.enabled():
+            return None
+        try:
+            result = self.supabase.rpc('reserve_deposit_amounts', {
+                'p_reservations': reservations
+            }).execute()
+        except Exception as e:
+            if _reserve_rpc.missing(e):
+                return None
+            raise
+        _reserve_rpc.succeeded()
+        
+        return result.data if isinstance(result.data, list) else None
+    
+    
+    def _settle_reservation(
+        self,
+        lead_id: str,
+        action: str,
+        description: Optional[str] = None
+    ) -> Optional[Dict]:
+        """
+        Solder la réservation d'un lead: 'deduct' (validé) ou 'release' (rejeté/expiré)
+        
+        Returns:
+            Soldes du dépôt après l'opération, ou None si le lead n'a pas de
+            réservation au registre (lead antérieur, registre non déployé)
+        
+        Raises:
+            ValueError: réservation déjà soldée par l'action contraire
+            Toute autre erreur (réseau, réponse perdue, refus du registre): le
+            repli lecture/écriture pourrait débiter une seconde fois
+        """
+        if not _settle_rpc.enabled():
+            return None
+        try:
+            result = self.supabase.rpc('settle_deposit_reservation', {
+                'p_lead_id': lead_id,
+                'p_action': action,
+                'p_description': description
+            }).execute()
+        except Exception as e:
+            if _settle_rpc.missing(e):
+                return None
+            raise
+        _settle_rpc.succeeded()
+        
+        data = result.data
+        if isinstance(data, list):
+            data = data[0] if data else None
+        if data and data.get('success'):
+            return data
+        if data and data.get('error') == 'reservation_not_found':
+            return None
+        if data and data.get('error') == 'settlement_conflict':
+            # Ex: lead expiré (réservation libérée) puis validé: pas de débit possible
+            raise ValueError(
+                f"Réservation du lead {lead_id} déjà soldée ({data.get('status')}): action {action} refusée"
+            )
+        raise RuntimeError(f"Règlement de la réservation du lead {lead_id} impossible: {data}")
+    
+    
+    @staticmethod
+    def _reservation_error(result: Dict) -> str:
+        """Message d'erreur d'une réservation refusée"""
+        if result.get('error') == 'insufficient_balance':
+            return "Solde du dépôt insuffisant"
+        return "Aucun dépôt actif trouvé pour cette campagne"
+    
+    
     def _get_active_deposit(
         self,
         merchant_id: str,
@@ -601,20 +883,31 @@ class LeadService:
             print(f"Erreur _record_validation: {e}")
     
     
-    def _check_deposit_balance(self, deposit_id: str, merchant_id: str):
-        """Vérifier le solde et envoyer notification si bas"""
+    def _check_deposit_balance(
+        self,
+        deposit_id: str,
+        merchant_id: str,
+        deposit_data: Optional[Dict] = None
+    ):
+        """
+        Vérifier le solde et envoyer notification si bas
+        
+        deposit_data: soldes déjà connus (retour du registre), évite une relecture
+        """
         try:
-            deposit = self.supabase.table('company_deposits').select('*').eq('id', deposit_id).single().execute()
-            
-            if not deposit.data:
-                return
+            if deposit_data is None:
+                deposit = self.supabase.table('company_deposits').select('*').eq('id', deposit_id).single().execute()
+                
+                if not deposit.data:
+                    return
+                deposit_data = deposit.data
             
-            current_balance = Decimal(deposit.data['current_balance'])
-            alert_threshold = Decimal(deposit.data['alert_threshold'])
+            current_balance = Decimal(str(deposit_data['current_balance']))
+            alert_threshold = Decimal(str(deposit_data['alert_threshold']))
             
             if current_balance <= alert_threshold:
                 # Envoyer notification (sera géré par NotificationService)
-                self._notify_low_balance(merchant_id, deposit.data)
+                self._notify_low_balance(merchant_id, deposit_data)
                 
                 # Mettre à jour last_alert_sent
                 self.supabase.table('company_deposits').update({
@@ -623,7 +916,7 @@ class LeadService:
             
             # Vérifier épuisement
             if current_balance <= 0:
-                self._handle_deposit_depletion(deposit_id, merchant_id, deposit.data)
+                self._handle_deposit_depletion(deposit_id, merchant_id, deposit_data)
                 
         except Exception as e:
             print(f"Erreur _check_deposit_balance: {e}")
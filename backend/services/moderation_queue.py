@@ -0,0 +1,246 @@
+"""
+File de modération IA: micro-lots, concurrence bornée, cache des verdicts
+
+Chaque produit à modérer passe par la file au lieu d'un appel modèle dédié:
+- les produits en attente sont regroupés (jusqu'à MODERATION_BATCH_SIZE, ou
+  après MODERATION_BATCH_WAIT_MS) en une seule requête au fournisseur
+- au plus MODERATION_MAX_CONCURRENCY requêtes en vol; au-delà, les produits
+  s'accumulent et partent dans des lots plus gros
+- verdicts mis en cache par empreinte du contenu (nom, description,
+  catégorie, prix normalisés): un produit identique n'est pas re-modéré, et
+  les demandes identiques simultanées partagent la même place dans le lot
+
+La fonction d'appel (call_batch) reçoit la liste des produits du lot et
+renvoie un verdict par produit, dans le même ordre (None: verdict manquant).
+
+Usage:
+    queue = ModerationQueue(call_batch=moderate_batch_with_ai)
+    verdict = await queue.moderate({"name": ..., "description": ...})
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from utils.llm_cache import normalize_prompt
+from utils.local_cache import LocalTTLCache
+from utils.logger import logger
+
+# Configuration
+MODERATION_BATCH_SIZE = int(os.getenv("MODERATION_BATCH_SIZE", "10"))  # Produits par requête au modèle
+MODERATION_BATCH_WAIT_MS = float(os.getenv("MODERATION_BATCH_WAIT_MS", "50"))  # Attente max pour remplir un lot
+MODERATION_MAX_CONCURRENCY = int(os.getenv("MODERATION_MAX_CONCURRENCY", "4"))  # Requêtes simultanées au fournisseur
+MODERATION_VERDICT_CACHE_SIZE = int(os.getenv("MODERATION_VERDICT_CACHE_SIZE", "10000"))
+MODERATION_VERDICT_CACHE_TTL = float(os.getenv("MODERATION_VERDICT_CACHE_TTL", "86400"))  # Secondes
+
+BatchCall = Callable[[List[Dict[str, Any]]], Awaitable[List[Optional[Dict[str, Any]]]]]
+
+
+def content_key(product: Dict[str, Any]) -> str:
+    """Empreinte sha256 du contenu modéré (nom, description, catégorie, prix)"""
+    payload = json.dumps(
+        [
+            normalize_prompt(product.get("name") or "").casefold(),
+            normalize_prompt(product.get("description") or "").casefold(),
+            normalize_prompt(product.get("category") or "").casefold(),
+            product.get("price"),
+        ],
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ModerationQueue:
+    """Regroupe les demandes de modération en lots envoyés en parallèle (borné)"""
+
+    def __init__(
+        self,
+        call_batch: BatchCall,
+        batch_size: int = MODERATION_BATCH_SIZE,
+        batch_wait_ms: float = MODERATION_BATCH_WAIT_MS,
+        max_concurrency: int = MODERATION_MAX_CONCURRENCY,
+        cache_size: int = MODERATION_VERDICT_CACHE_SIZE,
+        cache_ttl: float = MODERATION_VERDICT_CACHE_TTL,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            call_batch: Coroutine (produits) -> verdicts, un par produit
+            batch_size: Nombre maximum de produits par requête
+            batch_wait_ms: Attente pour compléter un lot incomplet (0: envoi immédiat)
+            max_concurrency: Lots en vol simultanément
+            cache_size: Nombre de verdicts gardés (0: pas de cache)
+            cache_ttl: Durée de vie d'un verdict en cache (secondes)
+        """
+        self._call_batch = call_batch
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = max(0.0, batch_wait_ms) / 1000
+        self.max_concurrency = max(1, max_concurrency)
+        self._verdicts = LocalTTLCache(maxsize=cache_size, ttl=cache_ttl, timer=timer) if cache_size > 0 else None
+
+        self._pending: Deque[Tuple[str, Dict[str, Any]]] = deque()
+        self._waiters: Dict[str, asyncio.Future] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._runner: Optional[asyncio.Task] = None
+
+        self.stats = {"requests": 0, "cache_hits": 0, "coalesced": 0, "batches": 0, "items_sent": 0, "errors": 0}
+
+    # ============================================
+    # API
+    # ============================================
+
+    def cached_verdict(self, product: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Verdict déjà connu pour ce contenu, sans appel au modèle"""
+        if self._verdicts is None:
+            return None
+        cached = self._verdicts.get(content_key(product))
+        return dict(cached) if cached is not None else None
+
+    async def moderate(self, product: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Verdict du modèle pour un produit (cache, sinon prochain lot)
+
+        Raises:
+            Exception: erreur de l'appel au modèle ou verdict manquant pour
+                ce produit (non mis en cache)
+        """
+        self.stats["requests"] += 1
+        key = content_key(product)
+
+        if self._verdicts is not None:
+            cached = self._verdicts.get(key)
+            if cached is not None:
+                self.stats["cache_hits"] += 1
+                return dict(cached)
+
+        self._ensure_runner()
+        future = self._waiters.get(key)
+        if future is None:
+            future = self._loop.create_future()
+            # Erreur consommée même si tous les demandeurs ont abandonné
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            self._waiters[key] = future
+            self._pending.append((key, product))
+            self._wakeup.set()
+        else:
+            self.stats["coalesced"] += 1
+
+        # Un demandeur annulé (client déconnecté) ne retire pas le produit du lot
+        return dict(await asyncio.shield(future))
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Envoie les produits en attente, attend les lots en vol puis arrête la file"""
+        if self._runner is None:
+            return
+        deadline = time.monotonic() + timeout
+        while (self._pending or self._tasks) and time.monotonic() < deadline:
+            self._wakeup.set()
+            await asyncio.sleep(0.01)
+
+        self._runner.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(self._runner, *self._tasks, return_exceptions=True)
+        self._runner = None
+
+        # Produits jamais envoyés ou lots annulés: les demandeurs ne restent pas en attente
+        self._pending.clear()
+        for key in list(self._waiters):
+            self._resolve(key, error=RuntimeError("File de modération arrêtée"))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Compteurs de la file et du cache des verdicts"""
+        stats = {
+            **self.stats,
+            "pending": len(self._pending),
+            "in_flight": len(self._waiters) - len(self._pending),
+            "avg_batch_size": round(self.stats["items_sent"] / self.stats["batches"], 2) if self.stats["batches"] else 0,
+        }
+        if self._verdicts is not None:
+            stats["cache"] = self._verdicts.get_stats()
+        return stats
+
+    # ============================================
+    # ENVOI DES LOTS
+    # ============================================
+
+    def _ensure_runner(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Première utilisation (ou nouvelle boucle): primitives liées à cette boucle
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._pending.clear()
+            self._waiters.clear()
+            self._tasks.clear()
+            self._runner = None
+        if self._runner is None or self._runner.done():
+            self._runner = loop.create_task(self._run())
+
+    def _track(self, task: asyncio.Task) -> None:
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self) -> None:
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            if len(self._pending) < self.batch_size and self.batch_wait:
+                await asyncio.sleep(self.batch_wait)
+
+            # Attendre une place: les produits arrivés entre-temps grossissent le lot
+            await self._slots.acquire()
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            if not batch:
+                self._slots.release()
+                continue
+
+            task = self._loop.create_task(self._send(batch))
+            task.add_done_callback(lambda _: self._slots.release())
+            self._track(task)
+
+    async def _send(self, batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+        self.stats["batches"] += 1
+        self.stats["items_sent"] += len(batch)
+        try:
+            verdicts = await self._call_batch([product for _, product in batch])
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Modération IA: lot de {len(batch)} produits en échec: {e}")
+            for key, _ in batch:
+                self._resolve(key, error=e)
+            return
+
+        verdicts = list(verdicts or [])
+        for index, (key, _) in enumerate(batch):
+            verdict = verdicts[index] if index < len(verdicts) else None
+            if verdict is None:
+                self.stats["errors"] += 1
+                self._resolve(key, error=ValueError("Verdict manquant dans la réponse du modèle"))
+                continue
+            if self._verdicts is not None:
+                self._verdicts.set(key, dict(verdict))
+            self._resolve(key, verdict=verdict)
+
+    def _resolve(
+        self, key: str, verdict: Optional[Dict[str, Any]] = None, error: Optional[BaseException] = None
+    ) -> None:
+        future = self._waiters.pop(key, None)
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(verdict)
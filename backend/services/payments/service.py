@@ -4,20 +4,28 @@ Contient la logique métier pour l'approbation et le paiement des commissions.
 """
 
 import logging
+import os
 from typing import Optional, List
 from uuid import UUID
 from datetime import datetime
 
 from supabase_client import get_supabase_client
+from utils.rpc_fallback import OptionalRpc
 
 logger = logging.getLogger(__name__)
 
+# Commissions par appel à approve_commissions_batch
+COMMISSION_APPROVAL_CHUNK_SIZE = int(os.getenv("COMMISSION_APPROVAL_CHUNK_SIZE", "1000"))
+
+ALLOWED_COMMISSION_STATUSES = ("approved", "paid", "rejected", "pending")
+
 
 class PaymentsService:
     """Service pour gérer les commissions et appeler approve_payout_transaction."""
 
     def __init__(self):
         self.supabase = get_supabase_client()
+        self._batch_rpc = OptionalRpc("approve_commissions_batch")
 
     async def approve_commission(self, commission_id: UUID, new_status: str = "approved") -> bool:
         """
@@ -55,23 +63,23 @@ class PaymentsService:
 
         except Exception as e:
             logger.error(f"Erreur lors de la mise à jour de la commission: {str(e)}")
-            error_msg = str(e)
-
-            # Parser les erreurs PostgreSQL
-            if "introuvable" in error_msg:
-                raise ValueError(f"Commission ou ressource introuvable: {error_msg}")
-            elif "Solde insuffisant" in error_msg:
-                raise ValueError("Solde insuffisant pour approuver cette commission")
-            elif "déjà été réglée" in error_msg:
-                raise ValueError("Cette commission a déjà été payée et ne peut plus être modifiée")
-            elif "doit être approuvée avant" in error_msg:
-                raise ValueError(
-                    "La commission doit être approuvée avant d'être marquée comme payée"
-                )
-            elif "non supporté" in error_msg:
-                raise ValueError(f"Statut invalide: {error_msg}")
-            else:
-                raise RuntimeError(f"Erreur lors de la mise à jour de la commission: {error_msg}")
+            raise self._map_commission_error(str(e))
+
+    @staticmethod
+    def _map_commission_error(error_msg: str) -> Exception:
+        """Traduit une erreur PostgreSQL de changement de statut en exception métier."""
+        if "introuvable" in error_msg:
+            return ValueError(f"Commission ou ressource introuvable: {error_msg}")
+        elif "Solde insuffisant" in error_msg:
+            return ValueError("Solde insuffisant pour approuver cette commission")
+        elif "déjà été réglée" in error_msg:
+            return ValueError("Cette commission a déjà été payée et ne peut plus être modifiée")
+        elif "doit être approuvée avant" in error_msg:
+            return ValueError("La commission doit être approuvée avant d'être marquée comme payée")
+        elif "non supporté" in error_msg:
+            return ValueError(f"Statut invalide: {error_msg}")
+        else:
+            return RuntimeError(f"Erreur lors de la mise à jour de la commission: {error_msg}")
 
     async def get_commission_by_id(self, commission_id: UUID) -> Optional[dict]:
         """
@@ -207,14 +215,24 @@ class PaymentsService:
             return 0.0
 
     async def batch_approve_commissions(
-        self, commission_ids: List[UUID], new_status: str = "approved"
+        self,
+        commission_ids: List[UUID],
+        new_status: str = "approved",
+        chunk_size: int = COMMISSION_APPROVAL_CHUNK_SIZE,
     ) -> dict:
         """
         Approuve plusieurs commissions en lot.
 
+        Les transitions sont validées et appliquées par paquets de chunk_size
+        via la fonction SQL approve_commissions_batch (une lecture, un UPDATE
+        des commissions et un delta de solde par influenceur par paquet).
+        Si la fonction n'est pas déployée, repli sur approve_payout_transaction
+        commission par commission (mêmes règles de solde insuffisant).
+
         Args:
             commission_ids: Liste des IDs de commissions
             new_status: Nouveau statut à appliquer
+            chunk_size: Commissions par paquet
 
         Returns:
             dict: Résumé des opérations (success, failed)
@@ -222,13 +240,31 @@ class PaymentsService:
         success = []
         failed = []
 
-        for commission_id in commission_ids:
+        # Dédoublonner en conservant l'ordre
+        ids = list(dict.fromkeys(str(commission_id) for commission_id in commission_ids))
+
+        if new_status not in ALLOWED_COMMISSION_STATUSES:
+            error = str(self._map_commission_error(f"Statut {new_status} non supporté"))
+            failed = [{"id": commission_id, "error": error} for commission_id in ids]
+            ids = []
+
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
             try:
-                await self.approve_commission(commission_id, new_status)
-                success.append(str(commission_id))
+                results = await self._approve_commissions_chunk(chunk, new_status)
             except Exception as e:
-                logger.error(f"Échec pour commission {commission_id}: {str(e)}")
-                failed.append({"id": str(commission_id), "error": str(e)})
+                logger.error(f"Échec du lot de {len(chunk)} commissions: {str(e)}")
+                error = str(self._map_commission_error(str(e)))
+                results = [{"id": commission_id, "success": False, "error": error} for commission_id in chunk]
+
+            for result in results:
+                if result.get("success"):
+                    success.append(result["id"])
+                else:
+                    failed.append({"id": result["id"], "error": result.get("error") or ""})
+
+        if failed:
+            logger.warning(f"Approbation en lot: {len(failed)} commission(s) refusée(s)")
 
         return {
             "success_count": len(success),
@@ -236,3 +272,44 @@ class PaymentsService:
             "success": success,
             "failed": failed,
         }
+
+    async def _approve_commissions_chunk(self, commission_ids: List[str], new_status: str) -> List[dict]:
+        """
+        Applique un statut à un paquet de commissions.
+
+        Returns:
+            List[dict]: [{"id", "success", "error"}] dans l'ordre des IDs,
+            error déjà traduit par _map_commission_error
+        """
+        if self._batch_rpc.enabled():
+            try:
+                result = self.supabase.rpc(
+                    "approve_commissions_batch",
+                    {"p_commission_ids": commission_ids, "p_status": new_status},
+                ).execute()
+                self._batch_rpc.succeeded()
+                return [
+                    {**row, "error": str(self._map_commission_error(row["error"])) if row.get("error") else None}
+                    for row in result.data or []
+                ]
+            except Exception as e:
+                if not self._batch_rpc.missing(e):
+                    raise
+
+        return await self._approve_commissions_chunk_fallback(commission_ids, new_status)
+
+    async def _approve_commissions_chunk_fallback(
+        self, commission_ids: List[str], new_status: str
+    ) -> List[dict]:
+        """
+        Une transaction approve_payout_transaction par commission, dans l'ordre
+        du paquet: mêmes verrous et mêmes soldes que l'approbation unitaire.
+        """
+        results = []
+        for commission_id in commission_ids:
+            try:
+                await self.approve_commission(commission_id, new_status)
+                results.append({"id": commission_id, "success": True, "error": None})
+            except Exception as e:
+                results.append({"id": commission_id, "success": False, "error": str(e)})
+        return results
@@ -1,22 +1,143 @@
 """
 Real-time Analytics Dashboard avec WebSocket
 Métriques business en temps réel pour décisions instantanées
+
+Diffusion:
+- Les mises à jour d'un dashboard sont regroupées et envoyées en une seule
+  trame par tick (metrics_batch), sérialisée une fois pour tous les clients
+- Métriques d'état (COALESCED_METRICS): seule la dernière valeur du tick part
+- Chaque connexion a sa file d'envoi bornée et sa tâche d'écriture: un client
+  lent ne bloque pas les autres. File pleine: les trames en retard sont
+  abandonnées et le client est resynchronisé par un snapshot
 """
 import asyncio
 import json
-from typing import Dict, List, Any, Optional
+import os
+from typing import Deque, Dict, List, Any, Optional
 from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import defaultdict, deque
 import redis
 from fastapi import WebSocket, WebSocketDisconnect
 
 from utils.logger import logger
 
+# Configuration
+REALTIME_BROADCAST_TICK = float(os.getenv("REALTIME_BROADCAST_TICK_MS", "250")) / 1000  # Secondes
+REALTIME_SEND_QUEUE_SIZE = int(os.getenv("REALTIME_SEND_QUEUE_SIZE", "16"))  # Trames en attente par connexion
+REALTIME_SEND_TIMEOUT = float(os.getenv("REALTIME_SEND_TIMEOUT", "5"))  # Secondes par trame
+REALTIME_MAX_EVENTS_PER_FRAME = int(os.getenv("REALTIME_MAX_EVENTS_PER_FRAME", "50"))
+
+# Métriques d'état: une nouvelle valeur remplace la précédente dans le tick
+COALESCED_METRICS = {
+    'active_users', 'conversion_rate', 'sales_per_minute', 'revenue_today', 'top_products'
+}
+
+
+class PendingBatch:
+    """Mises à jour d'un dashboard en attente du prochain tick"""
+
+    def __init__(self, max_events: int = REALTIME_MAX_EVENTS_PER_FRAME):
+        self.metrics: Dict[str, Any] = {}
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=max_events)
+        self.dropped = 0
+
+    def add(self, metric_type: str, data: Any):
+        if metric_type in COALESCED_METRICS:
+            self.metrics[metric_type] = data
+            return
+        if len(self.events) == self.events.maxlen:
+            self.dropped += 1  # Les événements les plus anciens du tick sont abandonnés
+        self.events.append({'metric': metric_type, 'value': data})
+
+    def __bool__(self) -> bool:
+        return bool(self.metrics or self.events)
+
+    def to_frame(self) -> str:
+        """Trame JSON unique du tick"""
+        updates = [{'metric': metric, 'value': value} for metric, value in self.metrics.items()]
+        updates.extend(self.events)
+        frame = {
+            'type': 'metrics_batch',
+            'timestamp': datetime.utcnow().isoformat(),
+            'updates': updates
+        }
+        if self.dropped:
+            frame['dropped'] = self.dropped
+        return json.dumps(frame, default=str)
+
+
+class ConnectionSender:
+    """File d'envoi bornée et tâche d'écriture d'une connexion WebSocket"""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        maxsize: int = REALTIME_SEND_QUEUE_SIZE,
+        send_timeout: float = REALTIME_SEND_TIMEOUT,
+        on_close=None
+    ):
+        self.websocket = websocket
+        self.maxsize = maxsize
+        self.send_timeout = send_timeout
+        self.on_close = on_close
+        self.needs_snapshot = False
+        self.dropped_frames = 0
+        self.closed = False
+        self._frames: Deque[str] = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def offer(self, frame: str) -> bool:
+        """Mettre une trame en file (sans attendre le client)"""
+        if self.closed:
+            return False
+        if len(self._frames) >= self.maxsize:
+            # Client en retard: ses trames en attente sont périmées
+            self.dropped_frames += len(self._frames)
+            self._frames.clear()
+            self.needs_snapshot = True
+        self._frames.append(frame)
+        self._wakeup.set()
+        return True
+
+    async def _run(self):
+        try:
+            while not self.closed:
+                if not self._frames:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                frame = self._frames.popleft()
+                await asyncio.wait_for(self.websocket.send_text(frame), self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            logger.warning(f"WebSocket send failed, closing connection: {e}")
+        finally:
+            self.closed = True
+            if self.on_close is not None:
+                self.on_close(self)
+
+    async def close(self):
+        self.closed = True
+        self._wakeup.set()
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+
 
 class RealtimeAnalytics:
     """Service d'analytics temps réel avec WebSocket"""
 
-    def __init__(self):
+    def __init__(self, tick: float = REALTIME_BROADCAST_TICK):
         # Redis pour pub/sub et caching
         self.redis_client = redis.Redis(
             host=os.getenv('REDIS_HOST', 'localhost'),
@@ -24,8 +145,14 @@ class RealtimeAnalytics:
             decode_responses=True
         )
 
-        # Connexions WebSocket actives
-        self.active_connections: Dict[str, List[WebSocket]] = defaultdict(list)
+        # Connexions WebSocket actives (par type de dashboard)
+        self.active_connections: Dict[str, Dict[WebSocket, ConnectionSender]] = defaultdict(dict)
+
+        # Mises à jour en attente du prochain tick (par type de dashboard)
+        self.tick = tick
+        self._pending: Dict[str, PendingBatch] = defaultdict(PendingBatch)
+        self._tasks: List[asyncio.Task] = []
+        self.broadcast_stats = {'frames': 0, 'updates': 0, 'dropped_events': 0}
 
         # Métriques en mémoire (cache rapide)
         self.metrics_cache = {
@@ -38,13 +165,38 @@ class RealtimeAnalytics:
             'alerts': []
         }
 
-        # Démarrer les tâches de fond
-        asyncio.create_task(self._background_metrics_updater())
+    def _ensure_started(self):
+        """Démarrer les tâches de fond (au premier usage, dans la boucle courante)"""
+        if not self._tasks or any(task.done() for task in self._tasks):
+            for task in self._tasks:
+                task.cancel()
+            self._tasks = [
+                asyncio.create_task(self._background_metrics_updater()),
+                asyncio.create_task(self._broadcast_loop())
+            ]
+
+    async def stop(self):
+        """Arrêter les tâches de fond et les files d'envoi"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for connections in self.active_connections.values():
+            for sender in list(connections.values()):
+                await sender.close()
+        self.active_connections.clear()
 
     async def connect(self, websocket: WebSocket, user_id: str, dashboard_type: str = "general"):
         """Connecter un client WebSocket"""
         await websocket.accept()
-        self.active_connections[dashboard_type].append(websocket)
+        self._ensure_started()
+
+        sender = ConnectionSender(
+            websocket,
+            on_close=lambda s: self._drop_sender(s, dashboard_type)
+        )
+        self.active_connections[dashboard_type][websocket] = sender
+        sender.start()
 
         logger.info(f"WebSocket connected: user={user_id}, type={dashboard_type}")
 
@@ -53,45 +205,83 @@ class RealtimeAnalytics:
 
     async def disconnect(self, websocket: WebSocket, dashboard_type: str = "general"):
         """Déconnecter un client"""
-        if websocket in self.active_connections[dashboard_type]:
-            self.active_connections[dashboard_type].remove(websocket)
+        sender = self.active_connections[dashboard_type].pop(websocket, None)
+        if sender is not None:
+            await sender.close()
             logger.info(f"WebSocket disconnected: type={dashboard_type}")
 
+    def _drop_sender(self, sender: ConnectionSender, dashboard_type: str):
+        """Retirer une connexion dont l'écriture a échoué"""
+        if self.active_connections[dashboard_type].get(sender.websocket) is sender:
+            del self.active_connections[dashboard_type][sender.websocket]
+
+    async def _snapshot_frame(self, dashboard_type: str) -> str:
+        snapshot = await self.get_dashboard_data(dashboard_type)
+        return json.dumps({
+            'type': 'snapshot',
+            'timestamp': datetime.utcnow().isoformat(),
+            'data': snapshot
+        }, default=str)
+
     async def send_snapshot(self, websocket: WebSocket, dashboard_type: str):
         """Envoyer snapshot complet des métriques"""
         try:
-            snapshot = await self.get_dashboard_data(dashboard_type)
-            await websocket.send_json({
-                'type': 'snapshot',
-                'timestamp': datetime.utcnow().isoformat(),
-                'data': snapshot
-            })
+            frame = await self._snapshot_frame(dashboard_type)
+            sender = self.active_connections[dashboard_type].get(websocket)
+            if sender is not None:
+                sender.offer(frame)
+            else:
+                await websocket.send_text(frame)
         except Exception as e:
             logger.error(f"Error sending snapshot: {e}")
 
     async def broadcast_metric(self, metric_type: str, data: Any, dashboard_type: str = "general"):
-        """Broadcaster une métrique à tous les clients connectés"""
-        message = {
-            'type': 'metric_update',
-            'metric': metric_type,
-            'value': data,
-            'timestamp': datetime.utcnow().isoformat()
-        }
-
-        disconnected = []
-
-        for websocket in self.active_connections[dashboard_type]:
+        """
+        Broadcaster une métrique à tous les clients connectés
+
+        Non bloquant: la mise à jour part avec la trame du prochain tick.
+        """
+        if not self.active_connections.get(dashboard_type):
+            return
+        self._pending[dashboard_type].add(metric_type, data)
+        self._ensure_started()
+
+    async def flush_broadcasts(self):
+        """Envoyer les mises à jour en attente: une trame par dashboard"""
+        for dashboard_type in list(self.active_connections):
+            senders = list(self.active_connections[dashboard_type].values())
+            batch = self._pending.pop(dashboard_type, None)
+            if not senders:
+                continue
+
+            # Clients resynchronisés après abandon de trames
+            lagging = [sender for sender in senders if sender.needs_snapshot]
+            if lagging:
+                snapshot = await self._snapshot_frame(dashboard_type)
+                for sender in lagging:
+                    sender.needs_snapshot = False
+                    sender.offer(snapshot)
+
+            if not batch:
+                continue
+
+            # Sérialisation unique pour tous les destinataires
+            frame = batch.to_frame()
+            for sender in senders:
+                sender.offer(frame)
+
+            self.broadcast_stats['frames'] += 1
+            self.broadcast_stats['updates'] += len(batch.metrics) + len(batch.events)
+            self.broadcast_stats['dropped_events'] += batch.dropped
+
+    async def _broadcast_loop(self):
+        """Tâche de fond: une trame par dashboard et par tick"""
+        while True:
+            await asyncio.sleep(self.tick)
             try:
-                await websocket.send_json(message)
-            except WebSocketDisconnect:
-                disconnected.append(websocket)
+                await self.flush_broadcasts()
             except Exception as e:
-                logger.error(f"Error broadcasting to websocket: {e}")
-                disconnected.append(websocket)
-
-        # Nettoyer les connexions mortes
-        for ws in disconnected:
-            await self.disconnect(ws, dashboard_type)
+                logger.error(f"Broadcast loop error: {e}")
 
     async def track_sale(self, sale_data: Dict[str, Any]):
         """Tracker une vente en temps réel"""
@@ -0,0 +1,327 @@
+"""
+Bus d'événements temps réel (commissions, paiements)
+
+Les chemins de code qui créent une commission ou changent le statut d'un
+paiement publient l'événement au moment de l'écriture: plus de polling de
+la base.
+
+- Transport entre workers/processus: Redis pub/sub (un canal). Un script Lua
+  attribue le numéro de séquence de l'utilisateur, archive l'événement dans
+  son backlog et le publie, en un aller-retour atomique.
+- Dans le processus: routage par user_id vers les abonnés locaux
+  (connexions WebSocket).
+- Reprise après reconnexion: le client renvoie le dernier seq reçu, les
+  événements manqués sont relus dans le backlog.
+
+Sans Redis, le bus reste fonctionnel dans le processus (séquences et
+backlog en mémoire). La séquence locale reprend au plus grand seq connu de
+l'utilisateur, et Redis repart au-dessus des numéros attribués localement:
+un client ne reçoit jamais deux événements avec le même seq.
+
+Usage:
+    realtime_bus.publish(user_id, EventTypes.COMMISSION_CREATED, {...})
+    await realtime_bus.publish_async(user_id, ...)   # depuis une route async
+
+    realtime_bus.subscribe(user_id, send)    # send: async (event) -> None
+    await realtime_bus.start()               # écoute du canal Redis
+"""
+
+import asyncio
+import json
+import os
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+import redis
+import redis.asyncio as aioredis
+
+from utils.logger import logger
+
+# Configuration
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REALTIME_CHANNEL = os.getenv("REALTIME_CHANNEL", "sysales:realtime")
+REALTIME_BACKLOG_SIZE = int(os.getenv("REALTIME_BACKLOG_SIZE", "200"))  # Événements rejouables par utilisateur
+REALTIME_BACKLOG_TTL = int(os.getenv("REALTIME_BACKLOG_TTL", "86400"))  # Secondes
+REALTIME_PUBLISH_TIMEOUT = float(os.getenv("REALTIME_PUBLISH_TIMEOUT", "1.0"))  # Secondes, côté écritures
+
+KEY_PREFIX = "realtime"
+
+Subscriber = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class EventTypes:
+    COMMISSION_CREATED = "commission_created"
+    COMMISSION_UPDATED = "commission_updated"
+    PAYMENT_CREATED = "payment_created"
+    PAYMENT_STATUS_CHANGED = "payment_status_changed"
+    SALE_CREATED = "sale_created"
+    DASHBOARD_UPDATE = "dashboard_update"
+
+
+# KEYS[1] = compteur de séquence, KEYS[2] = backlog (sorted set, score = seq)
+# ARGV[1] = événement JSON sans seq, ARGV[2] = taille du backlog,
+# ARGV[3] = TTL du backlog, ARGV[4] = canal, ARGV[5] = plus grand seq déjà
+# attribué par le processus (repli local): la séquence repart au-dessus
+PUBLISH_SCRIPT = """
+local seq = redis.call('INCR', KEYS[1])
+local floor = tonumber(ARGV[5])
+if seq <= floor then
+  seq = floor + 1
+  redis.call('SET', KEYS[1], seq)
+end
+local event = '{"seq": ' .. seq .. ', ' .. string.sub(ARGV[1], 2)
+redis.call('ZADD', KEYS[2], seq, event)
+redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -(tonumber(ARGV[2]) + 1))
+redis.call('EXPIRE', KEYS[2], tonumber(ARGV[3]))
+redis.call('PUBLISH', ARGV[4], event)
+return event
+"""
+
+
+class RealtimeEventBus:
+    """Pub/sub temps réel: Redis entre processus, routage par utilisateur dans le processus"""
+
+    def __init__(
+        self,
+        client=None,
+        async_client=None,
+        channel: str = REALTIME_CHANNEL,
+        backlog_size: int = REALTIME_BACKLOG_SIZE,
+        backlog_ttl: int = REALTIME_BACKLOG_TTL,
+    ):
+        self.redis = client if client is not None else redis.from_url(
+            REDIS_URL,
+            decode_responses=True,
+            socket_timeout=REALTIME_PUBLISH_TIMEOUT,
+            socket_connect_timeout=REALTIME_PUBLISH_TIMEOUT,
+        )
+        self._async_client = async_client
+        self.channel = channel
+        self.backlog_size = backlog_size
+        self.backlog_ttl = backlog_ttl
+        self._script = self.redis.register_script(PUBLISH_SCRIPT)
+
+        self._subscribers: Dict[str, Set[Subscriber]] = defaultdict(set)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._listener: Optional[asyncio.Task] = None
+
+        # Plus grand seq connu des utilisateurs suivis (abonnés locaux, repli sans Redis)
+        self._local_seq: Dict[str, int] = defaultdict(int)
+        self._local_backlog: Dict[str, Deque[Dict[str, Any]]] = defaultdict(
+            lambda: deque(maxlen=self.backlog_size)
+        )
+
+        self.stats = {"published": 0, "delivered": 0, "redis_errors": 0}
+
+    @property
+    def async_redis(self):
+        if self._async_client is None:
+            self._async_client = aioredis.from_url(REDIS_URL, decode_responses=True)
+        return self._async_client
+
+    def _keys(self, user_id: str) -> List[str]:
+        """Clés Redis d'un utilisateur (hash tag pour le sharding)"""
+        base = f"{KEY_PREFIX}:{{{user_id}}}"
+        return [f"{base}:seq", f"{base}:backlog"]
+
+    # ============================================
+    # PUBLICATION
+    # ============================================
+
+    def publish(self, user_id: str, event_type: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Publier un événement pour un utilisateur
+
+        Returns:
+            Événement publié (avec seq), None si user_id est vide
+        """
+        events = self.publish_many([(user_id, event_type, data)])
+        return events[0] if events else None
+
+    async def publish_async(self, user_id: str, event_type: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """publish() hors de la boucle d'événements (client Redis synchrone)"""
+        return await asyncio.to_thread(self.publish, user_id, event_type, data)
+
+    def publish_many(self, events: List[Tuple[str, str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """
+        Publier plusieurs événements en un aller-retour Redis (pipeline)
+
+        Args:
+            events: [(user_id, event_type, data)]
+        """
+        payloads = [
+            (str(user_id), self._serialize(str(user_id), event_type, data))
+            for user_id, event_type, data in events
+            if user_id
+        ]
+        if not payloads:
+            return []
+
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for user_id, payload in payloads:
+                self._script(
+                    keys=self._keys(user_id),
+                    args=[
+                        payload,
+                        self.backlog_size,
+                        self.backlog_ttl,
+                        self.channel,
+                        self._local_seq.get(user_id, 0),
+                    ],
+                    client=pipe,
+                )
+            published = [json.loads(raw) for raw in pipe.execute()]
+            for event in published:
+                self._note_seq(event)
+        except redis.RedisError as e:
+            self.stats["redis_errors"] += 1
+            logger.warning(f"Realtime: Redis indisponible, diffusion locale uniquement: {e}")
+            published = [self._publish_local(user_id, payload) for user_id, payload in payloads]
+
+        self.stats["published"] += len(published)
+        return published
+
+    @staticmethod
+    def _serialize(user_id: str, event_type: str, data: Dict[str, Any]) -> str:
+        return json.dumps(
+            {
+                "user_id": user_id,
+                "type": event_type,
+                "data": data,
+                "timestamp": datetime.now().isoformat(),
+            },
+            default=str,
+        )
+
+    def _note_seq(self, event: Dict[str, Any]) -> None:
+        """Retenir le seq d'un événement Redis pour un utilisateur suivi dans le processus"""
+        user_id = event.get("user_id")
+        if user_id in self._subscribers or user_id in self._local_seq:
+            self._local_seq[user_id] = max(self._local_seq.get(user_id, 0), event["seq"])
+
+    def _publish_local(self, user_id: str, payload: str) -> Dict[str, Any]:
+        """Séquence (suite du plus grand seq connu) et backlog en mémoire, livraison locale"""
+        self._local_seq[user_id] += 1
+        event = {"seq": self._local_seq[user_id], **json.loads(payload)}
+        self._local_backlog[user_id].append(event)
+
+        if self._loop is not None and not self._loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self._dispatch(event), self._loop)
+        return event
+
+    # ============================================
+    # ABONNEMENTS
+    # ============================================
+
+    def subscribe(self, user_id: str, callback: Subscriber) -> None:
+        """Recevoir les événements d'un utilisateur (callback async)"""
+        self._subscribers[str(user_id)].add(callback)
+
+    def unsubscribe(self, user_id: str, callback: Subscriber) -> None:
+        """Ne plus recevoir les événements d'un utilisateur"""
+        callbacks = self._subscribers.get(str(user_id))
+        if callbacks is None:
+            return
+        callbacks.discard(callback)
+        if not callbacks:
+            del self._subscribers[str(user_id)]
+
+    async def _dispatch(self, event: Dict[str, Any]) -> None:
+        """Livrer un événement aux abonnés locaux de son utilisateur"""
+        callbacks = list(self._subscribers.get(event.get("user_id"), ()))
+        if not callbacks:
+            return
+        self._note_seq(event)
+
+        results = await asyncio.gather(*(callback(event) for callback in callbacks), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning(f"Realtime: échec de livraison à {event.get('user_id')}: {result}")
+            else:
+                self.stats["delivered"] += 1
+
+    async def current_seq(self, user_id: str) -> int:
+        """Dernier seq attribué à un utilisateur (point de départ d'un nouveau client)"""
+        user_id = str(user_id)
+        try:
+            raw = await self.async_redis.get(self._keys(user_id)[0])
+            current = int(raw or 0)
+        except redis.RedisError as e:
+            self.stats["redis_errors"] += 1
+            logger.warning(f"Realtime: séquence Redis indisponible, séquence locale: {e}")
+            current = 0
+        return max(current, self._local_seq.get(user_id, 0))
+
+    async def replay(self, user_id: str, after_seq: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Événements d'un utilisateur postérieurs à after_seq
+
+        Returns:
+            (événements, complet). complet=False si des événements sont sortis
+            du backlog: le client doit recharger son état.
+        """
+        user_id = str(user_id)
+        try:
+            raw = await self.async_redis.zrangebyscore(self._keys(user_id)[1], f"({after_seq}", "+inf")
+            events = [json.loads(item) for item in raw]
+        except redis.RedisError as e:
+            self.stats["redis_errors"] += 1
+            logger.warning(f"Realtime: backlog Redis indisponible, backlog local: {e}")
+            events = [event for event in self._local_backlog.get(user_id, ()) if event["seq"] > after_seq]
+
+        complete = not events or events[0]["seq"] <= after_seq + 1
+        return events, complete
+
+    # ============================================
+    # ÉCOUTE DU CANAL REDIS
+    # ============================================
+
+    async def start(self) -> None:
+        """Démarrer l'écoute du canal Redis (livraison aux abonnés locaux)"""
+        self._loop = asyncio.get_running_loop()
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        """Arrêter l'écoute"""
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def _listen(self) -> None:
+        delay = 1.0
+        while True:
+            pubsub = self.async_redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                delay = 1.0
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        event = json.loads(message["data"])
+                    except (TypeError, ValueError):
+                        continue
+                    await self._dispatch(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["redis_errors"] += 1
+                logger.warning(f"Realtime: écoute Redis interrompue, nouvelle tentative dans {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+
+# Instance partagée du processus
+realtime_bus = RealtimeEventBus()
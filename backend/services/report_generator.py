@@ -6,8 +6,10 @@ Service complet pour exports de données
 import os
 import csv
 import json
+import itertools
+import tempfile
 from io import BytesIO, StringIO
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterable, Iterator, Tuple
 from datetime import datetime, timedelta
 from enum import Enum
 
@@ -27,11 +29,15 @@ try:
     import openpyxl
     from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
     from openpyxl.chart import BarChart, Reference, LineChart
+    from openpyxl.cell import WriteOnlyCell
     OPENPYXL_AVAILABLE = True
 except ImportError:
     OPENPYXL_AVAILABLE = False
     print("⚠️ openpyxl pas installé - Génération Excel désactivée")
 
+# Taille des morceaux envoyés au client en streaming
+STREAM_CHUNK_BYTES = int(os.getenv("REPORT_STREAM_CHUNK_BYTES", "65536"))
+
 
 class ReportType(str, Enum):
     """Types de rapports"""
@@ -41,6 +47,7 @@ class ReportType(str, Enum):
     COMMISSIONS = "commissions"
     PRODUCTS = "products"
     ANALYTICS = "analytics"
+    SALES = "sales"
 
 
 class ReportFormat(str, Enum):
@@ -482,5 +489,177 @@ class ReportGenerator:
         }
 
 
+    # ============================================
+    # EXPORTS EN STREAMING (mémoire constante)
+    # ============================================
+    
+    STREAM_MEDIA_TYPES = {
+        ReportFormat.CSV: ("text/csv; charset=utf-8", "csv"),
+        ReportFormat.JSON: ("application/x-ndjson", "ndjson"),
+        ReportFormat.EXCEL: ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+    }
+    
+    # Colonnes par défaut des exports (clés des lignes de db_queries_real)
+    STREAM_COLUMNS = {
+        ReportType.SALES: [
+            'id', 'product_name', 'tracking_code', 'amount', 'influencer_commission',
+            'platform_commission', 'merchant_revenue', 'status', 'payment_status',
+            'sale_timestamp', 'created_at'
+        ],
+        ReportType.COMMISSIONS: [
+            'id', 'sale_id', 'amount', 'status', 'payment_method', 'paid_at',
+            'sale_amount', 'sale_date', 'created_at'
+        ],
+    }
+    
+    def stream_report(
+        self,
+        report_type: ReportType,
+        format: ReportFormat,
+        rows: Iterable[Dict[str, Any]],
+        fieldnames: Optional[List[str]] = None,
+        user_info: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Export en streaming à partir d'un itérateur de lignes
+        
+        Les lignes sont consommées au fil de l'écriture (lectures paginées
+        en amont): la mémoire ne dépend pas de la taille du rapport. CSV et
+        NDJSON envoient l'en-tête / la première ligne immédiatement.
+        
+        Args:
+            rows: Itérateur de dictionnaires (ex: iter_commissions_for_export)
+            fieldnames: Colonnes (défaut: STREAM_COLUMNS du type, sinon clés de la première ligne)
+        
+        Returns:
+            {"content": Iterator[bytes], "media_type": str, "filename": str}
+        """
+        if format not in self.STREAM_MEDIA_TYPES:
+            raise ValueError(f"Format non supporté en streaming: {format}")
+        if format == ReportFormat.EXCEL and not self.excel_available:
+            raise ValueError("openpyxl n'est pas installé. Utilisez: pip install openpyxl")
+        
+        media_type, extension = self.STREAM_MEDIA_TYPES[format]
+        fieldnames = fieldnames or self.STREAM_COLUMNS.get(report_type)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        
+        if format == ReportFormat.CSV:
+            content = self._stream_csv(rows, fieldnames)
+        elif format == ReportFormat.JSON:
+            content = self._stream_ndjson(rows)
+        else:
+            content = self._stream_excel(report_type, rows, fieldnames, user_info or {})
+        
+        return {
+            "content": content,
+            "media_type": media_type,
+            "filename": f"{report_type.value}_{timestamp}.{extension}"
+        }
+    
+    @staticmethod
+    def _with_fieldnames(
+        rows: Iterable[Dict[str, Any]],
+        fieldnames: Optional[List[str]]
+    ) -> Tuple[List[str], Iterator[Dict[str, Any]]]:
+        """Colonnes explicites ou déduites de la première ligne (sans la perdre)"""
+        rows = iter(rows)
+        if fieldnames is not None:
+            return fieldnames, rows
+        first = next(rows, None)
+        if first is None:
+            return [], rows
+        return list(first.keys()), itertools.chain([first], rows)
+    
+    def _stream_csv(
+        self,
+        rows: Iterable[Dict[str, Any]],
+        fieldnames: Optional[List[str]]
+    ) -> Iterator[bytes]:
+        """CSV écrit par morceaux de STREAM_CHUNK_BYTES"""
+        fieldnames, rows = self._with_fieldnames(rows, fieldnames)
+        buffer = StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction='ignore')
+        writer.writeheader()
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() >= STREAM_CHUNK_BYTES:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+    
+    def _stream_ndjson(self, rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+        """Une ligne JSON par enregistrement (NDJSON)"""
+        chunk: List[str] = []
+        size = 0
+        first = True
+        for row in rows:
+            line = json.dumps(row, ensure_ascii=False, default=str) + "\n"
+            chunk.append(line)
+            size += len(line)
+            # Première ligne envoyée tout de suite, puis par morceaux
+            if first or size >= STREAM_CHUNK_BYTES:
+                yield "".join(chunk).encode('utf-8')
+                chunk, size, first = [], 0, False
+        
+        if chunk:
+            yield "".join(chunk).encode('utf-8')
+    
+    def _stream_excel(
+        self,
+        report_type: ReportType,
+        rows: Iterable[Dict[str, Any]],
+        fieldnames: Optional[List[str]],
+        user_info: Dict[str, Any]
+    ) -> Iterator[bytes]:
+        """
+        Excel en mode write-only d'openpyxl
+        
+        Les lignes sont écrites au fil de l'eau dans un fichier temporaire
+        (mémoire constante); le classeur, une archive zip, n'est envoyé
+        qu'une fois complet.
+        """
+        fieldnames, rows = self._with_fieldnames(rows, fieldnames)
+        
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet(title=report_type.value.title())
+        
+        header_fill = PatternFill(start_color="2563eb", end_color="2563eb", fill_type="solid")
+        header_font = Font(color="FFFFFF", bold=True, size=12)
+        
+        title = WriteOnlyCell(ws, value=f"Rapport {report_type.value.upper()}")
+        title.font = Font(size=16, bold=True, color="2563eb")
+        ws.append([title])
+        ws.append([f"Généré le: {datetime.now().strftime('%d/%m/%Y %H:%M')}"])
+        ws.append([f"Entreprise: {user_info.get('company_name', 'N/A')}"])
+        ws.append([])
+        
+        headers = []
+        for name in fieldnames:
+            cell = WriteOnlyCell(ws, value=name.replace('_', ' ').title())
+            cell.fill = header_fill
+            cell.font = header_font
+            headers.append(cell)
+        ws.append(headers)
+        
+        for row in rows:
+            ws.append([row.get(name) for name in fieldnames])
+        
+        with tempfile.TemporaryFile() as tmp:
+            wb.save(tmp)
+            tmp.seek(0)
+            while True:
+                chunk = tmp.read(STREAM_CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+
+
 # Instance singleton
 report_generator = ReportGenerator()
@@ -0,0 +1,189 @@
+"""
+Séries temporelles des ventes pour les graphiques des dashboards
+
+Une seule requête par fenêtre (RPC groupée côté serveur, ou requête de plage
+paginée en repli) puis agrégation par jour/semaine/mois en une passe,
+quel que soit le nombre de jours demandés (7, 30, 90, 365...).
+"""
+
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from utils.rpc_fallback import OptionalRpc
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ("day", "week", "month")
+PAGE_SIZE = 1000
+
+LABEL_FORMATS = {
+    "day": "%d/%m",
+    "week": "%d/%m",
+    "month": "%m/%Y",
+}
+
+_timeseries_rpc = OptionalRpc("get_sales_timeseries")
+
+
+def bucket_start(day: date, granularity: str) -> date:
+    """Début du bucket contenant `day`"""
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def bucket_range(start: date, end: date, granularity: str) -> List[date]:
+    """Liste ordonnée des débuts de buckets couvrant [start, end]"""
+    buckets = []
+    current = bucket_start(start, granularity)
+    while current <= end:
+        buckets.append(current)
+        if granularity == "month":
+            current = (current.replace(day=28) + timedelta(days=4)).replace(day=1)
+        elif granularity == "week":
+            current += timedelta(days=7)
+        else:
+            current += timedelta(days=1)
+    return buckets
+
+
+def bucket_rows(
+    rows: Iterable[Dict],
+    start: date,
+    end: date,
+    granularity: str = "day",
+    value_fields: Iterable[str] = ("amount",),
+    date_field: str = "created_at",
+) -> List[Dict]:
+    """
+    Agrège des lignes de ventes par bucket en une seule passe
+
+    Returns:
+        [{"bucket": date, "count": 3, "amount": 120.0, ...}] pour chaque bucket
+        de la fenêtre, y compris les buckets vides
+    """
+    value_fields = tuple(value_fields)
+    series = {
+        b: {"bucket": b, "count": 0, **{f: 0.0 for f in value_fields}}
+        for b in bucket_range(start, end, granularity)
+    }
+
+    for row in rows:
+        raw = row.get(date_field)
+        if not raw:
+            continue
+        day = date.fromisoformat(str(raw)[:10])
+        entry = series.get(bucket_start(day, granularity))
+        if entry is None:
+            continue
+        entry["count"] += 1
+        for f in value_fields:
+            entry[f] += float(row.get(f) or 0)
+
+    return list(series.values())
+
+
+def _fetch_grouped(client, start: date, end: date, granularity: str, filters: Dict) -> List[Dict]:
+    """Agrégation côté serveur via la fonction SQL get_sales_timeseries"""
+    result = client.rpc(
+        "get_sales_timeseries",
+        {
+            "p_start": start.isoformat(),
+            "p_end": (end + timedelta(days=1)).isoformat(),
+            "p_granularity": granularity,
+            "p_merchant_id": filters.get("merchant_id"),
+            "p_affiliate_id": filters.get("affiliate_id"),
+        },
+    ).execute()
+
+    grouped = {
+        date.fromisoformat(str(r["bucket"])[:10]): r for r in (result.data or [])
+    }
+    series = []
+    for b in bucket_range(start, end, granularity):
+        r = grouped.get(b, {})
+        series.append(
+            {
+                "bucket": b,
+                "count": int(r.get("sales_count") or 0),
+                "amount": float(r.get("amount_total") or 0),
+                "commission": float(r.get("commission_total") or 0),
+            }
+        )
+    return series
+
+
+def _fetch_rows(client, start: date, end: date, filters: Dict, columns: str) -> Iterable[Dict]:
+    """Une requête de plage sur toute la fenêtre, paginée par PAGE_SIZE lignes"""
+    offset = 0
+    while True:
+        query = (
+            client.table("sales")
+            .select(columns)
+            .gte("created_at", f"{start.isoformat()}T00:00:00")
+            .lt("created_at", f"{(end + timedelta(days=1)).isoformat()}T00:00:00")
+        )
+        for column, value in filters.items():
+            if value is not None:
+                query = query.eq(column, value)
+
+        page = query.order("created_at").range(offset, offset + PAGE_SIZE - 1).execute().data or []
+        yield from page
+
+        if len(page) < PAGE_SIZE:
+            return
+        offset += PAGE_SIZE
+
+
+def get_sales_timeseries(
+    client,
+    days: int = 7,
+    granularity: str = "day",
+    merchant_id: Optional[str] = None,
+    affiliate_id: Optional[str] = None,
+    end: Optional[date] = None,
+) -> List[Dict]:
+    """
+    Série temporelle des ventes sur les `days` derniers jours
+
+    Args:
+        client: Client Supabase
+        days: Taille de la fenêtre (jour courant inclus)
+        granularity: "day", "week" ou "month"
+        merchant_id: Filtrer sur un marchand (optionnel)
+        affiliate_id: Filtrer sur un affilié (optionnel)
+        end: Dernier jour inclus (défaut: aujourd'hui)
+
+    Returns:
+        [{"bucket": date, "label": "01/06", "count": 12, "amount": 3500.0, "commission": 350.0}]
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Granularité non supportée: {granularity}")
+
+    end = end or datetime.now().date()
+    start = end - timedelta(days=max(days, 1) - 1)
+    filters = {"merchant_id": merchant_id, "affiliate_id": affiliate_id}
+
+    series = None
+    if _timeseries_rpc.enabled():
+        try:
+            series = _fetch_grouped(client, start, end, granularity, filters)
+            _timeseries_rpc.succeeded()
+        except Exception as e:
+            # Lecture seule: repli sur la requête de plage pour cet appel
+            _timeseries_rpc.missing(e)
+
+    if series is None:
+        rows = _fetch_rows(client, start, end, filters, "created_at, amount, commission")
+        series = bucket_rows(rows, start, end, granularity, value_fields=("amount", "commission"))
+
+    label_format = LABEL_FORMATS[granularity]
+    for entry in series:
+        entry["label"] = entry["bucket"].strftime(label_format)
+        entry["amount"] = round(entry["amount"], 2)
+        entry["commission"] = round(entry["commission"], 2)
+
+    return series
@@ -0,0 +1,685 @@
+"""
+Embedded product search index (in-process fallback for Elasticsearch)
+
+Used by ElasticsearchService when no cluster is reachable, behind the same
+search_products / get_suggestions / index_product / delete_product calls:
+- Inverted index per field (name^3, description^2, merchant_name, tags)
+  with BM25 scoring, "or" semantics like the multi_match query
+- Text normalized like the moderation matcher (accents, Arabic letter
+  variants, light FR plural/feminine and Arabic article handling)
+- Prefix matching on product names (search-as-you-type) and typo
+  tolerance of one edit (insert, delete, substitute, transpose)
+- Facets: categories, price histogram (100 MAD buckets), rating counts,
+  price stats
+- Incremental updates; JSON snapshot on disk for fast restart
+
+Built from the products table (keyset pages) or loaded from its snapshot.
+"""
+
+import bisect
+import heapq
+import json
+import math
+import os
+import re
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from utils.keyword_matcher import canonical_token, normalize_text
+from utils.logger import logger
+from utils.product_visibility import is_publicly_visible
+
+# Configuration
+SEARCH_EMBEDDED_ENABLED = os.getenv("SEARCH_EMBEDDED_ENABLED", "true").lower() == "true"
+SEARCH_SNAPSHOT_PATH = os.getenv("SEARCH_SNAPSHOT_PATH", "")  # Empty: no snapshot
+SEARCH_INDEX_PAGE_SIZE = int(os.getenv("SEARCH_INDEX_PAGE_SIZE", "1000"))  # Rows per page when building
+
+SNAPSHOT_VERSION = 1
+
+FIELD_BOOSTS = {"name": 3.0, "description": 2.0, "merchant_name": 1.0, "tags": 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+PREFIX_WEIGHT = 0.8  # Name terms starting with a query word
+FUZZY_WEIGHT = 0.5  # Terms one edit away from a query word
+MAX_EXPANSIONS = 50  # Prefix / fuzzy terms per query word
+PRICE_INTERVAL = 100
+RATING_FLOORS = (4, 3, 2, 1)
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def product_document(product: Dict[str, Any]) -> Dict[str, Any]:
+    """Search document for a products row (shared by Elasticsearch and the embedded index)"""
+    merchant = product.get('merchants') or {}
+    if (
+        product.get('deleted_at')
+        or product.get('is_active') is False
+        or product.get('is_available') is False
+        or not is_publicly_visible(product)
+    ):
+        status = 'inactive'
+    else:
+        status = product.get('status') or 'active'
+
+    doc = {
+        'id': str(product['id']),
+        'name': product.get('name') or '',
+        'description': product.get('description') or '',
+        'category': product.get('category') or 'uncategorized',
+        'sub_category': product.get('sub_category'),
+        'price': float(product.get('price') or 0),
+        'original_price': float(product.get('original_price') or 0),
+        'discount_percentage': int(product.get('discount_percentage') or 0),
+        'merchant_id': str(product.get('merchant_id')),
+        'merchant_name': product.get('merchant_name') or merchant.get('company_name') or '',
+        'rating': float(product.get('rating') or 0),
+        'reviews_count': int(product.get('reviews_count') or 0),
+        'sales_count': int(product.get('sales_count') or 0),
+        'status': status,
+        'tags': product.get('tags') or [],
+        'image_url': product.get('image_url') or '',
+        'created_at': product.get('created_at'),
+        'updated_at': product.get('updated_at'),  # Source row time (index watermark)
+        'metadata': product.get('metadata') or {}
+    }
+
+    if product.get('latitude') is not None and product.get('longitude') is not None:
+        doc['location'] = {'lat': product['latitude'], 'lon': product['longitude']}
+
+    return doc
+
+
+def analyze(text: str) -> List[str]:
+    """Index terms of a text (normalized, lightly stemmed)"""
+    return [canonical_token(token) for token in _TOKEN_RE.findall(normalize_text(text or ""))]
+
+
+def _field_text(doc: Dict[str, Any], field: str) -> str:
+    value = doc.get(field)
+    if isinstance(value, (list, tuple)):
+        return " ".join(str(v) for v in value)
+    return value or ""
+
+
+def _deletes(term: str) -> Iterator[str]:
+    return (term[:i] + term[i + 1:] for i in range(len(term)))
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+    """True if a and b differ by at most one insert, delete, substitution or transposition"""
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) == len(b):
+        diff = [i for i in range(len(a)) if a[i] != b[i]]
+        if len(diff) == 1:
+            return True
+        return (
+            len(diff) == 2 and diff[1] == diff[0] + 1
+            and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]
+        )
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i:] == b[i + 1:]
+
+
+def _remove_sorted(items: List[Any], item: Any) -> None:
+    position = bisect.bisect_left(items, item)
+    if position < len(items) and items[position] == item:
+        del items[position]
+
+
+def _haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 12742 * math.asin(math.sqrt(h))
+
+
+class EmbeddedSearchIndex:
+    """In-memory inverted index of products (one per worker)"""
+
+    def __init__(self, snapshot_path: Optional[str] = SEARCH_SNAPSHOT_PATH):
+        self.snapshot_path = snapshot_path
+        self._docs: List[Optional[Dict[str, Any]]] = []  # Internal id -> document
+        self._ids: Dict[str, int] = {}  # Product id -> internal id
+        self._free: List[int] = []  # Slots of deleted documents, reused first
+        self._postings: Dict[str, Dict[str, Dict[int, int]]] = {f: {} for f in FIELD_BOOSTS}
+        self._lengths: Dict[str, List[int]] = {f: [] for f in FIELD_BOOSTS}
+        self._total_length: Dict[str, int] = {f: 0 for f in FIELD_BOOSTS}
+        self._term_docs: Counter = Counter()  # Term -> documents containing it (any field)
+        self._terms: List[str] = []  # Sorted vocabulary (prefix lookups)
+        self._fuzzy: Optional[Dict[str, Set[str]]] = None  # Deletion variant -> terms, built on first use
+        self._names: List[Tuple[str, int]] = []  # Sorted (normalized name, internal id) for suggestions
+        self._active: Set[int] = set()
+        self._by_category: Dict[str, Set[int]] = {}
+        self._by_merchant: Dict[str, Set[int]] = {}
+        # Columns by internal id: filters, sorts and facets without touching documents
+        self._price: List[float] = []
+        self._rating: List[float] = []
+        self._sales: List[int] = []
+        self._created: List[str] = []
+        self._category: List[str] = []
+        self._price_bucket: List[int] = []
+        self._rating_floor: List[int] = []
+        self._max_length: Dict[str, int] = {f: 0 for f in FIELD_BOOSTS}
+        # Bulk loads: new vocabulary / names sorted in once at the end
+        self._pending_terms: Optional[Set[str]] = None
+        self._pending_names: Optional[Set[Tuple[str, int]]] = None
+        self.watermark: Optional[str] = None  # Highest updated_at indexed
+        self.stats = {"indexed": 0, "deleted": 0, "searches": 0}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    # ========================================
+    # INDEXING
+    # ========================================
+
+    def index(self, doc: Dict[str, Any]) -> None:
+        """Add or replace a document (product_document format)"""
+        doc_id = str(doc['id'])
+        internal = self._ids.get(doc_id)
+        if internal is not None:
+            self._remove(internal)  # Updated in place, same slot
+        elif self._free:
+            internal = self._free.pop()
+        else:
+            internal = len(self._docs)
+            self._docs.append(None)
+            self._grow(1)
+        self._docs[internal] = doc
+        self._ids[doc_id] = internal
+
+        seen: Set[str] = set()
+        for field in FIELD_BOOSTS:
+            terms = analyze(_field_text(doc, field))
+            self._lengths[field][internal] = len(terms)
+            self._total_length[field] += len(terms)
+            self._max_length[field] = max(self._max_length[field], len(terms))
+            postings = self._postings[field]
+            for term, tf in Counter(terms).items():
+                postings.setdefault(term, {})[internal] = tf
+                seen.add(term)
+        term_docs = self._term_docs
+        for term in seen:
+            term_docs[term] += 1
+            if term_docs[term] == 1:
+                self._new_term(term)
+
+        name_key = (normalize_text(doc.get('name') or ''), internal)
+        if self._pending_names is not None:
+            self._pending_names.add(name_key)
+        else:
+            bisect.insort(self._names, name_key)
+        self._add_columns(internal, doc)
+
+        updated_at = doc.get('updated_at')
+        if updated_at and (self.watermark is None or str(updated_at) > self.watermark):
+            self.watermark = str(updated_at)
+        self.stats["indexed"] += 1
+
+    def index_many(self, docs: Iterable[Dict[str, Any]]) -> int:
+        """Add or replace several documents, returns how many"""
+        self._pending_terms, self._pending_names = set(), set()
+        count = 0
+        try:
+            for doc in docs:
+                self.index(doc)
+                count += 1
+        finally:
+            # Sorted lists merged once instead of one insort per term / name
+            self._terms.extend(self._pending_terms)
+            self._terms.sort()
+            self._names.extend(self._pending_names)
+            self._names.sort()
+            self._pending_terms = self._pending_names = None
+        return count
+
+    def delete(self, doc_id: str) -> bool:
+        """Remove a document, False if it was not indexed"""
+        internal = self._ids.pop(str(doc_id), None)
+        if internal is None:
+            return False
+        self._remove(internal)
+        self._free.append(internal)
+        self.stats["deleted"] += 1
+        return True
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        internal = self._ids.get(str(doc_id))
+        return self._docs[internal] if internal is not None else None
+
+    def _remove(self, internal: int) -> None:
+        doc = self._docs[internal]
+        self._docs[internal] = None
+
+        seen: Set[str] = set()
+        for field in FIELD_BOOSTS:
+            postings = self._postings[field]
+            for term in set(analyze(_field_text(doc, field))):
+                posting = postings.get(term)
+                if posting is None or posting.pop(internal, None) is None:
+                    continue
+                if not posting:
+                    del postings[term]
+                seen.add(term)
+            self._total_length[field] -= self._lengths[field][internal]
+            self._lengths[field][internal] = 0
+        for term in seen:
+            self._drop_term(term)
+
+        name_key = (normalize_text(doc.get('name') or ''), internal)
+        if self._pending_names is not None and name_key in self._pending_names:
+            self._pending_names.discard(name_key)
+        else:
+            _remove_sorted(self._names, name_key)
+        self._active.discard(internal)
+        self._by_category.get(doc.get('category') or 'uncategorized', set()).discard(internal)
+        self._by_merchant.get(str(doc.get('merchant_id')), set()).discard(internal)
+
+    def _grow(self, count: int) -> None:
+        """Extend the columns by count empty slots"""
+        for column in (self._price, self._rating, self._sales, self._price_bucket, self._rating_floor):
+            column.extend([0] * count)
+        self._created.extend([''] * count)
+        self._category.extend([''] * count)
+        for lengths in self._lengths.values():
+            lengths.extend([0] * (len(self._docs) - len(lengths)))
+
+    def _add_columns(self, internal: int, doc: Dict[str, Any]) -> None:
+        if doc.get('status', 'active') == 'active':
+            self._active.add(internal)
+        category = doc.get('category') or 'uncategorized'
+        self._by_category.setdefault(category, set()).add(internal)
+        self._by_merchant.setdefault(str(doc.get('merchant_id')), set()).add(internal)
+
+        price = doc.get('price') or 0
+        rating = doc.get('rating') or 0
+        self._price[internal] = price
+        self._rating[internal] = rating
+        self._sales[internal] = doc.get('sales_count') or 0
+        self._created[internal] = str(doc.get('created_at') or '')
+        self._category[internal] = category
+        self._price_bucket[internal] = int(math.floor(price / PRICE_INTERVAL) * PRICE_INTERVAL)
+        self._rating_floor[internal] = max(0, min(int(rating), RATING_FLOORS[0]))
+
+    def _new_term(self, term: str) -> None:
+        if self._pending_terms is not None:
+            self._pending_terms.add(term)
+        else:
+            bisect.insort(self._terms, term)
+        if self._fuzzy is not None:
+            self._add_fuzzy(term)
+
+    def _drop_term(self, term: str) -> None:
+        self._term_docs[term] -= 1
+        if self._term_docs[term] > 0:
+            return
+        del self._term_docs[term]
+        if self._pending_terms is not None and term in self._pending_terms:
+            self._pending_terms.discard(term)
+        else:
+            _remove_sorted(self._terms, term)
+        if self._fuzzy is not None:
+            for variant in _deletes(term):
+                variants = self._fuzzy.get(variant)
+                if variants is not None:
+                    variants.discard(term)
+                    if not variants:
+                        del self._fuzzy[variant]
+
+    def _add_fuzzy(self, term: str) -> None:
+        if len(term) >= 3:
+            for variant in _deletes(term):
+                self._fuzzy.setdefault(variant, set()).add(term)
+
+    # ========================================
+    # QUERY EXPANSION
+    # ========================================
+
+    def _prefix_terms(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self._terms, prefix)
+        expansions = []
+        for term in self._terms[start:start + MAX_EXPANSIONS + 1]:
+            if not term.startswith(prefix):
+                break
+            if term != prefix:
+                expansions.append(term)
+        return expansions[:MAX_EXPANSIONS]
+
+    def _fuzzy_terms(self, term: str) -> List[str]:
+        """Vocabulary terms one edit away (words of 3+ letters, like fuzziness AUTO)"""
+        if len(term) < 3:
+            return []
+        if self._fuzzy is None:
+            self._fuzzy = {}
+            for known in self._term_docs:
+                self._add_fuzzy(known)
+
+        candidates = set(self._fuzzy.get(term, ()))
+        for variant in _deletes(term):
+            if variant in self._term_docs:
+                candidates.add(variant)
+            candidates.update(self._fuzzy.get(variant, ()))
+        candidates.discard(term)
+        return sorted(c for c in candidates if _within_one_edit(term, c))[:MAX_EXPANSIONS]
+
+    def _query_terms(self, query: str) -> Dict[str, Dict[str, float]]:
+        """{field: {term: weight}} for a query, with prefix / fuzzy expansions"""
+        weighted: Dict[str, Dict[str, float]] = {f: {} for f in FIELD_BOOSTS}
+
+        def add(fields, term, weight):
+            for field in fields:
+                if weighted[field].get(term, 0) < weight:
+                    weighted[field][term] = weight
+
+        for token in _TOKEN_RE.findall(normalize_text(query)):
+            term = canonical_token(token)
+            add(FIELD_BOOSTS, term, 1.0)
+            if len(token) >= 2:
+                for expansion in self._prefix_terms(token):
+                    add(("name",), expansion, PREFIX_WEIGHT)
+            if term not in self._term_docs:
+                for expansion in self._fuzzy_terms(term):
+                    add(FIELD_BOOSTS, expansion, FUZZY_WEIGHT)
+        return weighted
+
+    def _score(self, query: str) -> Dict[int, float]:
+        """BM25 score of every document matching at least one query term"""
+        total_docs = len(self._ids)
+        scores: Dict[int, float] = {}
+        for field, terms in self._query_terms(query).items():
+            postings = self._postings[field]
+            lengths = self._lengths[field]
+            avg_length = self._total_length[field] / total_docs if total_docs else 0
+            # Length normalization by field length, computed once per query
+            norms = [
+                BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length) if avg_length else BM25_K1
+                for length in range(self._max_length[field] + 1)
+            ]
+            boost = FIELD_BOOSTS[field]
+            for term, weight in terms.items():
+                posting = postings.get(term)
+                if not posting:
+                    continue
+                df = len(posting)
+                factor = boost * weight * math.log(1 + (total_docs - df + 0.5) / (df + 0.5)) * (BM25_K1 + 1)
+                get = scores.get
+                for internal, tf in posting.items():
+                    scores[internal] = get(internal, 0.0) + factor * tf / (tf + norms[lengths[internal]])
+        return scores
+
+    # ========================================
+    # SEARCH
+    # ========================================
+
+    def search(
+        self,
+        query: str = "",
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        min_rating: Optional[float] = None,
+        merchant_id: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        sort_by: str = "relevance",
+        page: int = 1,
+        page_size: int = 20,
+        location: Optional[Dict[str, float]] = None,
+        radius_km: float = 50.0
+    ) -> Dict[str, Any]:
+        """
+        Filtered, scored and paginated search
+
+        Returns:
+            {'results': [...], 'total': int, 'facets': {...}} with the same
+            result and facet shapes as the Elasticsearch path
+        """
+        self.stats["searches"] += 1
+
+        # Candidate set from the cheapest exact filters
+        candidates = self._active
+        for restriction in (
+            self._by_category.get(category, set()) if category else None,
+            self._by_merchant.get(str(merchant_id), set()) if merchant_id else None,
+        ):
+            if restriction is not None:
+                candidates = candidates & restriction
+
+        scores: Optional[Dict[int, float]] = None
+        if query and query.strip():
+            scores = self._score(query)
+            hits = sorted(candidates.intersection(scores))
+        else:
+            hits = sorted(candidates)
+
+        # Range filters on columns, then the rarer document-level filters
+        price, rating = self._price, self._rating
+        if min_price is not None:
+            hits = [i for i in hits if price[i] >= min_price]
+        if max_price is not None:
+            hits = [i for i in hits if price[i] <= max_price]
+        if min_rating is not None:
+            hits = [i for i in hits if rating[i] >= min_rating]
+        if tags:
+            wanted_tags = set(tags)
+            hits = [i for i in hits if wanted_tags.intersection(self._docs[i].get('tags') or ())]
+        if location is not None:
+            hits = [
+                i for i in hits
+                if self._docs[i].get('location') and _haversine_km(
+                    location['lat'], location['lon'],
+                    self._docs[i]['location']['lat'], self._docs[i]['location']['lon']
+                ) <= radius_km
+            ]
+
+        page = max(page, 1)
+        top = self._top(hits, page * page_size, sort_by, scores)
+        results = [self._docs[i] for i in top[(page - 1) * page_size:]]
+
+        return {
+            'results': results,
+            'total': len(hits),
+            'facets': self._facets(hits)
+        }
+
+    def _top(self, hits: List[int], count: int, sort_by: str, scores: Optional[Dict[int, float]]) -> List[int]:
+        """First count hits in sort order (ties keep index order, hits are sorted by internal id)"""
+        if sort_by == "price_asc":
+            return heapq.nsmallest(count, hits, key=self._price.__getitem__)
+        columns = {
+            "price_desc": self._price,
+            "rating": self._rating,
+            "popular": self._sales,
+            "newest": self._created,  # ISO dates, undated ('') last
+        }
+        if sort_by in columns:
+            return heapq.nlargest(count, hits, key=columns[sort_by].__getitem__)
+        if scores is not None:
+            return heapq.nlargest(count, hits, key=scores.__getitem__)
+        return hits[:count]
+
+    def _facets(self, hits: List[int]) -> Dict[str, Any]:
+        categories = Counter(map(self._category.__getitem__, hits))
+        price_buckets = Counter(map(self._price_bucket.__getitem__, hits))
+        rating_floors = Counter(map(self._rating_floor.__getitem__, hits))
+        prices = list(map(self._price.__getitem__, hits))
+
+        # Histogram like Elasticsearch: empty buckets between the first and last one
+        price_ranges = []
+        if price_buckets:
+            price_ranges = [
+                {'min': key, 'max': key + PRICE_INTERVAL, 'count': price_buckets.get(key, 0)}
+                for key in range(min(price_buckets), max(price_buckets) + PRICE_INTERVAL, PRICE_INTERVAL)
+            ]
+
+        return {
+            'categories': [
+                {'key': key, 'count': count}
+                for key, count in sorted(categories.items(), key=lambda item: (-item[1], item[0]))[:20]
+            ],
+            'price_ranges': price_ranges,
+            'ratings': [
+                {'min': floor, 'count': sum(rating_floors[f] for f in range(floor, RATING_FLOORS[0] + 1))}
+                for floor in RATING_FLOORS
+            ],
+            'avg_rating': sum(map(self._rating.__getitem__, hits)) / len(hits) if hits else None,
+            'price_stats': {
+                'count': len(prices),
+                'min': min(prices) if prices else None,
+                'max': max(prices) if prices else None,
+                'avg': sum(prices) / len(prices) if prices else None,
+                'sum': sum(prices)
+            }
+        }
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[str]:
+        """Active product names starting with prefix (like the completion suggester)"""
+        normalized = normalize_text(prefix or "").strip()
+        if not normalized:
+            return []
+
+        suggestions: List[str] = []
+        seen: Set[str] = set()
+        position = bisect.bisect_left(self._names, (normalized, -1))
+        while position < len(self._names) and len(suggestions) < limit:
+            name, internal = self._names[position]
+            position += 1
+            if not name.startswith(normalized):
+                break
+            if internal in self._active and name not in seen:
+                seen.add(name)
+                suggestions.append(self._docs[internal]['name'])
+        return suggestions
+
+    # ========================================
+    # BUILD / SNAPSHOT
+    # ========================================
+
+    @classmethod
+    def from_database(
+        cls,
+        client=None,
+        page_size: int = SEARCH_INDEX_PAGE_SIZE,
+        snapshot_path: Optional[str] = SEARCH_SNAPSHOT_PATH
+    ) -> "EmbeddedSearchIndex":
+        """Build from the products table, one keyset page in memory at a time (blocking)"""
+        index = cls(snapshot_path=snapshot_path)
+        started = time.perf_counter()
+        index.index_many(product_document(row) for row in iter_product_rows(client, page_size))
+        logger.info(f"Embedded search index built: {len(index)} products in {time.perf_counter() - started:.1f}s")
+        return index
+
+    def save_snapshot(self, path: Optional[str] = None) -> bool:
+        """Write the index to disk (atomic replace), False without a path"""
+        path = path or self.snapshot_path
+        if not path:
+            return False
+
+        live_ids = [i for i, doc in enumerate(self._docs) if doc is not None]
+        positions = {internal: position for position, internal in enumerate(live_ids)}
+
+        # Compacted ids: postings as parallel lists (JSON object keys are strings)
+        postings = {
+            field: {
+                term: [[positions[i] for i in posting], list(posting.values())]
+                for term, posting in self._postings[field].items()
+            }
+            for field in FIELD_BOOSTS
+        }
+        lengths = {
+            field: [self._lengths[field][i] for i in live_ids]
+            for field in FIELD_BOOSTS
+        }
+        payload = {
+            'version': SNAPSHOT_VERSION,
+            'saved_at': datetime.utcnow().isoformat(),
+            'watermark': self.watermark,
+            'docs': [self._docs[i] for i in live_ids],
+            'postings': postings,
+            'lengths': lengths
+        }
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str))
+        os.replace(temporary, path)
+        logger.info(f"Embedded search index snapshot saved: {len(live_ids)} products -> {path}")
+        return True
+
+    @classmethod
+    def load_snapshot(cls, path: Optional[str] = SEARCH_SNAPSHOT_PATH) -> Optional["EmbeddedSearchIndex"]:
+        """Index restored from a snapshot, None if missing, unreadable or from another version"""
+        if not path or not os.path.exists(path):
+            return None
+        started = time.perf_counter()
+        try:
+            with open(path, encoding="utf-8") as f:
+                payload = json.load(f)
+            if payload.get('version') != SNAPSHOT_VERSION:
+                logger.warning(f"Search snapshot {path} has another format version, rebuilding")
+                return None
+
+            index = cls(snapshot_path=path)
+            index._docs = payload['docs']
+            index._ids = {str(doc['id']): position for position, doc in enumerate(index._docs)}
+            for field in FIELD_BOOSTS:
+                index._postings[field] = {
+                    term: dict(zip(ids, tfs)) for term, (ids, tfs) in payload['postings'][field].items()
+                }
+                index._lengths[field] = payload['lengths'][field]
+                index._total_length[field] = sum(index._lengths[field])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Search snapshot {path} unreadable, rebuilding: {e}")
+            return None
+
+        index._rebuild_derived()
+        index.watermark = payload.get('watermark')
+        logger.info(f"Embedded search index loaded: {len(index)} products in {time.perf_counter() - started:.2f}s")
+        return index
+
+    def _rebuild_derived(self) -> None:
+        """Vocabulary, suggestion list and filter sets from documents and postings"""
+        term_docs: Dict[str, Set[int]] = {}
+        for field in FIELD_BOOSTS:
+            for term, posting in self._postings[field].items():
+                term_docs.setdefault(term, set()).update(posting)
+        self._term_docs = Counter({term: len(docs) for term, docs in term_docs.items()})
+        self._terms = sorted(self._term_docs)
+        self._names = sorted((normalize_text(doc.get('name') or ''), i) for i, doc in enumerate(self._docs))
+        self._grow(len(self._docs))
+        for internal, doc in enumerate(self._docs):
+            self._add_columns(internal, doc)
+        for field in FIELD_BOOSTS:
+            self._max_length[field] = max(self._lengths[field], default=0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Size and counters of the index"""
+        return {
+            **self.stats,
+            "documents": len(self._ids),
+            "terms": len(self._terms),
+            "watermark": self.watermark
+        }
+
+
+def iter_product_rows(client=None, page_size: int = SEARCH_INDEX_PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+    """All products with their merchant name, by keyset pages"""
+    from utils.keyset_pagination import iter_keyset
+
+    if client is None:
+        from supabase_client import get_supabase_client
+        client = get_supabase_client()
+
+    def query():
+        return client.table("products").select("*, merchants(company_name)")
+
+    return iter_keyset(query, "created_at", page_size=page_size, desc=False)
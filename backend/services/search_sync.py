@@ -0,0 +1,624 @@
+"""
+Search index sync: incremental change data capture from Supabase
+
+Keeps the search index (Elasticsearch aliases, or the embedded index when no
+cluster is reachable) in step with products, merchants and influencers:
+- Incremental passes read the rows changed since each entity's updated_at
+  watermark, in keyset pages (one page in memory at a time), re-reading a
+  short overlap window for transactions that commit late
+- Hard deletes come from the search_deletions tombstones (migration 017)
+- Documents are bulk-indexed in bounded chunks off the event loop, retried
+  with exponential backoff
+- Full reindex streams every row into a new versioned index through parallel
+  bulk writers fed by a bounded queue (constant memory), catches up the
+  changes made meanwhile, then swaps the alias: search keeps answering from
+  the previous index until the swap
+- Lag metrics per entity (get_stats)
+
+With Elasticsearch, one worker at a time holds the sync lease and the
+watermarks live in search_sync_state. The embedded index is per worker:
+each worker syncs its own products index from its own watermark.
+
+Usage:
+    search_sync.start()                          # app startup
+    await search_sync.full_reindex("products")
+    await search_sync.stop()                     # app shutdown
+"""
+
+import asyncio
+import os
+import socket
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional
+
+from services.search_index import SEARCH_SNAPSHOT_PATH, EmbeddedSearchIndex, product_document
+from utils.async_db import async_db
+from utils.keyset_pagination import paginate_keyset
+from utils.logger import logger
+from utils.rpc_fallback import OptionalRpc
+
+# Configuration
+SEARCH_SYNC_ENABLED = os.getenv("SEARCH_SYNC_ENABLED", "false").lower() == "true"
+SEARCH_SYNC_INTERVAL = float(os.getenv("SEARCH_SYNC_INTERVAL", "30"))  # Seconds between incremental passes
+SEARCH_SYNC_PAGE_SIZE = int(os.getenv("SEARCH_SYNC_PAGE_SIZE", "1000"))  # Rows read per keyset page
+SEARCH_SYNC_CHUNK_SIZE = int(os.getenv("SEARCH_SYNC_CHUNK_SIZE", "500"))  # Documents per bulk request
+SEARCH_SYNC_WORKERS = int(os.getenv("SEARCH_SYNC_WORKERS", "4"))  # Parallel bulk writers (full reindex)
+SEARCH_SYNC_MAX_RETRIES = int(os.getenv("SEARCH_SYNC_MAX_RETRIES", "5"))
+SEARCH_SYNC_RETRY_BACKOFF = float(os.getenv("SEARCH_SYNC_RETRY_BACKOFF", "1.0"))  # Seconds, doubled per attempt
+SEARCH_SYNC_OVERLAP = float(os.getenv("SEARCH_SYNC_OVERLAP", "10"))  # Seconds re-read behind the watermark
+SEARCH_DELETIONS_RETENTION_DAYS = int(os.getenv("SEARCH_DELETIONS_RETENTION_DAYS", "7"))
+
+DELETIONS = "deletions"
+EMBEDDED_CHUNK_SIZE = 100  # Documents applied to the embedded index between event loop yields
+
+
+def merchant_document(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Search document for a merchants row"""
+    doc = {
+        'id': str(row['id']),
+        'name': row.get('company_name') or '',
+        'category': row.get('category'),
+        'rating': float(row.get('rating') or 0),
+        'products_count': int(row.get('products_count') or 0)
+    }
+    if row.get('latitude') is not None and row.get('longitude') is not None:
+        doc['location'] = {'lat': row['latitude'], 'lon': row['longitude']}
+    return doc
+
+
+def influencer_document(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Search document for an influencers row"""
+    return {
+        'id': str(row['id']),
+        'name': row.get('full_name') or row.get('username') or '',
+        'niche': row.get('niche') or row.get('category'),
+        'followers': int(row.get('followers') or row.get('audience_size') or 0),
+        'engagement_rate': float(row.get('engagement_rate') or 0)
+    }
+
+
+# Synced tables: select (with joins) and row -> document transform
+ENTITIES: Dict[str, Dict[str, Any]] = {
+    'products': {'select': '*, merchants(company_name)', 'document': product_document},
+    'merchants': {'select': '*', 'document': merchant_document},
+    'influencers': {'select': '*', 'document': influencer_document},
+}
+
+
+def chunked(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Lists of at most size items, consuming the iterable lazily"""
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, max(1, size)))
+        if not chunk:
+            return
+        yield chunk
+
+
+async def retry_async(
+    call: Callable[..., Awaitable[Any]],
+    *args,
+    what: str,
+    retries: int = SEARCH_SYNC_MAX_RETRIES,
+    backoff: float = SEARCH_SYNC_RETRY_BACKOFF,
+    on_retry: Optional[Callable[[], None]] = None
+) -> Any:
+    """Await call(*args), retrying failures with exponential backoff"""
+    for attempt in range(retries + 1):
+        try:
+            return await call(*args)
+        except Exception as e:
+            if attempt >= retries:
+                raise
+            delay = backoff * 2 ** attempt
+            logger.warning(f"Search sync: {what} failed ({e}), retry {attempt + 1}/{retries} in {delay:.1f}s")
+            if on_retry is not None:
+                on_retry()
+            await asyncio.sleep(delay)
+
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    """Naive UTC datetime from a PostgREST timestamp"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _rewind(watermark: Optional[str], seconds: float) -> Optional[str]:
+    parsed = _parse_timestamp(watermark)
+    return (parsed - timedelta(seconds=seconds)).isoformat() if parsed else None
+
+
+def _is_missing_delete(error: Dict[str, Any]) -> bool:
+    """Bulk error for a delete of a document already absent from the index"""
+    return error.get('delete', {}).get('status') == 404
+
+
+class SearchSync:
+    """Incremental and full synchronization of the search index"""
+
+    def __init__(
+        self,
+        service=None,
+        client=None,
+        page_size: int = SEARCH_SYNC_PAGE_SIZE,
+        chunk_size: int = SEARCH_SYNC_CHUNK_SIZE,
+        workers: int = SEARCH_SYNC_WORKERS,
+        max_retries: int = SEARCH_SYNC_MAX_RETRIES,
+        retry_backoff: float = SEARCH_SYNC_RETRY_BACKOFF,
+        overlap: float = SEARCH_SYNC_OVERLAP,
+        interval: float = SEARCH_SYNC_INTERVAL
+    ):
+        """
+        Args:
+            service: ElasticsearchService (default: search_service)
+            client: Supabase client (default: get_supabase_client())
+            page_size: Rows per keyset page
+            chunk_size: Documents per bulk request
+            workers: Parallel bulk writers during a full reindex
+            overlap: Seconds re-read behind each watermark
+            interval: Seconds between incremental passes (start())
+        """
+        self._service = service
+        self._client = client
+        self.page_size = max(1, page_size)
+        self.chunk_size = max(1, chunk_size)
+        self.workers = max(1, workers)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.overlap = overlap
+        self.interval = interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+        self.watermarks: Dict[str, Optional[str]] = {}
+        self._state_loaded = False
+        self._lease_rpc = OptionalRpc("claim_search_sync_lease")
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._runner: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+
+        self.stats = {"passes": 0, "pass_errors": 0, "retries": 0, "reindexes": 0}
+        self.metrics: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def service(self):
+        if self._service is None:
+            from services.elasticsearch_search import search_service
+            self._service = search_service
+        return self._service
+
+    @property
+    def client(self):
+        if self._client is None:
+            from supabase_client import get_supabase_client
+            self._client = get_supabase_client()
+        return self._client
+
+    # ========================================
+    # INCREMENTAL SYNC
+    # ========================================
+
+    async def sync_once(self) -> Dict[str, int]:
+        """One incremental pass over every entity and the tombstones, returns documents applied"""
+        service = self.service
+        if not service.available and service.local_index is None:
+            return {}
+        if service.available:
+            if not await self._claim_lease():
+                return {}
+            await self._load_state()
+
+        else:
+            # Embedded index restored from a snapshot: resume from its watermark
+            for entity in ('products', DELETIONS):
+                self.watermarks.setdefault(entity, service.local_index.watermark)
+
+        started = time.time()
+        applied = {}
+        for entity in self._entities():
+            async with self._lock(entity):
+                applied[entity] = await self._sync_entity(entity)
+        applied[DELETIONS] = await self._sync_deletions()
+
+        self.stats["passes"] += 1
+        for entity in applied:
+            self._metrics(entity)["last_pass_started_at"] = started
+        await self._purge_deletions()
+        return applied
+
+    def _entities(self) -> List[str]:
+        # The embedded index only holds products
+        return list(ENTITIES) if self.service.available else ['products']
+
+    def _lock(self, entity: str) -> asyncio.Lock:
+        if entity not in self._locks:
+            self._locks[entity] = asyncio.Lock()
+        return self._locks[entity]
+
+    async def _sync_entity(self, entity: str, target: Any = None, since: Optional[str] = None) -> int:
+        """Apply the rows changed since the watermark (or since) to target (default: live index)"""
+        previous = self.watermarks.get(entity)
+        since = since if since is not None else _rewind(previous, self.overlap)
+        document = ENTITIES[entity]['document']
+
+        count, newest, oldest_change = 0, previous, None
+        async for rows in self._pages(entity, ENTITIES[entity]['select'], 'updated_at', since):
+            await self._write(entity, [document(row) for row in rows], target=target)
+            count += len(rows)
+            for row in rows:
+                updated_at = row.get('updated_at')
+                if updated_at and (newest is None or str(updated_at) > newest):
+                    newest = str(updated_at)
+                if updated_at and oldest_change is None and (previous is None or str(updated_at) > previous):
+                    oldest_change = updated_at
+
+        await self._advance(entity, newest, count, oldest_change, target)
+        return count
+
+    async def _sync_deletions(self) -> int:
+        """Remove the rows deleted since the tombstone watermark"""
+        entities = set(self._entities())
+        previous = self.watermarks.get(DELETIONS)
+        count, newest, oldest_change = 0, previous, None
+
+        async for rows in self._pages(DELETIONS, 'id, entity, entity_id, deleted_at', 'deleted_at',
+                                      _rewind(previous, self.overlap), table='search_deletions'):
+            by_entity: Dict[str, List[str]] = {}
+            for row in rows:
+                if row['entity'] in entities:
+                    by_entity.setdefault(row['entity'], []).append(str(row['entity_id']))
+                deleted_at = str(row['deleted_at'])
+                if newest is None or deleted_at > newest:
+                    newest = deleted_at
+                if oldest_change is None and (previous is None or deleted_at > previous):
+                    oldest_change = deleted_at
+            for entity, ids in by_entity.items():
+                async with self._lock(entity):
+                    await self._write(entity, [], deletes=ids)
+                count += len(ids)
+
+        await self._advance(DELETIONS, newest, count, oldest_change)
+        return count
+
+    async def _replay_deletions(self, entity: str, target: Any, since: Optional[str]) -> int:
+        """Apply the entity tombstones recorded since `since` to a reindex target"""
+        count = 0
+        async for rows in self._pages(DELETIONS, 'id, entity, entity_id, deleted_at', 'deleted_at',
+                                      since, table='search_deletions'):
+            ids = [str(row['entity_id']) for row in rows if row['entity'] == entity]
+            if ids:
+                await self._write(entity, [], deletes=ids, target=target)
+                count += len(ids)
+        return count
+
+    async def _advance(
+        self,
+        entity: str,
+        newest: Optional[str],
+        count: int,
+        oldest_change: Any,
+        target: Any = None
+    ) -> None:
+        """Move the watermark and record lag metrics (live index only)"""
+        if target is not None:
+            return
+        metrics = self._metrics(entity)
+        metrics["documents"] += count
+        metrics["last_pass_documents"] = count
+        metrics["last_success_at"] = time.time()
+        # Propagation delay of the oldest change applied by this pass
+        changed_at = _parse_timestamp(oldest_change)
+        metrics["lag_seconds"] = round((datetime.utcnow() - changed_at).total_seconds(), 3) if changed_at else 0.0
+
+        if newest is None or newest == self.watermarks.get(entity):
+            return
+        self.watermarks[entity] = metrics["watermark"] = newest
+        if self.service.available:
+            await self._save_state(entity)
+
+    # ========================================
+    # READ / WRITE
+    # ========================================
+
+    async def _pages(
+        self,
+        entity: str,
+        select: str,
+        sort_column: str,
+        since: Optional[str],
+        table: Optional[str] = None
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Rows in (sort_column, id) order from since, one keyset page at a time"""
+        table = table or entity
+        cursor = None
+        while True:
+            def read(cursor=cursor):
+                query = self.client.table(table).select(select)
+                if since is not None:
+                    query = query.gte(sort_column, since)
+                return paginate_keyset(query, sort_column, self.page_size, cursor=cursor, desc=False)
+
+            page = await retry_async(
+                async_db.run, read, what=f"read {table}", retries=self.max_retries,
+                backoff=self.retry_backoff, on_retry=self._count_retry
+            )
+            if page["items"]:
+                yield page["items"]
+            if not page["has_more"]:
+                return
+            cursor = page["next_cursor"]
+
+    async def _write(self, entity: str, docs: List[Dict[str, Any]], deletes: Iterable[str] = (), target: Any = None):
+        """
+        Index docs and delete ids in bounded chunks
+
+        target: Elasticsearch index name (default: the entity alias), or an
+        EmbeddedSearchIndex (default: the live embedded index)
+        """
+        service = self.service
+        metrics = self._metrics(entity)
+
+        if not service.available:
+            index = target if target is not None else service.local_index
+            for chunk in chunked(docs, EMBEDDED_CHUNK_SIZE):
+                index.index_many(chunk)
+                await asyncio.sleep(0)
+            for doc_id in deletes:
+                index.delete(doc_id)
+            return
+
+        index_name = target or service.indexes[entity]
+        actions = [{'_index': index_name, '_id': doc['id'], '_source': doc} for doc in docs]
+        actions += [{'_op_type': 'delete', '_index': index_name, '_id': doc_id} for doc_id in deletes]
+        for chunk in chunked(actions, self.chunk_size):
+            _, errors = await retry_async(
+                service.bulk, chunk, what=f"bulk {entity}", retries=self.max_retries,
+                backoff=self.retry_backoff, on_retry=self._count_retry
+            )
+            errors = [error for error in errors if not _is_missing_delete(error)]
+            if errors:
+                metrics["failed"] += len(errors)
+                logger.warning(f"Search sync: {len(errors)} {entity} documents rejected, first: {errors[0]}")
+
+    def _count_retry(self) -> None:
+        self.stats["retries"] += 1
+
+    # ========================================
+    # FULL REINDEX
+    # ========================================
+
+    async def full_reindex(self, entity: str = 'products') -> Dict[str, Any]:
+        """
+        Rebuild an entity into a new index, then swap it in
+
+        Elasticsearch: versioned index loaded by SEARCH_SYNC_WORKERS parallel
+        bulk writers, alias swapped atomically. Embedded: new index built in
+        a worker thread, then replaces the live one. Either way the changes
+        made during the load are caught up before the swap.
+        """
+        service = self.service
+        if entity not in ENTITIES or (not service.available and entity != 'products'):
+            raise ValueError(f"Entity not synced to this search backend: {entity}")
+
+        started = time.monotonic()
+        # Everything changed after this point is re-read by the catch-up
+        catch_up_from = _rewind(self.watermarks.get(entity) or datetime.utcnow().isoformat(), self.overlap)
+
+        if service.available:
+            target = await service.create_reindex_target(entity)
+            try:
+                count = await self._load(entity, target)
+            except BaseException:
+                await asyncio.to_thread(service.es.indices.delete, index=target, ignore_unavailable=True)
+                raise
+        else:
+            snapshot_path = service.local_index.snapshot_path if service.local_index else SEARCH_SNAPSHOT_PATH
+            target = await asyncio.to_thread(
+                EmbeddedSearchIndex.from_database, self.client, self.page_size, snapshot_path
+            )
+            count = len(target)
+            await asyncio.to_thread(target.save_snapshot)
+
+        async with self._lock(entity):
+            caught_up = await self._sync_entity(entity, target=target, since=catch_up_from)
+            # Rows the loader read before they were deleted: their tombstones
+            # only reached the live index
+            deleted = await self._replay_deletions(entity, target, catch_up_from)
+            if service.available:
+                await service.swap_alias(entity, target)
+            else:
+                target.watermark = max(filter(None, (target.watermark, self.watermarks.get(entity))), default=None)
+                service.local_index = target
+
+        seconds = time.monotonic() - started
+        self.stats["reindexes"] += 1
+        self._metrics(entity)["last_reindex"] = {
+            "index": target if isinstance(target, str) else "embedded",
+            "documents": count,
+            "caught_up": caught_up,
+            "deleted": deleted,
+            "seconds": round(seconds, 1),
+            "documents_per_s": round(count / seconds, 1) if seconds else None,
+            "finished_at": time.time()
+        }
+        logger.info(f"✅ Reindexed {count} {entity} in {seconds:.1f}s ({caught_up} changes caught up)")
+        return self._metrics(entity)["last_reindex"]
+
+    async def _load(self, entity: str, index_name: str) -> int:
+        """Stream every row into index_name: one reader, bounded queue, parallel bulk writers"""
+        document = ENTITIES[entity]['document']
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 2)
+        failures: List[BaseException] = []
+
+        async def writer():
+            while True:
+                docs = await queue.get()
+                try:
+                    if docs is None:
+                        return
+                    if not failures:
+                        await self._write(entity, docs, target=index_name)
+                except Exception as e:
+                    failures.append(e)  # Keep draining: the reader must never block on a full queue
+                finally:
+                    queue.task_done()
+
+        writers = [asyncio.create_task(writer()) for _ in range(self.workers)]
+        count = 0
+        try:
+            async for rows in self._pages(entity, ENTITIES[entity]['select'], 'updated_at', None):
+                if failures:
+                    break
+                for chunk in chunked(rows, self.chunk_size):
+                    await queue.put([document(row) for row in chunk])
+                count += len(rows)
+            for _ in writers:
+                await queue.put(None)
+            await asyncio.gather(*writers)
+        finally:
+            for task in writers:
+                task.cancel()
+
+        if failures:
+            raise failures[0]
+        return count
+
+    # ========================================
+    # STATE / LEASE (ELASTICSEARCH)
+    # ========================================
+
+    async def _claim_lease(self) -> bool:
+        """Only the lease holder syncs the shared cluster (RPC claim_search_sync_lease)"""
+        if not self._lease_rpc.enabled():
+            return True
+        try:
+            response = await async_db.run(
+                lambda: self.client.rpc('claim_search_sync_lease', {
+                    'p_owner': self.owner,
+                    'p_lease_seconds': int(max(self.interval, 1) * 3)
+                }).execute()
+            )
+        except Exception as e:
+            # Migration 017 not applied: a single sync writer is not enforced.
+            # Any other error: skip this pass, the lease is claimed again next time.
+            return self._lease_rpc.missing(e)
+        self._lease_rpc.succeeded()
+        return bool(response.data)
+
+    async def _load_state(self) -> None:
+        if self._state_loaded:
+            return
+        try:
+            response = await async_db.run(
+                lambda: self.client.table('search_sync_state').select('entity, watermark').execute()
+            )
+            for row in response.data or []:
+                if row['entity'] in ENTITIES or row['entity'] == DELETIONS:
+                    self.watermarks.setdefault(row['entity'], row.get('watermark'))
+        except Exception as e:
+            logger.warning(f"search_sync_state unavailable, watermarks kept in memory: {e}")
+        self._state_loaded = True
+
+    async def _save_state(self, entity: str) -> None:
+        metrics = self._metrics(entity)
+        row = {
+            'entity': entity,
+            'watermark': self.watermarks.get(entity),
+            'index_name': self.service.indexes.get(entity),
+            'lag_seconds': metrics["lag_seconds"],
+            'documents_synced': metrics["documents"],
+            'updated_at': datetime.utcnow().isoformat()
+        }
+        try:
+            await async_db.run(lambda: self.client.table('search_sync_state').upsert(row).execute())
+        except Exception as e:
+            logger.warning(f"search_sync_state not saved for {entity}: {e}")
+
+    async def _purge_deletions(self) -> None:
+        """Drop tombstones older than the retention, at most once an hour"""
+        if time.time() - self._last_purge < 3600:
+            return
+        self._last_purge = time.time()
+        before = (datetime.utcnow() - timedelta(days=SEARCH_DELETIONS_RETENTION_DAYS)).isoformat()
+        try:
+            await async_db.run(lambda: self.client.rpc('purge_search_deletions', {'p_before': before}).execute())
+        except Exception as e:
+            logger.warning(f"RPC purge_search_deletions unavailable: {e}")
+
+    # ========================================
+    # LIFECYCLE / METRICS
+    # ========================================
+
+    async def _run(self) -> None:
+        service = self.service
+        if not service.available and service.local_index is not None:
+            # Tombstones older than the retention are gone: rebuild instead of catching up
+            watermark = _parse_timestamp(service.local_index.watermark)
+            if watermark is None or datetime.utcnow() - watermark > timedelta(days=SEARCH_DELETIONS_RETENTION_DAYS):
+                try:
+                    await self.full_reindex('products')
+                except Exception as e:
+                    logger.error(f"Search reindex failed: {e}")
+        while True:
+            try:
+                await self.sync_once()
+            except Exception as e:
+                self.stats["pass_errors"] += 1
+                logger.error(f"Search sync pass failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """Start the periodic incremental sync (from the asyncio loop)"""
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the periodic sync"""
+        if self._runner:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+
+    def _metrics(self, entity: str) -> Dict[str, Any]:
+        if entity not in self.metrics:
+            self.metrics[entity] = {
+                "watermark": self.watermarks.get(entity),
+                "documents": 0,
+                "failed": 0,
+                "last_pass_documents": 0,
+                "lag_seconds": None,
+                "last_pass_started_at": None,
+                "last_success_at": None,
+                "last_reindex": None
+            }
+        return self.metrics[entity]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Counters and per-entity lag
+
+        lag_seconds: delay between the oldest change applied by the last pass
+        and its indexing. staleness_seconds: time since the start of the last
+        successful pass (upper bound on how old an unindexed change can be).
+        """
+        now = time.time()
+        entities = {}
+        for entity, metrics in self.metrics.items():
+            started = metrics["last_pass_started_at"]
+            entities[entity] = {
+                **metrics,
+                "staleness_seconds": round(now - started, 3) if started else None
+            }
+        return {**self.stats, "entities": entities}
+
+
+# Global instance
+search_sync = SearchSync()
@@ -0,0 +1,65 @@
+"""
+Service des compteurs matérialisés du dashboard
+Lecture O(1) des totaux plateforme / marchand / influenceur
+
+Les lignes de stats_rollups sont maintenues par triggers SQL
+(migrations/008_stats_rollups.sql) et réconciliées périodiquement.
+"""
+
+import logging
+from typing import Dict, Optional
+
+from supabase import Client
+
+logger = logging.getLogger(__name__)
+
+PLATFORM_SCOPE_ID = "00000000-0000-0000-0000-000000000000"
+
+
+class StatsRollupService:
+    """Accès aux totaux agrégés du dashboard"""
+
+    def __init__(self, supabase: Client):
+        self.supabase = supabase
+
+    def _get(self, scope: str, scope_id: str) -> Optional[Dict]:
+        """Ligne de rollup, ou None si absente (migration non appliquée)"""
+        try:
+            result = (
+                self.supabase.table("stats_rollups")
+                .select("*")
+                .eq("scope", scope)
+                .eq("scope_id", scope_id)
+                .limit(1)
+                .execute()
+            )
+            return result.data[0] if result.data else None
+        except Exception as e:
+            logger.warning(f"Rollup {scope}/{scope_id} indisponible: {e}")
+            return None
+
+    def get_platform_totals(self) -> Optional[Dict]:
+        """Totaux plateforme (utilisateurs, produits, CA des ventes complétées)"""
+        return self._get("platform", PLATFORM_SCOPE_ID)
+
+    def get_merchant_totals(self, merchant_id: str) -> Optional[Dict]:
+        """Totaux d'un marchand (produits, CA des ventes complétées)"""
+        return self._get("merchant", merchant_id)
+
+    def get_influencer_totals(self, influencer_id: str) -> Optional[Dict]:
+        """Totaux d'un influenceur (ventes complétées)"""
+        return self._get("influencer", influencer_id)
+
+    def reconcile(self) -> Dict:
+        """
+        Recalcule tous les rollups depuis les tables sources
+
+        Returns:
+            {"success": True, "rows": 1234}
+        """
+        try:
+            result = self.supabase.rpc("reconcile_stats_rollups", {}).execute()
+            return {"success": True, "rows": result.data}
+        except Exception as e:
+            logger.error(f"Erreur réconciliation stats_rollups: {e}")
+            return {"success": False, "error": str(e)}
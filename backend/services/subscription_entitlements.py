@@ -0,0 +1,264 @@
+"""
+Droits d'abonnement en cache: limites du plan et compteurs d'usage
+
+Les vérifications SubscriptionLimits.check_*_limit lisaient le profil puis
+comptaient produits, campagnes, affiliations et liens à chaque écriture
+(4 requêtes). Le service garde, par compte et dans le worker:
+- le plan et ses limites
+- les compteurs d'usage, tenus à jour par les chemins de création /
+  suppression (record_usage)
+
+Une vérification de limite devient une comparaison en mémoire. Chaque entrée
+est réconciliée avec la base (RPC get_subscription_entitlement, une requête)
+toutes les ENTITLEMENT_RECONCILE_INTERVAL secondes, en tâche de fond: la
+valeur en cache sert la requête pendant le rechargement, et les écritures
+faites par les autres workers sont rattrapées à cette occasion.
+
+Usage:
+    subscription = await entitlement_service.get_subscription(user_id, role)
+    entitlement_service.record_usage("products", 1, profile_id=merchant_id)
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from subscription_helpers_simple import build_subscription_data, count_profile_usage
+from utils.local_cache import LocalTTLCache
+from utils.rpc_fallback import OptionalRpc
+from utils.logger import logger
+
+# Configuration
+ENTITLEMENT_CACHE_MAX_SIZE = int(os.getenv("ENTITLEMENT_CACHE_MAX_SIZE", "20000"))
+ENTITLEMENT_CACHE_TTL = float(os.getenv("ENTITLEMENT_CACHE_TTL", "3600"))  # Secondes sans réconciliation avant éviction
+ENTITLEMENT_RECONCILE_INTERVAL = float(os.getenv("ENTITLEMENT_RECONCILE_INTERVAL", "60"))  # Secondes
+
+ROLES = ("merchant", "influencer")
+
+EntitlementKey = Tuple[str, str]
+
+
+class Entitlement:
+    """Plan, limites et compteurs d'usage d'un compte"""
+
+    __slots__ = ("user_id", "role", "profile_id", "subscription", "usage", "reconciled_at")
+
+    def __init__(self, user_id: str, role: str, profile_id: str, subscription: Dict[str, Any], reconciled_at: float):
+        self.user_id = user_id
+        self.role = role
+        self.profile_id = profile_id
+        self.usage: Dict[str, int] = {k: int(v or 0) for k, v in subscription.pop("usage", {}).items()}
+        self.subscription = subscription
+        self.reconciled_at = reconciled_at
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Données au format de get_user_subscription_data"""
+        return {**self.subscription, "usage": dict(self.usage)}
+
+
+class EntitlementService:
+    """Cache des droits d'abonnement par compte (local au worker)"""
+
+    def __init__(
+        self,
+        client=None,
+        reconcile_interval: float = ENTITLEMENT_RECONCILE_INTERVAL,
+        maxsize: int = ENTITLEMENT_CACHE_MAX_SIZE,
+        ttl: float = ENTITLEMENT_CACHE_TTL,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            client: Client Supabase (défaut: supabase_client.get_supabase_client)
+            reconcile_interval: Âge maximal des compteurs avant rechargement depuis la base
+            maxsize: Nombre maximum de comptes en cache
+            ttl: Durée de vie d'un compte sans réconciliation (compte inactif)
+            timer: Horloge monotone (injectable pour les tests)
+        """
+        self._client = client
+        self.reconcile_interval = reconcile_interval
+        self._timer = timer
+        self._entries = LocalTTLCache(maxsize=maxsize, ttl=ttl, timer=timer)
+        self._profiles = LocalTTLCache(maxsize=maxsize, ttl=ttl, timer=timer)  # profile_id -> clé
+        self._loading: Dict[EntitlementKey, asyncio.Task] = {}
+        self._entitlement_rpc = OptionalRpc("get_subscription_entitlement")
+        self.stats = {"loads": 0, "reconciles": 0, "usage_updates": 0, "errors": 0}
+
+    def _get_client(self):
+        if self._client is None:
+            from supabase_client import get_supabase_client
+            self._client = get_supabase_client()
+        return self._client
+
+    # ============================================
+    # LECTURE
+    # ============================================
+
+    async def get_subscription(self, user_id: str, role: str) -> Optional[Dict[str, Any]]:
+        """
+        Données d'abonnement (plan, limites, usage) d'un compte
+
+        Première lecture: chargement depuis la base. Ensuite: valeur en cache,
+        réconciliée en tâche de fond quand elle dépasse reconcile_interval.
+
+        Returns:
+            Même format que get_user_subscription_data, None sans profil
+        """
+        if not user_id or role not in ROLES:
+            return None
+        key = (str(user_id), role)
+
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = await self._load(key)
+            return entry.snapshot() if entry is not None else None
+
+        if self._timer() - entry.reconciled_at >= self.reconcile_interval:
+            self._start_load(key)
+        return entry.snapshot()
+
+    async def check_limit(self, user_id: str, role: str, resource: str) -> Tuple[bool, int, Optional[int]]:
+        """
+        Vérifie qu'une création reste dans les limites du plan
+
+        Returns:
+            (autorisé, usage actuel, limite). limite=None: illimité.
+
+        Raises:
+            LookupError: aucun abonnement pour ce compte
+        """
+        subscription = await self.get_subscription(user_id, role)
+        if not subscription:
+            raise LookupError(f"Aucun abonnement pour {user_id}")
+        limit = subscription["limits"].get(resource)
+        current = subscription["usage"].get(resource, 0)
+        return limit is None or current < limit, current, limit
+
+    # ============================================
+    # COMPTEURS D'USAGE
+    # ============================================
+
+    def record_usage(
+        self,
+        resource: str,
+        delta: int = 1,
+        user_id: Optional[str] = None,
+        role: Optional[str] = None,
+        profile_id: Optional[str] = None,
+    ) -> bool:
+        """
+        Applique une création (+1) ou suppression (-1) au compteur d'un compte
+
+        Le compte est désigné par son profil (merchant_id / influencer_id) ou
+        par user_id (+ role si l'utilisateur a plusieurs profils). Un compte
+        absent du cache n'est pas chargé: sa prochaine lecture comptera en base.
+
+        Returns:
+            True si un compteur en cache a été mis à jour
+        """
+        updated = False
+        for entry in self._entries_for(user_id, role, profile_id):
+            if resource not in entry.usage:
+                continue
+            entry.usage[resource] = max(0, entry.usage[resource] + delta)
+            updated = True
+
+        if updated:
+            self.stats["usage_updates"] += 1
+        return updated
+
+    def invalidate(self, user_id: str) -> None:
+        """Oublie les droits d'un utilisateur (changement de plan, suppression de profil)"""
+        for role in ROLES:
+            self._entries.delete((str(user_id), role))
+
+    def _entries_for(self, user_id: Optional[str], role: Optional[str], profile_id: Optional[str]):
+        keys = []
+        if profile_id:
+            key = self._profiles.get(str(profile_id))
+            if key is not None:
+                keys.append(key)
+        if user_id:
+            keys.extend((str(user_id), r) for r in ROLES if role in (None, r))
+
+        for key in dict.fromkeys(keys):
+            entry = self._entries.get(key, count=False)
+            if entry is not None:
+                yield entry
+
+    # ============================================
+    # CHARGEMENT / RÉCONCILIATION
+    # ============================================
+
+    def _start_load(self, key: EntitlementKey) -> asyncio.Task:
+        task = self._loading.get(key)
+        if task is None:
+            task = asyncio.create_task(self._reconcile(key))
+            self._loading[key] = task
+            task.add_done_callback(lambda _: self._loading.pop(key, None))
+        return task
+
+    async def _load(self, key: EntitlementKey) -> Optional[Entitlement]:
+        # Une seule lecture en base par compte, même pour des requêtes simultanées
+        return await asyncio.shield(self._start_load(key))
+
+    async def _reconcile(self, key: EntitlementKey) -> Optional[Entitlement]:
+        """Recharge plan et compteurs depuis la base et remplace l'entrée en cache"""
+        user_id, role = key
+        previous = self._entries.get(key, count=False)
+        try:
+            loaded = await asyncio.to_thread(self._fetch, user_id, role)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Droits d'abonnement: réconciliation impossible pour {user_id}: {e}")
+            if previous is not None:
+                # Valeur conservée, nouvel essai à la prochaine échéance
+                previous.reconciled_at = self._timer()
+            return previous
+
+        self.stats["reconciles" if previous is not None else "loads"] += 1
+        if loaded is None:
+            self._entries.delete(key)
+            return None
+
+        profile, usage = loaded
+        entry = Entitlement(
+            user_id, role, str(profile["id"]), build_subscription_data(role, profile, usage), self._timer()
+        )
+        self._entries.set(key, entry)
+        self._profiles.set(entry.profile_id, key)
+        return entry
+
+    def _fetch(self, user_id: str, role: str) -> Optional[Tuple[Dict[str, Any], Dict[str, int]]]:
+        """(ligne du profil, compteurs d'usage) depuis la base, None sans profil"""
+        client = self._get_client()
+
+        if self._entitlement_rpc.enabled():
+            try:
+                result = client.rpc(
+                    "get_subscription_entitlement", {"p_user_id": user_id, "p_role": role}
+                ).execute()
+                self._entitlement_rpc.succeeded()
+                data = result.data
+                if not data:
+                    return None
+                return data["profile"], data["usage"]
+            except Exception as e:
+                # Lecture: repli sur les comptages pour cet appel, la RPC reste
+                # désactivée seulement si elle est absente
+                self._entitlement_rpc.missing(e)
+
+        result = client.from_(f"{role}s").select("*").eq("user_id", user_id).limit(1).execute()
+        if not result.data:
+            return None
+        profile = result.data[0]
+        return profile, count_profile_usage(client, role, profile["id"])
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Compteurs du service et du cache"""
+        return {**self.stats, "cache": self._entries.get_stats()}
+
+
+# Instance partagée du processus
+entitlement_service = EntitlementService()
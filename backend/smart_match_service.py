@@ -3,12 +3,14 @@ Smart Match AI Service
 Algorithme intelligent de matching influenceurs-marques
 """
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
 from pydantic import BaseModel
 from datetime import datetime
 from enum import Enum
 import math
 
+import numpy as np
+
 # ============================================
 # MODELS
 # ============================================
@@ -82,6 +84,185 @@ class MatchResult(BaseModel):
     recommended_commission: float
     confidence_level: str  # "high", "medium", "low"
 
+# Niches compatibles (mapping)
+COMPATIBLE_NICHES = {
+    Niche.FASHION: [Niche.BEAUTY, Niche.LIFESTYLE],
+    Niche.BEAUTY: [Niche.FASHION, Niche.LIFESTYLE],
+    Niche.TECH: [Niche.GAMING, Niche.BUSINESS],
+    Niche.FOOD: [Niche.TRAVEL, Niche.LIFESTYLE],
+    Niche.FITNESS: [Niche.LIFESTYLE],
+}
+
+MIN_MATCH_SCORE = 50  # Seuil minimum de compatibilité
+
+# ============================================
+# FEATURE MATRIX (scoring vectorisé)
+# ============================================
+
+_NICHE_BITS = {niche: 1 << i for i, niche in enumerate(Niche)}
+_AGE_BITS = {age: 1 << i for i, age in enumerate(AudienceAge)}
+_GENDER_CODES = {gender: i for i, gender in enumerate(AudienceGender)}
+_POPCOUNT = np.array([bin(i).count("1") for i in range(1 << len(AudienceAge))], dtype=np.int8)
+
+
+def _mask(values, bits) -> int:
+    mask = 0
+    for value in values:
+        mask |= bits[value]
+    return mask
+
+
+class InfluencerFeatureMatrix:
+    """
+    Caractéristiques des influenceurs en colonnes NumPy
+
+    Construite une fois pour un pool d'influenceurs, elle permet de scorer
+    tous les candidats contre une marque en une seule passe vectorisée.
+    Niches et tranches d'âge sont des masques de bits, plateformes et
+    localisations des matrices booléennes (influenceur x valeur).
+    """
+
+    def __init__(self, profiles: List[InfluencerProfile]):
+        self.profiles = list(profiles)
+        n = len(self.profiles)
+
+        self.platform_index = self._vocabulary(p.platforms for p in self.profiles)
+        self.location_index = self._vocabulary(p.audience_location for p in self.profiles)
+
+        self.niche_mask = np.zeros(n, dtype=np.int32)
+        self.age_mask = np.zeros(n, dtype=np.int32)
+        self.gender = np.zeros(n, dtype=np.int8)
+        self.followers = np.zeros(n, dtype=np.float64)
+        self.engagement = np.zeros(n, dtype=np.float64)
+        self.quality = np.zeros(n, dtype=np.float64)
+        self.reliability = np.zeros(n, dtype=np.float64)
+        self.preferred_commission = np.zeros(n, dtype=np.float64)
+        self.platforms = np.zeros((n, len(self.platform_index)), dtype=bool)
+        self.locations = np.zeros((n, len(self.location_index)), dtype=bool)
+
+        for row, profile in enumerate(self.profiles):
+            self.niche_mask[row] = _mask(profile.niches, _NICHE_BITS)
+            self.age_mask[row] = _mask(profile.audience_age, _AGE_BITS)
+            self.gender[row] = _GENDER_CODES[profile.audience_gender]
+            self.followers[row] = profile.followers_count
+            self.engagement[row] = profile.engagement_rate
+            self.quality[row] = profile.content_quality_score
+            self.reliability[row] = profile.reliability_score
+            self.preferred_commission[row] = profile.preferred_commission
+            for platform in profile.platforms:
+                self.platforms[row, self.platform_index[platform]] = True
+            for location in profile.audience_location:
+                self.locations[row, self.location_index[location]] = True
+
+    @staticmethod
+    def _vocabulary(lists) -> Dict[str, int]:
+        index: Dict[str, int] = {}
+        for values in lists:
+            for value in values:
+                index.setdefault(value, len(index))
+        return index
+
+    def __len__(self) -> int:
+        return len(self.profiles)
+
+    @staticmethod
+    def _overlap_score(matrix: np.ndarray, index: Dict[str, int], wanted: List[str]) -> np.ndarray:
+        """Part des valeurs demandées présentes chez chaque influenceur (0-100)"""
+        columns = [index[value] for value in set(wanted) if value in index]
+        if not columns:
+            return np.zeros(matrix.shape[0])
+        overlap = matrix[:, columns].sum(axis=1)
+        return overlap / len(wanted) * 100
+
+    def score(self, brand: BrandProfile, weights: Dict[str, float]) -> np.ndarray:
+        """Score de compatibilité (0-100) de chaque influenceur pour la marque"""
+
+        scores = {}
+
+        # 1. Niche
+        compatible = _mask(COMPATIBLE_NICHES.get(brand.product_category, []), _NICHE_BITS)
+        scores["niche_match"] = np.where(
+            self.niche_mask & _NICHE_BITS[brand.product_category], 100.0,
+            np.where(self.niche_mask & compatible, 70.0, 30.0)
+        )
+
+        # 2. Audience (âge 60%, genre 40%)
+        overlap = _POPCOUNT[self.age_mask & _mask(brand.target_audience_age, _AGE_BITS)]
+        age_score = overlap / max(len(brand.target_audience_age), 1) * 60
+        brand_gender = _GENDER_CODES[brand.target_audience_gender]
+        mixed = _GENDER_CODES[AudienceGender.MIXED]
+        if brand_gender == mixed:
+            gender_score = np.where(self.gender == brand_gender, 40, 30)
+        else:
+            gender_score = np.where(
+                self.gender == brand_gender, 40, np.where(self.gender == mixed, 30, 10)
+            )
+        scores["audience_match"] = age_score + gender_score
+
+        # 3. Engagement
+        engagement_score = np.select(
+            [self.engagement >= 5, self.engagement >= 3, self.engagement >= 1],
+            [100, 75, 50],
+            default=25,
+        )
+        scores["engagement_quality"] = engagement_score * 0.6 + self.quality * 0.4
+
+        # 4. Followers
+        required = brand.required_followers_min
+        if required > 0:
+            scores["followers_range"] = np.where(
+                self.followers < required,
+                self.followers / required * 50,
+                np.minimum(75 + (self.followers - required) / required * 25, 100),
+            )
+        else:
+            scores["followers_range"] = np.full(len(self), 100.0)
+
+        # 5-6. Plateformes et localisations
+        scores["platform_match"] = self._overlap_score(
+            self.platforms, self.platform_index, brand.preferred_platforms
+        )
+        scores["location_match"] = self._overlap_score(
+            self.locations, self.location_index, brand.target_locations
+        )
+
+        # 7. Fiabilité
+        scores["reliability"] = self.reliability
+
+        # 8. Commission
+        offered = brand.commission_percentage
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores["commission_fit"] = np.where(
+                offered >= self.preferred_commission, 100.0,
+                offered / self.preferred_commission * 100
+            )
+
+        total = np.zeros(len(self))
+        for criterion, weight in weights.items():
+            total += scores[criterion] * (weight / 100)
+        return total
+
+
+def top_k_indices(scores: np.ndarray, k: int, min_score: float = MIN_MATCH_SCORE) -> np.ndarray:
+    """
+    Indices des k meilleurs scores (>= min_score), par score décroissant
+
+    Sélection partielle (argpartition) puis tri des seuls candidats retenus;
+    à score égal, l'ordre d'origine est conservé.
+    """
+    rounded = np.round(scores, 2)
+    eligible = np.flatnonzero(rounded >= min_score)
+    if k <= 0 or eligible.size == 0:
+        return eligible[:0]
+
+    if eligible.size > k:
+        kth = np.argpartition(-rounded[eligible], k - 1)[:k]
+        threshold = rounded[eligible[kth]].min()
+        eligible = eligible[rounded[eligible] >= threshold]
+
+    order = np.lexsort((eligible, -rounded[eligible]))
+    return eligible[order][:k]
+
 # ============================================
 # SMART MATCH SERVICE
 # ============================================
@@ -105,30 +286,31 @@ class SmartMatchService:
     async def find_matches_for_brand(
         self,
         brand: BrandProfile,
-        influencers: List[InfluencerProfile],
+        influencers: Union[List[InfluencerProfile], InfluencerFeatureMatrix],
         top_n: int = 10
     ) -> List[MatchResult]:
         """
         Trouve les meilleurs influenceurs pour une marque
 
         Algorithme:
-        1. Score de compatibilité pour chaque influenceur
-        2. Tri par score
-        3. Prédiction du ROI
-        4. Retour des top N
-        """
+        1. Score de compatibilité vectorisé pour tout le pool
+        2. Sélection partielle des top N (sans tri complet)
+        3. Détail (raisons, ROI, portée) pour les seuls top N
 
-        matches = []
+        `influencers` peut être une InfluencerFeatureMatrix pré-construite
+        pour réutiliser le même pool sur plusieurs marques.
+        """
 
-        for influencer in influencers:
-            match_result = await self._calculate_match_score(influencer, brand)
-            if match_result.compatibility_score >= 50:  # Seuil minimum
-                matches.append(match_result)
+        if not isinstance(influencers, InfluencerFeatureMatrix):
+            influencers = InfluencerFeatureMatrix(influencers)
 
-        # Trier par score décroissant
-        matches.sort(key=lambda x: x.compatibility_score, reverse=True)
+        scores = influencers.score(brand, self.weights)
+        selected = top_k_indices(scores, top_n)
 
-        return matches[:top_n]
+        return [
+            await self._calculate_match_score(influencers.profiles[i], brand)
+            for i in selected
+        ]
 
     async def find_matches_for_influencer(
         self,
@@ -142,7 +324,7 @@ class SmartMatchService:
 
         for brand in brands:
             match_result = await self._calculate_match_score(influencer, brand)
-            if match_result.compatibility_score >= 50:
+            if match_result.compatibility_score >= MIN_MATCH_SCORE:
                 matches.append(match_result)
 
         matches.sort(key=lambda x: x.compatibility_score, reverse=True)
@@ -283,16 +465,7 @@ class SmartMatchService:
         if brand_niche in influencer_niches:
             return 100.0  # Match parfait
 
-        # Niches compatibles (mapping)
-        compatible_niches = {
-            Niche.FASHION: [Niche.BEAUTY, Niche.LIFESTYLE],
-            Niche.BEAUTY: [Niche.FASHION, Niche.LIFESTYLE],
-            Niche.TECH: [Niche.GAMING, Niche.BUSINESS],
-            Niche.FOOD: [Niche.TRAVEL, Niche.LIFESTYLE],
-            Niche.FITNESS: [Niche.LIFESTYLE],
-        }
-
-        compatible = compatible_niches.get(brand_niche, [])
+        compatible = COMPATIBLE_NICHES.get(brand_niche, [])
 
         for niche in influencer_niches:
             if niche in compatible:
@@ -474,7 +647,7 @@ class BatchMatchingService:
         self,
         campaign_id: str,
         brand: BrandProfile,
-        all_influencers: List[InfluencerProfile],
+        all_influencers: Union[List[InfluencerProfile], InfluencerFeatureMatrix],
         target_influencer_count: int = 10,
         min_score: float = 65.0
     ) -> Dict[str, Any]:
@@ -24,6 +24,50 @@ else:
 # USAGE COUNTING FUNCTIONS
 # ============================================
 
+def count_profile_usage(client, user_role: str, profile_id: str) -> Dict[str, int]:
+    """Compte l'utilisation d'un profil merchant/influencer déjà résolu"""
+    if user_role == "merchant":
+        # Compter les produits
+        products_response = client.from_("products")\
+            .select("id", count="exact")\
+            .eq("merchant_id", profile_id)\
+            .execute()
+        
+        # Compter les campagnes
+        campaigns_response = client.from_("campaigns")\
+            .select("id", count="exact")\
+            .eq("merchant_id", profile_id)\
+            .execute()
+        
+        # Compter les affiliations (affiliés)
+        affiliates_response = client.from_("affiliations")\
+            .select("id", count="exact")\
+            .eq("merchant_id", profile_id)\
+            .execute()
+        
+        return {
+            "products": products_response.count or 0,
+            "campaigns": campaigns_response.count or 0,
+            "affiliates": affiliates_response.count or 0
+        }
+    
+    # Compter les campagnes (affiliations)
+    campaigns_response = client.from_("affiliations")\
+        .select("id", count="exact")\
+        .eq("influencer_id", profile_id)\
+        .execute()
+    
+    # Compter les liens de tracking
+    links_response = client.from_("trackable_links")\
+        .select("id", count="exact")\
+        .eq("influencer_id", profile_id)\
+        .execute()
+    
+    return {
+        "campaigns": campaigns_response.count or 0,
+        "links": links_response.count or 0
+    }
+
 async def get_real_usage_counts(user_id: str, user_role: str) -> Dict[str, int]:
     """Compte l'utilisation réelle depuis la base de données"""
     if not supabase:
@@ -42,31 +86,7 @@ async def get_real_usage_counts(user_id: str, user_role: str) -> Dict[str, int]:
             if not merchant_response.data:
                 return {"products": 0, "campaigns": 0, "affiliates": 0}
             
-            merchant_id = merchant_response.data["id"]
-            
-            # Compter les produits
-            products_response = supabase.from_("products")\
-                .select("id", count="exact")\
-                .eq("merchant_id", merchant_id)\
-                .execute()
-            
-            # Compter les campagnes
-            campaigns_response = supabase.from_("campaigns")\
-                .select("id", count="exact")\
-                .eq("merchant_id", merchant_id)\
-                .execute()
-            
-            # Compter les affiliations (affiliés)
-            affiliates_response = supabase.from_("affiliations")\
-                .select("id", count="exact")\
-                .eq("merchant_id", merchant_id)\
-                .execute()
-            
-            return {
-                "products": products_response.count or 0,
-                "campaigns": campaigns_response.count or 0,
-                "affiliates": affiliates_response.count or 0
-            }
+            return count_profile_usage(supabase, user_role, merchant_response.data["id"])
         
         elif user_role == "influencer":
             # Trouver l'influencer_id
@@ -79,24 +99,7 @@ async def get_real_usage_counts(user_id: str, user_role: str) -> Dict[str, int]:
             if not influencer_response.data:
                 return {"campaigns": 0, "links": 0}
             
-            influencer_id = influencer_response.data["id"]
-            
-            # Compter les campagnes (affiliations)
-            campaigns_response = supabase.from_("affiliations")\
-                .select("id", count="exact")\
-                .eq("influencer_id", influencer_id)\
-                .execute()
-            
-            # Compter les liens de tracking
-            links_response = supabase.from_("trackable_links")\
-                .select("id", count="exact")\
-                .eq("influencer_id", influencer_id)\
-                .execute()
-            
-            return {
-                "campaigns": campaigns_response.count or 0,
-                "links": links_response.count or 0
-            }
+            return count_profile_usage(supabase, user_role, influencer_response.data["id"])
     
     except Exception as e:
         print(f"❌ Error counting usage: {e}")
@@ -232,73 +235,63 @@ def get_plan_features(plan_code: str, plan_type: str) -> list:
     
     return features_map.get(plan_code, [])
 
+def build_subscription_data(user_role: str, data: Dict[str, Any], usage: Dict[str, int]) -> Dict[str, Any]:
+    """Construit les données d'abonnement à partir de la ligne merchants/influencers"""
+    if user_role == "merchant":
+        return {
+            "plan_name": data.get("subscription_plan", "free").capitalize(),
+            "plan_code": data.get("subscription_plan", "free"),
+            "type": "merchant",
+            "status": data.get("subscription_status", "active"),
+            "monthly_fee": float(data.get("monthly_fee", 0)),
+            "commission_rate": float(data.get("commission_rate", 5)),
+            "total_sales": float(data.get("total_sales", 0)),
+            "total_commission_paid": float(data.get("total_commission_paid", 0)),
+            
+            # Limites selon le plan
+            "limits": get_merchant_limits(data.get("subscription_plan", "free")),
+            
+            # Utilisation actuelle (réelle)
+            "usage": usage
+        }
+    
+    return {
+        "plan_name": data.get("subscription_plan", "starter").capitalize(),
+        "plan_code": data.get("subscription_plan", "starter"),
+        "type": "influencer",
+        "status": data.get("subscription_status", "active"),
+        "monthly_fee": float(data.get("monthly_fee", 0)),
+        "platform_fee_rate": float(data.get("platform_fee_rate", 5)),
+        "total_earnings": float(data.get("total_earnings", 0)),
+        "balance": float(data.get("balance", 0)),
+        "audience_size": data.get("audience_size", 0),
+        "engagement_rate": float(data.get("engagement_rate", 0)),
+        
+        # Limites selon le plan
+        "limits": get_influencer_limits(data.get("subscription_plan", "starter")),
+        
+        # Utilisation actuelle (réelle)
+        "usage": usage
+    }
+
 async def get_user_subscription_data(user_id: str, user_role: str) -> Optional[Dict[str, Any]]:
     """Récupère les données d'abonnement depuis merchants ou influencers"""
     if not supabase:
         return None
     
     try:
-        if user_role == "merchant":
-            response = supabase.from_("merchants") \
+        if user_role in ("merchant", "influencer"):
+            response = supabase.from_(f"{user_role}s") \
                 .select("*") \
                 .eq("user_id", user_id) \
                 .single() \
                 .execute()
                 
             if response.data:
-                data = response.data
-                
-                # Obtenir l'utilisation réelle
-                usage = await get_real_usage_counts(user_id, user_role)
-                
-                return {
-                    "plan_name": data.get("subscription_plan", "free").capitalize(),
-                    "plan_code": data.get("subscription_plan", "free"),
-                    "type": "merchant",
-                    "status": data.get("subscription_status", "active"),
-                    "monthly_fee": float(data.get("monthly_fee", 0)),
-                    "commission_rate": float(data.get("commission_rate", 5)),
-                    "total_sales": float(data.get("total_sales", 0)),
-                    "total_commission_paid": float(data.get("total_commission_paid", 0)),
-                    
-                    # Limites selon le plan
-                    "limits": get_merchant_limits(data.get("subscription_plan", "free")),
-                    
-                    # Utilisation actuelle (réelle)
-                    "usage": usage
-                }
-        
-        elif user_role == "influencer":
-            response = supabase.from_("influencers") \
-                .select("*") \
-                .eq("user_id", user_id) \
-                .single() \
-                .execute()
-                
-            if response.data:
-                data = response.data
-                
                 # Obtenir l'utilisation réelle
                 usage = await get_real_usage_counts(user_id, user_role)
                 
-                return {
-                    "plan_name": data.get("subscription_plan", "starter").capitalize(),
-                    "plan_code": data.get("subscription_plan", "starter"),
-                    "type": "influencer",
-                    "status": data.get("subscription_status", "active"),
-                    "monthly_fee": float(data.get("monthly_fee", 0)),
-                    "platform_fee_rate": float(data.get("platform_fee_rate", 5)),
-                    "total_earnings": float(data.get("total_earnings", 0)),
-                    "balance": float(data.get("balance", 0)),
-                    "audience_size": data.get("audience_size", 0),
-                    "engagement_rate": float(data.get("engagement_rate", 0)),
-                    
-                    # Limites selon le plan
-                    "limits": get_influencer_limits(data.get("subscription_plan", "starter")),
-                    
-                    # Utilisation actuelle (réelle)
-                    "usage": usage
-                }
+                return build_subscription_data(user_role, response.data, usage)
                 
     except Exception as e:
         print(f"❌ Error fetching subscription data: {e}")
@@ -3,13 +3,14 @@
 SUBSCRIPTION LIMITS MIDDLEWARE - VERSION CORRIGÉE
 Vérifie les limites d'abonnement avant les actions
 BUG 7 CORRIGÉ: Utilise factory functions au lieu de Depends dans méthodes statiques
+Limites et usage servis par le cache des droits (services.subscription_entitlements)
 ============================================
 """
 
 from fastapi import HTTPException, Depends
 from typing import Optional, Callable
 from auth import get_current_user
-from subscription_helpers_simple import get_user_subscription_data
+from services.subscription_entitlements import entitlement_service
 
 class SubscriptionLimits:
     """Middleware pour vérifier les limites d'abonnement"""
@@ -21,7 +22,7 @@ class SubscriptionLimits:
             if current_user.get("role") != "merchant":
                 raise HTTPException(status_code=403, detail="Only merchants can create products")
             
-            subscription_data = await get_user_subscription_data(
+            subscription_data = await entitlement_service.get_subscription(
                 current_user.get("id"),
                 current_user.get("role")
             )
@@ -49,7 +50,7 @@ class SubscriptionLimits:
     def check_campaign_limit() -> Callable:
         """Factory qui retourne une dépendance pour vérifier les campagnes (BUG 7 CORRIGÉ)"""
         async def checker(current_user: dict = Depends(get_current_user)):
-            subscription_data = await get_user_subscription_data(
+            subscription_data = await entitlement_service.get_subscription(
                 current_user.get("id"),
                 current_user.get("role")
             )
@@ -80,7 +81,7 @@ class SubscriptionLimits:
             if current_user.get("role") != "merchant":
                 raise HTTPException(status_code=403, detail="Only merchants can manage affiliates")
             
-            subscription_data = await get_user_subscription_data(
+            subscription_data = await entitlement_service.get_subscription(
                 current_user.get("id"),
                 current_user.get("role")
             )
@@ -111,7 +112,7 @@ class SubscriptionLimits:
             if current_user.get("role") != "influencer":
                 raise HTTPException(status_code=403, detail="Only influencers can create tracking links")
             
-            subscription_data = await get_user_subscription_data(
+            subscription_data = await entitlement_service.get_subscription(
                 current_user.get("id"),
                 current_user.get("role")
             )
@@ -138,7 +139,7 @@ class SubscriptionLimits:
     @staticmethod
     async def get_plan_features(current_user: dict = Depends(get_current_user)) -> list:
         """Retourne les features disponibles pour le plan actuel"""
-        subscription_data = await get_user_subscription_data(
+        subscription_data = await entitlement_service.get_subscription(
             current_user.get("id"),
             current_user.get("role")
         )
@@ -180,7 +181,7 @@ class SubscriptionLimits:
         has_access = await SubscriptionLimits.has_feature(feature_name, current_user)
         
         if not has_access:
-            subscription_data = await get_user_subscription_data(
+            subscription_data = await entitlement_service.get_subscription(
                 current_user.get("id"),
                 current_user.get("role")
             )
@@ -0,0 +1,124 @@
+"""
+Tests pour le cache de réponses LLM et la coalescence des appels
+(AIAssistantMultilingualService contre un serveur stub httpx)
+"""
+
+import asyncio
+import httpx
+import pytest
+
+from services.ai_assistant_multilingual_service import AIAssistantMultilingualService, Language
+from utils.llm_cache import LLMResponseCache
+
+
+class StubModelAPI:
+    """Serveur stub de l'API Messages: compte les appels, répond en écho"""
+
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.calls = 0
+        self.delay = delay
+        self.fail = fail
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail:
+            return httpx.Response(529, json={"error": "overloaded"})
+        return httpx.Response(200, json={"content": [{"text": f"réponse {self.calls}"}]})
+
+
+def make_service(stub: StubModelAPI, cache: LLMResponseCache = None) -> AIAssistantMultilingualService:
+    return AIAssistantMultilingualService(
+        api_key="test-key",
+        api_url="http://stub.local/v1/messages",
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(stub)),
+        response_cache=cache,
+    )
+
+
+@pytest.mark.asyncio
+async def test_identical_translation_is_served_from_cache():
+    stub = StubModelAPI()
+    service = make_service(stub)
+
+    first = await service.translate("Livraison gratuite", Language.FRENCH, Language.ARABIC)
+    second = await service.translate("Livraison   gratuite ", Language.FRENCH, Language.ARABIC)
+
+    assert stub.calls == 1
+    assert first["translation"] == second["translation"] == "réponse 1"
+    await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_key_includes_operation_and_language():
+    stub = StubModelAPI()
+    service = make_service(stub)
+
+    await service.translate("Paiement sécurisé", Language.FRENCH, Language.ARABIC)
+    await service.translate("Paiement sécurisé", Language.FRENCH, Language.ENGLISH)
+    await service.optimize_seo("Paiement sécurisé", ["paiement"], Language.FRENCH)
+
+    assert stub.calls == 3
+    await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_requests_share_one_call():
+    stub = StubModelAPI(delay=0.05)
+    service = make_service(stub)
+
+    results = await asyncio.gather(*[
+        service.translate("Ajouter au panier", Language.FRENCH, Language.ARABIC)
+        for _ in range(10)
+    ])
+
+    assert stub.calls == 1
+    assert {r["translation"] for r in results} == {"réponse 1"}
+    assert service.get_cache_stats()["coalesced"] == 9
+    await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_upstream_errors_are_not_cached():
+    stub = StubModelAPI(fail=True)
+    service = make_service(stub)
+
+    result = await service.translate("Garantie 1 an", Language.FRENCH, Language.ARABIC)
+    assert result.get("demo_mode") is True
+
+    stub.fail = False
+    result = await service.translate("Garantie 1 an", Language.FRENCH, Language.ARABIC)
+    assert result["translation"] == "réponse 2"
+    await service.aclose()
+
+
+@pytest.mark.asyncio
+async def test_cache_ttl_and_lru_eviction():
+    now = [0.0]
+    cache = LLMResponseCache(maxsize=2, ttl=60, timer=lambda: now[0])
+    calls = []
+
+    async def call():
+        calls.append(1)
+        return "ok"
+
+    await cache.get_or_call("a", call)
+    await cache.get_or_call("b", call)
+    await cache.get_or_call("c", call)  # évince "a"
+    await cache.get_or_call("a", call)
+    assert len(calls) == 4
+
+    now[0] = 61
+    await cache.get_or_call("a", call)
+    assert len(calls) == 5
+
+
+@pytest.mark.asyncio
+async def test_demo_mode_skips_network():
+    service = AIAssistantMultilingualService(demo_mode=True)
+
+    result = await service.translate("Livraison gratuite", Language.FRENCH, Language.ARABIC)
+
+    assert result["translation"] == "توصيل مجاني"
+    assert service.get_cache_stats()["upstream_calls"] == 0
@@ -0,0 +1,77 @@
+"""
+Tests pour la couche d'accès base de données non bloquante
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from unittest.mock import MagicMock
+
+from utils.async_db import AsyncDB
+from repositories.base_repository import BaseRepository
+
+
+@pytest.fixture
+def db():
+    pool = AsyncDB(max_concurrency=4, timeout=5, slow_call_ms=10_000)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_run_offloads_to_pool_thread(db):
+    main_thread = threading.get_ident()
+
+    result = await db.run(threading.get_ident)
+
+    assert result != main_thread
+
+
+@pytest.mark.asyncio
+async def test_blocking_calls_overlap_up_to_limit(db):
+    """4 appels de 100 ms en parallèle prennent ~100 ms, pas 400 ms"""
+    started = time.perf_counter()
+    await asyncio.gather(*[db.run(time.sleep, 0.1) for _ in range(4)])
+
+    assert time.perf_counter() - started < 0.3
+
+
+@pytest.mark.asyncio
+async def test_execute_records_timing_and_errors(db):
+    query = MagicMock()
+    query.execute.return_value.data = [{"id": 1}]
+    failing = MagicMock()
+    failing.execute.side_effect = Exception("connection reset")
+
+    result = await db.execute(query, label="sales.select")
+    with pytest.raises(Exception):
+        await db.execute(failing, label="sales.select")
+
+    assert result.data == [{"id": 1}]
+    stats = db.get_stats()
+    assert stats["max_concurrency"] == 4
+    assert stats["in_flight"] == 0
+    assert stats["calls"]["sales.select"]["calls"] == 2
+    assert stats["calls"]["sales.select"]["errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_timeout_raises():
+    pool = AsyncDB(max_concurrency=1, timeout=0.05)
+    with pytest.raises(asyncio.TimeoutError):
+        await pool.run(time.sleep, 0.3)
+    pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_repository_aio_proxy():
+    client = MagicMock()
+    for method in ("table", "select", "eq", "maybe_single"):
+        getattr(client, method).return_value = client
+    client.execute.return_value.data = {"id": "p-1"}
+    repo = BaseRepository(client)
+    repo.table_name = "products"
+
+    assert await repo.aio.find_by_id("p-1") == {"id": "p-1"}
@@ -0,0 +1,295 @@
+"""
+Tests pour le service de paiement automatique
+
+Couvre:
+1. Validation des ventes par lots (RPC validate_sales_batch)
+2. Repli rejouable sans la fonction SQL (crédit atomique avant le statut)
+3. Reprise après interruption (max_chunks)
+4. Paiements automatiques par lots (pool borné, idempotence)
+5. Débit du montant payé, sans remise à zéro du solde
+"""
+
+import pytest
+from unittest.mock import MagicMock, patch
+
+from auto_payment_service import AutoPaymentService, GatewayRateLimiter
+
+
+def _table_mock(data=None):
+    """Chaîne de requête Supabase retournant `data`"""
+    mock = MagicMock()
+    for method in ("select", "eq", "lt", "gte", "in_", "order", "limit", "update", "insert", "upsert"):
+        getattr(mock, method).return_value = mock
+    mock.execute.return_value.data = data if data is not None else []
+    return mock
+
+
+def _sales(n, influencer_id="inf-1", commission=10.0):
+    return [
+        {
+            "id": f"sale-{i}",
+            "influencer_id": influencer_id if i % 2 == 0 else "inf-2",
+            "influencer_commission": commission,
+            "link_id": "link-1",
+            "created_at": f"2026-01-01T00:00:{i:02d}",
+        }
+        for i in range(n)
+    ]
+
+
+@pytest.fixture
+def db():
+    """Client Supabase mocké avec une chaîne par table"""
+    client = MagicMock()
+    tables = {}
+
+    def table(name):
+        return tables.setdefault(name, _table_mock())
+
+    client.table.side_effect = table
+    client.tables = tables
+    return client
+
+
+# ============================================
+# TESTS: validate_pending_sales
+# ============================================
+
+def test_validate_uses_batch_rpc_per_chunk(db):
+    """Un appel RPC par lot, aucune écriture ligne à ligne"""
+    sales_table = _table_mock()
+    sales_table.execute.side_effect = [
+        MagicMock(data=_sales(3)),
+        MagicMock(data=[]),
+    ]
+    db.tables["sales"] = sales_table
+    db.rpc.return_value.execute.return_value.data = {
+        "validated": 3,
+        "total_commission": 30,
+        "influencer_ids": ["inf-1", "inf-2"],
+    }
+
+    with patch("auto_payment_service.supabase", db):
+        result = AutoPaymentService().validate_pending_sales(chunk_size=3)
+
+    assert result["success"] is True
+    assert result["validated_sales"] == 3
+    assert result["total_commission"] == 30
+    assert result["influencers_updated"] == 2
+    assert result["remaining"] is False
+    db.rpc.assert_called_once_with(
+        "validate_sales_batch", {"p_sale_ids": ["sale-0", "sale-1", "sale-2"]}
+    )
+    assert "commissions" not in db.tables
+
+
+def _missing_batch_rpc(db, credit_error=None):
+    """validate_sales_batch absente, credit_sale_commissions présente (ou en erreur)"""
+    def rpc(name, params):
+        call = MagicMock()
+        if name == "validate_sales_batch":
+            call.execute.side_effect = Exception("function validate_sales_batch does not exist")
+        elif credit_error is not None:
+            call.execute.side_effect = credit_error
+        return call
+
+    db.rpc.side_effect = rpc
+
+
+def test_validate_fallback_credits_atomically_before_status_flip(db):
+    """Sans RPC de lot: commissions, crédit atomique, puis statut des ventes"""
+    chunk = _sales(4)
+    sales_table = _table_mock()
+    sales_table.execute.side_effect = [
+        MagicMock(data=chunk),  # ventes anciennes
+        MagicMock(data=chunk),  # encore pending
+        MagicMock(data=[{"id": s["id"]} for s in chunk]),  # passées en completed
+    ]
+    db.tables["sales"] = sales_table
+    db.tables["commissions"] = _table_mock([{"sale_id": "sale-0"}])  # Passage précédent interrompu
+    _missing_batch_rpc(db)
+
+    with patch("auto_payment_service.supabase", db):
+        result = AutoPaymentService().validate_pending_sales(chunk_size=10)
+
+    assert result["validated_sales"] == 4
+    assert result["total_commission"] == 40
+    inserted = db.tables["commissions"].insert.call_args[0][0]
+    assert [row["sale_id"] for row in inserted] == ["sale-1", "sale-2", "sale-3"]
+    assert all(row["approved_at"] is None for row in inserted)
+    assert [c.args[0] for c in db.rpc.call_args_list] == ["validate_sales_batch", "credit_sale_commissions"]
+    assert db.rpc.call_args_list[1].args[1] == {"p_sale_ids": [s["id"] for s in chunk]}
+    # Aucun solde ni lien réécrit depuis l'API
+    assert "influencers" not in db.tables or not db.tables["influencers"].update.called
+    assert "trackable_links" not in db.tables
+
+
+def test_validate_fallback_credit_failure_leaves_sales_pending(db):
+    """Crédit impossible: les ventes ne passent pas en completed et seront reprises"""
+    chunk = _sales(2)
+    sales_table = _table_mock()
+    sales_table.execute.side_effect = [MagicMock(data=chunk), MagicMock(data=chunk)]
+    db.tables["sales"] = sales_table
+    _missing_batch_rpc(db, credit_error=ConnectionError("timeout"))
+
+    with patch("auto_payment_service.supabase", db):
+        result = AutoPaymentService().validate_pending_sales(chunk_size=10)
+
+    assert result["validated_sales"] == 0
+    assert result["failed_chunks"] == 1
+    sales_table.update.assert_not_called()
+
+
+def test_validate_batch_rpc_transient_error_is_not_bypassed(db):
+    """Erreur réseau de validate_sales_batch: le lot échoue, pas de repli"""
+    db.tables["sales"] = _table_mock(_sales(2))
+    db.rpc.return_value.execute.side_effect = ConnectionError("connection reset")
+
+    with patch("auto_payment_service.supabase", db):
+        result = AutoPaymentService().validate_pending_sales(chunk_size=2)
+
+    assert result["failed_chunks"] == 1
+    assert result["validated_sales"] == 0
+    db.tables["sales"].update.assert_not_called()
+    assert "commissions" not in db.tables
+
+
+def test_validate_stops_after_max_chunks_and_reports_remaining(db):
+    """max_chunks borne l'exécution, le prochain appel reprend"""
+    sales_table = _table_mock(_sales(2))
+    db.tables["sales"] = sales_table
+    db.rpc.return_value.execute.return_value.data = {
+        "validated": 2,
+        "total_commission": 20,
+        "influencer_ids": ["inf-1", "inf-2"],
+    }
+    progress = []
+
+    with patch("auto_payment_service.supabase", db):
+        result = AutoPaymentService().validate_pending_sales(
+            chunk_size=2, max_chunks=2, progress_callback=progress.append
+        )
+
+    assert result["chunks"] == 2
+    assert result["validated_sales"] == 4
+    assert result["remaining"] is True
+    assert [p["validated_sales"] for p in progress] == [2, 4]
+
+
+def test_validate_stops_when_chunk_makes_no_progress(db):
+    """Un lot sans vente validée n'est pas retraité en boucle"""
+    db.tables["sales"] = _table_mock(_sales(2))
+    db.rpc.return_value.execute.return_value.data = {"validated": 0, "total_commission": 0}
+
+    with patch("auto_payment_service.supabase", db):
+        result = AutoPaymentService().validate_pending_sales(chunk_size=2)
+
+    assert result["chunks"] == 1
+    assert result["validated_sales"] == 0
+    assert result["remaining"] is True
+
+
+# ============================================
+# TESTS: process_automatic_payouts
+# ============================================
+
+def _influencer(i, method="paypal"):
+    return {
+        "id": f"inf-{i}",
+        "user_id": f"user-{i}",
+        "username": f"creator{i}",
+        "balance": 100 + i,
+        "payment_method": method,
+        "payment_details": {"email": f"c{i}@mail.ma", "iban": "MA64...", "account_name": "X"},
+    }
+
+
+def test_payouts_prefetch_in_flight_and_create_in_bulk(db):
+    """Une requête pour les paiements en cours, une création groupée"""
+    influencers = [_influencer(1), _influencer(2, "bank_transfer"), _influencer(3)]
+    db.tables["influencers"] = _table_mock(influencers)
+    payouts_table = _table_mock()
+    payouts_table.execute.side_effect = [
+        MagicMock(data=[{"influencer_id": "inf-3"}]),  # paiements en cours
+        MagicMock(data=[  # payouts créés
+            {"id": "p-1", "influencer_id": "inf-1", "amount": 101, "idempotency_key": "k1"},
+            {"id": "p-2", "influencer_id": "inf-2", "amount": 102, "idempotency_key": "k2"},
+        ]),
+        MagicMock(data=[]),  # upsert des payouts payés
+    ]
+    db.tables["payouts"] = payouts_table
+    db.tables["users"] = _table_mock([{"id": "user-1", "email": "a@b.ma"}])
+
+    with patch("auto_payment_service.supabase", db):
+        result = AutoPaymentService().process_automatic_payouts()
+
+    assert result["processed_count"] == 2
+    assert result["total_paid"] == 203
+    created = payouts_table.upsert.call_args_list[0]
+    rows = created[0][0]
+    assert [r["influencer_id"] for r in rows] == ["inf-1", "inf-2"]
+    assert rows[0]["idempotency_key"].startswith("auto-inf-1-")
+    assert created[1] == {"on_conflict": "idempotency_key", "ignore_duplicates": True}
+    db.rpc.assert_called_once_with("debit_payout_balances", {"p_idempotency_keys": ["k1", "k2"]})
+    db.tables["influencers"].update.assert_not_called()
+    db.tables["notifications"].insert.assert_called_once()
+
+
+def test_payouts_mark_gateway_failures_in_one_update(db):
+    """Les échecs passerelle sont marqués en un seul UPDATE"""
+    db.tables["influencers"] = _table_mock([_influencer(1)])
+    payouts_table = _table_mock()
+    payouts_table.execute.side_effect = [
+        MagicMock(data=[]),
+        MagicMock(data=[{"id": "p-1", "influencer_id": "inf-1", "amount": 101}]),
+        MagicMock(data=[]),
+    ]
+    db.tables["payouts"] = payouts_table
+    service = AutoPaymentService()
+    service._process_paypal_payment = MagicMock(side_effect=Exception("gateway timeout"))
+
+    with patch("auto_payment_service.supabase", db):
+        result = service.process_automatic_payouts()
+
+    assert result["processed_count"] == 0
+    assert result["failed_count"] == 1
+    payouts_table.update.assert_called_once_with(
+        {"status": "failed", "notes": "Échec du traitement automatique"}
+    )
+    payouts_table.in_.assert_called_with("id", ["p-1"])
+
+
+def test_payouts_debit_paid_amount_instead_of_zeroing_balance(db):
+    """Seuls les payouts payés sont débités, par clé d'idempotence"""
+    db.tables["influencers"] = _table_mock([_influencer(1), _influencer(2)])
+    payouts_table = _table_mock()
+    payouts_table.execute.side_effect = [
+        MagicMock(data=[]),
+        MagicMock(data=[
+            {"id": "p-1", "influencer_id": "inf-1", "amount": 101, "idempotency_key": "k1"},
+            {"id": "p-2", "influencer_id": "inf-2", "amount": 102, "idempotency_key": "k2"},
+        ]),
+        MagicMock(data=[]),
+        MagicMock(data=[]),
+    ]
+    db.tables["payouts"] = payouts_table
+    service = AutoPaymentService()
+    service._process_paypal_payment = MagicMock(
+        side_effect=lambda details, amount, key: (key == "k1", "TX" if key == "k1" else None)
+    )
+
+    with patch("auto_payment_service.supabase", db):
+        result = service.process_automatic_payouts()
+
+    assert result["processed_count"] == 1
+    db.rpc.assert_called_once_with("debit_payout_balances", {"p_idempotency_keys": ["k1"]})
+    db.tables["influencers"].update.assert_not_called()
+
+
+def test_gateway_rate_limiter_spaces_calls():
+    """Le limiteur réserve un créneau par appel"""
+    limiter = GatewayRateLimiter(calls_per_second=1000)
+    for _ in range(3):
+        limiter.acquire()
+
+    assert limiter.interval == pytest.approx(0.001)
@@ -0,0 +1,131 @@
+"""
+Tests pour l'approbation des commissions en lot (PaymentsService.batch_approve_commissions)
+"""
+
+import pytest
+from unittest.mock import MagicMock, patch
+from uuid import uuid4
+
+from services.payments.service import PaymentsService
+
+
+def make_service(client):
+    with patch("services.payments.service.get_supabase_client", return_value=client):
+        return PaymentsService()
+
+
+def make_fallback_client(commissions, balances):
+    """Client factice: approve_commissions_batch absente, approve_payout_transaction en mémoire"""
+    client = MagicMock()
+    client.single_calls = []
+
+    def approve_payout_transaction(commission_id, status):
+        client.single_calls.append(commission_id)
+        commission = commissions.get(commission_id)
+        if commission is None:
+            raise Exception(f"Commission {commission_id} introuvable")
+        if commission["status"] == "paid" and status != "paid":
+            raise Exception(f"La commission {commission_id} a déjà été réglée et ne peut pas changer de statut.")
+        if commission["status"] == status:
+            return True
+        if status == "approved" and commission["status"] == "pending":
+            if balances[commission["influencer_id"]] < commission["amount"]:
+                raise Exception(f"Solde insuffisant pour approuver la commission {commission_id}")
+            balances[commission["influencer_id"]] -= commission["amount"]
+        commission["status"] = status
+        return True
+
+    def rpc(name, params):
+        call = MagicMock()
+        if name == "approve_commissions_batch":
+            call.execute.side_effect = Exception("function approve_commissions_batch does not exist")
+        else:
+            call.execute.side_effect = lambda: MagicMock(
+                data=approve_payout_transaction(params["p_commission_id"], params["p_status"])
+            )
+        return call
+
+    client.rpc.side_effect = rpc
+    return client
+
+
+@pytest.mark.asyncio
+async def test_batch_uses_one_rpc_call_per_chunk():
+    client = MagicMock()
+    ids = [str(uuid4()) for _ in range(2500)]
+
+    def rpc(name, params):
+        call = MagicMock()
+        call.execute.return_value.data = [
+            {"id": cid, "success": i != 0, "error": None if i else f"Commission {cid} introuvable"}
+            for i, cid in enumerate(params["p_commission_ids"])
+        ]
+        return call
+
+    client.rpc.side_effect = rpc
+    service = make_service(client)
+
+    result = await service.batch_approve_commissions(ids, chunk_size=1000)
+
+    assert client.rpc.call_count == 3
+    assert client.rpc.call_args_list[0].args[0] == "approve_commissions_batch"
+    assert result["success_count"] == 2497
+    assert result["failed_count"] == 3
+    assert result["failed"][0]["error"].startswith("Commission ou ressource introuvable")
+
+
+@pytest.mark.asyncio
+async def test_duplicates_and_invalid_status():
+    client = MagicMock()
+    service = make_service(client)
+    cid = str(uuid4())
+
+    result = await service.batch_approve_commissions([cid, cid], "archived")
+
+    client.rpc.assert_not_called()
+    assert result["failed"] == [{"id": cid, "error": "Statut invalide: Statut archived non supporté"}]
+
+
+@pytest.mark.asyncio
+async def test_fallback_uses_atomic_single_rpc_with_same_overflow_rule():
+    """Sans la fonction de lot: approve_payout_transaction par commission, seul le dépassement est refusé"""
+    commissions = {
+        "c1": {"status": "pending", "amount": 100, "influencer_id": "i1"},
+        "c2": {"status": "pending", "amount": 100, "influencer_id": "i1"},
+        "c3": {"status": "pending", "amount": 100, "influencer_id": "i1"},
+        "c4": {"status": "paid", "amount": 50, "influencer_id": "i1"},
+        "c5": {"status": "pending", "amount": 30, "influencer_id": "i1"},
+    }
+    balances = {"i1": 250}
+    client = make_fallback_client(commissions, balances)
+    service = make_service(client)
+
+    result = await service.batch_approve_commissions(["c1", "c2", "c3", "c4", "c5", "missing"])
+
+    # c3 dépasse le solde restant (50), c5 (30) tient encore: même règle que la fonction SQL
+    assert result["success"] == ["c1", "c2", "c5"]
+    errors = {f["id"]: f["error"] for f in result["failed"]}
+    assert errors["c3"] == "Solde insuffisant pour approuver cette commission"
+    assert "déjà été payée" in errors["c4"]
+    assert errors["missing"].startswith("Commission ou ressource introuvable: Commission missing")
+    assert balances["i1"] == 20
+    assert client.single_calls == ["c1", "c2", "c3", "c4", "c5", "missing"]
+    client.table.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_transient_batch_error_fails_chunk_without_disabling_rpc():
+    """Une erreur réseau ne bascule pas sur le repli: le paquet échoue, la RPC reste utilisée"""
+    client = MagicMock()
+    client.rpc.return_value.execute.side_effect = [
+        ConnectionError("connection reset"),
+        MagicMock(data=[{"id": "c1", "success": True, "error": None}]),
+    ]
+    service = make_service(client)
+
+    first = await service.batch_approve_commissions(["c1"])
+    second = await service.batch_approve_commissions(["c1"])
+
+    assert first["failed_count"] == 1
+    assert second["success"] == ["c1"]
+    assert [c.args[0] for c in client.rpc.call_args_list] == ["approve_commissions_batch"] * 2
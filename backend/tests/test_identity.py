@@ -0,0 +1,82 @@
+"""
+Tests pour la résolution d'identité user_id → merchant_id / influencer_id
+"""
+
+import pytest
+from unittest.mock import MagicMock
+
+from utils import identity
+from utils.identity import (
+    IdentityNotFound,
+    get_influencer_id,
+    get_merchant_id,
+    identity_claims,
+    remember_identity,
+    require_merchant_id,
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    identity._identity_cache.clear()
+    yield
+    identity._identity_cache.clear()
+
+
+@pytest.fixture
+def client():
+    mock = MagicMock()
+    for method in ("table", "select", "eq", "limit"):
+        getattr(mock, method).return_value = mock
+    mock.execute.return_value.data = [{"id": "m-1"}]
+    return mock
+
+
+def test_lookup_hits_database_once_then_cache(client):
+    assert get_merchant_id("u-1", client) == "m-1"
+    assert get_merchant_id("u-1", client) == "m-1"
+
+    client.table.assert_called_once_with("merchants")
+    client.eq.assert_called_once_with("user_id", "u-1")
+
+
+def test_missing_profile_is_cached_briefly(client):
+    client.execute.return_value.data = []
+
+    assert get_influencer_id("u-2", client) is None
+    assert get_influencer_id("u-2", client) is None
+    assert client.execute.call_count == 1
+    with pytest.raises(IdentityNotFound):
+        require_merchant_id("u-2", client)
+
+
+def test_token_claims_skip_database(client):
+    remember_identity({"user_id": "u-3", "role": "influencer", "influencer_id": "i-3"})
+
+    assert get_influencer_id("u-3", client) == "i-3"
+    client.table.assert_not_called()
+
+
+def test_identity_claims_for_role(client):
+    assert identity_claims("u-1", "merchant", client) == {"merchant_id": "m-1"}
+    assert identity_claims("u-1", "admin", client) == {}
+
+
+def test_lookup_error_is_not_cached(client):
+    client.execute.side_effect = [Exception("timeout"), MagicMock(data=[{"id": "m-1"}])]
+
+    assert get_merchant_id("u-4", client) is None
+    assert get_merchant_id("u-4", client) == "m-1"
+
+
+def test_user_update_drops_cached_profile_ids(client, monkeypatch):
+    import db_helpers
+
+    client.execute.return_value.data = []
+    assert get_merchant_id("u-5", client) is None
+
+    monkeypatch.setattr(db_helpers, "supabase", MagicMock())
+    assert db_helpers.update_user("u-5", {"role": "merchant"}) is True
+
+    client.execute.return_value.data = [{"id": "m-5"}]
+    assert get_merchant_id("u-5", client) == "m-5"
@@ -6,7 +6,7 @@ import io
 from pathlib import Path
 from PIL import Image
 
-from services.image_optimizer import ImageOptimizer
+from services.image_optimizer import ImageOptimizer, ResizePyramid
 from utils.image_processing import (
     validate_image,
     calculate_optimal_quality,
@@ -213,6 +213,89 @@ class TestImageOptimizer:
         assert 'cdn.example.com' in result['srcset']['webp']
 
 
+# Tests du pipeline (pyramide, déduplication, async)
+
+class TestPipeline:
+    """Tests du pipeline décodage unique / pyramide / pool"""
+
+    def test_pyramid_reuses_previous_levels(self):
+        """Chaque niveau est une réduction du précédent, calculée une seule fois"""
+        pyramid = ResizePyramid(Image.new('RGB', (4000, 3000)))
+
+        assert pyramid.source_for(1920, 1920).size == (4000, 3000)
+        assert pyramid.source_for(640, 640).size == (1000, 750)
+        levels = list(pyramid.levels)
+        assert pyramid.source_for(150, 150).size == (250, 188)
+        assert pyramid.levels[:len(levels)] == levels
+
+    def test_large_jpeg_decoded_at_reduced_size(self):
+        """Thumbnails d'une grande photo: décodage JPEG réduit, dimensions exactes"""
+        img = Image.new('RGB', (4000, 3000), color=(10, 120, 200))
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG')
+        optimizer = ImageOptimizer(storage_path='/tmp/test_images', encode_workers=0)
+
+        jobs = optimizer._prepare_thumbnails(
+            buffer.getvalue(), 'large.jpg', {'small': (320, 320)}, ['jpeg']
+        )
+
+        size_name, dimensions, thumb, fmt, _ = jobs[0]
+        assert (size_name, dimensions, fmt) == ('small', (320, 320), 'jpeg')
+        assert thumb.size == (320, 320)
+        decoded, _ = optimizer._decode(buffer.getvalue(), 'large.jpg', min_scale=0.25)
+        assert decoded.size == (1000, 750)
+
+    def test_identical_upload_is_deduplicated(self, sample_image_data):
+        """Un upload identique ne repasse pas par l'encodage"""
+        optimizer = ImageOptimizer(storage_path='/tmp/test_images', encode_workers=0)
+
+        first = optimizer.optimize_image(sample_image_data, 'a.jpg', generate_formats=['jpeg'])
+        optimizer._submit_encodes = None  # Tout nouvel encodage échouerait
+        second = optimizer.optimize_image(sample_image_data, 'b.jpg', generate_formats=['jpeg'])
+
+        assert second['deduplicated'] is True
+        assert second['optimized']['jpeg']['data'] == first['optimized']['jpeg']['data']
+        assert first['original']['hash'] == second['original']['hash']
+        # Champs propres à la requête: ceux du second upload
+        assert second['original']['filename'] == 'b.jpg'
+        assert second['metadata']['filename'] == 'b.jpg'
+        assert 'deduplicated' not in first
+
+    def test_dedup_cache_is_bounded_in_bytes(self, sample_image_data):
+        """Le cache garde au plus dedup_cache_bytes octets encodés"""
+        optimizer = ImageOptimizer(storage_path='/tmp/test_images', encode_workers=0)
+        encoded = optimizer.optimize_image(sample_image_data, 'a.jpg', generate_formats=['jpeg'])
+        size = encoded['optimized']['jpeg']['size']
+
+        optimizer = ImageOptimizer(
+            storage_path='/tmp/test_images', encode_workers=0, dedup_cache_bytes=size
+        )
+        optimizer.optimize_image(sample_image_data, 'a.jpg', generate_formats=['jpeg'])
+        optimizer.optimize_image(sample_image_data, 'a.jpg', generate_formats=['jpeg'], quality=10)
+
+        stats = optimizer._dedup_cache.get_stats()
+        assert (stats['size'], stats['evictions']) == (1, 1)
+        assert stats['bytes'] <= size
+
+    @pytest.mark.asyncio
+    async def test_async_variants_match_sync(self, sample_image_data):
+        """Les variantes async produisent le même résultat"""
+        optimizer = ImageOptimizer(
+            storage_path='/tmp/test_images', encode_workers=0, dedup_cache_bytes=0
+        )
+
+        result = await optimizer.generate_responsive_srcset_async(
+            sample_image_data, 'test.jpg', base_url='https://cdn.example.com'
+        )
+        expected = optimizer.generate_responsive_srcset(
+            sample_image_data, 'test.jpg', base_url='https://cdn.example.com'
+        )
+
+        assert result['success'] is True
+        assert result['srcset'] == expected['srcset']
+        assert list(result['thumbnails']) == list(expected['thumbnails'])
+
+
 # Tests des utilitaires
 
 class TestImageProcessingUtils:
@@ -0,0 +1,129 @@
+"""
+Tests pour l'index de caractéristiques du matching marchand-influenceur
+"""
+
+import random
+import time
+
+import pytest
+from unittest.mock import AsyncMock
+
+from services.influencer_matching_service import InfluencerMatchingService
+
+NICHES = ["fashion", "beauty", "tech", "food", "travel", "fitness"]
+AGES = ["18-24", "25-34", "35-44"]
+CITIES = ["Casablanca", "Rabat", "Marrakech", "Tanger"]
+INTERESTS = ["mode", "sport", "cuisine", "voyage", "gaming"]
+
+
+def _influencer(rng: random.Random, i: int) -> dict:
+    price = rng.choice([0, 500, 2000, 8000])
+    return {
+        "id": f"inf-{i}",
+        "niches": rng.sample(NICHES, rng.randint(1, 2)),
+        "content_categories": rng.sample(NICHES, rng.randint(0, 2)),
+        "audience_demographics": {
+            "age_distribution": {age: 30 for age in rng.sample(AGES, rng.randint(1, 2))},
+            "gender_split": {"female": rng.randint(20, 80), "male": rng.randint(20, 80)},
+            "top_locations": rng.sample(CITIES, 2),
+            "interests": rng.sample(INTERESTS, 2),
+        },
+        "average_campaign_price": price,
+        "price_range": {"min": price * 0.5, "max": price * 2} if rng.random() < 0.3 else {},
+        "past_campaigns": [
+            {"type": rng.choice(["sales", "awareness"]), "roi_percentage": rng.randint(0, 400)}
+            for _ in range(rng.randint(0, 3))
+        ],
+        "engagement_rate": rng.uniform(0, 10),
+        "total_followers": rng.randint(1000, 200_000),
+    }
+
+
+CAMPAIGN = {
+    "product_category": "beauty",
+    "target_audience": {
+        "age_range": ["18-24", "25-34"],
+        "gender": "female",
+        "locations": ["Casablanca", "Rabat"],
+        "interests": ["mode"],
+    },
+    "budget": 2000,
+    "campaign_goals": ["sales"],
+    "duration_days": 10,
+    "product_price": 250,
+}
+
+
+def _service(influencers) -> InfluencerMatchingService:
+    service = InfluencerMatchingService()
+    service._get_active_influencers = AsyncMock(return_value=influencers)
+    return service
+
+
+async def _brute_force(service, influencers, campaign, limit):
+    scored = []
+    for position, influencer in enumerate(influencers):
+        score = await service._calculate_match_score({}, influencer, campaign)
+        if score["total"] >= 50:
+            scored.append((-score["total"], position, influencer["id"]))
+    return [(-s, inf_id) for s, _, inf_id in sorted(scored)[:limit]]
+
+
+@pytest.fixture
+def influencers():
+    rng = random.Random(7)
+    return [_influencer(rng, i) for i in range(500)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("campaign", [
+    CAMPAIGN,
+    {**CAMPAIGN, "budget": 300, "campaign_goals": ["awareness", "sales"]},
+    {"budget": 0},
+])
+async def test_indexed_matches_equal_full_scan(influencers, campaign):
+    service = _service(influencers)
+
+    matches = await service.find_matches("m-1", campaign, limit=20)
+    expected = await _brute_force(service, influencers, campaign, 20)
+
+    assert [(m["match_score"], m["influencer"]["id"]) for m in matches] == expected
+    assert all(m["match_reasons"] for m in matches)
+
+
+@pytest.mark.asyncio
+async def test_index_is_built_once_until_stale(influencers):
+    service = _service(influencers)
+
+    await service.find_matches("m-1", CAMPAIGN)
+    await service.find_matches("m-2", CAMPAIGN)
+    assert service._get_active_influencers.await_count == 1
+
+    service.feature_index.built_at -= service.feature_index.ttl
+    await service.find_matches("m-1", CAMPAIGN)
+    assert service._get_active_influencers.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_require_niche_restricts_candidates(influencers):
+    service = _service(influencers)
+
+    matches = await service.find_matches("m-1", {**CAMPAIGN, "require_niche": True}, limit=50)
+
+    assert matches
+    for match in matches:
+        influencer = match["influencer"]
+        assert "beauty" in influencer["niches"] + influencer["content_categories"]
+
+
+@pytest.mark.asyncio
+async def test_deck_on_large_pool_is_fast(influencers):
+    service = _service(influencers * 100)  # 50k influenceurs
+    await service.get_feature_index()
+
+    started = time.perf_counter()
+    matches = await service.find_matches("m-1", CAMPAIGN, limit=10)
+    elapsed = time.perf_counter() - started
+
+    assert len(matches) == 10
+    assert elapsed < 1.0
@@ -0,0 +1,243 @@
+"""
+Tests pour la pagination par curseur (keyset)
+"""
+
+import pytest
+from unittest.mock import MagicMock, patch
+
+from utils import keyset_pagination
+from utils.keyset_pagination import (
+    cached_count,
+    decode_cursor,
+    encode_cursor,
+    keyset_filter,
+    paginate_keyset,
+)
+
+
+def _query(rows):
+    """Query builder mocké retournant `rows`"""
+    query = MagicMock()
+    for method in ("or_", "order", "limit", "eq", "select"):
+        getattr(query, method).return_value = query
+    query.execute.return_value.data = rows
+    return query
+
+
+def _rows(start, n):
+    return [{"id": f"s-{i}", "sale_timestamp": f"2026-01-{31 - i:02d}T10:00:00+00:00"} for i in range(start, start + n)]
+
+
+# ============================================
+# TESTS: Curseurs
+# ============================================
+
+def test_cursor_roundtrip_and_binding_to_sort_column():
+    cursor = encode_cursor("sale_timestamp", "2026-01-01T00:00:00+00:00", "s-1")
+
+    assert decode_cursor(cursor, "sale_timestamp") == {
+        "c": "sale_timestamp", "v": "2026-01-01T00:00:00+00:00", "id": "s-1", "d": "next"
+    }
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, "created_at")
+
+
+@pytest.mark.parametrize("cursor", ["pas-un-curseur", "e30", ""])
+def test_invalid_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_keyset_filter_desc_and_asc():
+    assert keyset_filter("sale_timestamp", "2026-01-01", "s-1", desc=True) == (
+        'sale_timestamp.lt."2026-01-01",and(sale_timestamp.eq."2026-01-01",id.lt."s-1")'
+    )
+    assert keyset_filter("total_followers", 5000, "p-1", desc=False) == (
+        'total_followers.gt.5000,and(total_followers.eq.5000,id.gt."p-1"),total_followers.is.null'
+    )
+    assert keyset_filter("view_count", None, "p-1", desc=True) == (
+        'and(view_count.is.null,id.lt."p-1"),view_count.not.is.null'
+    )
+
+
+# ============================================
+# TESTS: paginate_keyset
+# ============================================
+
+def test_first_page_fetches_limit_plus_one_without_offset():
+    query = _query(_rows(0, 4))
+
+    page = paginate_keyset(query, "sale_timestamp", limit=3)
+
+    query.limit.assert_called_once_with(4)
+    query.or_.assert_not_called()
+    assert [r["id"] for r in page["items"]] == ["s-0", "s-1", "s-2"]
+    assert page["has_more"] is True
+    assert page["prev_cursor"] is None
+    assert decode_cursor(page["next_cursor"])["id"] == "s-2"
+
+
+def test_next_page_filters_after_cursor():
+    first = paginate_keyset(_query(_rows(0, 4)), "sale_timestamp", limit=3)
+    query = _query(_rows(3, 2))
+
+    page = paginate_keyset(query, "sale_timestamp", limit=3, cursor=first["next_cursor"])
+
+    filter_arg = query.or_.call_args[0][0]
+    assert filter_arg.startswith("sale_timestamp.lt.")
+    assert 'id.lt."s-2"' in filter_arg
+    assert page["has_more"] is False
+    assert page["next_cursor"] is None
+    assert decode_cursor(page["prev_cursor"])["d"] == "prev"
+
+
+def test_prev_page_scans_in_reverse_and_restores_order():
+    second = paginate_keyset(_query(_rows(3, 3)), "sale_timestamp", limit=3,
+                             cursor=encode_cursor("sale_timestamp", "x", "s-2"))
+    # Le scan inverse renvoie les lignes les plus proches en premier
+    query = _query(list(reversed(_rows(0, 3))))
+
+    page = paginate_keyset(query, "sale_timestamp", limit=3, cursor=second["prev_cursor"])
+
+    query.order.assert_any_call("sale_timestamp", desc=False)
+    assert [r["id"] for r in page["items"]] == ["s-0", "s-1", "s-2"]
+    assert page["prev_cursor"] is None
+    assert page["has_more"] is True
+
+
+# ============================================
+# TESTS: Total mis en cache
+# ============================================
+
+def test_cached_count_queries_once_per_key():
+    keyset_pagination._count_cache.clear()
+    count_query = _query([])
+    count_query.execute.return_value.count = 1234
+    build = MagicMock(return_value=count_query)
+
+    assert cached_count(("sales", "m-1"), build) == 1234
+    assert cached_count(("sales", "m-1"), build) == 1234
+    build.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_get_all_sales_uses_keyset_page():
+    import db_queries_real
+    from utils.identity import invalidate_identity
+
+    keyset_pagination._count_cache.clear()
+    invalidate_identity("u-1")
+    client = MagicMock()
+    for method in ("table", "select", "eq", "single", "or_", "order", "limit"):
+        getattr(client, method).return_value = client
+    sales = [{"id": "s-1", "sale_timestamp": "2026-01-02", "amount": 100, "products": None}]
+    client.execute.side_effect = [
+        MagicMock(data=[{"id": "m-1"}]),
+        MagicMock(data=sales),
+        MagicMock(count=42),
+    ]
+
+    with patch.object(db_queries_real, "get_supabase_client", return_value=client):
+        result = await db_queries_real.get_all_sales("u-1", "merchant", limit=10)
+
+    client.range.assert_not_called()
+    assert result["sales"][0]["id"] == "s-1"
+    assert result["total"] == 42
+    assert result["has_more"] is False
+
+
+@pytest.mark.asyncio
+async def test_get_all_sales_rejects_invalid_cursor():
+    import db_queries_real
+
+    with pytest.raises(ValueError):
+        await db_queries_real.get_all_sales("u-1", "merchant", cursor="invalide")
+
+
+# ============================================
+# TESTS: iter_keyset (exports)
+# ============================================
+
+def test_iter_keyset_walks_all_pages_with_fresh_queries():
+    queries = [_query(_rows(0, 3)), _query(_rows(2, 2))]
+    factory = MagicMock(side_effect=queries)
+
+    rows = keyset_pagination.iter_keyset(factory, "sale_timestamp", page_size=2)
+
+    factory.assert_not_called()  # lecture paresseuse
+    assert [r["id"] for r in rows] == ["s-0", "s-1", "s-2", "s-3"]
+    assert factory.call_count == 2
+    queries[1].or_.assert_called_once()
+
+
+@pytest.mark.parametrize("exporter", ["iter_sales_for_export", "iter_commissions_for_export"])
+def test_unscoped_exports_are_admin_only(exporter):
+    import db_queries_real
+
+    client = MagicMock()
+    with patch.object(db_queries_real, "get_supabase_client", return_value=client):
+        with pytest.raises(PermissionError):
+            getattr(db_queries_real, exporter)("u-1", "commercial")
+        getattr(db_queries_real, exporter)("u-1", "admin")  # Plateforme entière, lecture paresseuse
+
+    client.table.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_export_endpoint_scopes_merchant_token_by_subject():
+    """Token marchand (claim sub): export de ses propres ventes, pas de 404"""
+    server_complete = pytest.importorskip("server_complete")
+    import httpx
+    import jwt
+    import db_queries_real
+    from utils.identity import invalidate_identity
+
+    tables = {}
+
+    def table(name):
+        query = tables.setdefault(name, _query([]))
+        query.execute.return_value.data = [{"id": "m-7"}] if name == "merchants" else []
+        return query
+
+    client = MagicMock()
+    client.table.side_effect = table
+    token = jwt.encode(
+        {"sub": "user-7", "email": "shop@mail.ma", "role": "merchant"},
+        server_complete.JWT_SECRET,
+        algorithm=server_complete.JWT_ALGORITHM,
+    )
+
+    invalidate_identity("user-7")
+    try:
+        with patch.object(db_queries_real, "get_supabase_client", return_value=client):
+            transport = httpx.ASGITransport(app=server_complete.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                response = await http.get(
+                    "/api/reports/export/sales", headers={"Authorization": f"Bearer {token}"}
+                )
+    finally:
+        invalidate_identity("user-7")
+
+    assert response.status_code == 200
+    tables["merchants"].eq.assert_called_with("user_id", "user-7")
+    tables["sales"].eq.assert_any_call("merchant_id", "m-7")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("module_name, search", [
+    ("influencers_directory_endpoints", "search_influencers"),
+    ("commercials_directory_endpoints", "search_commercials"),
+])
+@pytest.mark.parametrize("sort_by", ["id.gt.0),(role", "password_hash"])
+async def test_directory_search_rejects_unlisted_sort_column(module_name, search, sort_by):
+    """sort_by hors liste blanche: 400 avant toute requête (injection dans or_)"""
+    from fastapi import HTTPException
+
+    module = pytest.importorskip(module_name)
+    client = MagicMock()
+    with patch.object(module, "supabase", client):
+        with pytest.raises(HTTPException) as exc:
+            await getattr(module, search)(sort_by=sort_by, sort_order="desc", cursor="e30")
+
+    assert exc.value.status_code == 400
+    client.from_.assert_not_called()
@@ -0,0 +1,231 @@
+"""
+Tests pour le registre de réservations des dépôts (LeadService)
+"""
+
+import pytest
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+from services.lead_service import LeadService
+
+
+def make_client(rpc_results=None):
+    """Client Supabase factice: résultats RPC par nom, requêtes table enregistrées"""
+    client = MagicMock()
+    client.rpc_calls = []
+    client.inserts = []
+
+    def rpc(name, params):
+        client.rpc_calls.append((name, params))
+        call = MagicMock()
+        result = (rpc_results or {}).get(name)
+        call.execute.return_value = MagicMock(data=result(params) if callable(result) else result)
+        return call
+
+    def table(name):
+        query = MagicMock()
+        for method in ("select", "eq", "order", "limit", "single", "update", "in_"):
+            getattr(query, method).return_value = query
+
+        def insert(rows):
+            client.inserts.append((name, rows))
+            query.execute.return_value = MagicMock(data=rows if isinstance(rows, list) else [rows])
+            return query
+
+        query.insert.side_effect = insert
+        query.execute.return_value = MagicMock(data=None)
+        return query
+
+    client.rpc.side_effect = rpc
+    client.table.side_effect = table
+    return client
+
+
+def reserve_all(params):
+    return [
+        {"success": True, "lead_id": r["lead_id"], "deposit_id": "dep-1", "available_balance": 1000}
+        for r in params["p_reservations"]
+    ]
+
+
+class TestCreateLead:
+    def test_reserves_atomically_before_insert(self):
+        client = make_client({"reserve_deposit_amounts": reserve_all})
+        service = LeadService(client)
+
+        lead = service.create_lead(
+            campaign_id="camp-1", merchant_id="m-1", influencer_id="inf-1",
+            estimated_value=Decimal("500")
+        )
+
+        name, params = client.rpc_calls[0]
+        assert name == "reserve_deposit_amounts"
+        assert params["p_reservations"][0]["lead_id"] == lead["id"]
+        assert params["p_reservations"][0]["amount"] == 50.0  # 10% sous 800 dhs
+        # Aucune lecture/écriture de company_deposits côté application
+        assert "company_deposits" not in [c.args[0] for c in client.table.call_args_list]
+
+    def test_insufficient_balance_raises(self):
+        client = make_client({"reserve_deposit_amounts": lambda p: [
+            {"success": False, "error": "insufficient_balance"}
+        ]})
+        service = LeadService(client)
+
+        with pytest.raises(ValueError, match="Solde du dépôt insuffisant"):
+            service.create_lead(
+                campaign_id="camp-1", merchant_id="m-1", influencer_id="inf-1",
+                estimated_value=Decimal("500")
+            )
+        assert client.inserts == []
+
+
+class TestSettlement:
+    def test_validate_deducts_through_ledger(self):
+        settled = {
+            "success": True, "deposit_id": "dep-1", "campaign_id": "camp-1",
+            "current_balance": 920, "alert_threshold": 500
+        }
+        client = make_client({"settle_deposit_reservation": settled})
+        service = LeadService(client)
+        service.supabase.table = MagicMock()
+        lead_query = service.supabase.table.return_value
+        for method in ("select", "eq", "single", "update", "insert"):
+            getattr(lead_query, method).return_value = lead_query
+        lead = {
+            "id": "lead-1", "merchant_id": "m-1", "campaign_id": "camp-1",
+            "status": "pending", "commission_amount": 80
+        }
+        lead_query.execute.side_effect = [
+            MagicMock(data=lead), MagicMock(data=[{**lead, "status": "validated"}]), MagicMock(data=[])
+        ]
+        service._check_deposit_balance = MagicMock()
+
+        service.validate_lead("lead-1", "m-1", "user-1", "validated")
+
+        name, params = client.rpc_calls[0]
+        assert name == "settle_deposit_reservation"
+        assert params["p_action"] == "deduct"
+        service._check_deposit_balance.assert_called_once_with("dep-1", "m-1", settled)
+
+    def test_settle_error_leaves_lead_pending_without_legacy_deduction(self):
+        """Erreur transitoire ou refus du registre: pas de repli lecture/écriture"""
+        for outcome in (ConnectionError("timeout"), {"success": False, "error": "deposit_locked"}):
+            client = make_client()
+            call = MagicMock()
+            if isinstance(outcome, Exception):
+                call.execute.side_effect = outcome
+            else:
+                call.execute.return_value = MagicMock(data=outcome)
+            client.rpc.side_effect = lambda name, params: call
+            service = LeadService(client)
+            service.supabase.table = MagicMock()
+            lead_query = service.supabase.table.return_value
+            for method in ("select", "eq", "single", "update", "insert"):
+                getattr(lead_query, method).return_value = lead_query
+            lead_query.execute.return_value = MagicMock(data={
+                "id": "lead-1", "merchant_id": "m-1", "campaign_id": "camp-1",
+                "status": "pending", "commission_amount": 80
+            })
+            service._deduct_from_deposit = MagicMock()
+
+            with pytest.raises(Exception):
+                service.validate_lead("lead-1", "m-1", "user-1", "validated")
+
+            lead_query.update.assert_not_called()
+            service._deduct_from_deposit.assert_not_called()
+
+    def _lead_service(self, client, status):
+        service = LeadService(client)
+        service.supabase.table = MagicMock()
+        lead_query = service.supabase.table.return_value
+        for method in ("select", "eq", "single", "update", "insert"):
+            getattr(lead_query, method).return_value = lead_query
+        lead_query.execute.return_value = MagicMock(data={
+            "id": "lead-1", "merchant_id": "m-1", "campaign_id": "camp-1",
+            "status": status, "commission_amount": 80
+        })
+        service._deduct_from_deposit = MagicMock()
+        return service, lead_query
+
+    def test_validate_refuses_released_reservation(self):
+        """Lead expiré (réservation libérée) puis validé: refus, pas de validation sans débit"""
+        client = make_client({"settle_deposit_reservation": {
+            "success": False, "error": "settlement_conflict", "status": "released"
+        }})
+        service, lead_query = self._lead_service(client, "pending")
+
+        with pytest.raises(ValueError, match="déjà soldée"):
+            service.validate_lead("lead-1", "m-1", "user-1", "validated")
+
+        lead_query.update.assert_not_called()
+        service._deduct_from_deposit.assert_not_called()
+
+    @pytest.mark.parametrize("previous, status", [
+        ("lost", "validated"),
+        ("rejected", "validated"),
+        ("validated", "validated"),
+        ("validated", "rejected"),
+    ])
+    def test_validate_refuses_processed_leads(self, previous, status):
+        client = make_client()
+        service, lead_query = self._lead_service(client, previous)
+
+        with pytest.raises(ValueError, match="Lead déjà traité"):
+            service.validate_lead("lead-1", "m-1", "user-1", status)
+
+        assert client.rpc_calls == []
+        lead_query.update.assert_not_called()
+
+    def test_convert_validated_lead_does_not_settle_again(self):
+        client = make_client()
+        service, lead_query = self._lead_service(client, "validated")
+        lead_query.execute.side_effect = [
+            MagicMock(data={"id": "lead-1", "merchant_id": "m-1", "campaign_id": "camp-1",
+                            "status": "validated", "commission_amount": 80}),
+            MagicMock(data=[{"id": "lead-1", "status": "converted"}]),
+            MagicMock(data=[]),
+        ]
+
+        service.validate_lead("lead-1", "m-1", "user-1", "converted")
+
+        assert client.rpc_calls == []
+        service._deduct_from_deposit.assert_not_called()
+        lead_query.eq.assert_any_call("status", "validated")
+
+    def test_release_falls_back_for_legacy_leads(self):
+        client = make_client({"settle_deposit_reservation": {
+            "success": False, "error": "reservation_not_found"
+        }})
+        service = LeadService(client)
+        service._get_active_deposit = MagicMock(return_value={"id": "dep-1"})
+        service._release_reserved_amount = MagicMock()
+
+        assert service.release_lead_reservation({
+            "id": "lead-1", "merchant_id": "m-1", "campaign_id": "camp-1", "commission_amount": 80
+        })
+        service._release_reserved_amount.assert_called_once_with("dep-1", Decimal("80"))
+
+
+class TestBatch:
+    def test_batch_uses_one_reservation_call_and_one_insert(self):
+        client = make_client({"reserve_deposit_amounts": lambda p: [
+            {"success": True} if i % 2 == 0 else {"success": False, "error": "insufficient_balance"}
+            for i, _ in enumerate(p["p_reservations"])
+        ]})
+        service = LeadService(client)
+        service._get_campaign_settings = MagicMock(return_value=None)
+        service._get_agreement = MagicMock(return_value=None)
+
+        result = service.create_leads_batch([
+            {"campaign_id": "camp-1", "merchant_id": "m-1", "influencer_id": "inf-1",
+             "estimated_value": Decimal("500")}
+            for _ in range(4)
+        ] + [{"campaign_id": "camp-1", "merchant_id": "m-1", "estimated_value": Decimal("500")}])
+
+        assert [name for name, _ in client.rpc_calls] == ["reserve_deposit_amounts"]
+        assert len(client.inserts) == 1 and len(client.inserts[0][1]) == 2
+        assert len(result["created"]) == 2
+        assert sorted(f["index"] for f in result["failed"]) == [1, 3, 4]
+        # Paramètres et accord lus une seule fois pour le lot
+        service._get_campaign_settings.assert_called_once()
+        service._get_agreement.assert_called_once()
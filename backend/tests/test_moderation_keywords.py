@@ -0,0 +1,114 @@
+"""
+Tests pour le filtrage par mots-clés de la modération (utils.keyword_matcher)
+"""
+
+import json
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+import moderation_service
+from utils.keyword_matcher import KeywordMatcher
+
+
+@pytest.fixture(autouse=True)
+def default_keywords():
+    moderation_service.reload_prohibited_keywords(
+        moderation_service.PROHIBITED_KEYWORDS, moderation_service.INSTANT_REJECT_KEYWORDS
+    )
+    yield
+    moderation_service.reload_prohibited_keywords(
+        moderation_service.PROHIBITED_KEYWORDS, moderation_service.INSTANT_REJECT_KEYWORDS
+    )
+
+
+def test_matches_whole_words_across_accents_inflections_and_scripts():
+    matcher = KeywordMatcher(moderation_service.PROHIBITED_KEYWORDS)
+
+    # Plus de faux positifs à l'intérieur des mots
+    assert matcher.find("Parfum charme oriental, brochette de poulet") == {}
+    assert matcher.find("Armes blanches et CANNABIS") == {
+        "weapons": ["arme"], "drugs": ["cannabis"]
+    }
+    assert matcher.find("Héroine pure, livraison rapide") == {"drugs": ["héroïne"]}
+    assert matcher.find("Vidéo ÉROTIQUES")["adult_content"] == ["érotique"]
+    assert matcher.find("Sextoy vibrant discret")["adult_content"] == ["sex toy", "vibr*"]
+    assert matcher.find("Jeux d’argent en ligne") == {"gambling": ["jeux d'argent"]}
+    # Arabe: article, hamza et harakat ignorés
+    assert matcher.find("الحَشِيش متوفر") == {"drugs": ["حشيش"]}
+    assert matcher.find("محتوى إباحـي")["adult_content"] == ["إباحي*"]
+
+
+@pytest.mark.parametrize("text, category, keyword", [
+    ("DVD porno", "adult_content", "porn*"),
+    ("Accès site pornographique", "adult_content", "porn*"),
+    ("Pornographie amateur", "adult_content", "porn*"),
+    ("Stimulant sexuellement explicite", "adult_content", "sexuel*"),
+    ("Service d'escorting VIP", "adult_content", "escort*"),
+    ("أفلام إباحية", "adult_content", "إباحي*"),
+    ("الإباحية", "adult_content", "إباحي*"),
+    ("Vente d'armement", "weapons", "armement"),
+    ("شهادة مزورة", "counterfeit", "مزور*"),
+    ("Windows cracked edition", "illegal_services", "cracked"),
+])
+def test_stems_keep_derived_forms_caught_by_substring_search(text, category, keyword):
+    matcher = KeywordMatcher(moderation_service.PROHIBITED_KEYWORDS)
+
+    assert keyword in matcher.find(text).get(category, [])
+
+
+@pytest.mark.parametrize("text", ["DVD porno", "site pornographique", "escorting de luxe"])
+def test_instant_reject_keeps_derived_forms(text):
+    assert moderation_service.quick_check_prohibited_keywords(text) is True
+    flags = moderation_service.moderate_product_keywords(text, "")
+    assert flags["flags"]
+
+
+def test_reports_every_overlapping_category_hit():
+    matcher = KeywordMatcher({"counterfeit": ["faux", "faux passeport"], "documents": ["passeport"]})
+
+    assert matcher.find("Vente faux passeports") == {
+        "counterfeit": ["faux", "faux passeport"], "documents": ["passeport"]
+    }
+    assert matcher.contains_any("passe-port") is False
+
+
+def test_screen_products_bulk_and_hot_reload_from_file(tmp_path):
+    products = [
+        {"name": "Tajine en terre cuite", "description": "Fait main à Safi"},
+        {"name": "Pistolet à billes", "description": "Jouet"},
+        {"name": "Coffret poker", "description": "Jetons et cartes"},
+    ]
+    results = moderation_service.screen_products(products)
+    assert [r["approved"] for r in results] == [True, False, False]
+    assert [r["instant_reject"] for r in results] == [False, True, False]
+    assert results[2]["flags"] == ["gambling"]
+
+    keywords_file = tmp_path / "keywords.json"
+    keywords_file.write_text(json.dumps({"prohibited": {"alcohol": ["mahia"]}, "instant_reject": ["mahia"]}))
+    with patch.object(moderation_service, "MODERATION_KEYWORDS_FILE", str(keywords_file)), \
+            patch.object(moderation_service, "MODERATION_KEYWORDS_RELOAD_INTERVAL", 0):
+        assert moderation_service.quick_check_prohibited_keywords("Mahia artisanale") is True
+        assert moderation_service.quick_check_prohibited_keywords("Pistolet") is False
+
+        keywords_file.write_text("{invalide")
+        # Fichier invalide: les listes en cours sont conservées
+        moderation_service._keywords_file_mtime = None
+        assert moderation_service.quick_check_prohibited_keywords("Mahia") is True
+
+
+@pytest.mark.asyncio
+async def test_instant_reject_skips_paid_ai_call():
+    ai = AsyncMock()
+    with patch.object(moderation_service, "client", object()), \
+            patch.object(moderation_service, "moderate_product_with_ai", ai):
+        result = await moderation_service.moderate_product("Cocaïne", "Qualité premium")
+        assert result["approved"] is False
+        assert result["moderation_method"] == "keywords_prescreen"
+        assert result["flags"] == ["drugs"]
+        ai.assert_not_called()
+
+        ai.return_value = {"approved": True, "flags": []}
+        result = await moderation_service.moderate_product("Couteau de cuisine", "Acier inoxydable")
+        assert result["moderation_method"] == "ai"
+        ai.assert_awaited_once()
@@ -0,0 +1,211 @@
+"""
+Tests pour la file de modération IA (services.moderation_queue)
+"""
+
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import moderation_service
+from services.moderation_queue import ModerationQueue
+
+
+def product(i, **extra):
+    return {"name": f"Produit {i}", "description": f"Description {i}", **extra}
+
+
+class FakeProvider:
+    """call_batch factice: compte les lots et la concurrence maximale"""
+
+    def __init__(self, delay=0.01, drop=()):
+        self.delay = delay
+        self.drop = set(drop)
+        self.batches = []
+        self.active = 0
+        self.max_active = 0
+
+    async def __call__(self, products):
+        self.batches.append([p["name"] for p in products])
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(self.delay)
+        self.active -= 1
+        return [
+            None if p["name"] in self.drop
+            else {"approved": True, "confidence": 0.9, "risk_level": "low", "flags": [], "name": p["name"]}
+            for p in products
+        ]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_batches_with_bounded_concurrency():
+    provider = FakeProvider()
+    queue = ModerationQueue(provider, batch_size=5, batch_wait_ms=5, max_concurrency=2)
+
+    verdicts = await asyncio.gather(*(queue.moderate(product(i)) for i in range(20)))
+
+    assert [v["name"] for v in verdicts] == [f"Produit {i}" for i in range(20)]
+    assert len(provider.batches) == 4
+    assert all(len(batch) == 5 for batch in provider.batches)
+    assert provider.max_active == 2
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_identical_content_is_cached_and_coalesced():
+    provider = FakeProvider()
+    queue = ModerationQueue(provider, batch_size=10, batch_wait_ms=5)
+
+    # Même contenu, casse et espaces différents: un seul produit envoyé
+    first, second = await asyncio.gather(
+        queue.moderate(product(1)),
+        queue.moderate({"name": "  PRODUIT 1", "description": "description   1"}),
+    )
+    assert first == second
+    assert await queue.moderate(product(1)) == first
+    assert queue.cached_verdict(product(1)) == first
+
+    assert provider.batches == [["Produit 1"]]
+    stats = queue.get_stats()
+    assert (stats["coalesced"], stats["cache_hits"]) == (1, 1)
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_missing_verdicts_and_failed_batches_are_not_cached():
+    provider = FakeProvider(drop={"Produit 2"})
+    queue = ModerationQueue(provider, batch_size=10, batch_wait_ms=5)
+
+    ok, missing = await asyncio.gather(
+        queue.moderate(product(1)), queue.moderate(product(2)), return_exceptions=True
+    )
+    assert ok["approved"] is True
+    assert isinstance(missing, ValueError)
+    assert queue.cached_verdict(product(2)) is None
+
+    failing = ModerationQueue(AsyncMock(side_effect=RuntimeError("503")), batch_wait_ms=0)
+    with pytest.raises(RuntimeError):
+        await failing.moderate(product(3))
+    assert failing.get_stats()["errors"] == 1
+    await queue.stop()
+    await failing.stop()
+
+
+@pytest.mark.asyncio
+async def test_stop_fails_requests_still_waiting():
+    provider = FakeProvider(delay=10)
+    queue = ModerationQueue(provider, batch_wait_ms=0)
+
+    waiting = asyncio.ensure_future(queue.moderate(product(1)))
+    await asyncio.sleep(0.01)
+    await queue.stop(timeout=0.05)
+
+    with pytest.raises(RuntimeError):
+        await asyncio.wait_for(waiting, 1)
+    assert queue.get_stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_product_creation_returns_pending_review_and_saves_verdict_later():
+    provider = FakeProvider(delay=0.05)
+    queue = ModerationQueue(provider, batch_wait_ms=0)
+    saved = []
+
+    with patch.object(moderation_service, "client", object()), \
+            patch.object(moderation_service, "moderation_queue", queue), \
+            patch.object(moderation_service, "_save_moderation", lambda *args: saved.append(args[-1])):
+        result = await moderation_service.submit_product_moderation(
+            "p-1", "m-1", "u-1", "Tapis berbère", "Laine naturelle"
+        )
+        assert result["status"] == "pending_review"
+        assert saved == []  # Rien n'attend la base ni le modèle dans la requête
+
+        await moderation_service.stop_moderation()
+        # Produit marqué pending_review, puis verdict enregistré
+        assert saved[0] is None
+        assert saved[1]["approved"] is True
+        assert saved[1]["moderation_method"] == "ai"
+
+        # Même contenu: verdict en cache, réponse immédiate
+        again = await moderation_service.submit_product_moderation(
+            "p-2", "m-1", "u-1", "Tapis berbère", "Laine naturelle"
+        )
+        assert again["status"] == "approved"
+        assert len(provider.batches) == 1
+
+
+def test_claim_stale_pending_resubmits_each_product_once():
+    """Réservation conditionnelle: un produit déjà repris par un autre worker est ignoré"""
+    stale = [
+        {"id": "p-1", "merchant_id": "m-1", "name": "A", "description": "a", "merchants": {"user_id": "u-1"}},
+        {"id": "p-2", "merchant_id": "m-1", "name": "B", "description": "b", "merchants": {"user_id": "u-1"}},
+    ]
+    query = MagicMock()
+    for method in ("select", "eq", "lt", "order", "limit", "update"):
+        getattr(query, method).return_value = query
+    query.execute.side_effect = [
+        MagicMock(data=stale),
+        MagicMock(data=[{"id": "p-1"}]),
+        MagicMock(data=[]),  # déjà réservé ailleurs
+    ]
+    supabase = MagicMock()
+    supabase.table.return_value = query
+
+    with patch("supabase_client.get_supabase_client", return_value=supabase):
+        claimed = moderation_service._claim_stale_pending(10)
+
+    assert [p["id"] for p in claimed] == ["p-1"]
+    query.eq.assert_any_call("moderation_status", "pending_review")
+
+
+@pytest.mark.asyncio
+async def test_sweep_resubmits_stale_pending_products():
+    queue = ModerationQueue(FakeProvider(), batch_wait_ms=0)
+    saved = []
+    stale = [{
+        "id": "p-9", "merchant_id": "m-1", "name": "Tapis", "description": "Laine",
+        "images": ["a.jpg"], "merchants": {"user_id": "u-1"}
+    }]
+
+    with patch.object(moderation_service, "client", object()), \
+            patch.object(moderation_service, "moderation_queue", queue), \
+            patch.object(moderation_service, "_claim_stale_pending", lambda limit: stale), \
+            patch.object(moderation_service, "_save_moderation", lambda *args: saved.append(args)):
+        assert await moderation_service.sweep_pending_moderations() == 1
+        await moderation_service.stop_moderation()
+
+    # Pas de nouveau marquage pending_review: seul le verdict est enregistré
+    assert len(saved) == 1
+    product_id, merchant_id, user_id, product_data, result = saved[0]
+    assert (product_id, merchant_id, user_id) == ("p-9", "m-1", "u-1")
+    assert product_data["images_urls"] == ["a.jpg"]
+    assert result["approved"] is True
+
+
+@pytest.mark.asyncio
+async def test_sweeper_stops_with_moderation():
+    with patch.object(moderation_service, "sweep_pending_moderations", AsyncMock(return_value=0)) as sweep:
+        moderation_service.start_moderation_sweeper()
+        await asyncio.sleep(0.01)
+        await moderation_service.stop_moderation()
+
+    sweep.assert_awaited()
+    assert moderation_service._sweeper_task is None
+
+
+@pytest.mark.asyncio
+async def test_batch_call_maps_verdicts_by_id():
+    content = '{"results": [{"id": 1, "approved": false, "flags": ["drugs"]}, {"id": 7, "approved": true}]}'
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(
+        return_value=MagicMock(choices=[MagicMock(message=MagicMock(content=content))])
+    )
+
+    with patch.object(moderation_service, "client", client):
+        verdicts = await moderation_service._moderate_batch_with_ai([product(0), product(1)])
+
+    assert verdicts[0] is None
+    assert verdicts[1]["approved"] is False
+    assert verdicts[1]["risk_level"] == "low"
+    assert "Produit 1" in client.chat.completions.create.call_args.kwargs["messages"][1]["content"]
@@ -0,0 +1,115 @@
+"""
+Tests pour le moteur de rate limiting Lua et le pré-contrôle local
+"""
+
+import os
+
+import pytest
+import redis
+from unittest.mock import AsyncMock, MagicMock, patch
+
+os.environ.setdefault("JWT_SECRET", "test-secret-key-for-rate-limiting-tests")
+
+from middleware import rate_limiting  # noqa: E402
+from middleware.rate_limiting import (  # noqa: E402
+    LocalTokenBucket,
+    LuaRateLimiter,
+    get_endpoint_limits,
+    get_rate_limiter,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _lua_limiter(result=(1, 9, 0), local_precheck=False):
+    client = MagicMock()
+    script = AsyncMock(return_value=list(result))
+    client.register_script.return_value = script
+    limiter = LuaRateLimiter(client=client, local_precheck=local_precheck)
+    return limiter, script
+
+
+# ============================================
+# TESTS: LocalTokenBucket
+# ============================================
+
+def test_local_bucket_rejects_after_capacity_and_refills():
+    clock = FakeClock()
+    bucket = LocalTokenBucket(timer=clock)
+
+    assert [bucket.try_acquire("k", 3, 60) for _ in range(3)] == [0, 0, 0]
+    wait = bucket.try_acquire("k", 3, 60)
+    assert wait == pytest.approx(20.0)
+
+    clock.now += 20
+    assert bucket.try_acquire("k", 3, 60) == 0
+
+
+def test_local_bucket_keys_are_independent():
+    bucket = LocalTokenBucket(timer=FakeClock())
+    bucket.try_acquire("a", 1, 60)
+
+    assert bucket.try_acquire("a", 1, 60) > 0
+    assert bucket.try_acquire("b", 1, 60) == 0
+
+
+# ============================================
+# TESTS: LuaRateLimiter
+# ============================================
+
+@pytest.mark.asyncio
+async def test_lua_limiter_runs_single_script_with_sharded_keys():
+    limiter, script = _lua_limiter(result=(1, 7, 0))
+
+    with patch.object(rate_limiting.time, "time", return_value=125.0):
+        allowed, remaining, retry_after = await limiter.check_rate_limit("ip:1.2.3.4", "/api/x", 10, 60)
+
+    assert (allowed, remaining, retry_after) == (1, 7, 0)
+    script.assert_awaited_once_with(
+        keys=["ratelimit:sw:{/api/x:ip:1.2.3.4}:2", "ratelimit:sw:{/api/x:ip:1.2.3.4}:1"],
+        args=[10, 60, 5.0],
+    )
+
+
+@pytest.mark.asyncio
+async def test_lua_limiter_converts_retry_after_to_seconds():
+    limiter, _ = _lua_limiter(result=(0, 0, 2300))
+
+    assert await limiter.check_rate_limit("u", "/api/x", 10, 60) == (False, 0, 3)
+
+
+@pytest.mark.asyncio
+async def test_lua_limiter_fails_open_on_redis_error():
+    limiter, script = _lua_limiter()
+    script.side_effect = redis.ConnectionError("down")
+
+    assert await limiter.check_rate_limit("u", "/api/x", 10, 60) == (True, 10, 0)
+    assert limiter.stats["redis_errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_local_precheck_rejects_without_redis_hop():
+    limiter, script = _lua_limiter(local_precheck=True)
+
+    results = [await limiter.check_rate_limit("u", "/api/x", 2, 60) for _ in range(3)]
+
+    assert [r[0] for r in results] == [1, 1, False]
+    assert script.await_count == 2
+    assert limiter.stats["local_rejections"] == 1
+
+
+# ============================================
+# TESTS: Sélection du moteur
+# ============================================
+
+def test_engine_is_selectable_per_endpoint():
+    assert get_endpoint_limits("/api/stripe/webhook")["engine"] == "lua"
+    assert get_rate_limiter("lua") is rate_limiting.lua_rate_limiter
+    assert get_rate_limiter("sliding_log") is rate_limiting.rate_limiter
+    assert get_rate_limiter(None) is get_rate_limiter(rate_limiting.RATE_LIMIT_ENGINE)
@@ -0,0 +1,108 @@
+"""
+Tests pour la diffusion groupée de RealtimeAnalytics (ticks, files bornées, snapshots)
+"""
+
+import asyncio
+import json
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from services.realtime_analytics import ConnectionSender, RealtimeAnalytics
+
+
+def make_ws(send_text=None):
+    ws = MagicMock()
+    ws.accept = AsyncMock()
+    ws.send_text = send_text or AsyncMock()
+    return ws
+
+
+def frames(ws):
+    return [json.loads(call.args[0]) for call in ws.send_text.call_args_list]
+
+
+@pytest.mark.asyncio
+async def test_updates_are_coalesced_into_one_frame_per_tick():
+    analytics = RealtimeAnalytics(tick=3600)
+    viewers = [make_ws() for _ in range(3)]
+    for i, ws in enumerate(viewers):
+        await analytics.connect(ws, f"admin-{i}", "admin")
+
+    for count in range(100):
+        await analytics.broadcast_metric('active_users', count, 'admin')
+    await analytics.broadcast_metric('new_sale', {'amount': 10}, 'admin')
+    await analytics.broadcast_metric('new_sale', {'amount': 20}, 'admin')
+    await analytics.flush_broadcasts()
+    await asyncio.sleep(0.01)
+
+    sent = [call.args[0] for ws in viewers for call in ws.send_text.call_args_list[1:]]
+    assert len(sent) == 3
+    assert sent[0] is sent[1] is sent[2]  # sérialisé une seule fois
+    batch = json.loads(sent[0])
+    assert batch['type'] == 'metrics_batch'
+    assert batch['updates'] == [
+        {'metric': 'active_users', 'value': 99},
+        {'metric': 'new_sale', 'value': {'amount': 10}},
+        {'metric': 'new_sale', 'value': {'amount': 20}},
+    ]
+    await analytics.stop()
+
+
+@pytest.mark.asyncio
+async def test_slow_client_does_not_stall_others_and_is_resynced():
+    analytics = RealtimeAnalytics(tick=3600)
+    blocked = asyncio.Event()
+
+    async def hang(frame):
+        await blocked.wait()
+
+    slow, fast = make_ws(AsyncMock(side_effect=hang)), make_ws()
+    await analytics.connect(slow, "slow", "general")
+    await analytics.connect(fast, "fast", "general")
+    analytics.active_connections["general"][slow].maxsize = 2
+
+    for i in range(5):
+        await analytics.broadcast_metric('alert', {'n': i})
+        await analytics.flush_broadcasts()
+        await asyncio.sleep(0.01)
+
+    assert len(fast.send_text.call_args_list) == 6  # snapshot + 5 trames
+    sender = analytics.active_connections["general"][slow]
+    assert sender.needs_snapshot and sender.dropped_frames > 0
+
+    await analytics.flush_broadcasts()
+    assert not sender.needs_snapshot
+    assert json.loads(sender._frames[-1])['type'] == 'snapshot'
+    blocked.set()
+    await analytics.stop()
+
+
+@pytest.mark.asyncio
+async def test_failed_send_removes_connection():
+    analytics = RealtimeAnalytics(tick=3600)
+    broken = make_ws(AsyncMock(side_effect=RuntimeError("closed")))
+    await analytics.connect(broken, "u", "general")
+    await asyncio.sleep(0.01)
+
+    assert broken not in analytics.active_connections["general"]
+    await analytics.stop()
+
+
+@pytest.mark.asyncio
+async def test_events_are_capped_per_frame():
+    sender = ConnectionSender(make_ws(), maxsize=4)
+    analytics = RealtimeAnalytics(tick=3600)
+    analytics.active_connections["general"][sender.websocket] = sender
+    sender.start()
+
+    for i in range(80):
+        await analytics.broadcast_metric('new_sale', {'n': i})
+    await analytics.flush_broadcasts()
+    await asyncio.sleep(0.01)
+
+    batch = frames(sender.websocket)[0]
+    assert len(batch['updates']) == 50
+    assert batch['updates'][0]['value'] == {'n': 30}
+    assert batch['dropped'] == 30
+    await analytics.stop()
@@ -0,0 +1,175 @@
+"""
+Tests pour le bus d'événements temps réel (services.realtime_events)
+"""
+
+import asyncio
+import json
+
+import pytest
+import redis
+from unittest.mock import AsyncMock, MagicMock
+
+from services.realtime_events import EventTypes, RealtimeEventBus
+
+
+def make_bus(raw_results=None, error=None):
+    """Bus avec clients Redis factices (script Lua et backlog simulés)"""
+    client = MagicMock()
+    pipe = client.pipeline.return_value
+    if error:
+        pipe.execute.side_effect = error
+    else:
+        pipe.execute.return_value = raw_results or []
+    async_client = MagicMock()
+    async_client.zrangebyscore = AsyncMock(side_effect=redis.ConnectionError("down"))
+    async_client.get = AsyncMock(side_effect=redis.ConnectionError("down"))
+    bus = RealtimeEventBus(client=client, async_client=async_client, backlog_size=3)
+    return bus, client
+
+
+def test_publish_many_runs_one_pipeline_with_user_scoped_keys():
+    raw = [
+        json.dumps({"seq": 7, "user_id": "u1", "type": "a", "data": {}, "timestamp": "t"}),
+        json.dumps({"seq": 1, "user_id": "u2", "type": "b", "data": {}, "timestamp": "t"}),
+    ]
+    bus, client = make_bus(raw_results=raw)
+    script = client.register_script.return_value
+
+    events = bus.publish_many([("u1", "a", {}), ("u2", "b", {}), (None, "c", {})])
+
+    assert [e["seq"] for e in events] == [7, 1]
+    client.pipeline.assert_called_once()
+    assert script.call_count == 2  # événement sans utilisateur ignoré
+    keys = script.call_args_list[0].kwargs["keys"]
+    assert keys == ["realtime:{u1}:seq", "realtime:{u1}:backlog"]
+
+
+@pytest.mark.asyncio
+async def test_local_fallback_sequences_and_replay():
+    bus, _ = make_bus(error=redis.ConnectionError("down"))
+
+    for i in range(5):
+        bus.publish("u1", EventTypes.COMMISSION_CREATED, {"i": i})
+    bus.publish("u2", EventTypes.PAYMENT_CREATED, {})
+
+    events, complete = await bus.replay("u1", 3)
+    assert [e["seq"] for e in events] == [4, 5]
+    assert complete
+
+    # Backlog de 3 événements: seq 2 est perdu pour un client resté à 1
+    events, complete = await bus.replay("u1", 1)
+    assert [e["seq"] for e in events] == [3, 4, 5]
+    assert not complete
+
+    events, _ = await bus.replay("u2", 0)
+    assert [e["seq"] for e in events] == [1]
+
+
+@pytest.mark.asyncio
+async def test_dispatch_routes_by_user():
+    bus, _ = make_bus(error=redis.ConnectionError("down"))
+    received = {"u1": [], "u2": []}
+
+    async def on_u1(event):
+        received["u1"].append(event["type"])
+
+    async def on_u2(event):
+        received["u2"].append(event["type"])
+
+    bus.subscribe("u1", on_u1)
+    bus.subscribe("u2", on_u2)
+    bus._loop = asyncio.get_running_loop()
+
+    bus.publish("u1", EventTypes.COMMISSION_CREATED, {"amount": 10})
+    bus.unsubscribe("u2", on_u2)
+    bus.publish("u2", EventTypes.PAYMENT_STATUS_CHANGED, {})
+    await asyncio.sleep(0.01)
+
+    assert received == {"u1": [EventTypes.COMMISSION_CREATED], "u2": []}
+
+
+@pytest.mark.asyncio
+async def test_local_fallback_continues_after_redis_sequence():
+    raw = [json.dumps({"seq": 41, "user_id": "u1", "type": "a", "data": {}, "timestamp": "t"})]
+    bus, client = make_bus(raw_results=raw)
+    script = client.register_script.return_value
+
+    async def on_u1(event):
+        pass
+
+    bus.subscribe("u1", on_u1)
+    bus.publish("u1", "a", {})
+
+    client.pipeline.return_value.execute.side_effect = redis.ConnectionError("down")
+    local = bus.publish("u1", "b", {})
+    assert local["seq"] == 42  # Pas de collision avec les seq Redis déjà livrés
+
+    # Redis revenu: la séquence repart au-dessus des seq locaux
+    client.pipeline.return_value.execute.side_effect = None
+    bus.publish("u1", "c", {})
+    assert script.call_args.kwargs["args"][4] == 42
+    assert await bus.current_seq("u1") == 42
+
+
+@pytest.mark.asyncio
+async def test_client_connection_starts_from_sequence_and_orders_live_events(monkeypatch):
+    pytest.importorskip("aiohttp")
+    pytest.importorskip("aiohttp_cors")
+    import websocket_server
+    from websocket_server import ClientConnection
+
+    bus, _ = make_bus(error=redis.ConnectionError("down"))
+    monkeypatch.setattr(websocket_server, "realtime_bus", bus)
+    for i in range(3):
+        bus.publish("u1", "old", {"i": i})
+
+    ws = MagicMock()
+    ws.send_json = AsyncMock()
+    connection = ClientConnection(ws, await bus.current_seq("u1"))
+
+    # Reçu pendant le rejeu: retenu, puis envoyé une seule fois dans l'ordre
+    live = bus.publish("u1", "live", {})
+    await connection.send(live)
+    await connection.replay("u1")
+    await connection.send(live)
+
+    sent = [call.args[0] for call in ws.send_json.call_args_list]
+    assert [(m["type"], m["seq"]) for m in sent] == [("live", 4)]  # Pas de backlog pour un nouveau client
+
+
+@pytest.mark.asyncio
+async def test_websocket_auth_takes_user_from_verified_token(monkeypatch):
+    """Un user_id envoyé sans token valide ne donne accès à aucun backlog"""
+    pytest.importorskip("aiohttp")
+    pytest.importorskip("aiohttp_cors")
+    import jwt
+    from aiohttp import web
+    from aiohttp.test_utils import TestClient, TestServer
+    import websocket_server
+
+    bus, _ = make_bus(error=redis.ConnectionError("down"))
+    monkeypatch.setattr(websocket_server, "realtime_bus", bus)
+    bus.publish("victim", EventTypes.PAYMENT_STATUS_CHANGED, {"amount": 500})
+    bus.publish("u1", EventTypes.COMMISSION_CREATED, {"amount": 12})
+
+    app = web.Application()
+    app.router.add_get("/ws", websocket_server.websocket_handler)
+    forged = jwt.encode({"sub": "victim"}, "forged-signing-key-not-used-by-this-api", algorithm="HS256")
+    valid = jwt.encode({"sub": "u1"}, websocket_server.JWT_SECRET, algorithm=websocket_server.JWT_ALGORITHM)
+
+    async with TestClient(TestServer(app)) as http:
+        for auth in ({"user_id": "victim"}, {"user_id": "victim", "token": forged}):
+            ws = await http.ws_connect("/ws")
+            await ws.send_json({"type": "auth", "last_seq": 0, **auth})
+            assert (await ws.receive_json(timeout=1))["type"] == "auth_error"
+            await ws.close()
+
+        ws = await http.ws_connect("/ws")
+        await ws.send_json({"type": "auth", "token": valid, "user_id": "victim", "last_seq": 0})
+        assert (await ws.receive_json(timeout=1))["type"] == "auth_success"
+        replayed = await ws.receive_json(timeout=1)
+        await ws.close()
+
+    assert replayed["type"] == EventTypes.COMMISSION_CREATED
+    assert replayed["data"] == {"amount": 12}
+    assert "victim" not in websocket_server.connected_clients
@@ -0,0 +1,85 @@
+"""
+Tests pour les exports en streaming de ReportGenerator
+"""
+
+import csv
+import io
+import json
+import tracemalloc
+
+import openpyxl
+import pytest
+
+from services.report_generator import ReportFormat, ReportGenerator, ReportType
+
+
+def _commissions(n, consumed=None):
+    for i in range(n):
+        if consumed is not None:
+            consumed.append(i)
+        yield {"id": f"c-{i}", "amount": float(i), "status": "paid", "created_at": f"2026-01-01T00:00:{i % 60:02d}"}
+
+
+@pytest.fixture
+def generator():
+    return ReportGenerator()
+
+
+def test_csv_header_is_sent_before_reading_rows(generator):
+    consumed = []
+    export = generator.stream_report(
+        ReportType.COMMISSIONS, ReportFormat.CSV, _commissions(10, consumed),
+        fieldnames=["id", "amount", "status", "created_at"]
+    )
+
+    assert next(export["content"]) == b"id,amount,status,created_at\r\n"
+    assert consumed == []
+
+    rows = list(csv.DictReader(io.StringIO(
+        "id,amount,status,created_at\r\n" + b"".join(export["content"]).decode()
+    )))
+    assert len(rows) == 10
+    assert export["media_type"].startswith("text/csv")
+    assert export["filename"].endswith(".csv")
+
+
+def test_csv_memory_stays_flat_for_large_exports(generator):
+    tracemalloc.start()
+    export = generator.stream_report(ReportType.ANALYTICS, ReportFormat.CSV, _commissions(200_000))
+    total = sum(len(chunk) for chunk in export["content"])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert total > 5_000_000
+    assert peak < 2_000_000
+
+
+def test_ndjson_first_line_is_immediate(generator):
+    export = generator.stream_report(ReportType.COMMISSIONS, ReportFormat.JSON, _commissions(3))
+    chunks = list(export["content"])
+
+    assert json.loads(chunks[0]) == {"id": "c-0", "amount": 0.0, "status": "paid", "created_at": "2026-01-01T00:00:00"}
+    lines = b"".join(chunks).decode().splitlines()
+    assert [json.loads(line)["id"] for line in lines] == ["c-0", "c-1", "c-2"]
+    assert export["media_type"] == "application/x-ndjson"
+
+
+def test_excel_write_only_export(generator):
+    export = generator.stream_report(
+        ReportType.COMMISSIONS, ReportFormat.EXCEL, _commissions(50), user_info={"company_name": "Acme"}
+    )
+    wb = openpyxl.load_workbook(io.BytesIO(b"".join(export["content"])))
+    ws = wb.active
+
+    assert ws["A1"].value == "Rapport COMMISSIONS"
+    assert [c.value for c in ws[5]][:4] == ["Id", "Sale Id", "Amount", "Status"]
+    assert ws.max_row == 5 + 50
+    assert export["filename"].endswith(".xlsx")
+
+
+def test_empty_export_and_unsupported_format(generator):
+    export = generator.stream_report(ReportType.COMMISSIONS, ReportFormat.CSV, iter([]))
+    assert b"".join(export["content"]).startswith(b"id,sale_id,amount,status")
+
+    with pytest.raises(ValueError):
+        generator.stream_report(ReportType.SALES, ReportFormat.PDF, iter([]))
@@ -0,0 +1,37 @@
+"""
+Tests pour l'état des fonctions SQL optionnelles (utils/rpc_fallback)
+"""
+
+from unittest.mock import patch
+
+from postgrest.exceptions import APIError
+
+from utils.rpc_fallback import OptionalRpc, is_missing_function
+
+
+def test_missing_function_detection():
+    """Seules les erreurs « fonction absente » déclenchent le repli"""
+    assert is_missing_function(APIError({"code": "PGRST202", "message": "Could not find the function"}))
+    assert is_missing_function(Exception("function validate_sales_batch does not exist"))
+    assert is_missing_function(APIError({"code": "42883", "message": "undefined function"}))
+    assert not is_missing_function(ConnectionError("timed out"))
+    assert not is_missing_function(APIError({"code": "23505", "message": "duplicate key"}))
+
+
+def test_missing_rpc_is_retried_after_delay_and_transient_errors_keep_state():
+    rpc = OptionalRpc("demo", retry_after=60)
+
+    assert rpc.enabled()
+    assert not rpc.missing(ConnectionError("reset"))
+    assert rpc.available is None and rpc.enabled()
+
+    with patch("utils.rpc_fallback.time.monotonic", return_value=1000.0):
+        assert rpc.missing(Exception("function demo does not exist"))
+        assert not rpc.enabled()
+    with patch("utils.rpc_fallback.time.monotonic", return_value=1061.0):
+        assert rpc.enabled()
+
+    rpc.succeeded()
+    assert rpc.available is True
+    assert not rpc.missing(TimeoutError())
+    assert rpc.available is True
@@ -0,0 +1,116 @@
+"""
+Tests pour les séries temporelles des ventes (graphiques dashboards)
+"""
+
+import pytest
+from datetime import date
+from unittest.mock import MagicMock
+
+import services.sales_timeseries as timeseries
+from services.sales_timeseries import bucket_range, bucket_rows, get_sales_timeseries
+
+
+@pytest.fixture(autouse=True)
+def reset_rpc_flag():
+    """Chaque test repart sans connaissance de la fonction SQL"""
+    timeseries._timeseries_rpc.reset()
+    yield
+    timeseries._timeseries_rpc.reset()
+
+
+@pytest.fixture
+def client():
+    mock = MagicMock()
+    for method in ("table", "select", "gte", "lt", "eq", "order", "range"):
+        getattr(mock, method).return_value = mock
+    mock.execute.return_value.data = []
+    return mock
+
+
+# ============================================
+# TESTS: Buckets
+# ============================================
+
+def test_bucket_range_week_and_month():
+    """Les buckets semaine/mois démarrent au lundi / au 1er"""
+    weeks = bucket_range(date(2026, 1, 1), date(2026, 1, 14), "week")
+    months = bucket_range(date(2025, 11, 15), date(2026, 2, 3), "month")
+
+    assert weeks == [date(2025, 12, 29), date(2026, 1, 5), date(2026, 1, 12)]
+    assert months == [date(2025, 11, 1), date(2025, 12, 1), date(2026, 1, 1), date(2026, 2, 1)]
+
+
+def test_bucket_rows_single_pass_with_empty_days():
+    """Agrégation par jour, jours vides inclus, hors fenêtre ignoré"""
+    rows = [
+        {"created_at": "2026-01-01T09:00:00+00:00", "amount": "100.50", "commission": 10},
+        {"created_at": "2026-01-01T18:00:00", "amount": 50, "commission": None},
+        {"created_at": "2026-01-03T12:00:00", "amount": 20, "commission": 2},
+        {"created_at": "2025-12-20T12:00:00", "amount": 999, "commission": 99},
+    ]
+
+    series = bucket_rows(
+        rows, date(2026, 1, 1), date(2026, 1, 3), "day", value_fields=("amount", "commission")
+    )
+
+    assert [s["count"] for s in series] == [2, 0, 1]
+    assert series[0]["amount"] == 150.5
+    assert series[0]["commission"] == 10
+    assert series[2]["amount"] == 20
+
+
+# ============================================
+# TESTS: get_sales_timeseries
+# ============================================
+
+def test_uses_grouped_rpc_when_available(client):
+    """Une seule RPC groupée, aucune requête par jour"""
+    client.rpc.return_value.execute.return_value.data = [
+        {"bucket": "2026-01-02", "sales_count": 3, "amount_total": "300", "commission_total": "30"}
+    ]
+
+    series = get_sales_timeseries(client, days=3, end=date(2026, 1, 3), merchant_id="m-1")
+
+    assert client.rpc.call_count == 1
+    assert client.rpc.call_args[0][1]["p_merchant_id"] == "m-1"
+    client.table.assert_not_called()
+    assert [s["label"] for s in series] == ["01/01", "02/01", "03/01"]
+    assert series[1]["count"] == 3
+    assert series[1]["amount"] == 300.0
+
+
+def test_falls_back_to_single_range_query(client):
+    """Sans la fonction SQL: une requête de plage pour toute la fenêtre"""
+    client.rpc.side_effect = Exception("function get_sales_timeseries does not exist")
+    client.execute.return_value.data = [
+        {"created_at": "2026-03-15T10:00:00", "amount": 40, "commission": 4},
+    ]
+
+    series = get_sales_timeseries(
+        client, days=90, granularity="month", affiliate_id="u-1", end=date(2026, 3, 31)
+    )
+
+    assert client.table.call_count == 1
+    client.eq.assert_called_once_with("affiliate_id", "u-1")
+    assert [s["label"] for s in series] == ["01/2026", "02/2026", "03/2026"]
+    assert series[-1]["commission"] == 4.0
+
+    # La RPC absente n'est plus retentée avant RPC_RETRY_AFTER
+    get_sales_timeseries(client, days=7, end=date(2026, 3, 31))
+    assert client.rpc.call_count == 1
+
+
+def test_transient_rpc_error_does_not_disable_rpc(client):
+    """Une erreur réseau: repli pour cet appel seulement, la RPC est retentée"""
+    client.rpc.return_value.execute.side_effect = [ConnectionError("timeout"), MagicMock(data=[])]
+
+    get_sales_timeseries(client, days=7, end=date(2026, 3, 31))
+    get_sales_timeseries(client, days=7, end=date(2026, 3, 31))
+
+    assert client.rpc.call_count == 2
+    assert client.table.call_count == 1
+
+
+def test_rejects_unknown_granularity(client):
+    with pytest.raises(ValueError):
+        get_sales_timeseries(client, granularity="hour")
@@ -0,0 +1,138 @@
+"""
+Tests for the embedded product search index (services.search_index)
+"""
+
+from unittest.mock import MagicMock, patch
+
+from services.search_index import EmbeddedSearchIndex, product_document
+
+
+def product(i, name, **extra):
+    row = {
+        "id": f"p-{i}", "name": name, "description": "", "category": "mode", "price": 100,
+        "merchant_id": "m-1", "rating": 4.0,
+        "created_at": f"2026-01-{i:02d}T00:00:00", "updated_at": f"2026-02-{i:02d}T00:00:00",
+    }
+    row.update(extra)
+    return product_document(row)
+
+
+def catalog():
+    index = EmbeddedSearchIndex(snapshot_path=None)
+    index.index_many([
+        product(1, "Tapis berbère en laine", description="Tapis tissé main", price=1200, rating=4.8),
+        product(2, "Babouches en cuir", description="Cuir de Fès", price=250, rating=3.5, category="chaussures"),
+        product(3, "Lampe en cuivre", description="Lampe marocaine ciselée", price=480, rating=4.2,
+                category="maison", tags=["artisanat"]),
+        product(4, "Coussin brodé", description="Coussin pour tapis", price=150, rating=2.0, category="maison"),
+        product(5, "Tapis ancien", price=3000, is_active=False),
+    ])
+    return index
+
+
+def ids(found):
+    return [doc["id"] for doc in found["results"]]
+
+
+def test_bm25_ranks_name_matches_and_handles_accents_prefix_and_typos():
+    index = catalog()
+
+    # Name boosted over description, inactive product excluded
+    assert ids(index.search("tapis")) == ["p-1", "p-4"]
+    # Accents and plural folded
+    assert ids(index.search("BERBERES")) == ["p-1"]
+    # Prefix of a name word (search-as-you-type)
+    assert ids(index.search("babou")) == ["p-2"]
+    # One typo
+    assert ids(index.search("lamep")) == ["p-3"]
+    assert ids(index.search("cuivr")) == ["p-3"]
+    assert index.search("zzzz")["total"] == 0
+
+
+def test_filters_sorting_pagination_and_facets():
+    index = catalog()
+
+    found = index.search("", min_price=200, sort_by="price_asc", page=1, page_size=2)
+    assert ids(found) == ["p-2", "p-3"]
+    assert found["total"] == 3
+    assert ids(index.search("", min_price=200, sort_by="price_asc", page=2, page_size=2)) == ["p-1"]
+
+    assert ids(index.search("", category="maison", sort_by="rating")) == ["p-3", "p-4"]
+    assert ids(index.search("", tags=["artisanat"])) == ["p-3"]
+    assert ids(index.search("", sort_by="newest")) == ["p-4", "p-3", "p-2", "p-1"]
+
+    facets = index.search("")["facets"]
+    assert facets["categories"] == [{"key": "maison", "count": 2}, {"key": "chaussures", "count": 1},
+                                    {"key": "mode", "count": 1}]
+    assert facets["ratings"] == [{"min": 4, "count": 2}, {"min": 3, "count": 3},
+                                 {"min": 2, "count": 4}, {"min": 1, "count": 4}]
+    assert facets["price_ranges"][0] == {"min": 100, "max": 200, "count": 1}
+    assert facets["price_ranges"][-1] == {"min": 1200, "max": 1300, "count": 1}
+    assert len(facets["price_ranges"]) == 12  # Empty buckets in between, like the histogram agg
+    assert facets["price_stats"]["max"] == 1200
+
+
+def test_only_moderated_products_are_active():
+    for status in ("pending_review", "under_review", "rejected"):
+        assert product(6, "Tapis", moderation_status=status)["status"] == "inactive"
+    for status in (None, "approved"):
+        assert product(6, "Tapis", moderation_status=status)["status"] == "active"
+
+
+def test_incremental_updates_and_suggestions():
+    index = catalog()
+
+    index.index(product(2, "Sandales en cuir", price=250, category="chaussures"))
+    assert index.search("babouches")["total"] == 0
+    assert ids(index.search("sandales")) == ["p-2"]
+
+    assert index.delete("p-3") is True
+    assert index.delete("p-3") is False
+    assert index.search("lampe")["total"] == 0
+    assert "lampe" not in index._terms
+    assert len(index) == 4
+
+    # Updated documents keep their slot, deleted slots are reused
+    index.index(product(6, "Lanterne en cuivre", category="maison"))
+    assert len(index._docs) == 5
+    assert ids(index.search("lanterne")) == ["p-6"]
+
+    assert index.suggest("tap") == ["Tapis berbère en laine"]
+    assert index.suggest("SAND") == ["Sandales en cuir"]
+
+
+def test_snapshot_round_trip(tmp_path):
+    index = catalog()
+    index.delete("p-4")
+    path = str(tmp_path / "search" / "index.json")
+    assert index.save_snapshot(path) is True
+
+    restored = EmbeddedSearchIndex.load_snapshot(path)
+    assert len(restored) == 4
+    assert restored.watermark == index.watermark
+    for query in ("tapis", "lamep", "babou", ""):
+        assert restored.search(query) == index.search(query)
+    assert restored.suggest("lam") == ["Lampe en cuivre"]
+
+    # Still incremental after a restore
+    restored.index(product(6, "Lanterne en cuivre", category="maison"))
+    assert sorted(ids(restored.search("cuivre"))) == ["p-3", "p-6"]
+
+    (tmp_path / "bad.json").write_text("{not json")
+    assert EmbeddedSearchIndex.load_snapshot(str(tmp_path / "bad.json")) is None
+    assert EmbeddedSearchIndex.load_snapshot(str(tmp_path / "missing.json")) is None
+
+
+def test_build_from_database_reads_keyset_pages():
+    rows = [
+        {"id": i, "name": f"Produit {i}", "price": i, "merchants": {"company_name": "Atlas Shop"},
+         "updated_at": f"2026-01-01T00:00:{i:02d}"}
+        for i in range(5)
+    ]
+    with patch("utils.keyset_pagination.iter_keyset", return_value=iter(rows)) as iter_keyset:
+        index = EmbeddedSearchIndex.from_database(MagicMock(), page_size=2, snapshot_path=None)
+
+    assert iter_keyset.call_args.kwargs["page_size"] == 2
+    assert len(index) == 5
+    assert index.search("atlas")["total"] == 5
+    assert index.watermark == "2026-01-01T00:00:04"
@@ -0,0 +1,316 @@
+"""
+Tests for the incremental search index sync (services.search_sync)
+"""
+
+import asyncio
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from services.search_index import EmbeddedSearchIndex, product_document
+from services.search_sync import SearchSync, chunked
+
+
+class FakeQuery:
+    def __init__(self, table):
+        self.table = table
+        self.since = None
+
+    def select(self, columns):
+        return self
+
+    def gte(self, column, value):
+        self.since = (column, value)
+        return self
+
+    def upsert(self, row):
+        self.table.upserts.append(row)
+        return self
+
+    def execute(self):
+        return MagicMock(data=[])
+
+
+class FakeTable:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.upserts = []
+
+
+class FakeClient:
+    def __init__(self, **tables):
+        self.tables = {name: FakeTable(rows) for name, rows in tables.items()}
+
+    def table(self, name):
+        return FakeQuery(self.tables.setdefault(name, FakeTable()))
+
+    def rpc(self, name, params):
+        raise Exception(f"function {name} does not exist")
+
+
+def fake_paginate_keyset(query, sort_column, limit, cursor=None, desc=True, id_column="id"):
+    """Ascending (sort_column, id) keyset pages over the fake table"""
+    rows = sorted(query.table.rows, key=lambda row: (str(row[sort_column]), str(row[id_column])))
+    if query.since is not None:
+        rows = [row for row in rows if str(row[sort_column]) >= query.since[1]]
+    if cursor is not None:
+        rows = [row for row in rows if (str(row[sort_column]), str(row[id_column])) > cursor]
+    items = rows[:limit]
+    has_more = len(rows) > limit
+    next_cursor = (str(items[-1][sort_column]), str(items[-1][id_column])) if has_more else None
+    return {"items": items, "next_cursor": next_cursor, "prev_cursor": None, "has_more": has_more}
+
+
+@pytest.fixture(autouse=True)
+def keyset_pages():
+    with patch("services.search_sync.paginate_keyset", side_effect=fake_paginate_keyset):
+        yield
+
+
+def at(minute):
+    return f"2026-10-16T10:{minute:02d}:00"
+
+
+def row(i, minute, **extra):
+    data = {"id": f"p-{i}", "name": f"Produit {i}", "price": 100, "category": "mode",
+            "created_at": at(0), "updated_at": at(minute)}
+    data.update(extra)
+    return data
+
+
+def es_service():
+    service = MagicMock()
+    service.available = True
+    service.local_index = None
+    service.indexes = {"products": "products", "merchants": "merchants", "influencers": "influencers"}
+    service.bulk = AsyncMock(side_effect=lambda actions: (len(actions), []))
+    return service
+
+
+def sync_for(service, client, **options):
+    options = {"page_size": 3, "chunk_size": 2, "retry_backoff": 0, "overlap": 10, **options}
+    return SearchSync(service=service, client=client, **options)
+
+
+def sent(service):
+    return [[action["_id"] for action in call.args[0]] for call in service.bulk.await_args_list]
+
+
+def test_chunked_is_lazy_and_bounded():
+    assert list(chunked(iter(range(5)), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunked([], 3)) == []
+
+
+@pytest.mark.asyncio
+async def test_incremental_sync_streams_chunks_and_advances_watermarks():
+    client = FakeClient(
+        products=[row(i, i) for i in range(1, 6)],
+        merchants=[{"id": "m-1", "company_name": "Atlas", "updated_at": at(2)}],
+        influencers=[{"id": "i-1", "username": "sara", "audience_size": 1200, "updated_at": at(3)}],
+    )
+    service = es_service()
+    sync = sync_for(service, client)
+
+    applied = await sync.sync_once()
+
+    assert applied == {"products": 5, "merchants": 1, "influencers": 1, "deletions": 0}
+    # Pages of 3 rows, bulk requests of at most 2 documents
+    assert sent(service)[:3] == [["p-1", "p-2"], ["p-3"], ["p-4", "p-5"]]
+    influencer = service.bulk.await_args_list[-1].args[0][0]["_source"]
+    assert influencer == {"id": "i-1", "name": "sara", "niche": None, "followers": 1200, "engagement_rate": 0.0}
+    assert sync.watermarks["products"] == at(5)
+    saved = {state["entity"]: state for state in client.tables["search_sync_state"].upserts}
+    assert saved["products"]["watermark"] == at(5)
+    assert saved["products"]["documents_synced"] == 5
+
+    # Next pass: only the overlap window behind the watermark and the new changes
+    service.bulk.reset_mock()
+    client.tables["products"].rows.append(row(2, 7, name="Produit 2 modifié"))
+    await sync.sync_once()
+    assert sent(service)[0] == ["p-5", "p-2"]
+    assert sync.watermarks["products"] == at(7)
+    stats = sync.get_stats()["entities"]["products"]
+    assert stats["documents"] == 7
+    assert stats["lag_seconds"] > 0
+    assert stats["staleness_seconds"] >= 0
+
+
+@pytest.mark.asyncio
+async def test_tombstones_delete_documents_and_ignore_missing_ones():
+    client = FakeClient(
+        products=[], merchants=[], influencers=[],
+        search_deletions=[
+            {"id": 1, "entity": "products", "entity_id": "p-1", "deleted_at": at(1)},
+            {"id": 2, "entity": "merchants", "entity_id": "m-9", "deleted_at": at(2)},
+        ],
+    )
+    service = es_service()
+    service.bulk = AsyncMock(side_effect=[(0, []), (0, [{"delete": {"_id": "m-9", "status": 404}}])])
+    sync = sync_for(service, client)
+
+    applied = await sync.sync_once()
+
+    assert applied["deletions"] == 2
+    actions = [call.args[0][0] for call in service.bulk.await_args_list]
+    assert [(a["_op_type"], a["_index"], a["_id"]) for a in actions] == [
+        ("delete", "products", "p-1"), ("delete", "merchants", "m-9")
+    ]
+    assert sync.metrics["merchants"]["failed"] == 0
+    assert sync.watermarks["deletions"] == at(2)
+
+
+@pytest.mark.asyncio
+async def test_bulk_failures_are_retried_with_backoff():
+    client = FakeClient(products=[row(1, 1)], merchants=[], influencers=[])
+    service = es_service()
+    service.bulk = AsyncMock(side_effect=[ConnectionError("reset"), ConnectionError("reset"), (1, [])])
+    sync = sync_for(service, client)
+
+    await sync.sync_once()
+
+    assert service.bulk.await_count == 3
+    assert sync.stats["retries"] == 2
+    assert sync.watermarks["products"] == at(1)
+
+    # Retries exhausted: the pass fails and the watermark does not move
+    client.tables["products"].rows.append(row(2, 2))
+    service.bulk = AsyncMock(side_effect=ConnectionError("down"))
+    failing = sync_for(service, client, max_retries=1)
+    with pytest.raises(ConnectionError):
+        await failing.sync_once()
+    assert "products" not in failing.watermarks
+
+
+@pytest.mark.asyncio
+async def test_full_reindex_loads_in_parallel_catches_up_and_swaps_alias():
+    client = FakeClient(products=[row(i, i % 50) for i in range(20)])
+    service = es_service()
+    service.create_reindex_target = AsyncMock(return_value="products_20261016120000")
+    service.swap_alias = AsyncMock(return_value=["products_old"])
+    in_flight = {"now": 0, "max": 0}
+
+    async def bulk(actions):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        if len(service.bulk.await_args_list) == 1:
+            # Product edited while the new index is loading
+            client.tables["products"].rows.append(
+                {**row(3, 0, name="Produit 3 modifié"), "updated_at": datetime.utcnow().isoformat()}
+            )
+        await asyncio.sleep(0.01)
+        in_flight["now"] -= 1
+        return len(actions), []
+
+    service.bulk = AsyncMock(side_effect=bulk)
+    sync = sync_for(service, client, page_size=5, chunk_size=2, workers=3)
+
+    result = await sync.full_reindex("products")
+
+    assert 1 < in_flight["max"] <= 3
+    documents = [a for call in service.bulk.await_args_list for a in call.args[0]]
+    assert {a["_index"] for a in documents} == {"products_20261016120000"}
+    assert documents[-1]["_source"]["name"] == "Produit 3 modifié"
+    service.swap_alias.assert_awaited_once_with("products", "products_20261016120000")
+    assert result["documents"] in (20, 21)  # The edit may also land in the last loaded page
+    assert result["caught_up"] == 1
+
+
+@pytest.mark.asyncio
+async def test_rows_deleted_during_reindex_are_removed_before_the_swap():
+    client = FakeClient(products=[row(i, i) for i in range(6)], search_deletions=[])
+    service = es_service()
+    service.create_reindex_target = AsyncMock(return_value="products_new")
+    service.swap_alias = AsyncMock()
+
+    async def bulk(actions):
+        if service.bulk.await_count == 1:
+            # p-0 already loaded, then hard-deleted: only a tombstone remains
+            client.tables["products"].rows = [r for r in client.tables["products"].rows if r["id"] != "p-0"]
+            client.tables["search_deletions"].rows.append(
+                {"id": 1, "entity": "products", "entity_id": "p-0", "deleted_at": datetime.utcnow().isoformat()}
+            )
+        return len(actions), []
+
+    service.bulk = AsyncMock(side_effect=bulk)
+    sync = sync_for(service, client)
+
+    result = await sync.full_reindex("products")
+
+    deletes = [a for call in service.bulk.await_args_list for a in call.args[0] if a.get("_op_type") == "delete"]
+    assert deletes == [{"_op_type": "delete", "_index": "products_new", "_id": "p-0"}]
+    assert result["deleted"] == 1
+    # The deletion reached the new index before the alias moved to it
+    assert service.bulk.await_args_list[-1].args[0] == deletes
+    service.swap_alias.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_lease_error_skips_the_pass_and_is_retried():
+    client = FakeClient(products=[row(1, 1)], merchants=[], influencers=[])
+    lease = MagicMock()
+    lease.execute.side_effect = [ConnectionError("reset"), MagicMock(data=True)]
+    client.rpc = MagicMock(side_effect=lambda name, params: lease if name == "claim_search_sync_lease" else MagicMock())
+    service = es_service()
+    sync = sync_for(service, client)
+
+    assert await sync.sync_once() == {}
+    service.bulk.assert_not_awaited()
+
+    applied = await sync.sync_once()
+    assert applied["products"] == 1
+    assert lease.execute.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_reindex_drops_the_new_index_and_keeps_the_alias():
+    client = FakeClient(products=[row(i, i) for i in range(10)])
+    service = es_service()
+    service.create_reindex_target = AsyncMock(return_value="products_new")
+    service.swap_alias = AsyncMock()
+    service.bulk = AsyncMock(side_effect=ConnectionError("down"))
+    sync = sync_for(service, client, max_retries=0, workers=2)
+
+    with pytest.raises(ConnectionError):
+        await sync.full_reindex("products")
+
+    service.swap_alias.assert_not_awaited()
+    service.es.indices.delete.assert_called_once_with(index="products_new", ignore_unavailable=True)
+
+
+@pytest.mark.asyncio
+async def test_embedded_index_syncs_products_and_reindexes_in_place():
+    index = EmbeddedSearchIndex(snapshot_path=None)
+    index.index_many([product_document(row(1, 1)), product_document(row(2, 2))])
+    service = MagicMock()
+    service.available = False
+    service.local_index = index
+    client = FakeClient(
+        products=[row(1, 1), row(2, 2), row(3, 4, name="Lampe cuivre")],
+        search_deletions=[{"id": 1, "entity": "products", "entity_id": "p-1", "deleted_at": at(3)}],
+    )
+    sync = sync_for(service, client)
+
+    applied = await sync.sync_once()
+
+    # Resumed from the index watermark (minus the overlap): p-2 re-read, p-3 added, p-1 deleted
+    assert applied == {"products": 2, "deletions": 1}
+    assert index.get("p-1") is None
+    assert [doc["id"] for doc in index.search("lampe")["results"]] == ["p-3"]
+    assert "search_sync_state" not in client.tables
+
+    # p-2 read by the rebuild, then deleted before the swap
+    rebuilt = EmbeddedSearchIndex(snapshot_path=None)
+    rebuilt.index_many([product_document(r) for r in client.tables["products"].rows])
+    client.tables["search_deletions"].rows.append(
+        {"id": 2, "entity": "products", "entity_id": "p-2", "deleted_at": datetime.utcnow().isoformat()}
+    )
+    with patch.object(EmbeddedSearchIndex, "from_database", return_value=rebuilt):
+        result = await sync.full_reindex("products")
+    assert service.local_index is rebuilt
+    assert result["index"] == "embedded"
+    assert result["deleted"] == 1
+    assert rebuilt.get("p-2") is None
+
+    with pytest.raises(ValueError):
+        await sync.full_reindex("merchants")
@@ -0,0 +1,139 @@
+"""
+Tests pour le scoring vectorisé du Smart Match
+"""
+
+import random
+import time
+
+import numpy as np
+import pytest
+
+from smart_match_service import (
+    SmartMatchService,
+    BatchMatchingService,
+    InfluencerFeatureMatrix,
+    InfluencerProfile,
+    BrandProfile,
+    Niche,
+    AudienceAge,
+    AudienceGender,
+    top_k_indices,
+)
+
+PLATFORMS = ["instagram", "tiktok", "youtube", "snapchat"]
+LOCATIONS = ["MA", "FR", "US", "BE", "SN"]
+
+
+def _influencer(rng: random.Random, i: int) -> InfluencerProfile:
+    return InfluencerProfile(
+        user_id=f"inf-{i}",
+        name=f"Creator {i}",
+        niches=rng.sample(list(Niche), rng.randint(1, 3)),
+        followers_count=rng.randint(500, 500_000),
+        engagement_rate=round(rng.uniform(0, 9), 2),
+        audience_age=rng.sample(list(AudienceAge), rng.randint(1, 3)),
+        audience_gender=rng.choice(list(AudienceGender)),
+        audience_location=rng.sample(LOCATIONS, rng.randint(1, 3)),
+        platforms=rng.sample(PLATFORMS, rng.randint(1, 3)),
+        average_views=rng.randint(100, 100_000),
+        content_quality_score=rng.uniform(40, 100),
+        reliability_score=rng.uniform(40, 100),
+        preferred_commission=rng.uniform(5, 25),
+        language=["fr"],
+    )
+
+
+def _brand(**overrides) -> BrandProfile:
+    data = dict(
+        company_id="brand-1",
+        company_name="Atlas Cosmetics",
+        product_category=Niche.BEAUTY,
+        target_audience_age=[AudienceAge.YOUNG_ADULT, AudienceAge.ADULT],
+        target_audience_gender=AudienceGender.FEMALE,
+        target_locations=["MA", "FR"],
+        budget_per_influencer=2000,
+        commission_percentage=12,
+        campaign_description="Lancement gamme soin",
+        required_followers_min=20_000,
+        required_engagement_min=2.0,
+        preferred_platforms=["instagram", "tiktok"],
+        language=["fr"],
+    )
+    data.update(overrides)
+    return BrandProfile(**data)
+
+
+@pytest.fixture
+def influencers():
+    rng = random.Random(42)
+    return [_influencer(rng, i) for i in range(300)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("brand", [
+    _brand(),
+    _brand(product_category=Niche.TECH, target_audience_gender=AudienceGender.MIXED),
+    _brand(required_followers_min=0, preferred_platforms=["youtube"], target_locations=["XX"]),
+])
+async def test_vectorized_scores_match_scalar_scores(influencers, brand):
+    service = SmartMatchService()
+    matrix = InfluencerFeatureMatrix(influencers)
+
+    vectorized = matrix.score(brand, service.weights)
+    scalar = [
+        (await service._calculate_match_score(influencer, brand)).compatibility_score
+        for influencer in influencers
+    ]
+
+    np.testing.assert_allclose(np.round(vectorized, 2), scalar, atol=0.011)
+
+
+@pytest.mark.asyncio
+async def test_find_matches_returns_same_top_n_as_full_sort(influencers):
+    service = SmartMatchService()
+    brand = _brand()
+
+    all_results = [await service._calculate_match_score(i, brand) for i in influencers]
+    expected = sorted(
+        (r for r in all_results if r.compatibility_score >= 50),
+        key=lambda r: r.compatibility_score,
+        reverse=True,
+    )[:15]
+
+    matches = await service.find_matches_for_brand(brand, influencers, top_n=15)
+
+    assert [m.compatibility_score for m in matches] == [r.compatibility_score for r in expected]
+    assert matches[0].match_reasons
+
+
+def test_top_k_keeps_input_order_on_ties():
+    scores = np.array([60.0, 90.0, 75.0, 90.0, 40.0, 75.0])
+
+    assert top_k_indices(scores, 3).tolist() == [1, 3, 2]
+    assert top_k_indices(scores, 10).tolist() == [1, 3, 2, 5, 0]
+    assert top_k_indices(scores, 0).tolist() == []
+
+
+@pytest.mark.asyncio
+async def test_batch_matching_accepts_prebuilt_matrix(influencers):
+    matrix = InfluencerFeatureMatrix(influencers)
+
+    report = await BatchMatchingService().match_campaign_to_influencers(
+        "camp-1", _brand(), matrix, target_influencer_count=5, min_score=0
+    )
+
+    assert report["selected_influencers_count"] == 5
+
+
+def test_scoring_large_pool_is_fast(influencers):
+    matrix = InfluencerFeatureMatrix(influencers * 334)  # ~100k profils
+    weights = SmartMatchService().weights
+
+    started = time.perf_counter()
+    scores = matrix.score(_brand(), weights)
+    top = top_k_indices(scores, 50)
+    elapsed = time.perf_counter() - started
+
+    assert len(scores) == len(matrix)
+    assert len(top) == 50
+    assert elapsed < 0.5
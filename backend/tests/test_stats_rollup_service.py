@@ -0,0 +1,73 @@
+"""
+Tests pour les compteurs matérialisés du dashboard
+"""
+
+import pytest
+from unittest.mock import MagicMock, patch
+
+import db_helpers
+from services.stats_rollup_service import StatsRollupService, PLATFORM_SCOPE_ID
+
+
+@pytest.fixture
+def client():
+    mock = MagicMock()
+    for method in ("table", "select", "eq", "limit"):
+        getattr(mock, method).return_value = mock
+    mock.execute.return_value.data = []
+    return mock
+
+
+PLATFORM_ROW = {
+    "scope": "platform",
+    "scope_id": PLATFORM_SCOPE_ID,
+    "users_count": 120,
+    "merchants_count": 20,
+    "influencers_count": 90,
+    "products_count": 300,
+    "completed_sales_count": 42,
+    "completed_revenue": "15230.50",
+}
+
+
+def test_platform_totals_read_single_row(client):
+    client.execute.return_value.data = [PLATFORM_ROW]
+    service = StatsRollupService(client)
+
+    assert service.get_platform_totals() == PLATFORM_ROW
+    client.table.assert_called_once_with("stats_rollups")
+    client.eq.assert_any_call("scope_id", PLATFORM_SCOPE_ID)
+
+
+def test_missing_table_returns_none(client):
+    client.execute.side_effect = Exception('relation "stats_rollups" does not exist')
+
+    assert StatsRollupService(client).get_merchant_totals("m-1") is None
+
+
+def test_reconcile_calls_rpc(client):
+    client.rpc.return_value.execute.return_value.data = 57
+
+    result = StatsRollupService(client).reconcile()
+
+    client.rpc.assert_called_once_with("reconcile_stats_rollups", {})
+    assert result == {"success": True, "rows": 57}
+
+
+def test_admin_dashboard_uses_rollup_without_scanning():
+    rollups = MagicMock()
+    rollups.get_platform_totals.return_value = PLATFORM_ROW
+    fake_supabase = MagicMock()
+
+    with patch.object(db_helpers, "stats_rollups", rollups), \
+            patch.object(db_helpers, "supabase", fake_supabase):
+        stats = db_helpers.get_dashboard_stats("admin", "u-1")
+
+    assert stats == {
+        "total_users": 120,
+        "total_merchants": 20,
+        "total_influencers": 90,
+        "total_products": 300,
+        "total_revenue": 15230.5,
+    }
+    fake_supabase.table.assert_not_called()
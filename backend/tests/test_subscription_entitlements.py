@@ -0,0 +1,134 @@
+"""
+Tests pour le cache des droits d'abonnement (services.subscription_entitlements)
+"""
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from unittest.mock import MagicMock, patch
+
+from services.subscription_entitlements import EntitlementService
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_client(usage=None, rpc_error=None):
+    """Client factice: RPC get_subscription_entitlement ou tables en mémoire"""
+    client = MagicMock()
+    state = {"usage": dict(usage or {"products": 9, "campaigns": 2, "affiliates": 0})}
+    profile = {"id": "m-1", "user_id": "u-1", "subscription_plan": "free"}
+
+    def rpc(name, params):
+        call = MagicMock()
+        if rpc_error:
+            call.execute.side_effect = rpc_error
+        else:
+            call.execute.return_value.data = {"profile": profile, "usage": dict(state["usage"])}
+        return call
+
+    def from_(table):
+        query = MagicMock()
+        for method in ("select", "eq", "limit"):
+            getattr(query, method).return_value = query
+        if table == "merchants":
+            query.execute.return_value = MagicMock(data=[profile])
+        else:
+            counts = {"products": "products", "campaigns": "campaigns", "affiliations": "affiliates"}
+            query.execute.return_value = MagicMock(count=state["usage"][counts[table]])
+        return query
+
+    client.rpc.side_effect = rpc
+    client.from_.side_effect = from_
+    client.state = state
+    return client
+
+
+@pytest.mark.asyncio
+async def test_checks_are_served_from_cache_and_track_writes():
+    client = make_client()
+    service = EntitlementService(client=client, timer=Clock())
+
+    allowed, current, limit = await service.check_limit("u-1", "merchant", "products")
+    assert (allowed, current, limit) == (True, 9, 10)
+
+    assert service.record_usage("products", 1, profile_id="m-1")
+    allowed, current, _ = await service.check_limit("u-1", "merchant", "products")
+    assert (allowed, current) == (False, 10)
+
+    service.record_usage("products", -1, user_id="u-1", role="merchant")
+    assert (await service.get_subscription("u-1", "merchant"))["usage"]["products"] == 9
+    # Une seule lecture en base pour toutes ces vérifications
+    assert client.rpc.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_stale_counters_are_reconciled_in_background():
+    clock = Clock()
+    client = make_client()
+    service = EntitlementService(client=client, reconcile_interval=60, timer=clock)
+
+    await service.get_subscription("u-1", "merchant")
+    service.record_usage("products", 1, profile_id="m-1")  # Écriture vue par ce worker
+    client.state["usage"]["products"] = 4  # Suppressions faites par un autre worker
+
+    clock.now = 61
+    stale = await service.get_subscription("u-1", "merchant")
+    assert stale["usage"]["products"] == 10  # Valeur en cache pendant le rechargement
+    await asyncio.sleep(0.01)
+
+    fresh = await service.get_subscription("u-1", "merchant")
+    assert fresh["usage"]["products"] == 4
+    assert client.rpc.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_first_reads_share_one_load_and_fallback_counts():
+    client = make_client(rpc_error=Exception("function get_subscription_entitlement does not exist"))
+    service = EntitlementService(client=client, timer=Clock())
+
+    results = await asyncio.gather(*(service.get_subscription("u-1", "merchant") for _ in range(5)))
+
+    assert all(r["usage"] == {"products": 9, "campaigns": 2, "affiliates": 0} for r in results)
+    assert client.rpc.call_count == 1
+    # Repli: profil + 3 comptages, une seule fois
+    assert client.from_.call_count == 4
+
+
+@pytest.mark.asyncio
+async def test_product_limit_dependency_uses_cache():
+    from subscription_limits_middleware import SubscriptionLimits
+
+    client = make_client({"products": 10, "campaigns": 0, "affiliates": 0})
+    service = EntitlementService(client=client, timer=Clock())
+    checker = SubscriptionLimits.check_product_limit()
+
+    with patch("subscription_limits_middleware.entitlement_service", service):
+        with pytest.raises(HTTPException) as exc:
+            await checker(current_user={"id": "u-1", "role": "merchant"})
+        assert "Product limit reached (10/10)" in exc.value.detail
+
+        service.record_usage("products", -1, profile_id="m-1")
+        assert await checker(current_user={"id": "u-1", "role": "merchant"}) is True
+
+    assert client.rpc.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_transient_rpc_error_falls_back_once_without_disabling_rpc():
+    client = make_client(rpc_error=Exception("canceling statement due to statement timeout"))
+    service = EntitlementService(client=client, timer=Clock())
+
+    first = await service.get_subscription("u-1", "merchant")
+    assert first["usage"]["products"] == 9
+    assert service._entitlement_rpc.enabled()
+
+    service.invalidate("u-1")
+    await service.get_subscription("u-1", "merchant")
+    assert client.rpc.call_count == 2
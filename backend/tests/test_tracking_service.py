@@ -0,0 +1,347 @@
+"""
+Tests pour le service de tracking
+
+Couvre:
+1. Ingestion bufferisée des clics (ClickBuffer)
+2. Incrément agrégé des compteurs de liens
+3. track_click en mode direct et bufferisé
+4. Cache de résolution des short codes
+"""
+
+import pytest
+from unittest.mock import MagicMock, patch
+
+import tracking_service
+from tracking_service import ClickBuffer, TrackingService, increment_link_clicks
+from utils.local_cache import LocalTTLCache
+
+
+# ============================================
+# FIXTURES
+# ============================================
+
+@pytest.fixture(autouse=True)
+def reset_increment_rpc():
+    """Chaque test repart sans connaissance de la fonction SQL"""
+    tracking_service._increment_rpc.reset()
+    yield
+    tracking_service._increment_rpc.reset()
+
+
+@pytest.fixture
+def client():
+    """Client Supabase mocké"""
+    mock = MagicMock()
+    mock.table.return_value = mock
+    mock.select.return_value = mock
+    mock.eq.return_value = mock
+    mock.insert.return_value = mock
+    mock.upsert.return_value = mock
+    mock.update.return_value = mock
+    mock.order.return_value = mock
+    mock.limit.return_value = mock
+    mock.execute.return_value.data = []
+    return mock
+
+
+def _echo_inserts(client, already_written=()):
+    """L'upsert renvoie les clics insérés, sans ceux déjà présents en base"""
+    def upsert(rows, **kwargs):
+        client.execute.return_value.data = [r for r in rows if r["id"] not in already_written]
+        return client
+
+    client.upsert.side_effect = upsert
+
+
+@pytest.fixture
+def request_mock():
+    """Requête FastAPI mockée"""
+    req = MagicMock()
+    req.client.host = "10.0.0.1"
+    req.headers = {"user-agent": "pytest", "referer": "https://instagram.com"}
+    return req
+
+
+def _click(link_id, clicked_at="2026-01-01T10:00:00"):
+    return {
+        "id": f"click-{link_id}-{clicked_at}",
+        "link_id": link_id,
+        "influencer_id": "inf-1",
+        "ip_address": "10.0.0.1",
+        "user_agent": "pytest",
+        "referer": "",
+        "clicked_at": clicked_at,
+    }
+
+
+# ============================================
+# TESTS: ClickBuffer
+# ============================================
+
+@pytest.mark.asyncio
+async def test_flush_bulk_inserts_and_aggregates_counters(client):
+    """Un flush = un insert groupé + un incrément par lien"""
+    _echo_inserts(client)
+    buffer = ClickBuffer(client=client, max_size=100, flush_interval=60)
+    buffer.add(_click("link-a", "2026-01-01T10:00:00"))
+    buffer.add(_click("link-a", "2026-01-01T10:00:05"))
+    buffer.add(_click("link-b"))
+
+    written = await buffer.flush()
+
+    assert written == 3
+    assert len(buffer) == 0
+    client.upsert.assert_called_once()
+    assert len(client.upsert.call_args[0][0]) == 3
+    assert client.upsert.call_args[1] == {"on_conflict": "id", "ignore_duplicates": True}
+
+    name, params = client.rpc.call_args[0]
+    assert name == "increment_tracking_link_clicks"
+    increments = {i["link_id"]: i for i in params["p_increments"]}
+    assert increments["link-a"]["clicks"] == 2
+    assert increments["link-a"]["last_click_at"] == "2026-01-01T10:00:05"
+    assert increments["link-b"]["clicks"] == 1
+
+
+@pytest.mark.asyncio
+async def test_flush_requeues_on_failure(client):
+    """Les clics sont conservés si l'écriture échoue"""
+    client.upsert.side_effect = Exception("db down")
+    buffer = ClickBuffer(client=client, max_size=100, flush_interval=60)
+    buffer.add(_click("link-a"))
+
+    assert await buffer.flush() == 0
+    assert len(buffer) == 1
+    assert buffer.stats["failures"] == 1
+
+
+@pytest.mark.asyncio
+async def test_flush_requeues_only_unwritten_chunks(client):
+    """Un paquet déjà inséré n'est pas rejoué, seuls les suivants reviennent en file"""
+    def upsert(rows, **kwargs):
+        if client.upsert.call_count > 1:
+            raise Exception("db down")
+        client.execute.return_value.data = rows
+        return client
+
+    client.upsert.side_effect = upsert
+    buffer = ClickBuffer(client=client, max_size=2, flush_interval=60)
+    for second in range(5):
+        buffer._events.append(_click("link-a", f"2026-01-01T10:00:0{second}"))
+
+    assert await buffer.flush() == 2
+    assert [e["clicked_at"][-2:] for e in buffer._events] == ["02", "03", "04"]
+    # Les 2 clics écrits sont comptés malgré l'échec du paquet suivant
+    assert client.rpc.call_args[0][1]["p_increments"][0]["clicks"] == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_increments_are_kept_without_requeueing_clicks(client):
+    """Incrément en échec: les clics ne sont pas réinsérés, l'incrément est retenté"""
+    _echo_inserts(client)
+    client.rpc.return_value.execute.side_effect = [ConnectionError("timeout"), MagicMock()]
+    buffer = ClickBuffer(client=client, max_size=100, flush_interval=60)
+    buffer.add(_click("link-a"))
+
+    assert await buffer.flush() == 1
+    assert len(buffer) == 0
+    assert buffer.stats["failures"] == 1
+
+    await buffer.flush()
+    assert client.upsert.call_count == 1
+    assert client.rpc.call_count == 2
+    assert client.rpc.call_args[0][1]["p_increments"] == [
+        {"link_id": "link-a", "clicks": 1, "last_click_at": "2026-01-01T10:00:00"}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_retried_chunk_counts_only_newly_inserted_clicks(client):
+    """Paquet inséré côté serveur puis échec client: pas de double comptage au nouvel essai"""
+    first, second = _click("link-a", "2026-01-01T10:00:00"), _click("link-a", "2026-01-01T10:00:01")
+    _echo_inserts(client, already_written={first["id"]})
+    buffer = ClickBuffer(client=client, max_size=100, flush_interval=60)
+    buffer.add(first)
+    buffer.add(second)
+
+    assert await buffer.flush() == 2
+    assert client.rpc.call_args[0][1]["p_increments"] == [
+        {"link_id": "link-a", "clicks": 1, "last_click_at": "2026-01-01T10:00:01"}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_chunk_of_duplicates_increments_nothing(client):
+    _echo_inserts(client, already_written={"click-link-a-2026-01-01T10:00:00"})
+    buffer = ClickBuffer(client=client, max_size=100, flush_interval=60)
+    buffer.add(_click("link-a"))
+
+    assert await buffer.flush() == 1
+    client.rpc.assert_not_called()
+
+
+def test_add_drops_oldest_beyond_max_pending(client):
+    """Le tampon reste borné en mémoire"""
+    buffer = ClickBuffer(client=client, max_size=100, flush_interval=60, max_pending=2)
+    for i in range(3):
+        buffer.add(_click(f"link-{i}"))
+
+    assert len(buffer) == 2
+    assert [e["link_id"] for e in buffer._events] == ["link-1", "link-2"]
+    assert buffer.stats["dropped"] == 1
+
+
+@pytest.mark.asyncio
+async def test_stop_flushes_pending_clicks(client):
+    """L'arrêt vide le tampon"""
+    buffer = ClickBuffer(client=client, max_size=100, flush_interval=60)
+    buffer.start()
+    buffer.add(_click("link-a"))
+
+    await buffer.stop()
+
+    assert len(buffer) == 0
+    assert buffer.stats["flushed"] == 1
+
+
+# ============================================
+# TESTS: increment_link_clicks
+# ============================================
+
+def test_increment_falls_back_without_rpc(client):
+    """Repli lecture/écriture si la fonction SQL n'est pas déployée"""
+    client.rpc.side_effect = Exception("PGRST202: Could not find the function increment_tracking_link_clicks")
+    client.execute.return_value.data = [{"clicks": 4}]
+
+    increment_link_clicks(
+        client, [{"link_id": "link-a", "clicks": 2, "last_click_at": "2026-01-01T10:00:00"}]
+    )
+
+    client.update.assert_called_once_with(
+        {"clicks": 6, "last_click_at": "2026-01-01T10:00:00"}
+    )
+
+
+# ============================================
+# TESTS: track_click
+# ============================================
+
+@pytest.mark.asyncio
+async def test_track_click_buffered_skips_synchronous_writes(client, request_mock):
+    """En mode bufferisé, seule la résolution du lien touche la base"""
+    link = {
+        "id": "link-a",
+        "influencer_id": "inf-1",
+        "destination_url": "https://shop.ma/p/1",
+        "status": "active",
+    }
+    client.execute.return_value.data = [link]
+    buffer = ClickBuffer(client=client, max_size=100, flush_interval=60)
+    service = TrackingService(click_buffer=buffer)
+    response = MagicMock()
+
+    with patch("tracking_service.supabase", client):
+        destination = await service.track_click("ABC12345", request_mock, response)
+
+    assert destination == "https://shop.ma/p/1"
+    assert len(buffer) == 1
+    client.insert.assert_not_called()
+    client.rpc.assert_not_called()
+    response.set_cookie.assert_called_once()
+
+
+# ============================================
+# TESTS: Cache de résolution
+# ============================================
+
+ACTIVE_LINK = {
+    "id": "link-a",
+    "short_code": "ABC12345",
+    "influencer_id": "inf-1",
+    "destination_url": "https://shop.ma/p/1",
+    "status": "active",
+}
+
+
+def test_resolve_short_code_hits_database_once(client):
+    """Le premier miss remplit le cache, les appels suivants n'interrogent plus la BDD"""
+    client.execute.return_value.data = [ACTIVE_LINK]
+    service = TrackingService()
+
+    with patch("tracking_service.supabase", client):
+        first = service.resolve_short_code("ABC12345")
+        second = service.resolve_short_code("ABC12345")
+
+    assert first == second == {
+        "link_id": "link-a",
+        "influencer_id": "inf-1",
+        "destination_url": "https://shop.ma/p/1",
+        "status": "active",
+    }
+    assert client.execute.call_count == 1
+    stats = service.get_cache_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_update_link_invalidates_cache(client):
+    """Un changement de statut invalide l'entrée en cache"""
+    client.execute.return_value.data = [ACTIVE_LINK]
+    service = TrackingService()
+
+    with patch("tracking_service.supabase", client):
+        service.resolve_short_code("ABC12345")
+        client.execute.return_value.data = [{**ACTIVE_LINK, "status": "paused"}]
+        result = await service.update_link("link-a", status="paused")
+        link = service.resolve_short_code("ABC12345")
+
+    assert result["success"] is True
+    assert link["status"] == "paused"
+
+
+@pytest.mark.asyncio
+async def test_update_link_scoped_to_owner_keeps_cache_on_miss(client):
+    """Lien d'un autre influenceur: aucune ligne modifiée, cache conservé"""
+    client.execute.return_value.data = [ACTIVE_LINK]
+    service = TrackingService()
+
+    with patch("tracking_service.supabase", client):
+        service.resolve_short_code("ABC12345")
+        client.execute.return_value.data = []
+        result = await service.update_link("link-a", status="inactive", influencer_id="inf-2")
+
+    assert result == {"success": False, "error": "Lien introuvable"}
+    client.eq.assert_any_call("influencer_id", "inf-2")
+    assert service.link_cache.get("ABC12345")["status"] == "active"
+
+
+def test_warm_link_cache_preloads_active_links(client):
+    """Le préchargement remplit le cache sans miss ultérieur"""
+    client.execute.return_value.data = [ACTIVE_LINK]
+    service = TrackingService()
+
+    with patch("tracking_service.supabase", client):
+        assert service.warm_link_cache(limit=100) == 1
+        service.resolve_short_code("ABC12345")
+
+    assert client.execute.call_count == 1
+    assert service.get_cache_stats()["misses"] == 0
+
+
+def test_local_cache_ttl_and_lru_eviction():
+    """Expiration TTL et éviction LRU du cache local"""
+    now = [0.0]
+    cache = LocalTTLCache(maxsize=2, ttl=10, timer=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats["evictions"] == 1
+
+    now[0] = 11.0
+    assert cache.get("a") is None
+    assert cache.stats["expirations"] == 1
@@ -0,0 +1,159 @@
+"""
+Tests pour le catalogue de traductions en mémoire (TranslationService)
+"""
+
+import json
+import pytest
+from unittest.mock import MagicMock
+
+import translation_service as ts
+from translation_service import TranslationService
+
+
+CATALOG = {
+    "fr": [{"key": f"k{i}", "value": f"texte {i}"} for i in range(200)],
+    "ar": [{"key": f"k{i}", "value": f"نص {i}"} for i in range(150)],
+}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_client(versions=None):
+    """Client Supabase factice: compte les requêtes par table"""
+    client = MagicMock()
+    client.versions = dict(versions or {"fr": 1, "ar": 1})
+    client.calls = []
+
+    def table(name):
+        query = MagicMock()
+        filters = {}
+        for method in ("select", "order", "in_", "update", "upsert"):
+            getattr(query, method).return_value = query
+
+        def eq(column, value):
+            filters[column] = value
+            return query
+
+        def range_(start, end):
+            filters["range"] = (start, end)
+            return query
+
+        def execute():
+            client.calls.append(name)
+            language = filters.get("language")
+            if name == "translation_versions":
+                return MagicMock(data=[{"version": client.versions[language]}])
+            start, end = filters.get("range", (0, 999))
+            return MagicMock(data=CATALOG.get(language, [])[start:end + 1])
+
+        query.eq.side_effect = eq
+        query.range.side_effect = range_
+        query.execute.side_effect = execute
+        return query
+
+    client.table.side_effect = table
+    return client
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def service(monkeypatch, clock):
+    monkeypatch.setattr(ts, "OPENAI_API_KEY", None)
+    return TranslationService(make_client(), timer=clock)
+
+
+@pytest.mark.asyncio
+async def test_page_render_does_not_hit_database_per_key(service):
+    await service.preload(["ar"])
+    loads = len(service.supabase.calls)
+
+    keys = [f"k{i}" for i in range(150)]
+    for key in keys:
+        assert await service.get_translation(key, "ar") is not None
+    result = await service.batch_translate(keys, "ar")
+
+    assert len(result) == 150
+    assert len(service.supabase.calls) == loads
+    assert service._pending_usage[("ar", "k0")] == 2
+
+
+@pytest.mark.asyncio
+async def test_refresh_only_reloads_when_version_changes(service, clock):
+    await service.get_all_translations("fr")
+    reloads = service.stats["reloads"]
+
+    clock.now += ts.TRANSLATION_REFRESH_INTERVAL + 1
+    await service.get_translation("k1", "fr")
+    assert service.stats["reloads"] == reloads
+
+    service.supabase.versions["fr"] = 2
+    clock.now += ts.TRANSLATION_REFRESH_INTERVAL + 1
+    await service.get_translation("k1", "fr")
+    assert service.stats["reloads"] == reloads + 1
+    assert await service.get_catalog_etag("fr") == '"fr-2"'
+
+
+@pytest.mark.asyncio
+async def test_usage_is_flushed_in_one_call_per_language(service):
+    await service.preload(["fr", "ar"])
+    await service.batch_translate(["k1", "k2"], "fr")
+    await service.batch_translate(["k1"], "ar")
+
+    assert await service.flush_usage() == 3
+    assert service.supabase.rpc.call_count == 2
+    fr_call = service.supabase.rpc.call_args_list[0].args
+    assert fr_call == ("touch_translations", {"p_language": "fr", "p_usage": [
+        {"key": "k1", "uses": 1}, {"key": "k2", "uses": 1}
+    ]})
+    assert service._pending_usage == {}
+
+
+@pytest.mark.asyncio
+async def test_missing_keys_translated_in_one_model_call(service):
+    await service.preload(["fr", "ar"])
+    missing = [f"k{i}" for i in range(150, 190)]
+
+    openai_client = MagicMock()
+    completion = MagicMock()
+    completion.choices[0].message.content = json.dumps({k: f"ترجمة {k}" for k in missing})
+    completion.usage.prompt_tokens = 100
+    completion.usage.completion_tokens = 100
+    openai_client.chat.completions.create.return_value = completion
+    service.openai_client = openai_client
+
+    result = await service.batch_translate(["k1"] + missing, "ar")
+
+    assert len(result) == 41
+    assert openai_client.chat.completions.create.call_count == 1
+    assert service._catalog["ar"]["k150"] == "ترجمة k150"
+
+
+@pytest.mark.asyncio
+async def test_unsupported_language_is_never_cached(service):
+    assert await service.get_all_translations("xx") == {}
+    assert await service.get_translation("k1", "../fr") is None
+    assert await service.get_catalog_etag("xx") is None
+
+    assert service._catalog == {}
+    assert service.supabase.calls == []
+
+
+@pytest.mark.asyncio
+async def test_transient_touch_error_keeps_usage_and_rpc(service):
+    await service.preload(["fr"])
+    await service.batch_translate(["k1"], "fr")
+    service.supabase.rpc.return_value.execute.side_effect = Exception("connection reset")
+
+    assert await service.flush_usage() == 0
+    assert service._pending_usage == {("fr", "k1"): 1}
+    assert service._touch_rpc.enabled()
@@ -9,10 +9,14 @@ from fastapi import Request, Response
 from fastapi.responses import RedirectResponse
 from datetime import datetime, timedelta
 from supabase_client import supabase
-from typing import Optional, Dict
+from collections import deque
+from typing import Optional, Dict, List
+import asyncio
 import hashlib
+import os
 import secrets
 import logging
+import uuid
 
 logger = logging.getLogger(__name__)
 
@@ -22,17 +26,239 @@ try:
 except ImportError:
     DBOptimizer = None
 
+from utils.local_cache import LocalTTLCache
+from utils.rpc_fallback import OptionalRpc
+
 # Configuration
 COOKIE_NAME = "systrack"  # ShareYourSales tracking
 COOKIE_EXPIRY_DAYS = 30  # Durée d'attribution (30 jours)
 SHORT_CODE_LENGTH = 8
 
+# Ingestion bufferisée des clics (write-behind)
+CLICK_BUFFER_ENABLED = os.getenv("TRACKING_CLICK_BUFFER_ENABLED", "false").lower() == "true"
+CLICK_BUFFER_MAX_SIZE = int(os.getenv("TRACKING_CLICK_BUFFER_MAX_SIZE", "500"))
+CLICK_BUFFER_FLUSH_INTERVAL = float(os.getenv("TRACKING_CLICK_BUFFER_FLUSH_INTERVAL", "2.0"))
+CLICK_BUFFER_MAX_PENDING = int(os.getenv("TRACKING_CLICK_BUFFER_MAX_PENDING", "50000"))
+
+# Cache de résolution short_code → lien (par worker)
+LINK_CACHE_MAX_SIZE = int(os.getenv("TRACKING_LINK_CACHE_MAX_SIZE", "50000"))
+LINK_CACHE_TTL = float(os.getenv("TRACKING_LINK_CACHE_TTL", "300"))
+LINK_CACHE_PREWARM = int(os.getenv("TRACKING_LINK_CACHE_PREWARM", "0"))
+LINK_CACHE_FIELDS = "id, short_code, influencer_id, destination_url, status"
+
+
+class ClickBuffer:
+    """
+    Tampon write-behind pour les clics de tracking
+
+    Les clics sont mis en file en mémoire puis écrits par lots:
+    - un INSERT groupé dans click_logs par paquet (idempotent sur l'id du clic)
+    - un incrément agrégé des compteurs par lien (RPC atomique)
+
+    En cas d'échec, seuls les clics non insérés reviennent en file, et les
+    incréments non appliqués sont conservés à part: un lot déjà écrit n'est
+    jamais rejoué. Les incréments ne comptent que les lignes réellement
+    insérées: un paquet écrit côté serveur dont la réponse s'est perdue est
+    ignoré comme doublon au nouvel essai, sans double comptage.
+
+    Le flush est déclenché par la taille du tampon ou par un intervalle de temps.
+    """
+
+    def __init__(
+        self,
+        client=None,
+        max_size: int = CLICK_BUFFER_MAX_SIZE,
+        flush_interval: float = CLICK_BUFFER_FLUSH_INTERVAL,
+        max_pending: int = CLICK_BUFFER_MAX_PENDING,
+    ):
+        self.supabase = client or supabase
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._events: deque = deque(maxlen=max_pending)
+        self._increments: Dict[str, Dict] = {}  # Clics insérés, compteurs pas encore incrémentés
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._runner: Optional[asyncio.Task] = None
+
+        self.stats = {"queued": 0, "flushed": 0, "flushes": 0, "failures": 0, "dropped": 0}
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def add(self, event: Dict) -> None:
+        """Ajoute un clic au tampon (non bloquant)"""
+        if len(self._events) >= self.max_pending:
+            # Protection mémoire si la base est indisponible trop longtemps:
+            # la deque bornée écarte le plus ancien clic
+            self.stats["dropped"] += 1
+
+        self._events.append(event)
+        self.stats["queued"] += 1
+
+        if len(self._events) >= self.max_size:
+            self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task and not self._flush_task.done():
+            return
+        try:
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+        except RuntimeError:
+            # Pas de boucle active: le prochain flush périodique s'en chargera
+            pass
+
+    async def flush(self) -> int:
+        """
+        Écrit les clics en attente en base
+
+        Returns:
+            Nombre de clics écrits
+        """
+        async with self._flush_lock:
+            if not self._events and not self._increments:
+                return 0
+
+            events = list(self._events)
+            self._events.clear()
+
+            written = 0
+            try:
+                for i in range(0, len(events), self.max_size):
+                    chunk = events[i : i + self.max_size]
+                    inserted = await asyncio.to_thread(self._insert_chunk, chunk)
+                    written += len(chunk)
+                    self._add_increments(inserted)
+            except Exception as e:
+                logger.error(f"Erreur flush clics ({len(events) - written} en attente): {e}")
+                self.stats["failures"] += 1
+                self._requeue(events[written:])
+
+            if self._increments:
+                increments, self._increments = self._increments, {}
+                try:
+                    await asyncio.to_thread(increment_link_clicks, self.supabase, list(increments.values()))
+                except Exception as e:
+                    logger.error(f"Erreur incrément compteurs ({len(increments)} liens en attente): {e}")
+                    self.stats["failures"] += 1
+                    self._merge_increments(increments.values())
+
+            if written:
+                self.stats["flushed"] += written
+                self.stats["flushes"] += 1
+            return written
+
+    def _insert_chunk(self, events: List[Dict]) -> List[Dict]:
+        """
+        Insert groupé (appel synchrone), sans effet pour les clics déjà écrits
+
+        Returns:
+            Clics réellement insérés (ON CONFLICT DO NOTHING: doublons exclus)
+        """
+        result = self.supabase.table("click_logs").upsert(
+            events, on_conflict="id", ignore_duplicates=True
+        ).execute()
+        return result.data or []
+
+    def _requeue(self, events: List[Dict]) -> None:
+        """Remet des clics non écrits en tête de file (les plus anciens au-delà de max_pending sont écartés)"""
+        pending = events + list(self._events)
+        self.stats["dropped"] += max(0, len(pending) - self.max_pending)
+        self._events = deque(pending, maxlen=self.max_pending)
+
+    def _add_increments(self, events: List[Dict]) -> None:
+        self._merge_increments(
+            {"link_id": event["link_id"], "clicks": 1, "last_click_at": event["clicked_at"]}
+            for event in events
+        )
+
+    def _merge_increments(self, increments) -> None:
+        """Agrège des incréments par lien dans ceux en attente"""
+        for increment in increments:
+            entry = self._increments.setdefault(
+                increment["link_id"],
+                {"link_id": increment["link_id"], "clicks": 0, "last_click_at": increment["last_click_at"]},
+            )
+            entry["clicks"] += increment["clicks"]
+            entry["last_click_at"] = max(entry["last_click_at"], increment["last_click_at"])
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Erreur boucle de flush des clics: {e}")
+
+    def start(self) -> None:
+        """Lance le flush périodique (à appeler depuis la boucle asyncio)"""
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.get_running_loop().create_task(self._run())
+            logger.info(
+                f"✅ Tampon de clics actif (taille={self.max_size}, intervalle={self.flush_interval}s)"
+            )
+
+    async def stop(self) -> None:
+        """Arrête le flush périodique et vide le tampon"""
+        if self._runner:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        await self.flush()
+
+
+_increment_rpc = OptionalRpc("increment_tracking_link_clicks")
+
+
+def increment_link_clicks(client, increments: List[Dict]) -> None:
+    """
+    Applique les incréments de clics agrégés par lien
+
+    Utilise la fonction SQL increment_tracking_link_clicks (UPDATE atomique
+    clicks = clicks + n) pour éviter les mises à jour perdues sous concurrence.
+    Repli sur lecture/écriture si la fonction n'est pas encore déployée.
+
+    Args:
+        increments: [{"link_id": "uuid", "clicks": 3, "last_click_at": "iso"}]
+    """
+    if not increments:
+        return
+
+    if _increment_rpc.enabled():
+        try:
+            client.rpc("increment_tracking_link_clicks", {"p_increments": increments}).execute()
+            _increment_rpc.succeeded()
+            return
+        except Exception as e:
+            # Erreur transitoire: l'appelant garde les incréments pour plus tard
+            if not _increment_rpc.missing(e):
+                raise
+
+    for inc in increments:
+        link = (
+            client.table("tracking_links").select("clicks").eq("id", inc["link_id"]).execute()
+        )
+        current = int(link.data[0].get("clicks") or 0) if link.data else 0
+        client.table("tracking_links").update(
+            {"clicks": current + inc["clicks"], "last_click_at": inc["last_click_at"]}
+        ).eq("id", inc["link_id"]).execute()
+
 
 class TrackingService:
     """Service de tracking des clics et attribution"""
 
-    def __init__(self):
+    def __init__(
+        self,
+        click_buffer: Optional[ClickBuffer] = None,
+        link_cache: Optional[LocalTTLCache] = None,
+    ):
         self.supabase = supabase
+        self.click_buffer = click_buffer
+        self.link_cache = link_cache or LocalTTLCache(maxsize=LINK_CACHE_MAX_SIZE, ttl=LINK_CACHE_TTL)
 
     # ============================================
     # 1. GÉNÉRATION DE LIENS TRACKÉS
@@ -114,7 +340,120 @@ class TrackingService:
             return {"success": False, "error": str(e)}
 
     # ============================================
-    # 2. TRACKING DES CLICS
+    # 2. RÉSOLUTION DES SHORT CODES (CACHE)
+    # ============================================
+
+    @staticmethod
+    def _link_entry(link: Dict) -> Dict:
+        return {
+            "link_id": link["id"],
+            "influencer_id": link.get("influencer_id"),
+            "destination_url": link.get("destination_url"),
+            "status": link.get("status"),
+        }
+
+    def resolve_short_code(self, short_code: str) -> Optional[Dict]:
+        """
+        Résout un short_code via le cache local, la BDD en cas de miss
+
+        Returns:
+            {"link_id", "influencer_id", "destination_url", "status"} ou None
+        """
+        entry = self.link_cache.get(short_code)
+        if entry is not None:
+            return entry
+
+        result = (
+            supabase.table("tracking_links")
+            .select(LINK_CACHE_FIELDS)
+            .eq("short_code", short_code)
+            .execute()
+        )
+        if not result.data:
+            return None
+
+        entry = self._link_entry(result.data[0])
+        self.link_cache.set(short_code, entry)
+        return entry
+
+    def warm_link_cache(self, limit: int = LINK_CACHE_PREWARM) -> int:
+        """
+        Précharge les liens actifs les plus cliqués dans le cache
+
+        Returns:
+            Nombre de liens chargés
+        """
+        if limit <= 0:
+            return 0
+
+        try:
+            result = (
+                supabase.table("tracking_links")
+                .select(LINK_CACHE_FIELDS)
+                .eq("status", "active")
+                .order("clicks", desc=True)
+                .limit(limit)
+                .execute()
+            )
+        except Exception as e:
+            logger.error(f"Erreur préchargement cache liens: {e}")
+            return 0
+
+        for link in result.data or []:
+            if link.get("short_code"):
+                self.link_cache.set(link["short_code"], self._link_entry(link))
+
+        logger.info(f"✅ Cache liens préchargé: {len(result.data or [])} liens")
+        return len(result.data or [])
+
+    def invalidate_link(self, short_code: str) -> None:
+        """Invalide l'entrée d'un short_code (changement de statut/destination)"""
+        self.link_cache.delete(short_code)
+
+    async def update_link(
+        self,
+        link_id: str,
+        status: Optional[str] = None,
+        destination_url: Optional[str] = None,
+        influencer_id: Optional[str] = None,
+    ) -> Dict:
+        """
+        Met à jour le statut et/ou la destination d'un lien et invalide le cache
+
+        influencer_id: restreint la mise à jour aux liens de cet influenceur.
+        Les autres workers convergent à l'expiration du TTL (TRACKING_LINK_CACHE_TTL).
+        """
+        updates = {}
+        if status is not None:
+            updates["status"] = status
+        if destination_url is not None:
+            updates["destination_url"] = destination_url
+        if not updates:
+            return {"success": False, "error": "Aucune modification"}
+
+        try:
+            query = supabase.table("tracking_links").update(updates).eq("id", link_id)
+            if influencer_id is not None:
+                query = query.eq("influencer_id", influencer_id)
+            result = query.execute()
+            if not result.data:
+                return {"success": False, "error": "Lien introuvable"}
+
+            short_code = result.data[0].get("short_code")
+            if short_code:
+                self.invalidate_link(short_code)
+
+            return {"success": True, "link": result.data[0]}
+        except Exception as e:
+            logger.error(f"Erreur mise à jour lien: {e}")
+            return {"success": False, "error": str(e)}
+
+    def get_cache_stats(self) -> Dict:
+        """Compteurs hit/miss du cache de résolution"""
+        return self.link_cache.get_stats()
+
+    # ============================================
+    # 3. TRACKING DES CLICS
     # ============================================
 
     async def track_click(
@@ -132,17 +471,13 @@ class TrackingService:
             URL de destination ou None si lien invalide
         """
         try:
-            # 1. Récupérer le lien depuis la BDD
-            link_result = (
-                supabase.table("tracking_links").select("*").eq("short_code", short_code).execute()
-            )
+            # 1. Résoudre le lien (cache local, BDD en cas de miss)
+            link = self.resolve_short_code(short_code)
 
-            if not link_result.data:
+            if not link:
                 logger.warning(f"⚠️ Lien introuvable: {short_code}")
                 return None
 
-            link = link_result.data[0]
-
             # Vérifier que le lien est actif
             if link.get("status") != "active":
                 logger.warning(f"⚠️ Lien inactif: {short_code}")
@@ -153,28 +488,38 @@ class TrackingService:
             user_agent = request.headers.get("user-agent", "unknown")
             referer = request.headers.get("referer", "")
 
-            # 3. Enregistrer le clic dans la table click_logs
+            # 3. Enregistrer le clic (id généré côté serveur pour le cookie)
+            clicked_at = datetime.now().isoformat()
+            click_id = str(uuid.uuid4())
             click_data = {
-                "link_id": link["id"],
+                "id": click_id,
+                "link_id": link["link_id"],
                 "influencer_id": link["influencer_id"],
                 "ip_address": client_ip,
                 "user_agent": user_agent,
                 "referer": referer,
-                "clicked_at": datetime.now().isoformat(),
+                "clicked_at": clicked_at,
             }
 
-            click_result = supabase.table("click_logs").insert(click_data).execute()
-            click_id = click_result.data[0]["id"]
-
-            # 4. Incrémenter le compteur de clics
-            new_clicks = int(link.get("clicks", 0)) + 1
-            supabase.table("tracking_links").update(
-                {"clicks": new_clicks, "last_click_at": datetime.now().isoformat()}
-            ).eq("id", link["id"]).execute()
+            if self.click_buffer is not None:
+                # Mode bufferisé: écriture différée, compteurs agrégés au flush
+                self.click_buffer.add(click_data)
+            else:
+                supabase.table("click_logs").insert(click_data).execute()
+
+                # 4. Incrémenter le compteur de clics (atomique)
+                try:
+                    increment_link_clicks(
+                        supabase,
+                        [{"link_id": link["link_id"], "clicks": 1, "last_click_at": clicked_at}],
+                    )
+                except Exception as e:
+                    # Le clic est enregistré: le compteur ne doit pas bloquer la redirection
+                    logger.error(f"Erreur incrément compteur du lien {link['link_id']}: {e}")
 
             # 5. Créer le cookie d'attribution (expire dans 30 jours)
             cookie_value = self._generate_attribution_cookie(
-                link_id=link["id"], influencer_id=link["influencer_id"], click_id=click_id
+                link_id=link["link_id"], influencer_id=link["influencer_id"], click_id=click_id
             )
 
             response.set_cookie(
@@ -204,7 +549,7 @@ class TrackingService:
         return "|".join(cookie_parts)
 
     # ============================================
-    # 3. ATTRIBUTION DES VENTES
+    # 4. ATTRIBUTION DES VENTES
     # ============================================
 
     def parse_attribution_cookie(self, cookie_value: str) -> Optional[Dict]:
@@ -273,7 +618,7 @@ class TrackingService:
             return None
 
     # ============================================
-    # 4. STATISTIQUES
+    # 5. STATISTIQUES
     # ============================================
 
     async def get_link_stats(self, link_id: str) -> Dict:
@@ -322,4 +667,4 @@ class TrackingService:
 
 
 # Instance globale
-tracking_service = TrackingService()
+tracking_service = TrackingService(click_buffer=ClickBuffer() if CLICK_BUFFER_ENABLED else None)
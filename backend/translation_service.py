@@ -7,17 +7,28 @@ Service de Traduction Intelligent avec Cache en Base de Données
 
 import os
 import json
-from typing import Dict, Optional, List
+import time
+import asyncio
+import hashlib
+from typing import Dict, Optional, List, Iterable
 from datetime import datetime
 from openai import OpenAI
 from dotenv import load_dotenv
 
+from utils.rpc_fallback import OptionalRpc
+
 load_dotenv()
 
 # Configuration OpenAI
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")  # Modèle le moins cher
 
+# Catalogue en mémoire (par worker)
+TRANSLATION_REFRESH_INTERVAL = float(os.getenv("TRANSLATION_REFRESH_INTERVAL", "60"))  # Vérif. de version (s)
+TRANSLATION_USAGE_FLUSH_INTERVAL = float(os.getenv("TRANSLATION_USAGE_FLUSH_INTERVAL", "30"))  # Écriture last_used (s)
+TRANSLATION_BATCH_SIZE = int(os.getenv("TRANSLATION_BATCH_SIZE", "50"))  # Clés par appel OpenAI
+TRANSLATION_PAGE_SIZE = 1000  # Limite de lignes par requête PostgREST
+
 # Langues supportées
 SUPPORTED_LANGUAGES = {
     'fr': 'Français',
@@ -26,12 +37,34 @@ SUPPORTED_LANGUAGES = {
     'darija': 'الدارجة المغربية (Moroccan Darija)'
 }
 
+# Consignes de style par langue (traduction groupée)
+LANGUAGE_STYLE = {
+    'darija': "Moroccan Darija (colloquial Moroccan dialect), written in Arabic script with a conversational Moroccan style",
+    'ar': "Modern Standard Arabic (MSA), formal and professional style",
+}
+
 class TranslationService:
     """Service de traduction intelligent avec cache DB et OpenAI"""
     
-    def __init__(self, supabase_client=None):
+    def __init__(self, supabase_client=None, timer=time.monotonic):
         self.supabase = supabase_client
         self.openai_client = None
+        self._timer = timer
+
+        # Catalogue {langue: {clé: valeur}} et état de fraîcheur
+        self._catalog: Dict[str, Dict[str, str]] = {}
+        self._versions: Dict[str, Optional[int]] = {}
+        self._etags: Dict[str, str] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._catalog_locks: Dict[str, asyncio.Lock] = {}
+
+        # Utilisations en attente {(langue, clé): nombre}
+        self._pending_usage: Dict[tuple, int] = {}
+        self._flush_lock = asyncio.Lock()
+        self._runner: Optional[asyncio.Task] = None
+        self._touch_rpc = OptionalRpc("touch_translations")
+
+        self.stats = {"hits": 0, "misses": 0, "reloads": 0, "usage_flushes": 0, "openai_calls": 0}
         
         # Initialiser OpenAI si la clé existe
         if OPENAI_API_KEY and OPENAI_API_KEY != "VOTRE_NOUVELLE_CLE_APRES_REVOCATION":
@@ -44,6 +77,140 @@ class TranslationService:
         else:
             print("⚠️ OpenAI API key not configured - translations will use fallback")
     
+    # ============================================
+    # CATALOGUE EN MÉMOIRE
+    # ============================================
+    
+    def _ensure_catalog(self, language: str) -> Optional[Dict[str, str]]:
+        """
+        Catalogue d'une langue, chargé au premier accès puis rafraîchi
+        quand sa version change (vérifiée au plus toutes les
+        TRANSLATION_REFRESH_INTERVAL secondes)
+        
+        Appel synchrone (requêtes Supabase): depuis la boucle asyncio,
+        passer par _get_catalog.
+        
+        Returns:
+            {clé: valeur}, ou None sans base de données ou langue non supportée
+        """
+        if not self.supabase or language not in SUPPORTED_LANGUAGES:
+            return None
+        
+        now = self._timer()
+        if language not in self._catalog:
+            self._load_catalog(language)
+        elif now - self._checked_at.get(language, 0) >= TRANSLATION_REFRESH_INTERVAL:
+            self._checked_at[language] = now
+            version = self._fetch_version(language)
+            # Version inconnue (table absente): rechargement périodique complet
+            if version is None or version != self._versions.get(language):
+                self._load_catalog(language)
+        
+        return self._catalog.get(language)
+    
+    def _needs_refresh(self, language: str) -> bool:
+        return (
+            language not in self._catalog
+            or self._timer() - self._checked_at.get(language, 0) >= TRANSLATION_REFRESH_INTERVAL
+        )
+    
+    async def _get_catalog(self, language: str) -> Optional[Dict[str, str]]:
+        """_ensure_catalog hors de la boucle asyncio (un chargement à la fois par langue)"""
+        if not self.supabase or language not in SUPPORTED_LANGUAGES:
+            return None
+        if not self._needs_refresh(language):
+            return self._catalog.get(language)
+        
+        lock = self._catalog_locks.setdefault(language, asyncio.Lock())
+        async with lock:
+            if not self._needs_refresh(language):
+                return self._catalog.get(language)
+            return await asyncio.to_thread(self._ensure_catalog, language)
+    
+    def _fetch_version(self, language: str) -> Optional[int]:
+        """Version courante du catalogue d'une langue (None si indisponible)"""
+        try:
+            result = self.supabase.table('translation_versions') \
+                .select('version') \
+                .eq('language', language) \
+                .execute()
+            return int(result.data[0]['version']) if result.data else 0
+        except Exception as e:
+            print(f"⚠️ Translation version lookup failed: {e}")
+            return None
+    
+    def _load_catalog(self, language: str) -> None:
+        """Charge toutes les traductions d'une langue, par pages"""
+        # Version lue avant les données: une écriture concurrente déclenchera un rechargement
+        version = self._fetch_version(language)
+        catalog: Dict[str, str] = {}
+        
+        try:
+            offset = 0
+            while True:
+                result = self.supabase.table('translations') \
+                    .select('key, value') \
+                    .eq('language', language) \
+                    .order('key') \
+                    .range(offset, offset + TRANSLATION_PAGE_SIZE - 1) \
+                    .execute()
+                rows = result.data or []
+                for row in rows:
+                    catalog[row['key']] = row['value']
+                if len(rows) < TRANSLATION_PAGE_SIZE:
+                    break
+                offset += TRANSLATION_PAGE_SIZE
+        except Exception as e:
+            print(f"❌ Load translations error ({language}): {e}")
+            # On garde l'ancien catalogue et on réessaiera au prochain intervalle
+            self._checked_at[language] = self._timer()
+            self._catalog.setdefault(language, {})
+            return
+        
+        self._catalog[language] = catalog
+        self._versions[language] = version
+        self._etags[language] = self._compute_etag(language, version, catalog)
+        self._checked_at[language] = self._timer()
+        self.stats["reloads"] += 1
+        print(f"📦 Loaded {len(catalog)} translations for {language}")
+    
+    @staticmethod
+    def _compute_etag(language: str, version: Optional[int], catalog: Dict[str, str]) -> str:
+        if version is not None:
+            return f'"{language}-{version}"'
+        digest = hashlib.md5(json.dumps(catalog, sort_keys=True).encode()).hexdigest()
+        return f'"{language}-{digest[:16]}"'
+    
+    def _set_cached(self, language: str, values: Dict[str, str]) -> None:
+        """Répercute localement des traductions qui viennent d'être écrites"""
+        catalog = self._catalog.get(language)
+        if catalog is None:
+            return
+        catalog.update(values)
+        
+        # Le trigger incrémente la version d'une unité par ligne écrite: si personne
+        # d'autre n'a écrit entre-temps, inutile de recharger tout le catalogue
+        known = self._versions.get(language)
+        if known is not None and self._fetch_version(language) == known + len(values):
+            self._versions[language] = known + len(values)
+        else:
+            self._checked_at[language] = 0  # Rechargement au prochain accès
+        self._etags[language] = self._compute_etag(language, self._versions.get(language), catalog)
+    
+    async def get_catalog_etag(self, language: str) -> Optional[str]:
+        """ETag du catalogue d'une langue (pour les réponses 304)"""
+        if await self._get_catalog(language) is None:
+            return None
+        return self._etags.get(language)
+    
+    async def preload(self, languages: Optional[Iterable[str]] = None) -> None:
+        """Charge les catalogues au démarrage (hors boucle asyncio)"""
+        if not self.supabase:
+            return
+        for language in languages or SUPPORTED_LANGUAGES:
+            if language in SUPPORTED_LANGUAGES:
+                await asyncio.to_thread(self._load_catalog, language)
+    
     async def get_translation(
         self, 
         key: str, 
@@ -64,28 +231,16 @@ class TranslationService:
             Texte traduit ou None si non trouvé
         """
         
-        # 1. Vérifier dans le cache DB
-        if self.supabase:
-            try:
-                result = self.supabase.table('translations') \
-                    .select('value, last_used') \
-                    .eq('key', key) \
-                    .eq('language', language) \
-                    .execute()
-                
-                if result.data and len(result.data) > 0:
-                    translation = result.data[0]['value']
-                    
-                    # Mettre à jour last_used
-                    self.supabase.table('translations') \
-                        .update({'last_used': datetime.now().isoformat()}) \
-                        .eq('key', key) \
-                        .eq('language', language) \
-                        .execute()
-                    
-                    return translation
-            except Exception as e:
-                print(f"⚠️ DB cache lookup failed: {e}")
+        if language not in SUPPORTED_LANGUAGES:
+            return None
+        
+        # 1. Catalogue en mémoire (chargé en masse, rafraîchi par version)
+        catalog = await self._get_catalog(language)
+        if catalog is not None and key in catalog:
+            self.stats["hits"] += 1
+            self._record_usage(language, [key])
+            return catalog[key]
+        self.stats["misses"] += 1
         
         # 2. Si pas trouvé et auto_translate activé, traduire avec OpenAI
         if auto_translate and self.openai_client:
@@ -113,22 +268,8 @@ class TranslationService:
     async def _get_source_text(self, key: str) -> Optional[str]:
         """Récupère le texte source (français) pour une clé"""
         
-        if not self.supabase:
-            return None
-        
-        try:
-            result = self.supabase.table('translations') \
-                .select('value') \
-                .eq('key', key) \
-                .eq('language', 'fr') \
-                .execute()
-            
-            if result.data and len(result.data) > 0:
-                return result.data[0]['value']
-        except Exception as e:
-            print(f"⚠️ Source text lookup failed: {e}")
-        
-        return None
+        catalog = await self._get_catalog('fr')
+        return catalog.get(key) if catalog else None
     
     async def _translate_with_openai(
         self, 
@@ -188,6 +329,7 @@ Translation in {language_name}:"""
                 max_tokens=150
             )
             
+            self.stats["openai_calls"] += 1
             translated_text = response.choices[0].message.content.strip()
             
             # Log du coût approximatif
@@ -225,12 +367,8 @@ Translation in {language_name}:"""
                 'source': 'openai'
             }
             
-            # Upsert (insert ou update si existe)
-            self.supabase.table('translations').upsert(
-                data,
-                on_conflict='key,language'
-            ).execute()
-            
+            # Upsert (insert ou update si existe), hors de la boucle asyncio
+            await asyncio.to_thread(self._write_translations, language, [data], {key: value})
             print(f"💾 Saved translation: {key} [{language}] = {value}")
             return True
         
@@ -238,6 +376,108 @@ Translation in {language_name}:"""
             print(f"❌ Save translation error: {e}")
             return False
     
+    async def _translate_batch_with_openai(
+        self,
+        texts: Dict[str, str],
+        target_language: str,
+        context: Optional[str] = None
+    ) -> Dict[str, str]:
+        """
+        Traduit plusieurs textes en un appel OpenAI par lot de
+        TRANSLATION_BATCH_SIZE clés (réponse JSON {clé: traduction})
+        """
+        
+        if not self.openai_client or not texts:
+            return {}
+        
+        language_name = SUPPORTED_LANGUAGES.get(target_language, target_language)
+        style = LANGUAGE_STYLE.get(target_language, f"{language_name}, professional tone for a business application")
+        items = list(texts.items())
+        translations: Dict[str, str] = {}
+        
+        for i in range(0, len(items), TRANSLATION_BATCH_SIZE):
+            chunk = dict(items[i:i + TRANSLATION_BATCH_SIZE])
+            prompt = f"""Translate each value of this JSON object from French to {style}.
+Keep the keys unchanged and return only a JSON object {{key: translation}}.
+{f'Context: {context}' if context else ''}
+
+{json.dumps(chunk, ensure_ascii=False)}"""
+            
+            try:
+                response = self.openai_client.chat.completions.create(
+                    model=OPENAI_MODEL,
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": "You are a professional translator specializing in business and e-commerce terminology. Provide accurate, natural translations."
+                        },
+                        {
+                            "role": "user",
+                            "content": prompt
+                        }
+                    ],
+                    temperature=0.3,
+                    response_format={"type": "json_object"}
+                )
+                self.stats["openai_calls"] += 1
+                
+                result = json.loads(response.choices[0].message.content)
+                for key, value in result.items():
+                    if key in chunk and isinstance(value, str) and value.strip():
+                        translations[key] = value.strip()
+                
+                input_tokens = response.usage.prompt_tokens
+                output_tokens = response.usage.completion_tokens
+                cost = (input_tokens * 0.00015 + output_tokens * 0.0006) / 1000
+                print(f"✅ Translated {len(chunk)} keys → {target_language} (Cost: ${cost:.6f})")
+            
+            except Exception as e:
+                print(f"❌ OpenAI batch translation error: {e}")
+        
+        return translations
+    
+    async def _save_translations(
+        self,
+        language: str,
+        values: Dict[str, str],
+        context: Optional[str] = None
+    ) -> bool:
+        """Sauvegarde plusieurs traductions en un seul upsert"""
+        
+        if not self.supabase or not values:
+            return False
+        
+        now = datetime.now().isoformat()
+        rows = [
+            {
+                'key': key,
+                'language': language,
+                'value': value,
+                'context': context,
+                'created_at': now,
+                'last_used': now,
+                'source': 'openai'
+            }
+            for key, value in values.items()
+        ]
+        
+        try:
+            await asyncio.to_thread(self._write_translations, language, rows, values)
+            print(f"💾 Saved {len(rows)} translations [{language}]")
+            return True
+        
+        except Exception as e:
+            print(f"❌ Save translations error: {e}")
+            return False
+    
+    def _write_translations(self, language: str, rows: List[Dict], values: Dict[str, str]) -> None:
+        """Upsert des lignes puis mise à jour du catalogue local (appel synchrone)"""
+        self.supabase.table('translations').upsert(
+            rows,
+            on_conflict='key,language'
+        ).execute()
+        self._set_cached(language, values)
+    
     async def batch_translate(
         self, 
         keys: List[str], 
@@ -256,43 +496,33 @@ Translation in {language_name}:"""
             Dictionnaire {key: traduction}
         """
         
-        translations = {}
-        missing_keys = []
-        
-        # 1. Récupérer les traductions existantes en une seule requête
-        if self.supabase:
-            try:
-                result = self.supabase.table('translations') \
-                    .select('key, value') \
-                    .eq('language', target_language) \
-                    .in_('key', keys) \
-                    .execute()
-                
-                for row in result.data:
-                    translations[row['key']] = row['value']
-                
-                # Identifier les clés manquantes
-                missing_keys = [k for k in keys if k not in translations]
-            except Exception as e:
-                print(f"⚠️ Batch lookup failed: {e}")
-                missing_keys = keys
-        else:
-            missing_keys = keys
+        if target_language not in SUPPORTED_LANGUAGES:
+            return {}
         
-        # 2. Traduire les clés manquantes
-        if missing_keys and self.openai_client:
-            print(f"🔄 Translating {len(missing_keys)} missing keys...")
+        translations = {}
+        missing_keys = list(keys)
+        
+        # 1. Catalogue en mémoire: aucune requête par clé
+        catalog = await self._get_catalog(target_language)
+        if catalog is not None:
+            translations = {k: catalog[k] for k in keys if k in catalog}
+            missing_keys = [k for k in keys if k not in translations]
+            self._record_usage(target_language, translations.keys())
+        self.stats["hits"] += len(translations)
+        self.stats["misses"] += len(missing_keys)
+        
+        # 2. Traduire les clés manquantes en un appel OpenAI par lot
+        if missing_keys and self.openai_client and target_language != 'fr':
+            source_catalog = await self._get_catalog('fr') or {}
+            sources = {k: source_catalog[k] for k in missing_keys if k in source_catalog}
             
-            for key in missing_keys:
-                translated = await self.get_translation(
-                    key, 
-                    target_language, 
-                    context, 
-                    auto_translate=True
-                )
+            if sources:
+                print(f"🔄 Translating {len(sources)} missing keys...")
+                translated = await self._translate_batch_with_openai(sources, target_language, context)
                 
-                if translated:
-                    translations[key] = translated
+                if translated and self.supabase:
+                    await self._save_translations(target_language, translated, context)
+                translations.update(translated)
         
         return translations
     
@@ -308,23 +538,8 @@ Translation in {language_name}:"""
             Dictionnaire {key: value} de toutes les traductions
         """
         
-        if not self.supabase:
-            return {}
-        
-        try:
-            result = self.supabase.table('translations') \
-                .select('key, value') \
-                .eq('language', language) \
-                .execute()
-            
-            translations = {row['key']: row['value'] for row in result.data}
-            
-            print(f"📦 Loaded {len(translations)} translations for {language}")
-            return translations
-        
-        except Exception as e:
-            print(f"❌ Load all translations error: {e}")
-            return {}
+        catalog = await self._get_catalog(language)
+        return dict(catalog) if catalog else {}
     
     async def import_static_translations(
         self, 
@@ -359,6 +574,100 @@ Translation in {language_name}:"""
         except Exception as e:
             print(f"❌ Import error: {e}")
             return imported
+    
+    # ============================================
+    # last_used: ÉCRITURES GROUPÉES
+    # ============================================
+    
+    def _record_usage(self, language: str, keys: Iterable[str]) -> None:
+        """Note l'utilisation de clés (écrite au prochain flush)"""
+        for key in keys:
+            usage_key = (language, key)
+            self._pending_usage[usage_key] = self._pending_usage.get(usage_key, 0) + 1
+    
+    async def flush_usage(self) -> int:
+        """
+        Écrit les utilisations en attente (un UPDATE par langue)
+        
+        Returns:
+            Nombre de clés mises à jour
+        """
+        async with self._flush_lock:
+            if not self._pending_usage or not self.supabase:
+                return 0
+            
+            pending, self._pending_usage = self._pending_usage, {}
+            written = len(pending)
+            
+            try:
+                await asyncio.to_thread(self._write_usage, pending)
+            except Exception as e:
+                print(f"⚠️ Translation usage flush failed: {e}")
+                # Fusion avec les utilisations arrivées entre-temps
+                for usage_key, uses in pending.items():
+                    self._pending_usage[usage_key] = self._pending_usage.get(usage_key, 0) + uses
+                return 0
+            
+            self.stats["usage_flushes"] += 1
+            return written
+    
+    def _write_usage(self, pending: Dict[tuple, int]) -> None:
+        """Mise à jour groupée de last_used / usage_count (appel synchrone)"""
+        by_language: Dict[str, List[Dict]] = {}
+        for (language, key), uses in pending.items():
+            by_language.setdefault(language, []).append({'key': key, 'uses': uses})
+        
+        for language, usage in by_language.items():
+            if self._touch_rpc.enabled():
+                try:
+                    self.supabase.rpc('touch_translations', {
+                        'p_language': language,
+                        'p_usage': usage
+                    }).execute()
+                    self._touch_rpc.succeeded()
+                    self._forget_written(pending, language, usage)
+                    continue
+                except Exception as e:
+                    # Erreur transitoire: flush_usage conserve les utilisations
+                    if not self._touch_rpc.missing(e):
+                        raise
+            
+            self.supabase.table('translations') \
+                .update({'last_used': datetime.now().isoformat()}) \
+                .eq('language', language) \
+                .in_('key', [u['key'] for u in usage]) \
+                .execute()
+            self._forget_written(pending, language, usage)
+    
+    @staticmethod
+    def _forget_written(pending: Dict[tuple, int], language: str, usage: List[Dict]) -> None:
+        """Retire une langue écrite: un échec sur la suivante ne la recompte pas"""
+        for u in usage:
+            pending.pop((language, u['key']), None)
+    
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(TRANSLATION_USAGE_FLUSH_INTERVAL)
+            try:
+                await self.flush_usage()
+            except Exception as e:
+                print(f"⚠️ Translation usage flush loop error: {e}")
+    
+    def start(self) -> None:
+        """Lance l'écriture périodique de last_used (depuis la boucle asyncio)"""
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.get_running_loop().create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Arrête l'écriture périodique et vide les utilisations en attente"""
+        if self._runner:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        await self.flush_usage()
 
 
 # Instance globale
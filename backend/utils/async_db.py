@@ -0,0 +1,138 @@
+"""
+Accès base de données non bloquant pour les handlers async FastAPI
+
+Le client supabase-py est synchrone: appelé directement dans un `async def`,
+il bloque la boucle asyncio pendant tout l'aller-retour HTTP. Ce module
+exécute ces appels dans un pool de threads borné et mesure chaque appel.
+
+Usage:
+    from utils.async_db import async_db
+
+    result = await async_db.execute(supabase.table("sales").select("*").eq("id", sale_id))
+    user = await async_db.run(get_user_by_id, user_id)
+    product = await product_repository.aio.find_by_id(product_id)
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+DB_MAX_CONCURRENCY = int(os.getenv("DB_MAX_CONCURRENCY", "32"))  # Appels simultanés par worker
+DB_CALL_TIMEOUT = float(os.getenv("DB_CALL_TIMEOUT", "30"))  # Secondes
+DB_SLOW_CALL_MS = float(os.getenv("DB_SLOW_CALL_MS", "500"))  # Seuil de log des appels lents
+
+
+class AsyncDB:
+    """Pool de threads borné pour les appels Supabase synchrones"""
+
+    def __init__(
+        self,
+        max_concurrency: int = DB_MAX_CONCURRENCY,
+        timeout: Optional[float] = DB_CALL_TIMEOUT,
+        slow_call_ms: float = DB_SLOW_CALL_MS,
+    ):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.slow_call_ms = slow_call_ms
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="db")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    async def run(self, func: Callable, *args, label: Optional[str] = None, **kwargs) -> Any:
+        """
+        Exécute une fonction synchrone (helper db_helpers, méthode de repository...)
+        dans le pool sans bloquer la boucle asyncio
+
+        Args:
+            func: Fonction synchrone à exécuter
+            label: Nom utilisé pour les statistiques (défaut: nom de la fonction)
+        """
+        label = label or getattr(func, "__qualname__", None) or repr(func)
+        loop = asyncio.get_running_loop()
+        call = functools.partial(self._timed, func, label, *args, **kwargs)
+        future = loop.run_in_executor(self._executor, call)
+        if self.timeout:
+            return await asyncio.wait_for(future, self.timeout)
+        return await future
+
+    async def execute(self, query, label: Optional[str] = None) -> Any:
+        """Exécute un query builder Supabase (`.execute()`) dans le pool"""
+        return await self.run(query.execute, label=label or "query.execute")
+
+    def _timed(self, func: Callable, label: str, *args, **kwargs) -> Any:
+        with self._lock:
+            self._in_flight += 1
+        started = time.perf_counter()
+        error = False
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            error = True
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._in_flight -= 1
+                entry = self.stats.setdefault(
+                    label, {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+                )
+                entry["calls"] += 1
+                entry["errors"] += int(error)
+                entry["total_ms"] += elapsed_ms
+                entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+            if elapsed_ms >= self.slow_call_ms:
+                logger.warning(f"Appel DB lent: {label} ({elapsed_ms:.0f} ms)")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Statistiques par appel (nombre, erreurs, latence moyenne/max)"""
+        with self._lock:
+            calls = {
+                label: {
+                    **entry,
+                    "avg_ms": round(entry["total_ms"] / entry["calls"], 2) if entry["calls"] else 0,
+                    "total_ms": round(entry["total_ms"], 2),
+                    "max_ms": round(entry["max_ms"], 2),
+                }
+                for label, entry in self.stats.items()
+            }
+            return {
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self._in_flight,
+                "calls": calls,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Arrête le pool (à l'arrêt du serveur)"""
+        self._executor.shutdown(wait=wait)
+
+
+class AsyncRepositoryProxy:
+    """Expose les méthodes synchrones d'un repository sous forme awaitable"""
+
+    def __init__(self, repository, db: AsyncDB):
+        self._repository = repository
+        self._db = db
+
+    def __getattr__(self, name: str):
+        method = getattr(self._repository, name)
+        if not callable(method):
+            return method
+
+        async def call(*args, **kwargs):
+            label = f"{type(self._repository).__name__}.{name}"
+            return await self._db.run(method, *args, label=label, **kwargs)
+
+        return call
+
+
+# Instance globale (un pool par worker)
+async_db = AsyncDB()
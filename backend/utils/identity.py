@@ -0,0 +1,130 @@
+"""
+Résolution d'identité: user_id (sujet du JWT) → merchant_id / influencer_id
+
+Les tokens émis embarquent l'ID de profil du rôle (claims `merchant_id` /
+`influencer_id`). verify_token les mémorise dans un cache local au worker,
+de sorte que les helpers de requêtes n'interrogent plus `merchants` /
+`influencers` par user_id à chaque appel. Les anciens tokens sans claim
+sont résolus une fois puis servis depuis le cache.
+
+Usage:
+    claims = identity_claims(user["id"], user["role"])      # à l'émission
+    remember_identity(payload)                               # à la vérification
+    merchant_id = get_merchant_id(user_id)                   # dans les helpers
+"""
+
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from utils.local_cache import LocalTTLCache
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+IDENTITY_CACHE_MAX_SIZE = int(os.getenv("IDENTITY_CACHE_MAX_SIZE", "50000"))
+IDENTITY_CACHE_TTL = float(os.getenv("IDENTITY_CACHE_TTL", "900"))  # Secondes
+IDENTITY_NEGATIVE_TTL = float(os.getenv("IDENTITY_NEGATIVE_TTL", "30"))  # Profil absent
+
+# Table de profil par claim
+ROLE_TABLES = {
+    "merchant_id": "merchants",
+    "influencer_id": "influencers",
+}
+
+_NOT_FOUND = ""
+
+_identity_cache = LocalTTLCache(maxsize=IDENTITY_CACHE_MAX_SIZE, ttl=IDENTITY_CACHE_TTL)
+
+
+class IdentityNotFound(LookupError):
+    """Aucun profil du rôle demandé pour cet utilisateur"""
+
+
+def _client(client=None):
+    if client is not None:
+        return client
+    from supabase_client import get_supabase_client
+    return get_supabase_client()
+
+
+def _resolve(user_id: str, claim: str, client=None) -> Optional[str]:
+    """ID de profil pour un claim, depuis le cache ou la base"""
+    if not user_id:
+        return None
+
+    cached = _identity_cache.get((user_id, claim))
+    if cached is not None:
+        return cached or None
+
+    try:
+        result = (
+            _client(client).table(ROLE_TABLES[claim])
+            .select("id")
+            .eq("user_id", user_id)
+            .limit(1)
+            .execute()
+        )
+    except Exception as e:
+        logger.warning(f"Résolution {claim} impossible pour {user_id}: {e}")
+        return None
+
+    profile_id = result.data[0]["id"] if result.data else None
+    if profile_id:
+        _identity_cache.set((user_id, claim), profile_id)
+    else:
+        # Profil pas encore créé: cache court pour le voir apparaître
+        _identity_cache.set((user_id, claim), _NOT_FOUND, ttl=IDENTITY_NEGATIVE_TTL)
+    return profile_id
+
+
+def get_merchant_id(user_id: str, client=None) -> Optional[str]:
+    """merchant_id de l'utilisateur (None s'il n'a pas de profil marchand)"""
+    return _resolve(user_id, "merchant_id", client)
+
+
+def get_influencer_id(user_id: str, client=None) -> Optional[str]:
+    """influencer_id de l'utilisateur (None s'il n'a pas de profil influenceur)"""
+    return _resolve(user_id, "influencer_id", client)
+
+
+def require_merchant_id(user_id: str, client=None) -> str:
+    """merchant_id de l'utilisateur, IdentityNotFound sinon"""
+    merchant_id = get_merchant_id(user_id, client)
+    if not merchant_id:
+        raise IdentityNotFound(f"Aucun profil marchand pour {user_id}")
+    return merchant_id
+
+
+def require_influencer_id(user_id: str, client=None) -> str:
+    """influencer_id de l'utilisateur, IdentityNotFound sinon"""
+    influencer_id = get_influencer_id(user_id, client)
+    if not influencer_id:
+        raise IdentityNotFound(f"Aucun profil influenceur pour {user_id}")
+    return influencer_id
+
+
+def identity_claims(user_id: str, role: str, client=None) -> Dict[str, str]:
+    """Claims d'identité à embarquer dans un access token"""
+    claim = f"{role}_id"
+    if claim not in ROLE_TABLES:
+        return {}
+    profile_id = _resolve(user_id, claim, client)
+    return {claim: profile_id} if profile_id else {}
+
+
+def remember_identity(payload: Dict[str, Any]) -> None:
+    """Mémorise les claims d'identité d'un token vérifié"""
+    user_id = payload.get("sub") or payload.get("user_id")
+    if not user_id:
+        return
+    for claim in ROLE_TABLES:
+        profile_id = payload.get(claim)
+        if profile_id and _identity_cache.get((user_id, claim), count=False) != profile_id:
+            _identity_cache.set((user_id, claim), profile_id)
+
+
+def invalidate_identity(user_id: str) -> None:
+    """Oublie les IDs de profil d'un utilisateur (création de profil, changement de rôle)"""
+    for claim in ROLE_TABLES:
+        _identity_cache.delete((str(user_id), claim))
@@ -0,0 +1,199 @@
+"""
+Pagination par curseur (keyset) pour les requêtes Supabase/PostgREST
+
+Au lieu de `range(offset, offset + limit - 1)`, qui fait lire et jeter
+`offset` lignes à Postgres, chaque page filtre sur la position de la
+dernière ligne vue: (colonne_de_tri, id). Le coût d'une page ne dépend
+plus de sa profondeur.
+
+Les curseurs sont opaques (JSON encodé base64url) et liés à la colonne de
+tri. Le total est optionnel: compté en mode "estimated" et mis en cache
+par worker.
+
+Usage:
+    page = paginate_keyset(query, "sale_timestamp", limit=50, cursor=cursor)
+    page["items"], page["next_cursor"], page["prev_cursor"], page["has_more"]
+
+    for row in iter_keyset(build_query, "created_at"):   # exports
+        ...
+"""
+
+import base64
+import json
+import os
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional
+
+from utils.local_cache import LocalTTLCache
+
+# Configuration
+PAGINATION_COUNT_MODE = os.getenv("PAGINATION_COUNT_MODE", "estimated")  # exact | planned | estimated
+PAGINATION_COUNT_TTL = float(os.getenv("PAGINATION_COUNT_TTL", "60"))  # Secondes
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))  # Lignes par page pour iter_keyset
+
+_count_cache = LocalTTLCache(maxsize=10000, ttl=PAGINATION_COUNT_TTL)
+
+
+# ============================================
+# CURSEURS
+# ============================================
+
+def encode_cursor(sort_column: str, value: Any, row_id: Any, direction: str = "next") -> str:
+    """Curseur opaque pointant sur une ligne (valeur de tri + id)"""
+    payload = json.dumps({"c": sort_column, "v": value, "id": row_id, "d": direction}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_column: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Décode un curseur
+
+    Raises:
+        ValueError: curseur illisible ou émis pour une autre colonne de tri
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        if not isinstance(data, dict) or data.get("d") not in ("next", "prev") or "id" not in data:
+            raise ValueError("structure invalide")
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Curseur invalide: {e}")
+
+    if sort_column is not None and data.get("c") != sort_column:
+        raise ValueError("Curseur invalide: colonne de tri différente")
+    return data
+
+
+# ============================================
+# FILTRE KEYSET
+# ============================================
+
+def _format_value(value: Any) -> str:
+    """Valeur littérale pour un filtre PostgREST `or=(...)`"""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return str(value)
+    escaped = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+def keyset_filter(sort_column: str, value: Any, row_id: Any, desc: bool, id_column: str = "id") -> str:
+    """
+    Filtre PostgREST des lignes situées après (value, row_id) dans l'ordre
+
+    Suit l'ordre par défaut de Postgres pour les NULL: en tête en DESC,
+    en fin en ASC.
+    """
+    op = "lt" if desc else "gt"
+    rid = _format_value(row_id)
+
+    if value is None:
+        same = f"and({sort_column}.is.null,{id_column}.{op}.{rid})"
+        return f"{same},{sort_column}.not.is.null" if desc else same
+
+    formatted = _format_value(value)
+    parts = [
+        f"{sort_column}.{op}.{formatted}",
+        f"and({sort_column}.eq.{formatted},{id_column}.{op}.{rid})",
+    ]
+    if not desc:
+        parts.append(f"{sort_column}.is.null")
+    return ",".join(parts)
+
+
+def paginate_keyset(
+    query,
+    sort_column: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    desc: bool = True,
+    id_column: str = "id"
+) -> Dict[str, Any]:
+    """
+    Exécute une page keyset sur un query builder déjà filtré
+
+    Args:
+        query: Query builder (select + filtres, sans order ni range)
+        sort_column: Colonne de tri principale
+        limit: Taille de page
+        cursor: next_cursor / prev_cursor d'une page précédente
+        desc: Tri décroissant
+
+    Returns:
+        {"items": [...], "next_cursor": str|None, "prev_cursor": str|None, "has_more": bool}
+
+    Raises:
+        ValueError: curseur invalide
+    """
+    direction = "next"
+    if cursor:
+        position = decode_cursor(cursor, sort_column)
+        direction = position["d"]
+
+    # Page précédente: on parcourt dans l'ordre inverse puis on retourne le résultat
+    scan_desc = desc if direction == "next" else not desc
+    if cursor:
+        query = query.or_(keyset_filter(sort_column, position["v"], position["id"], scan_desc, id_column))
+
+    response = query.order(sort_column, desc=scan_desc).order(id_column, desc=scan_desc).limit(limit + 1).execute()
+    rows = response.data or []
+
+    more_in_scan = len(rows) > limit
+    rows = rows[:limit]
+    if direction == "prev":
+        rows.reverse()
+        has_next, has_prev = True, more_in_scan
+    else:
+        has_next, has_prev = more_in_scan, cursor is not None
+
+    return {
+        "items": rows,
+        "next_cursor": encode_cursor(sort_column, rows[-1].get(sort_column), rows[-1][id_column], "next")
+        if rows and has_next else None,
+        "prev_cursor": encode_cursor(sort_column, rows[0].get(sort_column), rows[0][id_column], "prev")
+        if rows and has_prev else None,
+        "has_more": has_next,
+    }
+
+
+def iter_keyset(
+    query_factory: Callable[[], Any],
+    sort_column: str,
+    page_size: int = EXPORT_PAGE_SIZE,
+    desc: bool = True,
+    id_column: str = "id"
+) -> Iterator[Dict[str, Any]]:
+    """
+    Parcourt toutes les lignes d'une requête page par page (exports)
+
+    Une seule page est en mémoire à la fois. Les query builders Supabase
+    étant mutables, `query_factory` en construit un neuf pour chaque page.
+    """
+    cursor = None
+    while True:
+        page = paginate_keyset(query_factory(), sort_column, page_size, cursor=cursor, desc=desc, id_column=id_column)
+        yield from page["items"]
+        if not page["has_more"]:
+            return
+        cursor = page["next_cursor"]
+
+
+# ============================================
+# TOTAL APPROXIMATIF
+# ============================================
+
+def cached_count(key: Hashable, count_query: Callable[[], Any]) -> Optional[int]:
+    """
+    Total mis en cache par worker (PAGINATION_COUNT_TTL)
+
+    Args:
+        key: Identifie la requête et ses filtres
+        count_query: Construit le query builder de comptage
+            (select("id", count=PAGINATION_COUNT_MODE) + mêmes filtres)
+    """
+    total = _count_cache.get(key)
+    if total is None:
+        response = count_query().limit(1).execute()
+        total = response.count or 0
+        _count_cache.set(key, total)
+    return total
@@ -0,0 +1,220 @@
+"""
+Détection de mots-clés par catégorie, compilée une fois
+
+Remplace la recherche de sous-chaînes mot-clé par mot-clé:
+- Texte et mots-clés normalisés de la même façon: accents et diacritiques
+  retirés (français, harakat arabes), variantes de alef / ta marbuta / alef
+  maqsura unifiées, tatweel supprimé.
+- Comparaison par mots entiers ("arme" ne détecte plus "charme"), avec
+  tolérance au pluriel / féminin ("armes", "sexuelle") et à l'article
+  arabe ("الحشيش" pour "حشيش").
+- Expressions de plusieurs mots ("faux passeport", "sex toy") quel que
+  soit le séparateur; "mot*" désigne un radical ("vibr*").
+- Un seul parcours du texte renvoie toutes les catégories touchées; un
+  pré-filtre regex écarte d'abord, en C, les textes sans aucun candidat.
+
+Usage:
+    matcher = KeywordMatcher({"drugs": ["cannabis", "حشيش"], "weapons": ["arme"]})
+    matcher.find("Armes et CANNABIS")     # {"weapons": ["arme"], "drugs": ["cannabis"]}
+    matcher.contains_any("Le charme")     # False
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Diacritiques latins, harakat et signes coraniques (après décomposition NFKD)
+_COMBINING_RE = re.compile("[\u0300-\u036f\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed]")
+_FOLD = str.maketrans({
+    "ة": "ه",
+    "ى": "ي",
+    "\u0640": None,  # tatweel
+    "œ": "oe",
+    "æ": "ae",
+    "\u2019": "'",
+    "\u2018": "'",
+})
+_TOKEN_RE = re.compile(r"\w+")
+_ARABIC_RE = re.compile("[\u0600-\u06ff]")
+
+_ARABIC_PREFIXES = ("وال", "بال", "فال", "كال", "لل", "ال")
+_ARABIC_SUFFIXES = ("ات", "ون", "ين")
+_DOUBLE_CONSONANTS = ("ll", "nn", "ss", "tt")
+
+
+def normalize_text(text: str) -> str:
+    """Minuscules sans accents ni diacritiques (FR / AR / darija)"""
+    if text.isascii():
+        return text.lower()
+    text = _COMBINING_RE.sub("", unicodedata.normalize("NFKD", text))
+    return text.casefold().translate(_FOLD)
+
+
+def _strip_article(token: str) -> str:
+    """Mot arabe sans article ni préposition accolée (الحشيش → حشيش)"""
+    for prefix in _ARABIC_PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= 3:
+            return token[len(prefix):]
+    return token
+
+
+@lru_cache(maxsize=100_000)
+def canonical_token(token: str) -> str:
+    """
+    Forme de comparaison d'un mot normalisé
+
+    Pluriel et féminin latins (armes → arme, sexuelle → sexuel) retirés au-delà
+    de 4 lettres; article et pluriels arabes retirés s'il reste 3 lettres.
+    """
+    if _ARABIC_RE.search(token):
+        token = _strip_article(token)
+        for suffix in _ARABIC_SUFFIXES:
+            if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+                return token[:-len(suffix)]
+        return token
+
+    if len(token) > 4 and token[-1] in "sx":
+        token = token[:-1]
+    if len(token) > 4 and token[-1] == "e":
+        token = token[:-1]
+        if token.endswith(_DOUBLE_CONSONANTS):
+            token = token[:-1]
+    return token
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Regex équivalente à "mot1|mot2|..." factorisée par préfixes communs"""
+    trie: Dict[str, dict] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict[str, dict]) -> str:
+        # Un mot complet suffit: les suites plus longues n'ajoutent rien au pré-filtre
+        if "" in node:
+            return ""
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items())]
+        return branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+
+    return build(trie)
+
+
+class _Node:
+    __slots__ = ("children", "stems", "hits")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.stems: List[Tuple[str, "_Node"]] = []
+        self.hits: List[Tuple[str, str]] = []  # (catégorie, mot-clé)
+
+
+class KeywordMatcher:
+    """Trie de mots-clés (par mots normalisés), immuable une fois construit"""
+
+    def __init__(self, keywords: Dict[str, Iterable[str]]):
+        """
+        Args:
+            keywords: {catégorie: [mots-clés]}; "mot*" = radical
+        """
+        self.categories = list(keywords)
+        self._root = _Node()
+        self.size = 0
+        first_words: Set[str] = set()
+
+        for category, words in keywords.items():
+            for keyword in words:
+                tokens = _TOKEN_RE.findall(normalize_text(keyword))
+                if not tokens:
+                    continue
+                is_stem = keyword.rstrip().endswith("*")
+                self._insert(tokens, is_stem, (category, keyword))
+                if len(tokens) > 1 and not is_stem:
+                    # "sex toy" détecte aussi "sextoy"
+                    self._insert(["".join(tokens)], False, (category, keyword))
+                first_words.add(tokens[0] if is_stem and len(tokens) == 1 else canonical_token(tokens[0]))
+                self.size += 1
+
+        self._prefilter = self._compile_prefilter(first_words)
+
+    def _insert(self, tokens: List[str], is_stem: bool, hit: Tuple[str, str]) -> None:
+        node = self._root
+        for index, token in enumerate(tokens):
+            if is_stem and index == len(tokens) - 1:
+                child = next((n for stem, n in node.stems if stem == token), None)
+                if child is None:
+                    child = _Node()
+                    node.stems.append((token, child))
+            else:
+                child = node.children.setdefault(canonical_token(token), _Node())
+            node = child
+        if hit not in node.hits:
+            node.hits.append(hit)
+
+    @staticmethod
+    def _compile_prefilter(first_words: Set[str]) -> Optional["re.Pattern"]:
+        """
+        Regex des débuts de premiers mots (sur-ensemble): un texte sans match est propre
+
+        Ancrée en début de mot (article arabe optionnel) et factorisée en arbre
+        de caractères: le moteur ne lit qu'une branche par début de mot.
+        """
+        if not first_words:
+            return None
+        articles = _trie_pattern(_ARABIC_PREFIXES)
+        return re.compile(rf"(?<!\w)(?:{articles})?{_trie_pattern(first_words)}")
+
+    # ============================================
+    # RECHERCHE
+    # ============================================
+
+    def find(self, text: str, first_only: bool = False) -> Dict[str, List[str]]:
+        """
+        Toutes les catégories présentes dans le texte
+
+        Returns:
+            {catégorie: [mots-clés trouvés]} dans l'ordre des catégories
+        """
+        if not text or self._prefilter is None:
+            return {}
+        normalized = normalize_text(text)
+        if not self._prefilter.search(normalized):
+            return {}
+
+        tokens = _TOKEN_RE.findall(normalized)
+        found: Dict[str, List[str]] = {}
+        for start in range(len(tokens)):
+            frontier = [self._root]
+            for token in tokens[start:]:
+                frontier = self._step(frontier, token)
+                if not frontier:
+                    break
+                for node in frontier:
+                    for category, keyword in node.hits:
+                        keywords = found.setdefault(category, [])
+                        if keyword not in keywords:
+                            keywords.append(keyword)
+                        if first_only:
+                            return found
+
+        return {category: found[category] for category in self.categories if category in found}
+
+    def contains_any(self, text: str) -> bool:
+        """Au moins un mot-clé présent (s'arrête au premier)"""
+        return bool(self.find(text, first_only=True))
+
+    @staticmethod
+    def _step(frontier: List[_Node], token: str) -> List[_Node]:
+        canonical = canonical_token(token)
+        bare = _strip_article(token) if _ARABIC_RE.search(token) else token
+        next_nodes = []
+        for node in frontier:
+            child = node.children.get(canonical)
+            if child is not None:
+                next_nodes.append(child)
+            for stem, stem_node in node.stems:
+                if token.startswith(stem) or bare.startswith(stem):
+                    next_nodes.append(stem_node)
+        return next_nodes
@@ -0,0 +1,113 @@
+"""
+Cache des réponses LLM adressé par contenu + coalescence des requêtes
+
+Deux prompts identiques (même opération, même modèle, même texte normalisé,
+même langue) donnent la même clé: la réponse est servie depuis le cache
+local (LRU + TTL) au lieu d'être repayée à l'API. Les requêtes identiques
+simultanées partagent un seul appel amont (single-flight).
+
+Usage:
+    cache = LLMResponseCache()
+    text = await cache.get_or_call(
+        cache.make_key("translate", model, system, prompt, language="ar"),
+        lambda: call_model(system, prompt),
+    )
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+import unicodedata
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from utils.local_cache import LocalTTLCache
+
+# Configuration
+AI_RESPONSE_CACHE_MAX_SIZE = int(os.getenv("AI_RESPONSE_CACHE_MAX_SIZE", "5000"))
+AI_RESPONSE_CACHE_TTL = float(os.getenv("AI_RESPONSE_CACHE_TTL", "86400"))  # Secondes
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(text: str) -> str:
+    """Forme canonique d'un prompt (Unicode NFC, espaces compactés)"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text or "")).strip()
+
+
+class LLMResponseCache:
+    """Cache LRU/TTL des réponses de modèle avec coalescence des appels identiques"""
+
+    def __init__(
+        self,
+        maxsize: int = AI_RESPONSE_CACHE_MAX_SIZE,
+        ttl: float = AI_RESPONSE_CACHE_TTL,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        self._cache = LocalTTLCache(maxsize=maxsize, ttl=ttl, timer=timer)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.stats = {"upstream_calls": 0, "coalesced": 0, "errors": 0}
+
+    @staticmethod
+    def make_key(operation: str, model: str, *parts: Any, language: Optional[str] = None) -> str:
+        """
+        Clé de contenu: sha256 de (opération, modèle, parties normalisées, langue)
+
+        Les parties sont typiquement le prompt système, le prompt utilisateur et
+        les paramètres qui changent la réponse (max_tokens...).
+        """
+        normalized = [normalize_prompt(p) if isinstance(p, str) else p for p in parts]
+        payload = json.dumps([operation, model, language, normalized], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    async def get_or_call(self, key: str, call: Callable[[], Awaitable[Any]], ttl: Optional[float] = None) -> Any:
+        """
+        Réponse en cache, sinon un seul appel amont partagé par tous les
+        demandeurs simultanés de la même clé
+
+        Les erreurs ne sont pas mises en cache: elles sont propagées à tous
+        les demandeurs en attente.
+        """
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        task = self._inflight.get(key)
+        if task is None:
+            # Tâche indépendante: l'annulation d'un demandeur (client déconnecté)
+            # n'interrompt pas l'appel attendu par les autres
+            task = asyncio.get_running_loop().create_task(self._fill(key, call, ttl))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[key] = task
+        else:
+            self.stats["coalesced"] += 1
+
+        return await asyncio.shield(task)
+
+    async def _fill(self, key: str, call: Callable[[], Awaitable[Any]], ttl: Optional[float]) -> Any:
+        self.stats["upstream_calls"] += 1
+        try:
+            result = await call()
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        if result is not None:
+            self._cache.set(key, result, ttl=ttl)
+        return result
+
+    def invalidate(self, key: str) -> bool:
+        """Supprime une réponse du cache"""
+        return self._cache.delete(key)
+
+    def clear(self) -> None:
+        """Vide le cache"""
+        self._cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Compteurs du cache et de la coalescence"""
+        return {**self._cache.get_stats(), **self.stats, "in_flight": len(self._inflight)}
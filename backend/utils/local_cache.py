@@ -0,0 +1,121 @@
+"""
+Cache mémoire local (par worker)
+LRU borné + expiration TTL, thread-safe, avec compteurs hit/miss
+
+Pour les données lues très souvent et modifiées rarement
+(résolution de short codes, identités, entitlements...). Optionnellement
+borné aussi en octets (max_bytes + sizeof) pour les valeurs volumineuses.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+_MISSING = object()
+
+
+class LocalTTLCache:
+    """Cache LRU borné avec TTL par entrée"""
+
+    def __init__(
+        self,
+        maxsize: int = 10000,
+        ttl: float = 300.0,
+        timer: Callable[[], float] = time.monotonic,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[Any], int]] = None,
+    ):
+        """
+        Args:
+            maxsize: Nombre maximum d'entrées (éviction LRU au-delà)
+            ttl: Durée de vie par défaut d'une entrée (secondes)
+            timer: Horloge monotone (injectable pour les tests)
+            max_bytes: Taille totale maximale des valeurs (éviction LRU au-delà)
+            sizeof: Taille d'une valeur en octets (requis avec max_bytes)
+        """
+        if max_bytes is not None and sizeof is None:
+            raise ValueError("max_bytes requiert sizeof")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._timer = timer
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # clé -> (valeur, expiration, octets)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "sets": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None, count: bool = True) -> Any:
+        """Récupérer une valeur (None/default si absente ou expirée)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at, _ = entry
+                if expires_at > self._timer():
+                    self._data.move_to_end(key)
+                    if count:
+                        self.stats["hits"] += 1
+                    return value
+                self._remove(key)
+                self.stats["expirations"] += 1
+            if count:
+                self.stats["misses"] += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Stocker une valeur (éviction LRU si plein)"""
+        expires_at = self._timer() + (self.ttl if ttl is None else ttl)
+        size = self._sizeof(value) if self._sizeof is not None else 0
+        with self._lock:
+            self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return  # Plus grande que le cache entier: jamais conservée
+            self._data[key] = (value, expires_at, size)
+            self._bytes += size
+            self.stats["sets"] += 1
+            while len(self._data) > self.maxsize or (self.max_bytes is not None and self._bytes > self.max_bytes):
+                _, (_, _, evicted) = self._data.popitem(last=False)
+                self._bytes -= evicted
+                self.stats["evictions"] += 1
+
+    def _remove(self, key: Hashable) -> bool:
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= entry[2]
+        return True
+
+    def delete(self, key: Hashable) -> bool:
+        """Invalider une entrée"""
+        with self._lock:
+            if self._remove(key):
+                self.stats["invalidations"] += 1
+                return True
+            return False
+
+    def clear(self) -> None:
+        """Vider le cache"""
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Statistiques du cache (taille, hit rate...)"""
+        total = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hit_rate": round(self.stats["hits"] / total * 100, 2) if total > 0 else 0,
+        }
@@ -0,0 +1,31 @@
+"""
+Visibilité publique des produits selon leur modération (migration 016)
+
+Un produit en attente du verdict IA (pending_review), en révision admin
+(under_review) ou rejeté n'apparaît pas dans les listes et fiches publiques
+et ne peut pas recevoir de lien d'affiliation. NULL: produit antérieur à la
+modération automatique, visible.
+
+Usage:
+    query = only_public_products(supabase.table("products").select("*"))
+
+    if not is_publicly_visible(product):
+        raise HTTPException(status_code=404, detail="Produit non trouvé")
+"""
+
+from typing import Any, Dict
+
+HIDDEN_MODERATION_STATUSES = ("pending_review", "under_review", "rejected")
+
+# NOT IN exclurait aussi les NULL (produits antérieurs): filtre positif
+PUBLIC_MODERATION_FILTER = "moderation_status.is.null,moderation_status.eq.approved"
+
+
+def only_public_products(query):
+    """Restreint une requête products aux produits visibles publiquement"""
+    return query.or_(PUBLIC_MODERATION_FILTER)
+
+
+def is_publicly_visible(product: Dict[str, Any]) -> bool:
+    """Le produit peut être affiché publiquement et recevoir des liens"""
+    return product.get("moderation_status") not in HIDDEN_MODERATION_STATUSES
@@ -0,0 +1,87 @@
+"""
+Fonctions SQL optionnelles (RPC) avec repli
+
+Plusieurs services appellent une fonction SQL ajoutée par une migration
+(get_sales_timeseries, validate_sales_batch, approve_commissions_batch...)
+et se replient sur des requêtes classiques tant qu'elle n'est pas déployée.
+
+Seule une fonction réellement absente (PostgREST PGRST202, Postgres 42883)
+désactive la RPC, et seulement pour RPC_RETRY_AFTER secondes: la migration
+appliquée plus tard est prise en compte sans redémarrage. Une erreur
+transitoire (réseau, timeout, contrainte) ne change pas l'état: l'appelant
+décide de la re-lever (écritures) ou de se replier pour cet appel (lectures).
+
+Usage:
+    _timeseries_rpc = OptionalRpc("get_sales_timeseries")
+
+    if _timeseries_rpc.enabled():
+        try:
+            data = client.rpc("get_sales_timeseries", params).execute().data
+            _timeseries_rpc.succeeded()
+        except Exception as e:
+            if not _timeseries_rpc.missing(e):
+                raise
+"""
+
+import logging
+import os
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+RPC_RETRY_AFTER = float(os.getenv("RPC_RETRY_AFTER", "300"))  # Secondes avant de retenter une RPC absente
+
+MISSING_FUNCTION_CODES = ("PGRST202", "42883")
+
+
+def is_missing_function(error: BaseException) -> bool:
+    """La RPC n'existe pas (pas une erreur transitoire)"""
+    code = getattr(error, "code", None)
+    if code in MISSING_FUNCTION_CODES:
+        return True
+    text = str(error)
+    if any(missing in text for missing in MISSING_FUNCTION_CODES):
+        return True
+    return "function" in text and ("does not exist" in text or "Could not find" in text)
+
+
+class OptionalRpc:
+    """État d'une fonction SQL optionnelle: disponible, absente (temporairement), inconnue"""
+
+    def __init__(self, name: str, retry_after: float = RPC_RETRY_AFTER):
+        self.name = name
+        self.retry_after = retry_after
+        self.available: Optional[bool] = None  # None = pas encore appelée
+        self._disabled_until = 0.0
+
+    def enabled(self) -> bool:
+        """La RPC doit être tentée (jamais constatée absente, ou délai écoulé)"""
+        return self.available is not False or time.monotonic() >= self._disabled_until
+
+    def succeeded(self) -> None:
+        self.available = True
+        self._disabled_until = 0.0
+
+    def missing(self, error: BaseException) -> bool:
+        """
+        Enregistre l'échec d'un appel
+
+        Returns:
+            True si la fonction est absente (l'appelant se replie),
+            False pour une erreur transitoire (état inchangé)
+        """
+        if not is_missing_function(error):
+            logger.error(f"Erreur RPC {self.name}: {error}")
+            return False
+        if self.available is not False:
+            logger.warning(
+                f"RPC {self.name} indisponible, repli pendant {self.retry_after:.0f}s: {error}"
+            )
+        self.available = False
+        self._disabled_until = time.monotonic() + self.retry_after
+        return True
+
+    def reset(self) -> None:
+        self.available = None
+        self._disabled_until = 0.0
@@ -5,6 +5,7 @@ Supporte Shopify, WooCommerce, Stripe, etc.
 
 from fastapi import Request, HTTPException
 from supabase_client import supabase
+from tracking_service import tracking_service
 from datetime import datetime
 from typing import Dict, Optional
 import hmac
@@ -222,16 +223,12 @@ class WebhookService:
     async def _get_attribution_from_code(self, short_code: str) -> Optional[Dict]:
         """Récupère l'attribution depuis un short_code"""
         try:
-            link = (
-                supabase.table("tracking_links").select("*").eq("short_code", short_code).execute()
-            )
+            link = tracking_service.resolve_short_code(short_code)
 
-            if not link.data:
+            if not link:
                 return None
 
-            link_data = link.data[0]
-
-            return {"influencer_id": link_data["influencer_id"], "link_id": link_data["id"]}
+            return {"influencer_id": link["influencer_id"], "link_id": link["link_id"]}
         except Exception as e:
             logger.error(f"Erreur récupération attribution: {e}")
             return None
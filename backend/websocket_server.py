@@ -1,28 +1,95 @@
 """
 WebSocket server for real-time notifications
 Handles commission alerts, payment status updates, and live dashboard updates
+
+Events are pushed by the code paths that write them (services.realtime_events)
+and reach this process through Redis pub/sub; there is no database polling.
+Clients authenticate with their access token ({"type": "auth", "token": ...});
+the user id is taken from the verified token, never from the message.
+Clients resume after a reconnect by sending the last "seq" they received;
+a client that sends none only gets events published from now on.
 """
 
-import asyncio
 import json
+import os
 from datetime import datetime
-from typing import Dict, Set
+from typing import Any, Dict, List, Optional, Set
+import jwt
 from aiohttp import web, WSMsgType
 import aiohttp_cors
-from supabase_client import get_supabase
+from services.realtime_events import realtime_bus
+
+# Same signing key as the API tokens (auth.py)
+JWT_SECRET = os.getenv("JWT_SECRET", "fallback-secret-please-set-env-variable")
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 
 # Connected clients by user_id
 connected_clients: Dict[str, Set[web.WebSocketResponse]] = {}
 
 
-# Event types
-class EventTypes:
-    COMMISSION_CREATED = "commission_created"
-    COMMISSION_UPDATED = "commission_updated"
-    PAYMENT_CREATED = "payment_created"
-    PAYMENT_STATUS_CHANGED = "payment_status_changed"
-    SALE_CREATED = "sale_created"
-    DASHBOARD_UPDATE = "dashboard_update"
+class ClientConnection:
+    """
+    Per-socket delivery of a user's events, in seq order without duplicates
+
+    Live events received while the backlog is being replayed are held back
+    and flushed after it.
+    """
+
+    def __init__(self, ws: web.WebSocketResponse, last_seq: int = 0):
+        self.ws = ws
+        self.last_seq = last_seq
+        self._replaying = True
+        self._pending: List[Dict[str, Any]] = []
+
+    async def send(self, event: Dict[str, Any]):
+        if self._replaying:
+            self._pending.append(event)
+            return
+        await self._send(event)
+
+    async def _send(self, event: Dict[str, Any]):
+        if event["seq"] <= self.last_seq:
+            return
+        self.last_seq = event["seq"]
+        await self.ws.send_json(
+            {
+                "type": event["type"],
+                "seq": event["seq"],
+                "data": event["data"],
+                "timestamp": event["timestamp"],
+            }
+        )
+
+    async def replay(self, user_id: str):
+        """Send events missed since last_seq, then switch to live delivery"""
+        events, complete = await realtime_bus.replay(user_id, self.last_seq)
+        if not complete:
+            # Events fell out of the backlog: the client must reload its state
+            await self.ws.send_json(
+                {"type": "resync", "seq": events[0]["seq"] - 1, "timestamp": datetime.now().isoformat()}
+            )
+            self.last_seq = events[0]["seq"] - 1
+
+        for event in events:
+            await self._send(event)
+
+        while self._pending:
+            pending, self._pending = self._pending, []
+            for event in sorted(pending, key=lambda e: e["seq"]):
+                await self._send(event)
+        self._replaying = False
+
+
+def authenticate_token(token: Optional[str]) -> Optional[str]:
+    """User id (sub claim) of a valid, unexpired access token, None otherwise"""
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except jwt.PyJWTError:
+        return None
+    user_id = payload.get("sub") or payload.get("user_id")
+    return str(user_id) if user_id else None
 
 
 async def websocket_handler(request):
@@ -31,6 +98,7 @@ async def websocket_handler(request):
     await ws.prepare(request)
 
     user_id = None
+    connection = None
 
     try:
         async for msg in ws:
@@ -39,22 +107,42 @@ async def websocket_handler(request):
                     data = json.loads(msg.data)
 
                     # Handle authentication
-                    if data.get("type") == "auth":
-                        user_id = data.get("user_id")
-                        if user_id:
-                            if user_id not in connected_clients:
-                                connected_clients[user_id] = set()
-                            connected_clients[user_id].add(ws)
-
-                            # Send confirmation
+                    if data.get("type") == "auth" and connection is None:
+                        user_id = authenticate_token(data.get("token"))
+                        if not user_id:
                             await ws.send_json(
                                 {
-                                    "type": "auth_success",
-                                    "message": "Authenticated successfully",
+                                    "type": "auth_error",
+                                    "message": "Invalid or expired token",
                                     "timestamp": datetime.now().isoformat(),
                                 }
                             )
-                            print(f"User {user_id} connected")
+                            await ws.close()
+                            break
+
+                        if user_id not in connected_clients:
+                            connected_clients[user_id] = set()
+                        connected_clients[user_id].add(ws)
+
+                        # Subscribe before replaying so no event is missed in between
+                        connection = ClientConnection(ws)
+                        realtime_bus.subscribe(user_id, connection.send)
+                        if data.get("last_seq") is None:
+                            # New client: no backlog, start from the current seq
+                            connection.last_seq = await realtime_bus.current_seq(user_id)
+                        else:
+                            connection.last_seq = int(data["last_seq"])
+
+                        # Send confirmation
+                        await ws.send_json(
+                            {
+                                "type": "auth_success",
+                                "message": "Authenticated successfully",
+                                "timestamp": datetime.now().isoformat(),
+                            }
+                        )
+                        await connection.replay(user_id)
+                        print(f"User {user_id} connected")
 
                     # Handle ping/pong for keepalive
                     elif data.get("type") == "ping":
@@ -70,6 +158,8 @@ async def websocket_handler(request):
 
     finally:
         # Clean up on disconnect
+        if connection is not None:
+            realtime_bus.unsubscribe(user_id, connection.send)
         if user_id and user_id in connected_clients:
             connected_clients[user_id].discard(ws)
             if not connected_clients[user_id]:
@@ -80,24 +170,8 @@ async def websocket_handler(request):
 
 
 async def broadcast_to_user(user_id: str, event_type: str, data: dict):
-    """Send event to specific user"""
-    if user_id not in connected_clients:
-        return
-
-    message = {"type": event_type, "data": data, "timestamp": datetime.now().isoformat()}
-
-    # Send to all connections for this user
-    disconnected = set()
-    for ws in connected_clients[user_id]:
-        try:
-            await ws.send_json(message)
-        except Exception as e:
-            print(f"Error sending to user {user_id}: {e}")
-            disconnected.add(ws)
-
-    # Clean up disconnected clients
-    for ws in disconnected:
-        connected_clients[user_id].discard(ws)
+    """Send event to specific user (on every worker, with a resumable seq)"""
+    await realtime_bus.publish_async(str(user_id), event_type, data)
 
 
 async def broadcast_to_all(event_type: str, data: dict):
@@ -118,64 +192,6 @@ async def broadcast_to_all(event_type: str, data: dict):
             connected_clients[user_id].discard(ws)
 
 
-async def listen_to_database_changes():
-    """Listen to Supabase realtime changes (simulated with polling)"""
-    supabase = get_supabase()
-    last_check = datetime.now()
-
-    while True:
-        try:
-            # Check for new commissions
-            response = (
-                supabase.table("commissions")
-                .select("*")
-                .gte("created_at", last_check.isoformat())
-                .execute()
-            )
-
-            for commission in response.data:
-                affiliate_id = commission.get("affiliate_id")
-                if affiliate_id:
-                    await broadcast_to_user(
-                        str(affiliate_id),
-                        EventTypes.COMMISSION_CREATED,
-                        {
-                            "commission_id": commission["id"],
-                            "amount": commission["amount"],
-                            "sale_id": commission["sale_id"],
-                        },
-                    )
-
-            # Check for payment status changes
-            response = (
-                supabase.table("payments")
-                .select("*")
-                .gte("updated_at", last_check.isoformat())
-                .execute()
-            )
-
-            for payment in response.data:
-                affiliate_id = payment.get("affiliate_id")
-                if affiliate_id:
-                    await broadcast_to_user(
-                        str(affiliate_id),
-                        EventTypes.PAYMENT_STATUS_CHANGED,
-                        {
-                            "payment_id": payment["id"],
-                            "status": payment["status"],
-                            "amount": payment["amount"],
-                        },
-                    )
-
-            last_check = datetime.now()
-
-        except Exception as e:
-            print(f"Error listening to database: {e}")
-
-        # Check every 5 seconds
-        await asyncio.sleep(5)
-
-
 async def init_app():
     """Initialize aiohttp application"""
     app = web.Application()
@@ -197,24 +213,20 @@ async def init_app():
     for route in list(app.router.routes()):
         cors.add(route)
 
-    # Start database listener
-    app["db_listener"] = asyncio.create_task(listen_to_database_changes())
+    # Start realtime feed listener (Redis pub/sub)
+    await realtime_bus.start()
+    app.on_cleanup.append(cleanup)
 
     return app
 
 
 async def cleanup(app):
     """Cleanup on shutdown"""
-    if "db_listener" in app:
-        app["db_listener"].cancel()
-        try:
-            await app["db_listener"]
-        except asyncio.CancelledError:
-            pass
+    await realtime_bus.stop()
 
     # Close all WebSocket connections
     for user_id in list(connected_clients.keys()):
-        for ws in connected_clients[user_id]:
+        for ws in list(connected_clients.get(user_id, ())):
             await ws.close()
 
 
@@ -187,13 +187,13 @@ export const useWebSocket = (url, options = {}) => {
 
   /**
    * Authenticate with server
-   * @param {string} userId - User ID
+   * @param {string} token - Access token (the server reads the user from it)
    */
   const authenticate = useCallback(
-    (userId) => {
+    (token) => {
       sendMessage({
         type: 'auth',
-        user_id: userId,
+        token,
       });
     },
     [sendMessage]